@@ -3,12 +3,11 @@ nümap applications should subclass the NumapApp.
 '''
 import sys
 import os
-import importlib
+import importlib.util
 import logging
 import docopt
-
-# TODO: replace FaceDancerPhy with just FaceDancerApp
-from facedancer import FacedancerUSBApp
+from numap.dev.registry import get_devices, load_device_module
+from numap.phy.registry import load_phy
 from numap.utils.ulogger import set_default_handler_level
 
 
@@ -19,25 +18,9 @@ class NumapApp(object):
             self.options = docopt.docopt(docstring)
         else:
             self.options = {}
+        # name: (module, description), see numap.dev.registry
         self.umap_class_dict = {
-            'audio': ('audio', 'Headset'),
-            'billboard': ('billboard', 'A billboard, requires USB-C'),
-            'bluetooth_cypress': ('bluetooth_cypress', 'A Bluetooth Cypress adapter.'),
-            'cdc_acm': ('cdc_acm', 'Abstract Control Model device (like serial modem)'),
-            'cdc_ecm': ('cdc_ecm', 'Ethernet Control Model device (Ethernet over USB)'),
-            'cdc_eem': ('cdc_eem', 'Ethernet Emulation Model device (Ethernet over USB)'),
-            'cdc_dl': ('cdc_dl', 'Direct Line Control device (like modem)'),
-            'cdc_ncm': ('cdc_ncm', 'Network Control Model device (Ethernet over USB)'),
-            'ftdi': ('ftdi', 'USB<->RS232 FTDI chip'),
-            'hub': ('hub', 'USB hub'),
-            'keyboard': ('keyboard', 'Keyboard'),
-            'mass_storage': ('mass_storage', 'Mass Storage device (e.g. thumb drive)'),
-            'mtp': ('mtp', 'Android phone'),
-            'printer': ('printer', 'Printer'),
-            'rndis': ('rndis', 'RNDIS network interface'),
-            'smartcard': ('smartcard', 'USB<->smart card interface'),
-            'wifi_realtek': ('wifi_realtek', 'Realtek Wifi Adapter'),
-            'wifi_qualcomm': ('wifi_qualcomm', 'Qualcomm Atheros Wifi Adapter'),
+            name: (info.module, info.description) for name, info in get_devices().items()
         }
         self.umap_classes = sorted(self.umap_class_dict.keys())
         self.logger = self.get_logger()
@@ -64,22 +47,36 @@ class NumapApp(object):
         return logger
 
     def load_phy(self, phy_string):
-        # TODO: support options; bring GadgetFS into FaceDancer2?
-        return FacedancerUSBApp()
+        # the backends are imported on demand, see numap.phy.registry
+        phy = load_phy(self, phy_string)
+        capture_file = self.options.get('--capture', None)
+        if capture_file:
+            from numap.phy.capture import CapturePhy
+            self.logger.info('Capturing USB traffic to %s' % capture_file)
+            phy = CapturePhy(phy, capture_file)
+        return phy
 
     def load_device(self, dev_name, phy):
         if dev_name in self.umap_classes:
             self.logger.info('Loading USB device %s' % dev_name)
-            module_name = self.umap_class_dict[dev_name][0]
-            module = importlib.import_module('numap.dev.%s' % module_name)
+            module = load_device_module(dev_name)
+        elif dev_name.endswith('.json'):
+            self.logger.info('Loading USB device from spec: %s' % dev_name)
+            from numap.utils.device_spec import load_spec, SpecDevice
+            return SpecDevice(self, phy, load_spec(dev_name), **self.get_user_device_kwargs())
         else:
             self.logger.info('Loading custom USB device from file: %s' % dev_name)
-            dirpath, filename = os.path.split(dev_name)
+            dirpath, filename = os.path.split(os.path.abspath(dev_name))
             modulename = filename[:-3]
+            # the module may import other modules next to it
             if dirpath in sys.path:
                 sys.path.remove(dirpath)
             sys.path.insert(0, dirpath)
-            module = __import__(modulename, globals(), locals(), [], -1)
+            module_spec = importlib.util.spec_from_file_location(modulename, dev_name)
+            if module_spec is None:
+                raise Exception('Can not load USB device from file: %s' % dev_name)
+            module = importlib.util.module_from_spec(module_spec)
+            module_spec.loader.exec_module(module)
         usb_device = module.usb_device
         kwargs = self.get_user_device_kwargs()
         dev = usb_device(self, phy, **kwargs)
@@ -92,6 +89,18 @@ class NumapApp(object):
         kwargs = {}
         self.update_from_user_param('--vid', 'vid', kwargs, 'int')
         self.update_from_user_param('--pid', 'pid', kwargs, 'int')
+        self.update_from_user_param('--tap', 'tap', kwargs, 'str')
+        self.update_from_user_param('--at-script', 'at_script', kwargs, 'str')
+        self.update_from_user_param('--pty', 'pty', kwargs, 'str')
+        self.update_from_user_param('--keys', 'text', kwargs, 'str')
+        self.update_from_user_param('--key-script', 'script', kwargs, 'str')
+        self.update_from_user_param('--key-layout', 'layout', kwargs, 'str')
+        self.update_from_user_param('--report-descriptor', 'report_descriptor', kwargs, 'str')
+        self.update_from_user_param('--audio-source', 'audio_source', kwargs, 'str')
+        self.update_from_user_param('--audio-sink', 'audio_sink', kwargs, 'str')
+        self.update_from_user_param('--card', 'card', kwargs, 'str')
+        self.update_from_user_param('--hub-ports', 'children', kwargs, 'str')
+        self.update_from_user_param('--functions', 'functions', kwargs, 'str')
         return kwargs
 
     def update_from_user_param(self, flag, arg_name, kwargs, type):
@@ -100,6 +109,9 @@ class NumapApp(object):
             if type == 'int':
                 kwargs[arg_name] = int(val, 0)
                 self.logger.info('Setting user-supplied %s: %#x' % (arg_name, kwargs[arg_name]))
+            elif type == 'str':
+                kwargs[arg_name] = val
+                self.logger.info('Setting user-supplied %s: %s' % (arg_name, val))
             else:
                 raise Exception('arg type not supported!!')
 
@@ -3,16 +3,19 @@ Try to detect OS based on the USB traffic.
 Not implemented yet.
 
 Usage:
-    numapdetect [-P=PHY_INFO] [-q] [-v ...]
+    numapdetect [-P=PHY_INFO] [-q] [--capture=FILE] [-v ...]
 
 Options:
     -P --phy PHY_INFO           physical layer info, see list below
     -v --verbose                verbosity level
     -q --quiet                  quiet mode. only print warning/error messages
+    --capture FILE              record the USB traffic to a pcap file (usbmon format)
 
 Physical layer:
     fd:<serial_port>        use facedancer connected to given serial port
-    gadgetfs                use gadgetfs (requires mounting of gadgetfs beforehand)
+    gadgetfs[:<mountpoint>] use gadgetfs (requires mounting of gadgetfs beforehand)
+    functionfs[:<name>]     use a FunctionFS gadget on the first UDC (requires libcomposite)
+    virtual                 no hardware, the device only answers requests made in-process
 
 Example:
     numapdetect -P fd:/dev/ttyUSB0 -q
@@ -20,15 +23,15 @@ Example:
 from __future__ import annotations  # so we can better use type hints, see https://stackoverflow.com/a/35617812
 
 import time
-from typing import Type
+from typing import Type, TYPE_CHECKING
 
-import usb.core
-
-from Facedancer.facedancer.USBClass import USBClass
-from Facedancer.facedancer.USBDevice import USBDevice
 from numap.apps.base import NumapApp
 
-from numap.apps.fingerprints import DEVICES, FINGERPRINTS, OS
+from numap.apps.fingerprints import FINGERPRINTS, OS, get_devices
+
+if TYPE_CHECKING:
+    from Facedancer.facedancer.USBClass import USBClass
+    from Facedancer.facedancer.USBDevice import USBDevice
 
 def test(fun):
     def wrapper(req):
@@ -80,8 +83,10 @@ class NumapDetectOSApp(NumapApp):
     def run(self):
         print(
             f'Devices sometimes hang during OS detection. Reattach the GreatFET to the host to continue with the next device.')
+        # pyusb is only needed to catch the errors of the GreatFET backend
+        import usb.core
         phy = self.load_phy(self.options['--phy'])
-        for device_name, base_dev, base_class in DEVICES:
+        for device_name, base_dev, base_class in get_devices():
             # reset everything
             self.start_time = time.time()
             self.requests = []
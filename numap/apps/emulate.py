@@ -3,26 +3,55 @@
 Emulate a USB device
 
 Usage:
-    numapemulate -C=DEVICE_CLASS [-P=PHY_INFO] [-q] [--vid=VID] [--pid=PID] [-v ...]
+    numapemulate -C=DEVICE_CLASS [-P=PHY_INFO] [-q] [--capture=FILE] [--tap=IFACE] [--at-script=FILE] [--pty=LINK] [--keys=TEXT] [--key-script=FILE] [--key-layout=LAYOUT] [--report-descriptor=DESC] [--audio-source=SRC] [--audio-sink=FILE] [--card=CARD] [--hub-ports=CLASSES] [--functions=CLASSES] [--vid=VID] [--pid=PID] [-v ...]
 
 Options:
     -P --phy PHY_INFO           physical layer info, see list below [default: auto]
-    -C --class DEVICE_CLASS     class of the device or path to python file with device class
+    -C --class DEVICE_CLASS     class of the device, path to python file with device class
+                                or json device spec (see numap/utils/device_spec.py)
     -v --verbose                verbosity level
     -q --quiet                  quiet mode. only print warning/error messages
+    --capture FILE              record the USB traffic to a pcap file (usbmon format)
+    --tap IFACE                 bridge the network devices (cdc_ecm, cdc_eem, cdc_ncm, rndis)
+                                to a TAP interface
+    --at-script FILE            json file with AT command responses for the modems (cdc_acm, cdc_dl)
+    --pty LINK                  bridge the serial data of ftdi to a PTY, linked to LINK
+    --keys TEXT                 text for the keyboard to type
+    --key-script FILE           keystroke script for the keyboard (see numap/utils/keystrokes.py)
+    --key-layout LAYOUT         keyboard layout of the host (us, de)
+    --report-descriptor DESC    report descriptor of the hid device, as hex string or binary file
+    --audio-source SRC          capture data of the audio device: tone[:FREQUENCY] or a WAV file
+    --audio-sink FILE           WAV file for the playback data of the audio device
+    --card CARD                 virtual card of the smartcard reader: json APDU script
+                                or exec:COMMAND (see numap/utils/virtual_card.py)
+    --hub-ports CLASSES         device classes to attach to the ports of the hub,
+                                comma separated (e.g. keyboard,mass_storage)
+    --functions CLASSES         device classes of the composite device, comma separated
     --vid VID                   override vendor ID
     --pid PID                   override product ID
 
 Physical layer:
     fd:<serial_port>        use facedancer connected to given serial port
-    gadgetfs                use gadgetfs (requires mounting of gadgetfs beforehand)
+    gadgetfs[:<mountpoint>] use gadgetfs (requires mounting of gadgetfs beforehand)
+    functionfs[:<name>]     use a FunctionFS gadget on the first UDC (requires libcomposite)
+    virtual                 no hardware, the device only answers requests made in-process
     auto                    automatically detect how we should connect
 
 Examples:
     emulate keyboard:
         numapemulate -P fd:/dev/ttyUSB1 -C keyboard
+    emulate a keyboard that types a script on a host with a german layout:
+        numapemulate -P fd:/dev/ttyUSB1 -C keyboard --key-script payload.txt --key-layout de
+    emulate an ethernet adapter, bridged to the TAP interface numap0:
+        numapemulate -P fd:/dev/ttyUSB1 -C cdc_ecm --tap numap0
+    emulate an FTDI serial adapter, connected to /tmp/ttyNUMAP:
+        numapemulate -P fd:/dev/ttyUSB1 -C ftdi --pty /tmp/ttyNUMAP
+    emulate a keyboard and a serial adapter in one configuration:
+        numapemulate -P fd:/dev/ttyUSB1 -C composite --functions keyboard,cdc_acm
     emulate your own device:
         numapemulate -P fd:/dev/ttyUSB1 -C my_usb_device.py
+    emulate a device from a spec (numapmkdevice --batch ... --format json):
+        numapemulate -P fd:/dev/ttyUSB1 -C dev_413c_2113_eb395ac3.json
 '''
 import traceback
 
@@ -1,23 +1,31 @@
 from enum import IntEnum
 
-from numap.dev.audio import USBAudioDevice, USBAudioClass
-from numap.dev.keyboard import USBKeyboardDevice, USBKeyboardClass
-from numap.dev.mass_storage import USBMassStorageDevice, USBMassStorageClass
-from numap.dev.printer import USBPrinterDevice, USBPrinterClass
-from numap.dev.cdc_acm import USBCdcAcmDevice
-from numap.dev.cdc import USBCDCClass
-from numap.dev.rndis import USBRndisDevice, USBRndisClass
+import importlib
 
 
+# (name, device class, class of the first interface), the modules are imported by get_devices
 DEVICES = [
-    ('keyboard', USBKeyboardDevice, USBKeyboardClass),
-    ('audio', USBAudioDevice, USBAudioClass),
-    ('mass_storage', USBMassStorageDevice, USBMassStorageClass),
-    ('printer', USBPrinterDevice, USBPrinterClass),
-    ('cdc_acm', USBCdcAcmDevice, USBCDCClass),
-    ('rndis', USBRndisDevice, USBRndisClass)
+    ('keyboard', 'numap.dev.keyboard:USBKeyboardDevice', 'numap.dev.keyboard:USBKeyboardClass'),
+    ('audio', 'numap.dev.audio:USBAudioDevice', 'numap.dev.audio:USBAudioClass'),
+    ('mass_storage', 'numap.dev.mass_storage:USBMassStorageDevice', 'numap.dev.mass_storage:USBMassStorageClass'),
+    ('printer', 'numap.dev.printer:USBPrinterDevice', 'numap.dev.printer:USBPrinterClass'),
+    ('cdc_acm', 'numap.dev.cdc_acm:USBCdcAcmDevice', 'numap.dev.cdc:USBCDCClass'),
+    ('rndis', 'numap.dev.rndis:USBRndisDevice', 'numap.dev.rndis:USBRndisClass')
 ]
 
+
+def _load(path):
+    module, _, name = path.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def get_devices():
+    '''
+    :return: list of (name, device class, class of the first interface)
+    '''
+    return [(name, _load(device), _load(cls)) for name, device, cls in DEVICES]
+
+
 class OS(IntEnum):
     UNKNOWN = 0
     WINDOWS = 1
@@ -3,21 +3,25 @@
 Emulate a USB device to be used for fuzzing
 
 Usage:
-    numapfuzz-C=DEVICE_CLASS [-P=PHY_INFO]  [-q] [--vid=VID] [--pid=PID] [-i=FUZZER_IP] [-p FUZZER_PORT] [-v ...]
+    numapfuzz-C=DEVICE_CLASS [-P=PHY_INFO]  [-q] [--capture=FILE] [--vid=VID] [--pid=PID] [-i=FUZZER_IP] [-p FUZZER_PORT] [-t=TRIGGER_DIR] [-v ...]
 
 Options:
     -P --phy PHY_INFO           physical layer info, see list below
-    -C --class DEVICE_CLASS     class of the device or path to python file with device class
+    -C --class DEVICE_CLASS     class of the device, path to python file with device class or json device spec
     -v --verbose                verbosity level
     -i --fuzzer-ip HOST         hostname or IP of the fuzzer [default: 127.0.0.1]
     -p --fuzzer-port PORT       port of the fuzzer [default: 26007]
+    -t --trigger-dir DIR        directory for the trigger files shared with the fuzzer [default: /tmp/umap_kitty]
     -q --quiet                  quiet mode. only print warning/error messages
+    --capture FILE              record the USB traffic to a pcap file (usbmon format)
     --vid VID                   override vendor ID
     --pid PID                   override product ID
 
 Physical layer:
     fd:<serial_port>        use facedancer connected to given serial port
-    gadgetfs                use gadgetfs (requires mounting of gadgetfs beforehand)
+    gadgetfs[:<mountpoint>] use gadgetfs (requires mounting of gadgetfs beforehand)
+    functionfs[:<name>]     use a FunctionFS gadget on the first UDC (requires libcomposite)
+    virtual                 no hardware, the device only answers requests made in-process
 
 Examples:
     emulate disk-on-key:
@@ -34,6 +38,7 @@ class NumapFuzzApp(NumapEmulationApp):
     def __init__(self, options):
         super(NumapFuzzApp, self).__init__(options)
         self.count = 0
+        self.reset_progress()
 
     def get_fuzzer(self):
         fuzzer = RpcClient(
@@ -51,7 +56,7 @@ class NumapFuzzApp(NumapEmulationApp):
         return False
 
     def send_heartbeat(self):
-        heartbeat_file = '/tmp/umap_kitty/heartbeat'
+        heartbeat_file = os.path.join(self.options['--trigger-dir'], 'heartbeat')
         if os.path.isdir(os.path.dirname(heartbeat_file)):
             with open(heartbeat_file, 'a'):
                 os.utime(heartbeat_file, None)
@@ -62,6 +67,8 @@ class NumapFuzzApp(NumapEmulationApp):
         '''
         if self._should_disconnect():
             self.phy.disconnect()
+            # report before clearing the trigger, so it is received while kitty is still in post_test
+            self.report_progress()
             self._clear_disconnect_trigger()
             # wait for reconnection request; no point in returning to service_irqs loop while not connected!
             while not self._should_reconnect():
@@ -71,6 +78,7 @@ class NumapFuzzApp(NumapEmulationApp):
         # be robust to reconnection requests, whether received after a disconnect request, or standalone
         # (not sure this is right, might be better to *not* be robust in the face of possible misuse?)
         if self._should_reconnect():
+            self.reset_progress()
             self.phy.connect(self.dev)
             self._clear_reconnect_trigger()
             return True
@@ -78,30 +86,71 @@ class NumapFuzzApp(NumapEmulationApp):
 
     def _should_reconnect(self):
         if self.fuzzer:
-            if os.path.isfile('/tmp/umap_kitty/trigger_reconnect'):
+            if os.path.isfile(os.path.join(self.options['--trigger-dir'], 'trigger_reconnect')):
                 return True
         return False
 
     def _clear_reconnect_trigger(self):
-        trigger = '/tmp/umap_kitty/trigger_reconnect'
+        trigger = os.path.join(self.options['--trigger-dir'], 'trigger_reconnect')
         if os.path.isfile(trigger):
             os.remove(trigger)
 
     def _should_disconnect(self):
         if self.fuzzer:
-            if os.path.isfile('/tmp/umap_kitty/trigger_disconnect'):
+            if os.path.isfile(os.path.join(self.options['--trigger-dir'], 'trigger_disconnect')):
                 return True
         return False
 
     def _clear_disconnect_trigger(self):
-        trigger = '/tmp/umap_kitty/trigger_disconnect'
+        trigger = os.path.join(self.options['--trigger-dir'], 'trigger_disconnect')
         if os.path.isfile(trigger):
             os.remove(trigger)
 
+    def reset_progress(self):
+        '''
+        Start tracking the host progress for a new test
+        '''
+        self.progress = {
+            'mutated': False,
+            'requests': 0,
+            'configured': False,
+            'function_supported': False,
+        }
+
+    def get_progress(self):
+        '''
+        :return: how far the host got after the mutated response was sent -
+                 number of stages requested, whether SET_CONFIGURATION was
+                 received and whether the function was supported (e.g. class requests)
+        '''
+        return self.progress
+
+    def report_progress(self):
+        if self.fuzzer and self.progress['mutated']:
+            try:
+                self.fuzzer.report_progress(progress=self.get_progress())
+            except Exception as e:
+                self.logger.warning('Failed to report progress to the fuzzer: %s' % e)
+
+    def usb_configuration_occurred(self):
+        if self.progress['mutated']:
+            self.progress['configured'] = True
+
+    def usb_function_supported(self, reason=None):
+        if self.progress['mutated']:
+            self.progress['function_supported'] = True
+
     def get_mutation(self, stage, data=None):
         if self.fuzzer:
+            if self.progress['mutated']:
+                self.progress['requests'] += 1
             data = {} if data is None else data
-            return self.fuzzer.get_mutation(stage=stage, data=data)
+            mutation = self.fuzzer.get_mutation(stage=stage, data=data)
+            if mutation is not None:
+                self.progress['mutated'] = True
+            if mutation is not None and hasattr(self.phy, 'record_mutation'):
+                self.phy.record_mutation(stage, mutation)
+            return mutation
         return None
 
 
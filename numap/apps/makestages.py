@@ -3,20 +3,23 @@
 Prepare stages for USB fuzzing
 
 Usage:
-    numapstages -C=DEVICE_CLASS [-P=PHY_INFO] -s=FILE [-q] [--vid=VID] [--pid=PID] [-v ...]
+    numapstages -C=DEVICE_CLASS [-P=PHY_INFO] -s=FILE [-q] [--capture=FILE] [--vid=VID] [--pid=PID] [-v ...]
 
 Options:
     -P --phy PHY_INFO       physical layer info, see list below
-    -C --class DEVICE_CLASS class of the device or path to python file with device class
+    -C --class DEVICE_CLASS class of the device, path to python file with device class or json device spec
     -s --stage-file FILE    file to store list of stages in
     -q --quiet              quiet mode. only print warning/error messages
+    --capture FILE          record the USB traffic to a pcap file (usbmon format)
     -v --verbose            verbosity level
     --vid VID               override vendor ID
     --pid PID               override product ID
 
 Physical layer:
     fd:<serial_port>        use facedancer connected to given serial port
-    gadgetfs                use gadgetfs (requires mounting of gadgetfs beforehand)
+    gadgetfs[:<mountpoint>] use gadgetfs (requires mounting of gadgetfs beforehand)
+    functionfs[:<name>]     use a FunctionFS gadget on the first UDC (requires libcomposite)
+    virtual                 no hardware, the device only answers requests made in-process
 '''
 import time
 from numap.apps.emulate import NumapEmulationApp
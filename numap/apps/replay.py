@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+'''
+Replay a captured host session against an emulated device
+
+Usage:
+    numapreplay -C=DEVICE_CLASS -r=CAPTURE [-m=MUTATIONS] [-b=ITERATIONS] [-q] [--vid=VID] [--pid=PID] [-v ...]
+    numapreplay -r=CAPTURE -e [-P=PHY_INFO] [-q] [-v ...]
+
+Options:
+    -C --class DEVICE_CLASS     class of the device or path to python file with device class
+    -r --replay CAPTURE         pcap file (usbmon format) with the host session
+    -m --mutations MUTATIONS    json file with a mutation (hex string) per stage,
+                                defaults to CAPTURE.json if it exists
+    -b --benchmark ITERATIONS   replay the session ITERATIONS times and report the response rate
+    -e --emit                   re-emit the captured device responses to a real host
+    -P --phy PHY_INFO           physical layer info, only used with --emit, see list below
+    -v --verbose                verbosity level
+    -q --quiet                  quiet mode. only print warning/error messages
+    --vid VID                   override vendor ID
+    --pid PID                   override product ID
+
+Physical layer:
+    fd:<serial_port>        use facedancer connected to given serial port
+    gadgetfs[:<mountpoint>] use gadgetfs (requires mounting of gadgetfs beforehand)
+    functionfs[:<name>]     use a FunctionFS gadget on the first UDC (requires libcomposite)
+    virtual                 no hardware, the device only answers requests made in-process
+
+Examples:
+    check that the keyboard still answers like it did in the capture:
+        numapreplay -C keyboard -r keyboard.pcap
+    reproduce a crash found by the fuzzer, without the host:
+        numapreplay -C mass_storage -r crash.pcap -m crash.json
+    play the captured responses to a host:
+        numapreplay -r crash.pcap -e -P fd:/dev/ttyUSB0
+'''
+import os
+import json
+import time
+import struct
+import binascii
+import traceback
+from collections import deque
+from numap.apps.base import NumapApp
+from numap.phy.virtual_phy import VirtualPhy, HostStep, STALL, steps_from_records
+from numap.utils.usbmon import read_pcap
+
+
+class CapturedResponder(object):
+    '''
+    Stands in for a USBDevice on a real phy,
+    answers the host with the device side of a captured session.
+    '''
+
+    name = 'Replay'
+
+    def __init__(self, phy, steps):
+        '''
+        :param phy: physical layer to answer on
+        :param steps: list of HostStep, with the captured responses
+        '''
+        self.phy = phy
+        self.control = {}
+        self.data_in = {}
+        for step in steps:
+            if step.kind == HostStep.setup:
+                self.control.setdefault(bytes(step.data[:8]), deque()).append(step.expected)
+            elif step.kind == HostStep.data_in:
+                self.data_in.setdefault(step.ep_num, deque()).extend(step.expected)
+
+    @staticmethod
+    def create_request(raw_bytes):
+        from facedancer.USBDevice import USBDeviceRequest
+        return USBDeviceRequest(raw_bytes)
+
+    def handle_request(self, req):
+        key = struct.pack('<BBHHH', req.request_type, req.request, req.value, req.index, req.length)
+        answers = self.control.get(key)
+        if not answers:
+            self.phy.stall_ep0()
+            return
+        expected = answers.popleft() if len(answers) > 1 else answers[0]
+        if not expected:
+            self.phy.ack_status_stage()
+            if req.request_type == 0x00 and req.request == 0x05:
+                self.phy.set_address(req.value)
+        for data in expected:
+            if data is STALL:
+                self.phy.stall_ep0()
+            else:
+                self.phy.send_on_endpoint(0, data)
+
+    def handle_data_available(self, ep_num, data):
+        pass
+
+    def handle_buffer_available(self, ep_num):
+        pending = self.data_in.get(ep_num)
+        if pending:
+            self.phy.send_on_endpoint(ep_num, pending.popleft())
+
+    def handle_nak(self, ep_num):
+        self.handle_buffer_available(ep_num)
+
+    def handle_bus_reset(self):
+        pass
+
+
+class NumapReplayApp(NumapApp):
+
+    def __init__(self, docstring=None):
+        super(NumapReplayApp, self).__init__(docstring)
+        self.mutations = {}
+
+    def load_mutations(self):
+        capture = self.options['--replay']
+        filename = self.options['--mutations']
+        if filename is None and os.path.isfile(capture + '.json'):
+            filename = capture + '.json'
+        if filename is None:
+            return
+        self.logger.info('Loading mutations from %s' % filename)
+        with open(filename, 'r') as f:
+            mutations = json.load(f)
+        self.mutations = {
+            stage: binascii.unhexlify(payload) for stage, payload in mutations.items()
+        }
+
+    def get_mutation(self, stage, data=None):
+        return self.mutations.get(stage)
+
+    def run(self):
+        steps = steps_from_records(read_pcap(self.options['--replay']))
+        self.logger.info('Loaded %d host steps from %s' % (len(steps), self.options['--replay']))
+        if self.options['--emit']:
+            self.emit(steps)
+            return
+        self.load_mutations()
+        iterations = self.options['--benchmark']
+        if iterations:
+            self.benchmark(steps, int(iterations))
+        else:
+            mismatches = self.replay(steps, compare=True)
+            self.logger.always('Replay done, %d/%d responses differ from the capture' % (mismatches, len(steps)))
+
+    def replay(self, steps, compare=False):
+        '''
+        Drive a freshly loaded device with the host steps
+
+        :param steps: list of HostStep
+        :param compare: log responses that differ from the capture (default: False)
+        :return: number of steps with a different response
+        '''
+        phy = VirtualPhy(self)
+        dev = self.load_device(self.options['--class'], phy)
+        dev.connect()
+        mismatches = 0
+        for i, step in enumerate(steps):
+            try:
+                responses = phy.execute(step)
+            except Exception:
+                self.logger.error('Device raised an exception on step %d (%s)' % (i, step))
+                self.logger.error(traceback.format_exc())
+                break
+            if compare and step.expected and responses != step.expected:
+                mismatches += 1
+                self.logger.warning('Step %d (%s) response differs' % (i, step))
+                self.logger.warning('    captured: %s' % self._responses_str(step.expected))
+                self.logger.warning('    replayed: %s' % self._responses_str(responses))
+        dev.disconnect()
+        return mismatches
+
+    def benchmark(self, steps, iterations):
+        start = time.time()
+        for _ in range(iterations):
+            self.replay(steps)
+        elapsed = time.time() - start
+        total = len(steps) * iterations
+        self.logger.always('Replayed %d steps in %.3f seconds (%.1f steps/sec)' % (total, elapsed, total / elapsed if elapsed else 0))
+
+    def emit(self, steps):
+        phy = self.load_phy(self.options['--phy'])
+        responder = CapturedResponder(phy, steps)
+        phy.connect(responder)
+        try:
+            while not self.should_stop_phy():
+                phy.service_irqs()
+                if hasattr(phy, 'wait_events'):
+                    phy.wait_events()
+        except KeyboardInterrupt:
+            self.logger.info('user terminated the run')
+        phy.disconnect()
+
+    def _responses_str(self, responses):
+        return ', '.join('STALL' if r is STALL else r.hex() for r in responses)
+
+
+def main():
+    app = NumapReplayApp(__doc__)
+    app.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,13 @@
 Scan device support in USB host
 
 Usage:
-    numapscan [-P PHY_INFO] [-q] [-T] [-t TIMEOUT] [-v LEVEL] [-d DEVICE...] [-i DEVICE...]
+    numapscan [-P PHY_INFO] [-q] [--capture FILE] [-T] [-t TIMEOUT] [-v LEVEL] [-d DEVICE...] [-i DEVICE...]
 
 Options:
     -P --phy PHY_INFO           physical layer info, see list below
     -v --verbose LEVEL          verbosity level, higher is more verbose [default: 0]
     -q --quiet                  quiet mode. only print warning/error messages
+    --capture FILE              record the USB traffic to a pcap file (usbmon format)
     -t --timeout TIMEOUT        timeout of each device test in seconds [default: 5]
     -T --always-timeout         keep emulating the device until the timeout is reached, regardless of support
     -d --device DEVICE          test only the specified device(s)
@@ -16,7 +17,9 @@ Options:
 
 Physical layer:
     fd:<serial_port>        use facedancer connected to given serial port
-    gadgetfs                use gadgetfs (requires mounting of gadgetfs beforehand)
+    gadgetfs[:<mountpoint>] use gadgetfs (requires mounting of gadgetfs beforehand)
+    functionfs[:<name>]     use a FunctionFS gadget on the first UDC (requires libcomposite)
+    virtual                 no hardware, the device only answers requests made in-process
 
 Example:
     numapscan -P fd:/dev/ttyUSB0 -q
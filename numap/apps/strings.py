@@ -2,55 +2,31 @@
 Explore and modify USB Strings.
 
 Usage:
-    numap-strings [-P PHY_INFO] [-q] [-v LEVEL]
+    numap-strings [-P PHY_INFO] [-q] [--capture FILE] [-v LEVEL]
 
 Options:
     -P --phy PHY_INFO           physical layer info, see list below
     -v --verbose LEVEL          verbosity level, higher is more verbose [default: 0]
     -q --quiet                  quiet mode. only print warning/error messages
+    --capture FILE              record the USB traffic to a pcap file (usbmon format)
 
 Physical layer:
     fd:<serial_port>            use facedancer connected to given serial port
-    gadgetfs                    use gadgetfs (requires mounting of gadgetfs beforehand)
+    gadgetfs[:<mountpoint>]     use gadgetfs (requires mounting of gadgetfs beforehand)
+    functionfs[:<name>]         use a FunctionFS gadget on the first UDC (requires libcomposite)
+    virtual                     no hardware, the device only answers requests made in-process
 
 Example:
     numapscan -P fd:/dev/ttyUSB0 -q
 '''
 from numap.apps.base import NumapApp
+from numap.dev.registry import get_string_locations
 
 
 # maps the descriptors of devices to indices in the string array
-# TODO this is kinda fragile...
-STRING_LOCATIONS = {
-    'billboard': {
-        'Manufacturer String': 0,
-        'Product String': 1,
-        'Serial Number String': 2,
-        'Configuration String': 3,
-        'Billboard Additional Info String': 4,
-        'Alternate Mode String': 5,
-    },
-    'printer': {
-        'Manufacturer String': 0,
-        'Product String': 1,
-        'Serial Number String': 2,
-        'Configuration String': 3,
-        'Device ID (insert as Python dictionary, will be automatically formatted, bytes are passed as-is; unlimited length)': 4
-    },
-}
-
-STRING_LOCATIONS |= {name: {
-    'Manufacturer String': 0,
-    'Product String': 1,
-    'Serial Number String': 2,
-    'Configuration String': 3
-} for name in ['audio', 'cdc_acm', 'cdc_dl', 'cdc_ecm', 'cdc_eem', 'cdc_ncm', 'ftdi', 'hub', 'keyboard', 'mass_storage', 'mtp', 'rndis', 'smartcard']}
-
-STRING_LOCATIONS |= {name: {
-    'Manufacturer String': 0,
-    'Product String': 1,
-    'Serial Number String': 2,
-} for name in ['bluetooth_cypress', 'wifi_qualcomm', 'wifi_realtek']}
+# declared by each device class in numap.dev.registry
+STRING_LOCATIONS = get_string_locations()
+
 
 class NumapStringsApp(NumapApp):
 
@@ -2,12 +2,13 @@
 Scan USB host for vendor specific device support
 
 Usage:
-    numapvsscan [-P=PHY_INFO] [-q] [-d=DB_FILE] [-s=VID:PID] [-t=TIMEOUT] [-z|-b=DELAY] [-r=RESUME_FILE] [-o=OS]  [-e] [-v ...]
+    numapvsscan [-P=PHY_INFO] [-q] [--capture=FILE] [-d=DB_FILE] [-s=VID:PID] [-t=TIMEOUT] [-z|-b=DELAY] [-r=RESUME_FILE] [-o=OS]  [-e] [-v ...]
 
 Options:
     -P --phy PHY_INFO           physical layer info, see list below
     -v --verbose                verbosity level
     -q --quiet                  quiet mode. only print warning/error messages
+    --capture FILE              record the USB traffic to a pcap file (usbmon format)
     -d --db DB_FILE             vid, pid database file (see DB_FILE below)
     -s --vid_pid VID:PID        specific VID:PID combination scan
     -t --timeout TIMEOUT        seconds to wait for host to detect each device (defualt: 3)
@@ -19,7 +20,9 @@ Options:
 
 Physical layer:
     fd:<serial_port>        use facedancer connected to given serial port
-    gadgetfs                use gadgetfs (requires mounting of gadgetfs beforehand)
+    gadgetfs[:<mountpoint>] use gadgetfs (requires mounting of gadgetfs beforehand)
+    functionfs[:<name>]     use a FunctionFS gadget on the first UDC (requires libcomposite)
+    virtual                 no hardware, the device only answers requests made in-process
 
 DB_FILE:
     a python file with a db member which is a list of DBEntry() objects.
@@ -45,7 +48,6 @@ import sys
 import six
 from six.moves import cPickle
 from numap.apps.base import NumapApp
-from numap.dev.vendor_specific import USBVendorSpecificDevice
 
 
 class OS(object):
@@ -220,6 +222,8 @@ class NumapVSScanApp(NumapApp):
             self.logger.always('%s (%s)' % (self.scan_session.db[i], pvp))
 
     def run(self):
+        # imported here, so the usage and the scan database do not need facedancer
+        from numap.dev.vendor_specific import USBVendorSpecificDevice
         self.build_scan_session()
         self.logger.always('Scanning host for supported vendor specific devices')
         phy = self.load_phy(self.options['--phy'])
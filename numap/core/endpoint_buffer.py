@@ -0,0 +1,184 @@
+'''
+Bounded buffers for the data a device sends on its IN endpoints.
+
+The producer (a request handler, a coroutine of the runtime or one of its
+worker threads) puts data, the handle_buffer_available handler of the
+endpoint gets the next transfer. The queue is changed under a condition
+lock, so clear() can be called from either side; a producer that waits
+for room is woken by get(), clear() and close().
+'''
+import time
+import weakref
+import threading
+from collections import deque, namedtuple
+
+EndpointStats = namedtuple(
+    'EndpointStats', ['name', 'queued', 'high_water', 'dropped', 'sent', 'puts', 'transfers']
+)
+EndpointStats.__doc__ = '''
+Counters of an endpoint buffer, in bytes (puts and transfers are counts).
+dropped includes the data discarded by clear().
+'''
+
+_buffers = weakref.WeakSet()
+
+
+def get_buffer_stats():
+    '''
+    :return: list of EndpointStats of all endpoint buffers, sorted by name
+    '''
+    return sorted((buffer.stats for buffer in list(_buffers)), key=lambda stats: stats.name)
+
+
+class EndpointBuffer(object):
+    '''
+    Bounded FIFO of IN data, with packet size aware chunking
+    '''
+
+    def __init__(self, name, capacity=0x10000, max_packet_size=0x40, max_transfer=0x4000, stream=False):
+        '''
+        :param name: name of the buffer, for the statistics
+        :param capacity: maximum number of queued bytes (default: 0x10000)
+        :param max_packet_size: max packet size of the endpoint (default: 0x40)
+        :param max_transfer: maximum size of a transfer returned by get (default: 0x4000)
+        :param stream: whether the data is a byte stream (default: False).
+                       Messages are split at max_transfer, and only coalesced while they
+                       end on a packet boundary, so a short packet still ends the transfer.
+                       A stream is returned in chunks of any size, parts of a put
+                       that do not fit are dropped.
+        '''
+        self.name = name
+        self.capacity = capacity
+        self.requested_max_transfer = max_transfer
+        self.set_max_packet_size(max_packet_size)
+        self.stream = stream
+        self.items = deque()
+        # consumed bytes of the first item, only used by the consumer
+        self.offset = 0
+        # written by the producer
+        self.put_bytes = 0
+        self.dropped = 0
+        self.puts = 0
+        self.high_water = 0
+        # written by the consumer
+        self.sent = 0
+        self.discarded = 0
+        self.transfers = 0
+        self.closed = False
+        # signalled when room is made or the buffer is closed
+        self.not_full = threading.Condition()
+        _buffers.add(self)
+
+    def __len__(self):
+        return self.put_bytes - self.sent - self.discarded
+
+    def set_max_packet_size(self, max_packet_size):
+        '''
+        :param max_packet_size: max packet size of the endpoint at the speed of the connection
+        '''
+        self.max_packet_size = max_packet_size
+        max_transfer = self.requested_max_transfer
+        self.max_transfer = max(max_transfer - max_transfer % max_packet_size, max_packet_size)
+
+    def room(self):
+        return max(self.capacity - len(self), 0)
+
+    @property
+    def stats(self):
+        return EndpointStats(
+            self.name, len(self), self.high_water, self.dropped + self.discarded, self.sent, self.puts, self.transfers
+        )
+
+    def put(self, data, block=False, timeout=None):
+        '''
+        :param data: data to queue (not copied, must not be modified afterwards)
+        :param block: wait for room instead of dropping, not from the thread of the consumer (default: False)
+        :param timeout: maximum seconds to wait for room (default: None, no limit)
+        :return: number of bytes queued
+        '''
+        size = len(data)
+        with self.not_full:
+            if block:
+                deadline = None if timeout is None else time.time() + timeout
+                # a message larger than the capacity is queued once the buffer is empty
+                while size > self.room() and len(self) and not self.closed:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self.not_full.wait(remaining)
+            room = self.room()
+            if size > room and (self.stream or len(self)):
+                if not self.stream:
+                    self.dropped += size
+                    return 0
+                self.dropped += size - room
+                data = data[:room]
+                size = room
+            if not size and self.stream:
+                return 0
+            self.items.append(data)
+            self.puts += 1
+            self.put_bytes += size
+            queued = len(self)
+            if queued > self.high_water:
+                self.high_water = queued
+            return size
+
+    def get(self, size=None):
+        '''
+        :param size: maximum number of bytes (default: None, max_transfer)
+        :return: data of the next transfer, None if the buffer is empty
+        '''
+        if not self.items:
+            return None
+        with self.not_full:
+            data = self._get(self.max_transfer if size is None else size)
+            self.not_full.notify_all()
+        return data
+
+    def _get(self, size):
+        if not self.items:
+            # cleared by the other side
+            return None
+        chunks = []
+        taken = 0
+        while self.items and taken < size:
+            item = self.items[0]
+            if not len(item) and not self.stream:
+                # an explicit zero length packet is a transfer of its own
+                if not taken:
+                    self.items.popleft()
+                break
+            part = memoryview(item)[self.offset:self.offset + size - taken]
+            chunks.append(part)
+            taken += len(part)
+            self.offset += len(part)
+            if self.offset < len(item):
+                break
+            self.items.popleft()
+            self.offset = 0
+            if not self.stream and taken % self.max_packet_size:
+                # the message ended with a short packet, which ends the transfer
+                break
+        self.sent += taken
+        self.transfers += 1
+        return b''.join(chunks)
+
+    def clear(self):
+        '''
+        Drop the queued data (e.g. on reset)
+        '''
+        with self.not_full:
+            while self.items:
+                item = self.items.popleft()
+                self.discarded += len(item) - self.offset
+                self.offset = 0
+            self.not_full.notify_all()
+
+    def close(self):
+        '''
+        Release producers that wait for room
+        '''
+        with self.not_full:
+            self.closed = True
+            self.not_full.notify_all()
@@ -0,0 +1,273 @@
+'''
+asyncio runtime of a device.
+
+The PHY is still serviced synchronously: service_irqs() calls the endpoint
+handlers, which must not block. Between the calls the runtime waits for the
+event fds of the PHY in the event loop, so the coroutines keep running. Work that takes longer (SCSI commands,
+backend I/O) runs in coroutines of the runtime, fed by bounded
+EndpointStreams. While a stream is full the PHY is not serviced, so the
+host sees NAKs instead of the device queueing without limit.
+'''
+import asyncio
+import logging
+from collections import deque
+from numap.core.endpoint_buffer import get_buffer_stats
+
+
+class EndpointStream(object):
+    '''
+    Bounded FIFO from an endpoint handler (synchronous) to a coroutine
+    '''
+
+    def __init__(self, name, maxsize=64):
+        '''
+        :param name: name of the stream, for logging
+        :param maxsize: maximum number of queued items (default: 64)
+        '''
+        self.name = name
+        self.maxsize = maxsize
+        self.items = deque()
+        self.waiter = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def full(self):
+        return len(self.items) >= self.maxsize
+
+    def put_nowait(self, item):
+        '''
+        :param item: item to queue
+
+        .. note:: data the host already sent is never dropped, the runtime
+                  keeps the stream near maxsize by not servicing the PHY
+        '''
+        self.items.append(item)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def get(self):
+        '''
+        :return: the next item, waits until there is one
+        '''
+        while not self.items:
+            self.waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self.waiter
+            finally:
+                self.waiter = None
+        return self.items.popleft()
+
+    def get_nowait(self):
+        return self.items.popleft()
+
+    def clear(self):
+        self.items.clear()
+
+
+class DeviceRuntime(object):
+    '''
+    Runs the PHY service loop and the coroutines of a device in one event loop
+    '''
+
+    def __init__(self, app, phy, idle_sleep=0.0005):
+        '''
+        :param app: numap application
+        :param phy: physical connection
+        :param idle_sleep: seconds to wait while a stream is full (default: 0.0005)
+        '''
+        self.app = app
+        self.phy = phy
+        self.idle_sleep = idle_sleep
+        self.logger = logging.getLogger('numap')
+        self.streams = []
+        self.coroutines = []
+        self.stop_callbacks = []
+        self.tasks = []
+        self.loop = None
+        self.stop_event = None
+        self.stop_requested = False
+        # future that wait_phy() waits on, resolved when the PHY has events
+        self.phy_waiter = None
+
+    def stream(self, name, maxsize=64):
+        '''
+        :param name: name of the stream
+        :param maxsize: maximum number of queued items (default: 64)
+        :return: new EndpointStream, the PHY is not serviced while it is full
+        '''
+        return self.watch(EndpointStream(name, maxsize))
+
+    def watch(self, stream):
+        '''
+        :param stream: EndpointStream, the PHY is not serviced while it is full
+        :return: the stream
+        '''
+        self.streams.append(stream)
+        return stream
+
+    def spawn(self, coroutine_function, *args):
+        '''
+        Run a coroutine while the device runs
+
+        :param coroutine_function: async function to call
+        :param args: arguments for the function
+        '''
+        self.coroutines.append((coroutine_function, args))
+        if self.loop is not None:
+            task = self.loop.create_task(coroutine_function(*args))
+            task.add_done_callback(self.check_task)
+            self.tasks.append(task)
+
+    def at_stop(self, callback):
+        '''
+        :param callback: called when the device stops, before the coroutines are cancelled
+                         (e.g. to release worker threads that wait for the host)
+        '''
+        self.stop_callbacks.append(callback)
+
+    def adopt(self, other):
+        '''
+        Run the streams and coroutines of another runtime in this one,
+        for devices that are served through a parent device (hub, composite)
+
+        :param other: DeviceRuntime of the other device
+        '''
+        for stream in other.streams:
+            self.watch(stream)
+        for coroutine_function, args in other.coroutines:
+            self.spawn(coroutine_function, *args)
+        self.stop_callbacks.extend(other.stop_callbacks)
+        other.streams = []
+        other.coroutines = []
+        other.stop_callbacks = []
+
+    async def run_blocking(self, func, *args):
+        '''
+        Run a blocking function (disk, TAP or PTY I/O) in a worker thread
+
+        :return: the return value of the function
+        '''
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def wait_readable(self, fd):
+        '''
+        :param fd: file descriptor (e.g. of a TAP interface or a PTY), waits until it can be read
+        '''
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        loop.add_reader(fd, lambda: future.done() or future.set_result(None))
+        try:
+            await future
+        finally:
+            loop.remove_reader(fd)
+
+    async def wait_writable(self, fd):
+        '''
+        :param fd: file descriptor (e.g. of a PTY), waits until it can be written
+        '''
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        loop.add_writer(fd, lambda: future.done() or future.set_result(None))
+        try:
+            await future
+        finally:
+            loop.remove_writer(fd)
+
+    def stop(self):
+        '''
+        Stop the runtime, can be called from any thread
+        '''
+        self.stop_requested = True
+        if self.loop is not None and self.stop_event is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+            self.loop.call_soon_threadsafe(self.wake_phy)
+
+    async def stopped(self):
+        '''
+        Wait until the device is stopped, by stop() or because app.should_stop_phy() returned True
+        '''
+        await self.stop_event.wait()
+
+    def backpressure(self):
+        return any(stream.full() for stream in self.streams)
+
+    async def service(self):
+        while not self.stop_event.is_set():
+            if self.app.should_stop_phy():
+                self.stop_event.set()
+                break
+            if self.backpressure():
+                await asyncio.sleep(self.idle_sleep)
+                continue
+            self.phy.service_irqs()
+            # let the coroutines run between the PHY events
+            await self.wait_phy()
+
+    async def wait_phy(self):
+        '''
+        Wait until the PHY has events, or for its idle timeout
+        (PHYs without get_idle_timeout wait in service_irqs)
+        '''
+        timeout = self.phy.get_idle_timeout() if hasattr(self.phy, 'get_idle_timeout') else 0
+        if not timeout:
+            await asyncio.sleep(0)
+            return
+        fds = self.phy.get_event_fds()
+        self.phy_waiter = self.loop.create_future()
+        for fd in fds:
+            self.loop.add_reader(fd, self.wake_phy)
+        try:
+            await asyncio.wait([self.phy_waiter], timeout=timeout)
+        finally:
+            for fd in fds:
+                self.loop.remove_reader(fd)
+            self.phy_waiter.cancel()
+            self.phy_waiter = None
+
+    def wake_phy(self):
+        if self.phy_waiter is not None and not self.phy_waiter.done():
+            self.phy_waiter.set_result(None)
+
+    def check_task(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error('Device task failed: %s' % task.exception())
+            self.stop_event.set()
+
+    async def main(self):
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        if self.stop_requested:
+            self.stop_event.set()
+        self.tasks = [self.loop.create_task(function(*args)) for function, args in self.coroutines]
+        for task in self.tasks:
+            task.add_done_callback(self.check_task)
+        try:
+            # errors of the PHY are raised to the caller of run()
+            await self.service()
+        finally:
+            for callback in self.stop_callbacks:
+                callback()
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            self.loop = None
+            self.tasks = []
+            self.stop_requested = False
+            self.report()
+
+    def report(self):
+        '''
+        Log the counters of the endpoint buffers
+        '''
+        for stats in get_buffer_stats():
+            log = self.logger.warning if stats.dropped else self.logger.debug
+            log('Endpoint buffer %s: %d bytes sent in %d transfers, high water %d, %d dropped, %d queued' % (
+                stats.name, stats.sent, stats.transfers, stats.high_water, stats.dropped, stats.queued
+            ))
+
+    def run(self):
+        '''
+        Service the PHY and run the coroutines until the device is stopped
+        '''
+        asyncio.run(self.main())
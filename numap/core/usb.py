@@ -20,6 +20,7 @@ class DescriptorType(object):
     device_qualifier = 0x06
     other_speed_configuration = 0x07
     interface_power = 0x08
+    interface_association = 0x0b
     bos = 0x0f
     device_capability = 0x10
     hid = 0x21
@@ -27,6 +28,24 @@ class DescriptorType(object):
     cs_interface = 0x24
     cs_endpoint = 0x25
     hub = 0x29
+    superspeed_endpoint_companion = 0x30
+
+
+def get_speed(phy):
+    '''
+    :param phy: physical connection
+    :return: speed of the connection ('fullspeed', 'highspeed' or 'superspeed'),
+             full speed unless the phy reports another one
+    '''
+    return getattr(phy, 'speed', None) or 'fullspeed'
+
+
+def get_supported_speeds(phy):
+    '''
+    :param phy: physical connection
+    :return: tuple of the speeds that the phy can connect at
+    '''
+    return tuple(getattr(phy, 'speeds', None) or ('fullspeed',))
 
 
 class USB(object):
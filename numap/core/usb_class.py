@@ -27,7 +27,7 @@ class USBClass(USBBaseActor):
     Billboard = 0x11
     DiagnosticDevice = 0xdc
     WirelessController = 0xe0
-    Miscellaneous = 0xed
+    Miscellaneous = 0xef
     ApplicationSpecific = 0xfe
     VendorSpecific = 0xff
 
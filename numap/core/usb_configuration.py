@@ -33,8 +33,49 @@ class USBConfiguration(USBBaseActor, BaseUSBConfiguration):
         :param string: configuration string
         :param interfaces: list of interfaces for this configuration
         :param attributes: configuratioin attributes. one or more of USBConfiguration.ATTR_* (default: ATTR_SELF_POWERED)
-        :param max_power: maximum power consumption of this configuration (default: 0x32)
+        :param max_power: maximum power consumption of this configuration, in 2 mA units (default: 0x32)
         '''
 
         USBBaseActor.__init__(self, app, phy)
         BaseUSBConfiguration.__init__(self, index, string, interfaces, attributes, max_power)
+        self.configuration_index = index
+        self.attributes = attributes
+        self.max_power = max_power
+
+    # see Table 9-10 of USB 2.0 spec and section 9.6.3 of USB 3.1 spec
+    @mutable('configuration_descriptor')
+    def get_descriptor(self, usb_type='fullspeed', valid=False):
+        return self._get_descriptor(DescriptorType.configuration, usb_type, valid)
+
+    @mutable('other_speed_configuration_descriptor')
+    def get_other_speed_descriptor(self, usb_type='fullspeed', valid=False):
+        '''
+        :param usb_type: the speed the device is not running at
+        '''
+        return self._get_descriptor(DescriptorType.other_speed_configuration, usb_type, valid)
+
+    def _get_descriptor(self, descriptor_type, usb_type, valid):
+        interface_descriptors = b''
+        for i in self.interfaces:
+            interface_descriptors += i.get_descriptor(usb_type, valid)
+        bLength = 9
+        wTotalLength = len(interface_descriptors) + bLength
+        # alternate settings are separate interface instances with the same number
+        bNumInterfaces = len(set(i.number for i in self.interfaces))
+        if usb_type == 'superspeed':
+            # 8 mA units instead of 2 mA
+            bMaxPower = (self.max_power + 3) // 4
+        else:
+            bMaxPower = self.max_power
+        d = struct.pack(
+            '<BBHBBBBB',
+            bLength,
+            descriptor_type,
+            wTotalLength & 0xffff,
+            bNumInterfaces,
+            self.configuration_index,
+            getattr(self, 'configuration_string_index', 0),
+            self.attributes,
+            bMaxPower & 0xff
+        )
+        return d + interface_descriptors
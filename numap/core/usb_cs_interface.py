@@ -57,6 +57,15 @@ class USBCSInterface(USBBaseActor):
         self.phy.send_on_endpoint(0, b'')
         self.debug('Received an unknown USBCSInterface request: %s, returned an empty response' % req)
 
+    def renumber_interfaces(self, numbers):
+        '''
+        Called when the interfaces are renumbered (e.g. in a composite device),
+        descriptors that refer to interfaces update their fields
+
+        :param numbers: dictionary (old interface number: new interface number)
+        '''
+        pass
+
     def get_descriptor(self, usb_type='fullspeed', valid=False):
         descriptor_type = DescriptorType.cs_interface
         length = len(self.cs_config) + 2
@@ -6,8 +6,11 @@
 
 import traceback
 import struct
-from numap.core.usb import DescriptorType, State, Request
+from numap.core.usb import DescriptorType, State, Request, get_speed, get_supported_speeds
 from numap.core.usb_base import USBBaseActor
+from numap.core.usb_bos import USBBinaryObjectStore
+from numap.core.usb_device_capability import DCUsb20Extension, DCSuperspeedUsb
+from numap.core.runtime import DeviceRuntime
 from numap.fuzz.helpers import mutable
 
 from facedancer.USBDevice import USBDevice as BaseUSBDevice
@@ -38,7 +41,11 @@ class USBDevice(USBBaseActor, BaseUSBDevice):
         :param descriptors: dict of handler for descriptor requests (default: None)
         :param usb_class: USBClass instance (default: None)
         :param usb_vendor: USB device vendor (default: None)
-        :param bos: USBBinaryStoreObject instance (default: None)
+        :param bos: USBBinaryStoreObject instance (default: None,
+                    one is built for the speeds of the phy if bcdUSB is 0x0210 or higher)
+
+        .. note:: the descriptors of each speed are derived from the same configurations,
+                  bcdUSB defaults to the highest speed that the phy supports
         '''
 
         if configurations is None:
@@ -56,7 +63,7 @@ class USBDevice(USBBaseActor, BaseUSBDevice):
 
         self.strings = []
 
-        self.usb_spec_version = 0x0100
+        self._usb_spec_version = None
         self._device_class = device_class
         self.device_subclass = device_subclass
         self.protocol_rel_num = protocol_rel_num
@@ -115,7 +122,50 @@ class USBDevice(USBBaseActor, BaseUSBDevice):
         self.address = 0
         self.endpoints = {}
 
-        self.scheduler.add_task(lambda: self.stop() if self.app.should_stop_phy() else None)
+        self.runtime = DeviceRuntime(app, phy)
+
+    @property
+    def speeds(self):
+        '''
+        Speeds that the device can run at, those of the phy
+        '''
+        return get_supported_speeds(self.phy)
+
+    @property
+    def speed(self):
+        '''
+        Speed of the current connection
+        '''
+        return get_speed(self.phy)
+
+    @property
+    def usb_spec_version(self):
+        '''
+        bcdUSB of the current connection
+        '''
+        return self.get_usb_spec_version(self.speed)
+
+    @usb_spec_version.setter
+    def usb_spec_version(self, value):
+        self._usb_spec_version = value
+
+    def get_usb_spec_version(self, usb_type):
+        '''
+        :param usb_type: speed of the connection
+        :return: bcdUSB for a connection at this speed
+        '''
+        if self._usb_spec_version is not None:
+            version = self._usb_spec_version
+        elif 'superspeed' in self.speeds:
+            version = 0x0300
+        elif 'highspeed' in self.speeds:
+            version = 0x0200
+        else:
+            version = 0x0100
+        if usb_type != 'superspeed' and version >= 0x0300:
+            # a SuperSpeed device that runs at full or high speed (USB 3.1 spec, section 9.6.1)
+            return 0x0210
+        return version
 
     def get_string_id(self, s):
         try:
@@ -152,6 +202,15 @@ class USBDevice(USBBaseActor, BaseUSBDevice):
         self.phy.disconnect()
         self.state = State.detached
 
+    def run(self):
+        '''
+        Service the phy until app.should_stop_phy() returns True or stop() is called
+        '''
+        self.runtime.run()
+
+    def stop(self):
+        self.runtime.stop()
+
     def ack_status_stage(self):
         self.phy.ack_status_stage()
 
@@ -159,7 +218,11 @@ class USBDevice(USBBaseActor, BaseUSBDevice):
     def get_descriptor(self, index=0, valid=False):
         bLength = 18
         bDescriptorType = 1
-        bMaxPacketSize0 = self.max_packet_size_ep0
+        if self.speed == 'superspeed':
+            # 2^9 = 512 bytes
+            bMaxPacketSize0 = 9
+        else:
+            bMaxPacketSize0 = self.max_packet_size_ep0
         d = struct.pack(
             '<BBHBBBBHHHBBBB',
             bLength,
@@ -183,6 +246,9 @@ class USBDevice(USBBaseActor, BaseUSBDevice):
     #####################################################
     @mutable('device_qualifier_descriptor')
     def get_device_qualifier_descriptor(self, n):
+        if 'highspeed' not in self.speeds:
+            # full speed only devices stall the request (USB 2.0 spec, section 9.6.2)
+            return None
         bDescriptorType = 6
         bNumConfigurations = len(self.configurations)
         bReserved = 0
@@ -191,7 +257,8 @@ class USBDevice(USBBaseActor, BaseUSBDevice):
         d = struct.pack(
             '<BHBBBBBB',
             bDescriptorType,
-            self.usb_spec_version,
+            # the qualifier describes the other of full and high speed
+            self.get_usb_spec_version('highspeed'),
             self._device_class,
             self.device_subclass,
             self.protocol_rel_num,
@@ -234,24 +301,57 @@ class USBDevice(USBBaseActor, BaseUSBDevice):
     # No need to mutate this one, will mutate
     # USBConfiguration.get_descriptor instead
     #
-    def get_configuration_descriptor(self, num):
+    def get_configuration_descriptor(self, num, usb_type=None):
+        '''
+        :param num: configuration index
+        :param usb_type: speed of the descriptor (default: None, speed of the current connection)
+        '''
+        if usb_type is None:
+            usb_type = self.speed
         if num < len(self.configurations):
-            return self.configurations[num].get_descriptor()
+            return self.configurations[num].get_descriptor(usb_type)
         else:
-            return self.configurations[0].get_descriptor()
+            return self.configurations[0].get_descriptor(usb_type)
 
     def get_other_speed_configuration_descriptor(self, num):
+        # only exists for the other of full and high speed
+        if self.speed == 'highspeed':
+            usb_type = 'fullspeed'
+        elif self.speed == 'fullspeed' and 'highspeed' in self.speeds:
+            usb_type = 'highspeed'
+        else:
+            return None
         if num < len(self.configurations):
-            return self.configurations[num].get_other_speed_descriptor()
+            return self.configurations[num].get_other_speed_descriptor(usb_type)
         else:
-            return self.configurations[0].get_other_speed_descriptor()
+            return self.configurations[0].get_other_speed_descriptor(usb_type)
 
     def get_bos_descriptor(self, num):
+        if self.bos is None and self.usb_spec_version >= 0x0210:
+            self.bos = self.build_bos()
         if self.bos:
-            return self.bos.get_descriptor()
+            return self.bos.get_descriptor(self.speed)
         # no bos? stall ep
         return None
 
+    def build_bos(self):
+        '''
+        :return: USBBinaryObjectStore with the capabilities of the speeds of the phy
+        '''
+        capabilities = [DCUsb20Extension(self.app, self.phy)]
+        if 'superspeed' in self.speeds:
+            capabilities.append(DCSuperspeedUsb(
+                self.app, self.phy,
+                attributes=0,
+                # full, high and SuperSpeed
+                speeds_supported=0x0e,
+                # lowest speed with all functionality: full speed
+                functionality_support=1,
+                u1dev_exit_lat=0x0a,
+                u2dev_exit_lat=0x07ff,
+            ))
+        return USBBinaryObjectStore(self.app, self.phy, capabilities)
+
     @mutable('string_descriptor_zero')
     def get_string0_descriptor(self):
         d = struct.pack(
@@ -2,6 +2,7 @@
 #
 # Contains class definition for USBEndpoint.
 import struct
+from numap.core.usb import DescriptorType, get_speed
 from numap.core.usb_base import USBBaseActor
 from numap.fuzz.helpers import mutable
 
@@ -37,8 +38,9 @@ class USBEndpoint(USBBaseActor):
         :param transfer_type: one of USBEndpoint.transfer_type\*
         :param sync_type: one of USBEndpoint.sync_type\*
         :param usage_type: on of USBEndpoint.usage_type\*
-        :param max_packet_size: maximum size of a packet
-        :param interval: TODO
+        :param max_packet_size: maximum size of a packet at full speed
+                                (bulk endpoints use 512 bytes at high speed and 1024 at SuperSpeed)
+        :param interval: polling interval in frames (ms) at full speed
         :type handler:
             func(data) -> None if direction is out,
             func() -> None if direction is IN
@@ -92,8 +94,9 @@ class USBEndpoint(USBBaseActor):
             ((self.usage_type & 0x03) << 4)
         )
         bLength = 7
-        bDescriptorType = 5
+        bDescriptorType = DescriptorType.endpoint
         wMaxPacketSize = self._get_max_packet_size(usb_type)
+        bInterval = self._get_interval(usb_type)
         d = struct.pack(
             '<BBBBHB',
             bLength,
@@ -101,13 +104,60 @@ class USBEndpoint(USBBaseActor):
             self.address,
             attributes,
             wMaxPacketSize,
-            self.interval
+            bInterval
         )
+        if usb_type == 'superspeed':
+            d += self.get_companion_descriptor()
         for cs in self.cs_endpoints:
             d += cs.get_descriptor()
         return d
 
+    # see section 9.6.7 of USB 3.1 spec
+    def get_companion_descriptor(self):
+        bLength = 6
+        bDescriptorType = DescriptorType.superspeed_endpoint_companion
+        bMaxBurst = 0
+        bmAttributes = 0
+        if self.transfer_type in (self.transfer_type_interrupt, self.transfer_type_isochronous):
+            wBytesPerInterval = self._get_max_packet_size('superspeed')
+        else:
+            wBytesPerInterval = 0
+        return struct.pack(
+            '<BBBBH',
+            bLength,
+            bDescriptorType,
+            bMaxBurst,
+            bmAttributes,
+            wBytesPerInterval
+        )
+
+    def get_max_packet_size(self):
+        '''
+        :return: max packet size at the speed of the current connection
+        '''
+        return self._get_max_packet_size(get_speed(self.phy))
+
     def _get_max_packet_size(self, usb_type):
-        if usb_type == 'highspeed':
-            return 512
-        return self.max_packet_size
+        if self.transfer_type == self.transfer_type_bulk:
+            if usb_type == 'highspeed':
+                return 512
+            if usb_type == 'superspeed':
+                return 1024
+            return min(self.max_packet_size, 64)
+        if usb_type == 'fullspeed':
+            if self.transfer_type == self.transfer_type_isochronous:
+                return min(self.max_packet_size, 1023)
+            return min(self.max_packet_size, 64)
+        return min(self.max_packet_size, 1024)
+
+    def _get_interval(self, usb_type):
+        if usb_type == 'fullspeed' or not self.interval:
+            return self.interval
+        # high speed and SuperSpeed intervals are 2^(bInterval-1) microframes (125 us)
+        if self.transfer_type == self.transfer_type_isochronous:
+            # full speed isochronous intervals are 2^(bInterval-1) frames (1 ms)
+            return min(self.interval + 3, 16)
+        if self.transfer_type == self.transfer_type_interrupt:
+            # use the largest one that is not longer than the full speed interval
+            return min((self.interval * 8).bit_length(), 16)
+        return self.interval
@@ -10,7 +10,6 @@ headset.
 However, it does not contain alternate settings for the interfaces
 and no HID interface (as we don't really need it here)
 '''
-from six.moves.queue import Queue
 from numap.core.usb_class import USBClass
 from numap.core.usb_configuration import USBConfiguration
 from numap.core.usb_cs_endpoint import USBCSEndpoint
@@ -19,6 +18,9 @@ from numap.core.usb_device import USBDevice
 from numap.core.usb_endpoint import USBEndpoint
 from numap.core.usb_interface import USBInterface
 from numap.fuzz.helpers import mutable
+from numap.utils.audio import (
+    AudioFormat, PacketSizer, StreamStats, SilenceSource, ToneSource, WaveSource, WaveSink, NullSink
+)
 
 
 SUBCLASS_UNDEFINED = 0x00
@@ -112,22 +114,115 @@ class USBAudioClass(USBClass):
 
 
 class AudioStreaming(object):
-
-    def __init__(self, app, phy, tx_ep, rx_ep):
+    '''
+    Streams PCM data on the isochronous endpoints at the sample rate the host selected
+    '''
+
+    SAMPLING_FREQ_CONTROL = 0x0100
+
+    def __init__(self, app, phy, tx_ep, rx_ep, source=None, sink=None, stats_interval=5.0):
+        '''
+        :param tx_ep: number of the IN (capture) endpoint
+        :param rx_ep: number of the OUT (playback) endpoint
+        :param source: capture source: None for silence, 'tone[:<frequency>]' or a WAV file (default: None)
+        :param sink: WAV file for the playback data (default: None, discard it)
+        :param stats_interval: seconds between stream reports (default: 5.0)
+        '''
         self.app = app
         self.phy = phy
         self.tx_ep = tx_ep
         self.rx_ep = rx_ep
-        self.txq = Queue()
+        self.source_spec = source
+        self.sink_spec = sink
+        self.stats_interval = stats_interval
+        self.usb_class = None
+        self.source = None
+        self.sink = NullSink()
+
+    def attach(self, usb_class, tx_interface, rx_interface):
+        '''
+        Take the stream formats and packet sizes from the streaming interfaces
+
+        :param usb_class: USBAudioClass, holds the sample rates set by the host
+        :param tx_interface: streaming interface of the IN endpoint
+        :param rx_interface: streaming interface of the OUT endpoint
+        '''
+        self.usb_class = usb_class
+        self.tx_endpoint = tx_interface.endpoints[0]
+        self.rx_endpoint = rx_interface.endpoints[0]
+        self.tx_format = self._get_format(tx_interface)
+        self.rx_format = self._get_format(rx_interface)
+        self._setup_tx()
+        self._setup_rx()
+        if self.sink_spec:
+            self.sink = WaveSink(self.sink_spec, self.rx_format)
+
+    def _get_format(self, interface):
+        for cs_interface in interface.cs_interfaces:
+            if cs_interface.cs_config[:1] == b'\x02':
+                return AudioFormat.from_format_type(cs_interface.cs_config)
+        raise Exception('No format type descriptor in audio streaming interface %d' % interface.number)
+
+    def _setup_tx(self):
+        fmt = self.tx_format
+        self.sizer = PacketSizer(fmt, self.tx_endpoint.max_packet_size, self.tx_endpoint.interval)
+        self.tx_stats = StreamStats(self.sizer.period, self.stats_interval)
+        if fmt.rate > self.sizer.max_rate:
+            self.app.logger.warning(
+                '[AudioStreaming] %s does not fit in %d byte packets, packets are clipped' % (fmt, self.sizer.max_packet_size)
+            )
+        if not self.source_spec:
+            self.source = SilenceSource(fmt)
+        elif self.source_spec.split(':')[0] == 'tone':
+            frequency = int(self.source_spec.split(':')[1]) if ':' in self.source_spec else 440
+            self.source = ToneSource(fmt, frequency)
+        else:
+            self.source = WaveSource(self.source_spec, fmt)
+
+    def _setup_rx(self):
+        sizer = PacketSizer(self.rx_format, self.rx_endpoint.max_packet_size, self.rx_endpoint.interval)
+        self.rx_stats = StreamStats(sizer.period, self.stats_interval)
+
+    def _get_rate(self, endpoint):
+        try:
+            rate = self.usb_class._settings[(self.SAMPLING_FREQ_CONTROL, endpoint.address)][0]
+        except KeyError:
+            return None
+        return int.from_bytes(bytes(rate[:3]), 'little')
 
     def buffer_available(self):
-        if self.txq.empty():
-            self.phy.send_on_endpoint(self.tx_ep, b'\x00\x00\x00\x00\x00\x00\x00\x00')
-        else:
-            self.phy.send_on_endpoint(self.tx_ep, self.txq.get())
+        rate = self._get_rate(self.tx_endpoint)
+        if rate and rate != self.tx_format.rate:
+            self.app.logger.info('[AudioStreaming] Capture sample rate set to %d Hz' % rate)
+            self.tx_format.rate = rate
+            self._setup_tx()
+        size = self.sizer.next_size()
+        data = self.source.read(size)
+        underrun = len(data) < size
+        if underrun:
+            data += bytes(size - len(data))
+        self.phy.send_on_endpoint(self.tx_ep, data)
+        self.tx_stats.add(size, underrun)
+        self._report('capture', self.tx_stats)
 
     def data_available(self, data):
-        self.app.logger.info('[AudioStreaming] Got %#x bytes on streaming endpoint' % (len(data)))
+        rate = self._get_rate(self.rx_endpoint)
+        if rate and rate != self.rx_format.rate:
+            self.app.logger.info('[AudioStreaming] Playback sample rate set to %d Hz' % rate)
+            self.rx_format.rate = rate
+            self._setup_rx()
+            self.sink.set_rate(rate)
+        self.sink.write(data)
+        self.rx_stats.add(len(data))
+        self._report('playback', self.rx_stats)
+
+    def _report(self, direction, stats):
+        report = stats.poll()
+        if report:
+            self.app.logger.info('[AudioStreaming] %s: %s' % (direction, report))
+
+    def close(self):
+        self.sink.close()
 
 
 class USBAudioStreamingInterface(USBInterface):
@@ -152,6 +247,22 @@ class USBAudioStreamingInterface(USBInterface):
         return super(USBAudioStreamingInterface, self).get_descriptor(usb_type, valid)
 
 
+class USBAudioControlHeader(USBCSInterface):
+    '''
+    Class specific AC interface header (4.3.2), lists the streaming interfaces
+    '''
+
+    def __init__(self, app, phy, cs_config):
+        super(USBAudioControlHeader, self).__init__('ACHeader', app, phy, cs_config)
+
+    def renumber_interfaces(self, numbers):
+        # bDescriptorSubtype, bcdADC, wTotalLength, bInCollection, baInterfaceNr(1..n)
+        cs_config = bytearray(self.cs_config)
+        for offset in range(6, min(6 + cs_config[5], len(cs_config))):
+            cs_config[offset] = numbers.get(cs_config[offset], cs_config[offset])
+        self.cs_config = bytes(cs_config)
+
+
 class USBAudioControlInterface(USBInterface):
 
     def __init__(self, app, phy, iface_num, iface_alt, iface_str_idx, cs_ifaces, usb_class):
@@ -177,8 +288,12 @@ class USBAudioDevice(USBDevice):
 
     name = 'AudioDevice'
 
-    def __init__(self, app, phy, vid=0x0d8c, pid=0x000c, rev=0x0001, *args, **kwargs):
-        audio_streaming = AudioStreaming(app, phy, 2, 1)
+    def __init__(self, app, phy, vid=0x0d8c, pid=0x000c, rev=0x0001, audio_source=None, audio_sink=None, *args, **kwargs):
+        '''
+        :param audio_source: capture source, None for silence, 'tone[:<frequency>]' or a WAV file (default: None)
+        :param audio_sink: WAV file for the playback data (default: None)
+        '''
+        audio_streaming = AudioStreaming(app, phy, 2, 1, audio_source, audio_sink)
         usb_class = USBAudioClass(app, phy)
         super(USBAudioDevice, self).__init__(
             app=app,
@@ -205,7 +320,7 @@ class USBAudioDevice(USBDevice):
                             app=app, phy=phy, iface_num=0, iface_alt=0, iface_str_idx=0,
                             cs_ifaces=[
                                 # Class specific AC interface: header (4.3.2)
-                                USBCSInterface('ACHeader', app, phy, b'\x01\x00\x01\x64\x00\x02\x01\x02'),
+                                USBAudioControlHeader(app, phy, b'\x01\x00\x01\x64\x00\x02\x01\x02'),
                                 # Class specific AC interface: input terminal (Table 4.3.2.1)
                                 USBCSInterface('ACInputTerminal0', app, phy, b'\x02\x01\x01\x01\x00\x02\x03\x00\x00\x00'),
                                 USBCSInterface('ACInputTerminal1', app, phy, b'\x02\x02\x01\x02\x00\x01\x01\x00\x00\x00'),
@@ -276,6 +391,15 @@ class USBAudioDevice(USBDevice):
             ],
             usb_vendor=None
         )
+        interfaces = self.configurations[0].interfaces
+        audio_streaming.attach(usb_class, interfaces[2], interfaces[1])
+        self.audio_streaming = audio_streaming
+        # finalize the WAV file when the device stops
+        self.runtime.at_stop(audio_streaming.close)
+
+    def disconnect(self):
+        super(USBAudioDevice, self).disconnect()
+        self.audio_streaming.close()
 
 
 usb_device = USBAudioDevice
@@ -318,6 +318,22 @@ class FunctionalDescriptor(USBCSInterface):
         cs_config = struct.pack('B', subtype) + cs_config
         super(FunctionalDescriptor, self).__init__(name, app, phy, cs_config)
 
+    def renumber_interfaces(self, numbers):
+        subtype = self.cs_config[0]
+        if subtype == self.CM:
+            # bmCapabilities, bDataInterface
+            offsets = [2]
+        elif subtype == self.UN:
+            # bControlInterface, bSubordinateInterface0..N
+            offsets = range(1, len(self.cs_config))
+        else:
+            return
+        cs_config = bytearray(self.cs_config)
+        for offset in offsets:
+            if offset < len(cs_config):
+                cs_config[offset] = numbers.get(cs_config[offset], cs_config[offset])
+        self.cs_config = bytes(cs_config)
+
     @classmethod
     def get_subtype_name(cls, subtype):
         for vn in dir(cls):
@@ -335,6 +351,59 @@ def build_notification(req_type, notification_code, value, index, data=None):
     return struct.pack('<BBHHH', req_type, notification_code, value, index, len(data) & 0xffff) + data
 
 
+class LineBuffer(object):
+    '''
+    Reassembles lines (e.g. AT commands) from the data received on a bulk endpoint.
+    Only the newly received bytes are scanned for the terminator,
+    and lines longer than max_length are dropped.
+    '''
+
+    def __init__(self, handler, terminator=b'\r', max_length=4096):
+        '''
+        :param handler: function (line) -> None, called for each complete line (without the terminator)
+        :param terminator: line terminator (default: b'\\r')
+        :param max_length: maximum length of a line (default: 4096)
+        '''
+        self.handler = handler
+        self.terminator = terminator
+        self.max_length = max_length
+        self.buffer = bytearray()
+        self.scanned = 0
+        self.discarding = False
+        self.overflows = 0
+
+    def feed(self, data):
+        '''
+        :param data: received data
+        '''
+        buff = self.buffer
+        buff += data
+        start = 0
+        end = buff.find(self.terminator, self.scanned)
+        while end != -1:
+            if self.discarding:
+                self.discarding = False
+            else:
+                self.handler(bytes(buff[start:end]))
+            start = end + len(self.terminator)
+            end = buff.find(self.terminator, start)
+        if start:
+            del buff[:start]
+        if len(buff) > self.max_length:
+            # keep dropping data until the end of the line
+            self.overflows += 1
+            self.discarding = True
+            keep = len(self.terminator) - 1
+            del buff[:len(buff) - keep]
+        # a terminator may start in the last bytes of the buffer
+        self.scanned = max(len(buff) - len(self.terminator) + 1, 0)
+
+    def clear(self):
+        del self.buffer[:]
+        self.scanned = 0
+        self.discarding = False
+
+
 class USBCDCControlInterface(USBInterface):
 
     @mutable('cdc_control_interface_descriptor')
@@ -394,6 +463,7 @@ class USBCDCDevice(USBDevice):
             usb_class=cdc_cls,
         )
         interfaces.insert(0, control_interface)
+        self.control_interface = control_interface
         super(USBCDCDevice, self).__init__(
             app=app, phy=phy,
             device_class=USBClass.CDC,
@@ -427,5 +497,5 @@ class USBCDCDevice(USBDevice):
         by default, send management notification endpoint
         '''
         self.debug('sending network connection notification')
-        resp = build_notification(0xa1, NotificationCodes.NetworkConnection, 1, self.bDataInterface)
+        resp = build_notification(0xa1, NotificationCodes.NetworkConnection, 1, self.control_interface.number)
         self.send_on_endpoint(3, resp)
@@ -8,11 +8,12 @@ import struct
 from numap.core.usb_interface import USBInterface
 from numap.core.usb_class import USBClass
 from numap.core.usb_endpoint import USBEndpoint
-from numap.dev.cdc import USBCDCDevice
+from numap.dev.cdc import USBCDCDevice, LineBuffer
 from numap.dev.cdc import CommunicationClassSubclassCodes
 from numap.dev.cdc import CommunicationClassProtocolCodes
 from numap.dev.cdc import DataInterfaceClassProtocolCodes
 from numap.dev.cdc import FunctionalDescriptor as FD
+from numap.utils.modem import ATResponder
 
 
 class USBCdcAcmDevice(USBCDCDevice):
@@ -23,7 +24,7 @@ class USBCdcAcmDevice(USBCDCDevice):
     bControlProtocol = CommunicationClassProtocolCodes.AtCommands_v250
     bDataProtocol = DataInterfaceClassProtocolCodes.NoClassSpecificProtocolRequired
 
-    def __init__(self, app, phy, vid=0x2548, pid=0x1001, rev=0x0010, cs_interfaces=None, cdc_cls=None, bmCapabilities=0x01, **kwargs):
+    def __init__(self, app, phy, vid=0x2548, pid=0x1001, rev=0x0010, cs_interfaces=None, cdc_cls=None, bmCapabilities=0x01, at_script=None, **kwargs):
         if cdc_cls is None:
             cdc_cls = self.get_default_class(app, phy)
         cs_interfaces = [
@@ -78,26 +79,31 @@ class USBCdcAcmDevice(USBCDCDevice):
             interfaces=interfaces, cs_interfaces=cs_interfaces, cdc_cls=cdc_cls,
             bmCapabilities=0x03, **kwargs
         )
-        self.receive_buffer = b''
+        # bulk IN endpoint of the data interface (the control interface was inserted before it)
+        self.data_in = interfaces[-1].endpoints[1]
+        self.receive_buffer = LineBuffer(self.handle_line)
+        self.modem = ATResponder.from_script(at_script)
 
     def handle_ep1_data_available(self, data):
+        self.receive_buffer.feed(data)
+
+    def handle_line(self, line):
         '''
         print the AT commands only upon new line
         '''
-        self.receive_buffer += data
-        if b'\r' in self.receive_buffer:
-            lines = self.receive_buffer.split(b'\r')
-            self.receive_buffer = lines[-1]
-            for l in lines[:-1]:
-                self.info('received line: %s' % l)
+        self.info('received line: %s' % line)
+        self.modem.handle_line(line)
 
     def handle_ep2_buffer_available(self):
-        # send ARP
-        self.debug('in handle ep2 buffer available')
-        self.send_on_endpoint(
-            2,
-            b'\xff\xff\xff\xff\xff\xff\xaa\xbb\xcc\xdd\xee\xff\x08\x06\x00\x01\x08\x00\x06\x04\x00\x01\x60\x03\x08\xaa\xaa\xaa\xc0\xa8\x00\x65\x00\x00\x00\x00\x00\x00\xc0\xa8\x01\x00'
-        )
+        '''
+        send the queued modem responses, several responses may share a transfer
+        '''
+        data = self.modem.read(0x200)
+        if data:
+            self.send_on_endpoint(2, data)
+            if len(data) % self.data_in.get_max_packet_size() == 0:
+                # the host reads up to a short packet
+                self.send_on_endpoint(2, b'')
 
 
 usb_device = USBCdcAcmDevice
@@ -7,11 +7,12 @@ import struct
 from numap.core.usb_interface import USBInterface
 from numap.core.usb_class import USBClass
 from numap.core.usb_endpoint import USBEndpoint
-from numap.dev.cdc import USBCDCDevice
+from numap.dev.cdc import USBCDCDevice, LineBuffer
 from numap.dev.cdc import CommunicationClassSubclassCodes
 from numap.dev.cdc import CommunicationClassProtocolCodes
 from numap.dev.cdc import DataInterfaceClassProtocolCodes
 from numap.dev.cdc import FunctionalDescriptor as FD
+from numap.utils.modem import ATResponder
 
 
 class USBCdcDlDevice(USBCDCDevice):
@@ -22,7 +23,7 @@ class USBCdcDlDevice(USBCDCDevice):
     bControlProtocol = CommunicationClassProtocolCodes.AtCommands_v250
     bDataProtocol = DataInterfaceClassProtocolCodes.NoClassSpecificProtocolRequired
 
-    def __init__(self, app, phy, vid=0x2548, pid=0x1001, rev=0x0010, cs_interfaces=None, cdc_cls=None, bmCapabilities=0x01, **kwargs):
+    def __init__(self, app, phy, vid=0x2548, pid=0x1001, rev=0x0010, cs_interfaces=None, cdc_cls=None, bmCapabilities=0x01, at_script=None, **kwargs):
         if cdc_cls is None:
             cdc_cls = self.get_default_class(app, phy)
         cs_interfaces = [
@@ -77,23 +78,31 @@ class USBCdcDlDevice(USBCDCDevice):
             interfaces=interfaces, cs_interfaces=cs_interfaces, cdc_cls=cdc_cls,
             bmCapabilities=0x03, **kwargs
         )
-        self.receive_buffer = b''
+        # bulk IN endpoint of the data interface (the control interface was inserted before it)
+        self.data_in = interfaces[-1].endpoints[1]
+        self.receive_buffer = LineBuffer(self.handle_line)
+        self.modem = ATResponder.from_script(at_script)
 
     def handle_ep1_data_available(self, data):
-        self.receive_buffer += data
-        if b'\r' in self.receive_buffer:
-            lines = self.receive_buffer.split(b'\r')
-            self.receive_buffer = lines[-1]
-            for l in lines[:-1]:
-                self.info('received line: %s' % l)
+        self.receive_buffer.feed(data)
+
+    def handle_line(self, line):
+        '''
+        print the AT commands only upon new line
+        '''
+        self.info('received line: %s' % line)
+        self.modem.handle_line(line)
 
     def handle_ep2_buffer_available(self):
-        # send some junk
-        self.debug('in handle ep2 buffer available')
-        self.send_on_endpoint(
-            2,
-            b'\x00\x11\x22\x33\x44\x55\x66\x77\x88\x99\xaa\xbb\xcc\xdd\xee\xff'
-        )
+        '''
+        send the queued modem responses, several responses may share a transfer
+        '''
+        data = self.modem.read(0x200)
+        if data:
+            self.send_on_endpoint(2, data)
+            if len(data) % self.data_in.get_max_packet_size() == 0:
+                # the host reads up to a short packet
+                self.send_on_endpoint(2, b'')
 
 
 usb_device = USBCdcDlDevice
@@ -12,6 +12,7 @@ from numap.dev.cdc import CommunicationClassSubclassCodes
 from numap.dev.cdc import CommunicationClassProtocolCodes
 from numap.dev.cdc import DataInterfaceClassProtocolCodes
 from numap.dev.cdc import FunctionalDescriptor as FD
+from numap.utils.ethernet import EthernetBridge, EcmFraming, get_sink
 
 
 class USBCdcEcmDevice(USBCDCDevice):
@@ -22,7 +23,7 @@ class USBCdcEcmDevice(USBCDCDevice):
     bControlProtocol = CommunicationClassProtocolCodes.NoClassSpecificProtocolRequired
     bDataProtocol = DataInterfaceClassProtocolCodes.NoClassSpecificProtocolRequired  # TODO not defined???
 
-    def __init__(self, app, phy, vid=0x2548, pid=0x1001, rev=0x0010, cs_interfaces=None, cdc_cls=None, bmCapabilities=0x01, **kwargs):
+    def __init__(self, app, phy, vid=0x2548, pid=0x1001, rev=0x0010, cs_interfaces=None, cdc_cls=None, bmCapabilities=0x01, tap=None, **kwargs):
         if cdc_cls is None:
             cdc_cls = self.get_default_class(app, phy)
         cs_interfaces = [
@@ -90,26 +91,19 @@ class USBCdcEcmDevice(USBCDCDevice):
             interfaces=interfaces, cs_interfaces=cs_interfaces, cdc_cls=cdc_cls,
             bmCapabilities=0x03, **kwargs
         )
-        self.receive_buffer = b''
+        self.bridge = EthernetBridge(self, EcmFraming(), get_sink(tap), interfaces[-1].endpoints[1])
+        # release the TAP interface when the device stops
+        self.runtime.at_stop(self.bridge.close)
+
+    def disconnect(self):
+        super(USBCdcEcmDevice, self).disconnect()
+        self.bridge.close()
 
     def handle_ep1_data_available(self, data):
-        '''
-        print the AT commands only upon new line
-        '''
-        self.receive_buffer += data
-        if b'\r' in self.receive_buffer:
-            lines = self.receive_buffer.split(b'\r')
-            self.receive_buffer = lines[-1]
-            for l in lines[:-1]:
-                self.info('received line: %s' % l)
+        self.bridge.handle_data_available(data)
 
     def handle_ep2_buffer_available(self):
-        # send ARP
-        self.debug('in handle ep2 buffer available')
-        self.send_on_endpoint(
-            2,
-            b'\xff\xff\xff\xff\xff\xff\xaa\xbb\xcc\xdd\xee\xff\x08\x06\x00\x01\x08\x00\x06\x04\x00\x01\x60\x03\x08\xaa\xaa\xaa\xc0\xa8\x00\x65\x00\x00\x00\x00\x00\x00\xc0\xa8\x01\x00'
-        )
+        self.bridge.handle_buffer_available()
 
 
 usb_device = USBCdcEcmDevice
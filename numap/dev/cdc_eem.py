@@ -12,6 +12,7 @@ from numap.dev.cdc import CommunicationClassSubclassCodes
 from numap.dev.cdc import CommunicationClassProtocolCodes
 from numap.dev.cdc import DataInterfaceClassProtocolCodes
 from numap.dev.cdc import FunctionalDescriptor as FD
+from numap.utils.ethernet import EthernetBridge, EemFraming, get_sink
 from numap.core.usb_configuration import USBConfiguration
 
 
@@ -23,7 +24,7 @@ class USBCdcEemDevice(USBCDCDevice):
     bControlProtocol = CommunicationClassProtocolCodes.EthernetEmulationModel
     bDataProtocol = DataInterfaceClassProtocolCodes.NoClassSpecificProtocolRequired
 
-    def __init__(self, app, phy, vid=0x2548, pid=0x1001, rev=0x0010, cs_interfaces=None, cdc_cls=None, bmCapabilities=0x01, **kwargs):
+    def __init__(self, app, phy, vid=0x2548, pid=0x1001, rev=0x0010, cs_interfaces=None, cdc_cls=None, bmCapabilities=0x01, tap=None, **kwargs):
         if cdc_cls is None:
             cdc_cls = self.get_default_class(app, phy)
         cs_interfaces = [
@@ -71,7 +72,7 @@ class USBCdcEemDevice(USBCDCDevice):
                         usage_type=USBEndpoint.usage_type_data,
                         max_packet_size=0x40,
                         interval=0x00,
-                        handler=self.handle_ep1_data_available
+                        handler=self.handle_ep1_buffer_available
                     ),
                     USBEndpoint(
                         app=app,
@@ -83,7 +84,7 @@ class USBCdcEemDevice(USBCDCDevice):
                         usage_type=USBEndpoint.usage_type_data,
                         max_packet_size=0x40,
                         interval=0x00,
-                        handler=self.handle_ep2_buffer_available
+                        handler=self.handle_ep2_data_available
                     )
                 ],
                 usb_class=cdc_cls
@@ -117,26 +118,19 @@ class USBCdcEemDevice(USBCDCDevice):
                 )
             ],
             usb_class=cdc_cls)
-        self.receive_buffer = b''
+        self.bridge = EthernetBridge(self, EemFraming(), get_sink(tap), interfaces[0].endpoints[0])
+        # release the TAP interface when the device stops
+        self.runtime.at_stop(self.bridge.close)
 
-    def handle_ep1_data_available(self, data):
-        '''
-        print the AT commands only upon new line
-        '''
-        self.receive_buffer += data
-        if b'\r' in self.receive_buffer:
-            lines = self.receive_buffer.split(b'\r')
-            self.receive_buffer = lines[-1]
-            for l in lines[:-1]:
-                self.info('received line: %s' % l)
+    def disconnect(self):
+        super(USBCdcEemDevice, self).disconnect()
+        self.bridge.close()
 
-    def handle_ep2_buffer_available(self):
-        # send ARP
-        self.debug('in handle ep2 buffer available')
-        self.send_on_endpoint(
-            2,
-            b'\xff\xff\xff\xff\xff\xff\xaa\xbb\xcc\xdd\xee\xff\x08\x06\x00\x01\x08\x00\x06\x04\x00\x01\x60\x03\x08\xaa\xaa\xaa\xc0\xa8\x00\x65\x00\x00\x00\x00\x00\x00\xc0\xa8\x01\x00'
-        )
+    def handle_ep2_data_available(self, data):
+        self.bridge.handle_data_available(data)
+
+    def handle_ep1_buffer_available(self):
+        self.bridge.handle_buffer_available()
 
 
 usb_device = USBCdcEemDevice
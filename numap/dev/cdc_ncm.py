@@ -7,11 +7,97 @@ import struct
 from numap.core.usb_interface import USBInterface
 from numap.core.usb_class import USBClass
 from numap.core.usb_endpoint import USBEndpoint
-from numap.dev.cdc import USBCDCDevice
+from numap.dev.cdc import USBCDCClass, USBCDCDevice, stage
 from numap.dev.cdc import CommunicationClassSubclassCodes
 from numap.dev.cdc import CommunicationClassProtocolCodes
 from numap.dev.cdc import DataInterfaceClassProtocolCodes
 from numap.dev.cdc import FunctionalDescriptor as FD
+from numap.utils.ethernet import EthernetBridge, NcmFraming, NtbParameters, get_sink
+
+
+class USBCdcNcmClass(USBCDCClass):
+    '''
+    NCM specific requests (NCM10, 6.2), the values the host selects
+    are used by the NTB framing of the device.
+    '''
+    name = 'CdcNcmClass'
+
+    def __init__(self, app, phy, ntb_params=None):
+        '''
+        :param app: numap application
+        :param phy: physical connection
+        :param ntb_params: NtbParameters instance (default: None, the default parameters)
+        '''
+        self.ntb_params = NtbParameters() if ntb_params is None else ntb_params
+        super(USBCdcNcmClass, self).__init__(app, phy)
+
+    def setup_local_handlers(self):
+        super(USBCdcNcmClass, self).setup_local_handlers()
+        self.local_handlers.update({
+            self.GET_NTB_PARAMETERS: stage('cdc_get_ntb_parameters', self.handle_get_ntb_parameters),
+            self.GET_NTB_FORMAT: stage('cdc_get_format', self.handle_get_ntb_format),
+            self.SET_NTB_FORMAT: self.handle_set_ntb_format,
+            self.GET_NTB_INPUT_SIZE: stage('cdc_get_ntb_input_size', self.handle_get_ntb_input_size),
+            self.SET_NTB_INPUT_SIZE: self.handle_set_ntb_input_size,
+            self.GET_MAX_DATAGRAM_SIZE: stage('cdc_get_max_datagram_size', self.handle_get_max_datagram_size),
+            self.SET_MAX_DATAGRAM_SIZE: self.handle_set_max_datagram_size,
+            self.GET_CRC_MODE: stage('cdc_get_crc_mode', self.handle_get_crc_mode),
+            self.SET_CRC_MODE: self.handle_set_crc_mode,
+        })
+
+    def handle_get_ntb_parameters(self, req):
+        return self.ntb_params.pack()
+
+    def handle_get_ntb_format(self, req):
+        return struct.pack('<H', self.ntb_params.ntb_format)
+
+    def handle_set_ntb_format(self, req):
+        if req.value > NtbParameters.FORMAT_NTB32 or (req.value == NtbParameters.FORMAT_NTB32 and not self.ntb_params.ntb32_supported):
+            self.phy.stall_ep0()
+            return None
+        self.ntb_params.ntb_format = req.value
+        self.info('host selected the %s format' % ('NTB32' if req.value else 'NTB16'))
+        return b''
+
+    def handle_get_ntb_input_size(self, req):
+        if req.length >= 8:
+            return struct.pack('<IHH', self.ntb_params.ntb_in_size, self.ntb_params.ntb_in_max_datagrams, 0)
+        return struct.pack('<I', self.ntb_params.ntb_in_size)
+
+    def handle_set_ntb_input_size(self, req):
+        data = bytes(req.data)
+        if len(data) < 4:
+            self.phy.stall_ep0()
+            return None
+        size, = struct.unpack_from('<I', data)
+        if not NtbParameters.MIN_NTB_IN_SIZE <= size <= self.ntb_params.ntb_in_max_size:
+            self.warning('host selected an invalid NTB input size: %#x' % size)
+            self.phy.stall_ep0()
+            return None
+        self.ntb_params.ntb_in_size = size
+        if len(data) >= 6:
+            self.ntb_params.ntb_in_max_datagrams, = struct.unpack_from('<H', data, 4)
+        self.info('host selected NTB input size %#x (max datagrams: %d)' % (size, self.ntb_params.ntb_in_max_datagrams))
+        return b''
+
+    def handle_get_max_datagram_size(self, req):
+        return struct.pack('<H', self.ntb_params.max_datagram_size)
+
+    def handle_set_max_datagram_size(self, req):
+        data = bytes(req.data)
+        if len(data) >= 2:
+            self.ntb_params.max_datagram_size, = struct.unpack_from('<H', data)
+        return b''
+
+    def handle_get_crc_mode(self, req):
+        return struct.pack('<H', 1 if self.ntb_params.crc else 0)
+
+    def handle_set_crc_mode(self, req):
+        if req.value > 1:
+            self.phy.stall_ep0()
+            return None
+        self.ntb_params.crc = bool(req.value)
+        return b''
 
 
 class USBCdcNcmDevice(USBCDCDevice):
@@ -24,7 +110,7 @@ class USBCdcNcmDevice(USBCDCDevice):
     bControlProtocol = CommunicationClassProtocolCodes.NoClassSpecificProtocolRequired
     bDataProtocol = DataInterfaceClassProtocolCodes.NetworkTransferBlock
 
-    def __init__(self, app, phy, vid=0x2548, pid=0x1001, rev=0x0010, cs_interfaces=None, cdc_cls=None, bmCapabilities=0x01, **kwargs):
+    def __init__(self, app, phy, vid=0x2548, pid=0x1001, rev=0x0010, cs_interfaces=None, cdc_cls=None, bmCapabilities=0x01, tap=None, **kwargs):
         if cdc_cls is None:
             cdc_cls = self.get_default_class(app, phy)
         cs_interfaces = [
@@ -100,26 +186,26 @@ class USBCdcNcmDevice(USBCDCDevice):
             interfaces=interfaces, cs_interfaces=cs_interfaces, cdc_cls=cdc_cls,
             bmCapabilities=0x03, **kwargs
         )
-        self.receive_buffer = b''
+        self.bridge = EthernetBridge(
+            self, NcmFraming(params=getattr(cdc_cls, 'ntb_params', None)), get_sink(tap), interfaces[-1].endpoints[1]
+        )
+        # release the TAP interface when the device stops
+        self.runtime.at_stop(self.bridge.close)
+
+    def disconnect(self):
+        super(USBCdcNcmDevice, self).disconnect()
+        self.bridge.close()
+
+    def get_default_class(self, app, phy):
+        if self._default_cls is None:
+            self._default_cls = USBCdcNcmClass(app, phy)
+        return self._default_cls
 
     def handle_ep1_data_available(self, data):
-        '''
-        print the AT commands only upon new line
-        '''
-        self.receive_buffer += data
-        if b'\r' in self.receive_buffer:
-            lines = self.receive_buffer.split(b'\r')
-            self.receive_buffer = lines[-1]
-            for l in lines[:-1]:
-                self.info('received line: %s' % l)
+        self.bridge.handle_data_available(data)
 
     def handle_ep2_buffer_available(self):
-        # send ARP
-        self.debug('in handle ep2 buffer available')
-        self.send_on_endpoint(
-            2,
-            b'\xff\xff\xff\xff\xff\xff\xaa\xbb\xcc\xdd\xee\xff\x08\x06\x00\x01\x08\x00\x06\x04\x00\x01\x60\x03\x08\xaa\xaa\xaa\xc0\xa8\x00\x65\x00\x00\x00\x00\x00\x00\xc0\xa8\x01\x00'
-        )
+        self.bridge.handle_buffer_available()
 
 
 usb_device = USBCdcNcmDevice
@@ -0,0 +1,176 @@
+'''
+Composite device that combines several nümap device classes in a single
+configuration, so one enumeration exercises the drivers of all of them.
+
+Each function is created from its device class with a PHY proxy that maps
+the endpoint numbers used in its code to the numbers it was given in the
+composite configuration: a function keeps its endpoint numbers unless
+another function already uses them. Interfaces are renumbered in order,
+together with the class-specific descriptors that refer to them (see
+USBCSInterface.renumber_interfaces), and each function gets an interface
+association descriptor (IAD).
+
+.. note:: the endpoints of all functions must fit the PHY,
+          the MAXUSB facedancers only have endpoint 1 OUT and endpoints 2, 3 IN
+'''
+import struct
+from numap.core.usb import DescriptorType
+from numap.core.usb_class import USBClass
+from numap.core.usb_device import USBDevice
+from numap.core.usb_configuration import USBConfiguration
+from numap.dev.registry import get_devices, load_device_module
+
+
+class EndpointRemapPhy(object):
+    '''
+    PHY proxy that translates the endpoint numbers of a function
+    '''
+
+    def __init__(self, phy):
+        '''
+        :param phy: the PHY to wrap
+        '''
+        self.backend = phy
+        # function endpoint number: composite endpoint number
+        self.endpoint_map = {}
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def send_on_endpoint(self, ep_num, data, *args, **kwargs):
+        return self.backend.send_on_endpoint(self.endpoint_map.get(ep_num, ep_num), data, *args, **kwargs)
+
+    def stall_endpoint(self, ep_num, *args, **kwargs):
+        return self.backend.stall_endpoint(self.endpoint_map.get(ep_num, ep_num), *args, **kwargs)
+
+
+class InterfaceAssociation(object):
+    '''
+    Interface association descriptor (USB ECN, Interface Association Descriptors)
+    '''
+
+    def __init__(self, first_interface, interface_count, function_class, function_subclass, function_protocol):
+        self.first_interface = first_interface
+        self.interface_count = interface_count
+        self.function_class = function_class
+        self.function_subclass = function_subclass
+        self.function_protocol = function_protocol
+
+    def get_descriptor(self):
+        return struct.pack(
+            '<BBBBBBBB',
+            8,
+            DescriptorType.interface_association,
+            self.first_interface,
+            self.interface_count,
+            self.function_class,
+            self.function_subclass,
+            self.function_protocol,
+            0
+        )
+
+
+def _prepend_association(interface, association):
+    get_descriptor = interface.get_descriptor
+
+    def get_descriptor_with_association(usb_type='fullspeed', valid=False):
+        return association.get_descriptor() + get_descriptor(usb_type, valid)
+
+    interface.get_descriptor = get_descriptor_with_association
+
+
+class USBCompositeDevice(USBDevice):
+    name = 'CompositeDevice'
+
+    def __init__(self, app, phy, vid=0x1d6b, pid=0x0104, rev=0x0100, functions='keyboard,mass_storage', **kwargs):
+        '''
+        :param functions: comma separated list of device classes (default: 'keyboard,mass_storage')
+        :param kwargs: passed to the device classes of the functions
+        '''
+        if isinstance(functions, str):
+            functions = [name.strip() for name in functions.split(',') if name.strip()]
+        self.functions = []
+        interfaces = []
+        used_endpoints = set()
+        for name in functions:
+            remap = EndpointRemapPhy(phy)
+            function = self.create_function(app, remap, name, kwargs)
+            function_interfaces = function.configurations[0].interfaces
+            # alternate settings share the number of their interface
+            numbers = {}
+            for interface in function_interfaces:
+                numbers.setdefault(interface.number, len(interfaces) + len(numbers))
+            for interface in function_interfaces:
+                interface.number = numbers[interface.number]
+                for cs_interface in interface.cs_interfaces:
+                    cs_interface.renumber_interfaces(numbers)
+                for endpoint in interface.endpoints:
+                    if endpoint.number not in remap.endpoint_map:
+                        remap.endpoint_map[endpoint.number] = self.allocate_endpoint(endpoint.number, used_endpoints)
+                    endpoint.number = remap.endpoint_map[endpoint.number]
+                    endpoint.address = (endpoint.number & 0x0f) | (endpoint.direction << 7)
+            first = function_interfaces[0]
+            _prepend_association(first, InterfaceAssociation(
+                first.number, len(numbers), first.iclass, first.subclass, first.protocol
+            ))
+            interfaces.extend(function_interfaces)
+            self.functions.append(function)
+        super(USBCompositeDevice, self).__init__(
+            app=app,
+            phy=phy,
+            device_class=USBClass.Miscellaneous,
+            device_subclass=2,
+            protocol_rel_num=1,
+            max_packet_size_ep0=64,
+            vendor_id=vid,
+            product_id=pid,
+            device_rev=rev,
+            manufacturer_string='nümap',
+            product_string='Composite Device',
+            serial_number_string=b'0001',
+            configurations=[
+                USBConfiguration(
+                    app=app,
+                    phy=phy,
+                    index=1,
+                    string='Emulated Composite Device',
+                    interfaces=interfaces
+                )
+            ],
+        )
+        for function in self.functions:
+            # the functions are served by the service loop of the composite device
+            self.runtime.adopt(function.runtime)
+            function.runtime = self.runtime
+        for function in self.functions:
+            self.info('Function %s: interfaces %s, endpoints %s' % (
+                function.name,
+                sorted(set(i.number for i in function.configurations[0].interfaces)),
+                sorted(function.phy.endpoint_map.values())
+            ))
+
+    def allocate_endpoint(self, number, used):
+        '''
+        :param number: endpoint number in the function
+        :param used: endpoint numbers that are already taken
+        :return: the same number if it is free, the lowest free one otherwise
+        '''
+        if number in used:
+            free = [n for n in range(1, 16) if n not in used]
+            if not free:
+                raise Exception('Not enough endpoints for the composite device')
+            number = free[0]
+        used.add(number)
+        return number
+
+    def create_function(self, app, phy, name, kwargs):
+        '''
+        :param name: device class (see numap-list)
+        :return: USBDevice instance of the function
+        '''
+        if name not in get_devices() or name in ('composite', 'hub'):
+            raise Exception('Device class can not be a function of a composite device: %s' % name)
+        return load_device_module(name).usb_device(app, phy, **kwargs)
+
+
+usb_device = USBCompositeDevice
@@ -1,8 +1,10 @@
 '''
 USB Class definitions for FTDI FT232 Serial (UART) device
 '''
+import time
 import struct
-from six.moves.queue import Queue
+from numap.core.endpoint_buffer import EndpointBuffer
+from numap.core.runtime import EndpointStream
 from numap.core.usb_device import USBDevice
 from numap.core.usb_configuration import USBConfiguration
 from numap.core.usb_interface import USBInterface
@@ -10,6 +12,30 @@ from numap.core.usb_endpoint import USBEndpoint
 from numap.core.usb_vendor import USBVendor
 from numap.core.usb_class import USBClass
 from numap.fuzz.helpers import mutable
+from numap.utils.pty_bridge import PtyBridge
+
+# modem status: bit 0 is always set, CTS and DSR are asserted
+MODEM_STATUS = 0x31
+# line status: transmitter holding register and transmitter empty
+LINE_STATUS = 0x60
+
+
+def ftdi_baudrate(value, index):
+    '''
+    Decode the divisor of a SET_BAUD_RATE request (FT232B/R encoding)
+
+    :param value: wValue of the request
+    :param index: wIndex of the request
+    :return: baud rate
+    '''
+    divisor = value & 0x3fff
+    fraction = ((value >> 14) & 0x3) | ((index & 0x1) << 2)
+    if divisor == 0 and fraction == 0:
+        return 3000000
+    if divisor == 1 and fraction == 0:
+        return 2000000
+    eighths = divisor * 8 + (0, 4, 2, 1, 3, 5, 6, 7)[fraction]
+    return 3000000 * 8 // eighths if eighths else 0
 
 
 class USBFtdiVendor(USBVendor):
@@ -17,9 +43,9 @@ class USBFtdiVendor(USBVendor):
 
     def __init__(self, app, phy):
         super(USBFtdiVendor, self).__init__(app, phy)
-        self.latency_timer = 0x01
+        self.latency_timer = 0x10
         self.data = 0x00
-        self.baudrate = 0x00
+        self.baudrate = 9600
         self.dtr = 0x00
         self.flow_control = 0x00
         self.rts = 0x00
@@ -59,24 +85,34 @@ class USBFtdiVendor(USBVendor):
 
     @mutable('ftdi_set_flow_ctrl_response')
     def handle_set_flow_ctrl(self, req):
-        self.flow_control = req.value
-        if req.value == 0x000:
+        # the handshake protocol is in the high byte of wIndex
+        self.flow_control = req.index >> 8
+        if self.flow_control == 0x00:
             self.info('SET_FLOW_CTRL to no handshaking')
-        if req.value & 0x0001:
+        if self.flow_control & 0x01:
             self.info('SET_FLOW_CTRL for RTS/CTS handshaking')
-        if req.value & 0x0002:
+        if self.flow_control & 0x02:
             self.info('SET_FLOW_CTRL for DTR/DSR handshaking')
-        if req.value & 0x0004:
+        if self.flow_control & 0x04:
             self.info('SET_FLOW_CTRL for XON/XOFF handshaking')
         return b''
 
     @mutable('ftdi_set_baud_rate_response')
     def handle_set_baud_rate(self, req):
-        self.dtr = req.value & 0x0001
-        self.baudrate = req.value
-        self.info('baudrate set to: %#x dtr set to: %#x' % (self.baudrate, self.dtr))
+        self.baudrate = ftdi_baudrate(req.value, req.index)
+        self.info('baudrate set to: %d' % self.baudrate)
         return b''
 
+    def host_ready(self):
+        '''
+        :return: whether the host lets the device send data (RTS/CTS or DTR/DSR handshaking)
+        '''
+        if self.flow_control & 0x01 and self.rtsen and not self.rts:
+            return False
+        if self.flow_control & 0x02 and self.dtren and not self.dtr:
+            return False
+        return True
+
     @mutable('ftdi_set_data_response')
     def handle_set_data(self, req):
         self.data = req.value
@@ -84,7 +120,7 @@ class USBFtdiVendor(USBVendor):
 
     @mutable('ftdi_get_modem_status_response')
     def handle_get_modem_status(self, req):
-        return b'\x00' * req.length
+        return struct.pack('BB', MODEM_STATUS, LINE_STATUS)[:req.length]
 
     @mutable('ftdi_set_event_char_response')
     def handle_set_event_char(self, req):
@@ -109,9 +145,30 @@ class USBFtdiVendor(USBVendor):
 
 
 class USBFtdiInterface(USBInterface):
+    '''
+    Data interface of the FT232. Without a PTY, data from the host is looped back.
+
+    Every IN packet starts with the modem and line status bytes.
+    Data is sent once a full packet is available, or when the latency timer expires.
+    With a PTY, OUT data is written to the terminal by a coroutine of the
+    runtime, while the terminal is full the host sees NAKs.
+    '''
     name = 'FtdiInterface'
 
-    def __init__(self, app, phy, interface_number):
+    # each IN packet starts with 2 status bytes
+    STATUS_SIZE = 2
+    # max packets per IN transfer
+    MAX_PACKETS = 8
+
+    def __init__(self, app, phy, interface_number, vendor=None, pty=None, capacity=0x10000):
+        '''
+        :param app: numap application
+        :param phy: physical connection
+        :param interface_number: interface number
+        :param vendor: USBFtdiVendor with the serial settings (default: None)
+        :param pty: path to link the PTY to, None to loop the data back (default: None)
+        :param capacity: max bytes buffered for the host (default: 0x10000)
+        '''
         super(USBFtdiInterface, self).__init__(
             app=app,
             phy=phy,
@@ -144,26 +201,88 @@ class USBFtdiInterface(USBInterface):
                     usage_type=USBEndpoint.usage_type_data,
                     max_packet_size=0x40,
                     interval=0,
-                    handler=self.handle_ep3_buffer_available  # at this point, we don't send data to the host
+                    handler=self.handle_ep3_buffer_available
                 )
             ],
         )
-        self.txq = Queue()
+        self.vendor = vendor
+        self.pty = None
+        self.runtime = None
+        # OUT data for the PTY, written by forward()
+        self.rx = EndpointStream('ftdi rx')
+        if pty:
+            self.pty = PtyBridge(pty)
+            self.info('serial data is bridged to %s (%s)' % (self.pty.name, pty))
+        # data for the host, split in packets after the status bytes
+        self.txq = EndpointBuffer('ftdi tx', capacity=capacity, stream=True)
+        self.last_in = time.time()
+        self.baudrate = None
+
+    def start(self, runtime):
+        '''
+        :param runtime: DeviceRuntime of the device, writes the OUT data to the PTY
+        '''
+        self.runtime = runtime
+        if self.pty is not None:
+            runtime.watch(self.rx)
+            runtime.spawn(self.forward)
+
+    async def forward(self):
+        while True:
+            data = await self.rx.get()
+            while data:
+                written = self.pty.write(data)
+                data = data[written:]
+                if data:
+                    await self.runtime.wait_writable(self.pty.master)
 
     def handle_data_available(self, data):
         self.debug('received string (%d): %s' % (len(data), data))
-        reply = b'\x01\x00' + data
-        self.txq.put(reply)
+        if self.pty is not None:
+            self.rx.put_nowait(data)
+        else:
+            self.queue(data)
+
+    def queue(self, data):
+        self.txq.put(data)
 
     def handle_ep3_buffer_available(self):
-        if not self.txq.empty():
-            self.send_on_endpoint(3, self.txq.get())
+        if self.pty is not None:
+            # read only what fits, the writer blocks on the full terminal
+            self.queue(self.pty.read(self.txq.room()))
+            if self.vendor is not None and self.vendor.baudrate != self.baudrate:
+                self.baudrate = self.vendor.baudrate
+                self.pty.set_speed(self.baudrate)
+        latency = (self.vendor.latency_timer if self.vendor is not None else 0x10) / 1000.0
+        expired = time.time() - self.last_in >= latency
+        # 62 bytes of data at full speed, 510 at high speed
+        payload_size = self.endpoints[1].get_max_packet_size() - self.STATUS_SIZE
+        if self.vendor is not None and not self.vendor.host_ready():
+            count = 0
+        elif expired:
+            count = min((len(self.txq) + payload_size - 1) // payload_size, self.MAX_PACKETS)
+        else:
+            # batch until the latency timer expires, unless there are full packets to send
+            count = min(len(self.txq) // payload_size, self.MAX_PACKETS)
+        if not count and not expired:
+            return
+        status = struct.pack('BB', MODEM_STATUS, LINE_STATUS)
+        data = self.txq.get(count * payload_size) if count else b''
+        packets = [
+            status + data[i:i + payload_size]
+            for i in range(0, len(data), payload_size)
+        ]
+        # with no data, a status only packet is sent every latency period
+        self.send_on_endpoint(3, b''.join(packets) or status)
+        self.last_in = time.time()
 
 
 class USBFtdiDevice(USBDevice):
     name = 'FtdiDevice'
 
-    def __init__(self, app, phy, vid=0x0403, pid=0x6001, rev=0x0100, **kwargs):
+    def __init__(self, app, phy, vid=0x0403, pid=0x6001, rev=0x0100, pty=None, **kwargs):
+        vendor = USBFtdiVendor(app=app, phy=phy)
+        interface = USBFtdiInterface(app, phy, 0, vendor, pty)
         super(USBFtdiDevice, self).__init__(
             app=app,
             phy=phy,
@@ -183,15 +302,14 @@ class USBFtdiDevice(USBDevice):
                     phy=phy,
                     index=1,
                     string='FTDI',
-                    interfaces=[
-                        USBFtdiInterface(app, phy, 0)
-                    ],
+                    interfaces=[interface],
                     attributes=USBConfiguration.ATTR_BASE,
                     max_power=0x2d,
                 )
             ],
-            usb_vendor=USBFtdiVendor(app=app, phy=phy)
+            usb_vendor=vendor
         )
+        interface.start(self.runtime)
 
 
 usb_device = USBFtdiDevice
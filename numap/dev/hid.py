@@ -0,0 +1,263 @@
+'''
+Contains class definitions to implement a generic USB HID device.
+
+The device is described by its report descriptor only (a mouse by default),
+which is parsed once into a report layout (see numap/utils/hid.py).
+Input reports are queued with send_input_report() and sent on the interrupt
+IN endpoint, output reports (SET_REPORT or interrupt OUT) are passed to
+handle_output_report().
+'''
+import struct
+from collections import deque
+from numap.core.usb import DescriptorType
+from numap.core.usb_class import USBClass
+from numap.core.usb_device import USBDevice
+from numap.core.usb_configuration import USBConfiguration
+from numap.core.usb_interface import USBInterface
+from numap.core.usb_endpoint import USBEndpoint
+from numap.fuzz.helpers import mutable
+from numap.utils.hid import ReportLayout, load_report_descriptor
+
+# 3 button mouse with X, Y and wheel
+DEFAULT_REPORT_DESCRIPTOR = (
+    b'\x05\x01\x09\x02\xa1\x01\x09\x01\xa1\x00'
+    b'\x05\x09\x19\x01\x29\x03\x15\x00\x25\x01\x95\x03\x75\x01\x81\x02'
+    b'\x95\x01\x75\x05\x81\x01'
+    b'\x05\x01\x09\x30\x09\x31\x09\x38\x15\x81\x25\x7f\x75\x08\x95\x03\x81\x06'
+    b'\xc0\xc0'
+)
+
+
+class Requests(object):
+    GET_REPORT = 0x01
+    GET_IDLE = 0x02
+    GET_PROTOCOL = 0x03
+    SET_REPORT = 0x09
+    SET_IDLE = 0x0A
+    SET_PROTOCOL = 0x0B
+
+
+class ReportType(object):
+    INPUT = 1
+    OUTPUT = 2
+    FEATURE = 3
+
+
+class USBHidClass(USBClass):
+    name = 'HidClass'
+
+    def __init__(self, app, phy):
+        super(USBHidClass, self).__init__(app, phy)
+        self.idle_rate = 0
+        self.protocol = 1
+
+    def setup_local_handlers(self):
+        self.local_handlers = {
+            Requests.GET_REPORT: self.handle_get_report,
+            Requests.GET_IDLE: self.handle_get_idle,
+            Requests.GET_PROTOCOL: self.handle_get_protocol,
+            Requests.SET_REPORT: self.handle_set_report,
+            Requests.SET_IDLE: self.handle_set_idle,
+            Requests.SET_PROTOCOL: self.handle_set_protocol,
+        }
+
+    @mutable('hid_get_report_response')
+    def handle_get_report(self, req):
+        report_type = req.value >> 8
+        report_id = req.value & 0xff
+        return self.interface.get_report(report_type, report_id)[:req.length]
+
+    @mutable('hid_get_idle_response')
+    def handle_get_idle(self, req):
+        return struct.pack('<B', self.idle_rate)
+
+    def handle_get_protocol(self, req):
+        return struct.pack('<B', self.protocol)
+
+    @mutable('hid_set_report_response')
+    def handle_set_report(self, req):
+        report_type = req.value >> 8
+        if report_type == ReportType.OUTPUT:
+            self.interface.handle_output_report(bytes(req.data))
+        elif report_type == ReportType.FEATURE:
+            self.interface.feature_reports[req.value & 0xff] = bytes(req.data)
+        return b''
+
+    @mutable('hid_set_idle_response')
+    def handle_set_idle(self, req):
+        self.idle_rate = req.value >> 8
+        return b''
+
+    def handle_set_protocol(self, req):
+        self.protocol = req.value & 0xff
+        return b''
+
+
+class USBHidInterface(USBInterface):
+    name = 'HidInterface'
+
+    def __init__(self, app, phy, report_descriptor=DEFAULT_REPORT_DESCRIPTOR, interval=0x0a, output_handler=None):
+        '''
+        :param report_descriptor: HID report descriptor (default: DEFAULT_REPORT_DESCRIPTOR)
+        :param interval: polling interval of the interrupt endpoints in ms (default: 0x0a)
+        :param output_handler: called with (report_id, values, usages) for each output report (default: None)
+        '''
+        self.layout = ReportLayout(report_descriptor)
+        self.report_descriptor = self.layout.descriptor
+        self.hid_descriptor = struct.pack('<BBHBBBH', 9, DescriptorType.hid, 0x0111, 0, 1, DescriptorType.report, len(self.report_descriptor))
+        max_packet_size = min(max(self.layout.max_input_length, 8), 64)
+        endpoints = [
+            USBEndpoint(
+                app=app,
+                phy=phy,
+                number=2,
+                direction=USBEndpoint.direction_in,
+                transfer_type=USBEndpoint.transfer_type_interrupt,
+                sync_type=USBEndpoint.sync_type_none,
+                usage_type=USBEndpoint.usage_type_data,
+                max_packet_size=max_packet_size,
+                interval=interval,
+                handler=self.handle_buffer_available
+            )
+        ]
+        if self.layout.get_reports('output'):
+            endpoints.append(
+                USBEndpoint(
+                    app=app,
+                    phy=phy,
+                    number=1,
+                    direction=USBEndpoint.direction_out,
+                    transfer_type=USBEndpoint.transfer_type_interrupt,
+                    sync_type=USBEndpoint.sync_type_none,
+                    usage_type=USBEndpoint.usage_type_data,
+                    max_packet_size=64,
+                    interval=interval,
+                    handler=self.handle_data_available
+                )
+            )
+        super(USBHidInterface, self).__init__(
+            app=app,
+            phy=phy,
+            interface_number=0,
+            interface_alternate=0,
+            interface_class=USBClass.HID,
+            interface_subclass=0,
+            interface_protocol=0,
+            interface_string_index=0,
+            endpoints=endpoints,
+            descriptors={
+                DescriptorType.hid: self.get_hid_descriptor,
+                DescriptorType.report: self.get_report_descriptor
+            },
+            usb_class=USBHidClass(app, phy)
+        )
+        self.output_handler = output_handler
+        self.pending = deque(maxlen=256)
+        # last report sent/received per (report type, report id), for GET_REPORT
+        self.input_reports = {}
+        self.output_reports = {}
+        self.feature_reports = {}
+
+    @mutable('hid_descriptor')
+    def get_hid_descriptor(self, *args, **kwargs):
+        return self.hid_descriptor
+
+    @mutable('hid_report_descriptor')
+    def get_report_descriptor(self, *args, **kwargs):
+        return self.report_descriptor
+
+    def send_input_report(self, values=None, pressed=(), report_id=0, data=None):
+        '''
+        Queue an input report for the interrupt IN endpoint
+
+        :param values: dictionary of usage: value (default: None)
+        :param pressed: usages for the array fields (default: ())
+        :param report_id: report id (default: 0)
+        :param data: raw report data, used as is instead of values and pressed (default: None)
+        '''
+        if data is None:
+            report = self.layout.get_report('input', report_id)
+            if report is None:
+                raise Exception('No input report with id %d in report descriptor' % report_id)
+            data = report.pack(values, pressed)
+        self.input_reports[report_id] = data
+        self.pending.append(data)
+
+    def get_report(self, report_type, report_id):
+        '''
+        :param report_type: ReportType
+        :param report_id: report id
+        :return: the last report of this type and id, zeros if there is none
+        '''
+        reports = {
+            ReportType.INPUT: self.input_reports,
+            ReportType.OUTPUT: self.output_reports,
+            ReportType.FEATURE: self.feature_reports,
+        }.get(report_type, {})
+        if report_id in reports:
+            return reports[report_id]
+        kind = {ReportType.INPUT: 'input', ReportType.OUTPUT: 'output', ReportType.FEATURE: 'feature'}.get(report_type)
+        report = self.layout.get_report(kind, report_id)
+        return report.pack() if report else b''
+
+    def handle_output_report(self, data):
+        '''
+        :param data: output report from the host
+        '''
+        report_id = data[0] if self.layout.numbered and data else 0
+        self.output_reports[report_id] = data
+        report = self.layout.get_report('output', report_id)
+        if report is None:
+            self.warning('Output report with unknown id %d: %s' % (report_id, data.hex()))
+            return
+        values, usages = report.unpack(data)
+        self.debug('Output report %d: %s' % (report_id, values))
+        if self.output_handler:
+            self.output_handler(report_id, values, usages)
+
+    def handle_data_available(self, data):
+        self.handle_output_report(bytes(data))
+
+    def handle_buffer_available(self):
+        if self.pending:
+            self.usb_function_supported('buffer available for hid report')
+            self.send_on_endpoint(2, self.pending.popleft())
+
+
+class USBHidDevice(USBDevice):
+    name = 'HidDevice'
+
+    def __init__(self, app, phy, vid=0x610b, pid=0x4654, rev=0x0100, report_descriptor=None, **kwargs):
+        '''
+        :param report_descriptor: report descriptor as bytes, hex string or file (default: None, a mouse)
+        '''
+        if report_descriptor is None:
+            report_descriptor = DEFAULT_REPORT_DESCRIPTOR
+        super(USBHidDevice, self).__init__(
+            app=app,
+            phy=phy,
+            device_class=USBClass.Unspecified,
+            device_subclass=0,
+            protocol_rel_num=0,
+            max_packet_size_ep0=64,
+            vendor_id=vid,
+            product_id=pid,
+            device_rev=rev,
+            manufacturer_string='numap',
+            product_string='numap HID device',
+            serial_number_string='00001',
+            configurations=[
+                USBConfiguration(
+                    app=app,
+                    phy=phy,
+                    index=1,
+                    string='Emulated HID device',
+                    interfaces=[
+                        USBHidInterface(app, phy, load_report_descriptor(report_descriptor))
+                    ]
+                )
+            ],
+        )
+
+
+usb_device = USBHidDevice
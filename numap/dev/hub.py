@@ -1,48 +1,197 @@
 '''
 Contains class definitions to implement a USB hub.
+
+The hub keeps the state of each downstream port (USB 2.0, 11.24.2.7),
+reports status changes on its interrupt endpoint and handles the port
+features, so emulated child devices can be attached to its ports.
+
+Requests for a child device are routed by bus address (see
+USBHubDevice.handle_request_for). This needs a PHY that passes the address
+of each transaction: the virtual PHY does (e.g. numapreplay of a session
+with the hub and its devices), the MAXUSB based facedancers and the gadget
+PHYs answer a single address in hardware.
 '''
 import struct
-from numap.core.usb import DescriptorType
+from numap.core.usb import DescriptorType, Request
 from numap.core.usb_class import USBClass
 from numap.core.usb_device import USBDevice
 from numap.core.usb_configuration import USBConfiguration
 from numap.core.usb_interface import USBInterface
 from numap.core.usb_endpoint import USBEndpoint
+from numap.dev.registry import load_device_module
 from numap.fuzz.helpers import mutable
 
 
+class PortStatus(object):
+    # wPortStatus bits (Table 11-21)
+    CONNECTION = 0x0001
+    ENABLE = 0x0002
+    SUSPEND = 0x0004
+    OVER_CURRENT = 0x0008
+    RESET = 0x0010
+    POWER = 0x0100
+    LOW_SPEED = 0x0200
+    HIGH_SPEED = 0x0400
+
+
+class PortFeature(object):
+    # feature selectors (Table 11-17)
+    PORT_CONNECTION = 0
+    PORT_ENABLE = 1
+    PORT_SUSPEND = 2
+    PORT_OVER_CURRENT = 3
+    PORT_RESET = 4
+    PORT_POWER = 8
+    PORT_LOW_SPEED = 9
+    C_PORT_CONNECTION = 16
+    C_PORT_ENABLE = 17
+    C_PORT_SUSPEND = 18
+    C_PORT_OVER_CURRENT = 19
+    C_PORT_RESET = 20
+    PORT_TEST = 21
+    PORT_INDICATOR = 22
+
+
+class HubPort(object):
+    '''
+    State of a downstream port
+    '''
+
+    def __init__(self, number):
+        self.number = number
+        self.status = 0
+        self.change = 0
+        self.device = None
+
+    def attach(self, device):
+        self.device = device
+        if self.status & PortStatus.POWER:
+            self.status |= PortStatus.CONNECTION
+            self.change |= PortStatus.CONNECTION
+
+    def detach(self):
+        self.device = None
+        if self.status & PortStatus.CONNECTION:
+            self.status &= ~(PortStatus.CONNECTION | PortStatus.ENABLE)
+            self.change |= PortStatus.CONNECTION
+
+    def set_feature(self, feature):
+        '''
+        :return: False if the feature can not be set
+        '''
+        if feature == PortFeature.PORT_POWER:
+            self.status |= PortStatus.POWER
+            if self.device is not None and not self.status & PortStatus.CONNECTION:
+                self.status |= PortStatus.CONNECTION
+                self.change |= PortStatus.CONNECTION
+        elif feature == PortFeature.PORT_RESET:
+            if not self.status & PortStatus.CONNECTION:
+                return True
+            # the reset completes immediately
+            self.status = (self.status | PortStatus.ENABLE) & ~(PortStatus.RESET | PortStatus.SUSPEND)
+            self.change |= PortStatus.RESET
+        elif feature == PortFeature.PORT_SUSPEND:
+            self.status |= PortStatus.SUSPEND
+        elif feature in (PortFeature.PORT_TEST, PortFeature.PORT_INDICATOR):
+            pass
+        else:
+            return False
+        return True
+
+    def clear_feature(self, feature):
+        '''
+        :return: False if the feature can not be cleared
+        '''
+        if feature == PortFeature.PORT_ENABLE:
+            self.status &= ~PortStatus.ENABLE
+        elif feature == PortFeature.PORT_SUSPEND:
+            if self.status & PortStatus.SUSPEND:
+                self.status &= ~PortStatus.SUSPEND
+                self.change |= PortStatus.SUSPEND
+        elif feature == PortFeature.PORT_POWER:
+            self.status &= ~(PortStatus.POWER | PortStatus.CONNECTION | PortStatus.ENABLE)
+        elif PortFeature.C_PORT_CONNECTION <= feature <= PortFeature.C_PORT_RESET:
+            self.change &= ~(1 << (feature - PortFeature.C_PORT_CONNECTION))
+        elif feature == PortFeature.PORT_INDICATOR:
+            pass
+        else:
+            return False
+        return True
+
+
 class USBHubClass(USBClass):
     name = 'HubClass'
 
-    def __init__(self, app, phy):
+    GET_STATUS = 0x00
+    CLEAR_FEATURE = 0x01
+    SET_FEATURE = 0x03
+    GET_DESCRIPTOR = 0x06
+
+    def __init__(self, app, phy, num_ports=4):
         super(USBHubClass, self).__init__(app, phy)
-        self.num_ports = 7
-        self.hub_chars = 0x0000
-        self.pwr_on_2_pwr_good = 2
-        self.hub_contr_current = 50
+        self.num_ports = num_ports
+        self.hub_chars = 0xe000
+        self.pwr_on_2_pwr_good = 0x32
+        self.hub_contr_current = 0x64
+        self.ports = [HubPort(i + 1) for i in range(num_ports)]
+        # port that was reset last, its device answers on the default address
+        self.reset_port = None
 
     def setup_local_handlers(self):
         self.local_handlers = {
-            0x00: self.handle_get_hub_status,
-            0x03: self.handle_set_port_feature,
-            0x06: self.handle_get_descriptor
+            self.GET_STATUS: self.handle_get_hub_status,
+            self.CLEAR_FEATURE: self.handle_clear_port_feature,
+            self.SET_FEATURE: self.handle_set_port_feature,
+            self.GET_DESCRIPTOR: self.handle_get_descriptor
         }
 
+    def get_port(self, req):
+        if req.get_recipient() != Request.recipient_other:
+            return None
+        if 1 <= req.index & 0xff <= self.num_ports:
+            return self.ports[(req.index & 0xff) - 1]
+        return None
+
     @mutable('hub_get_hub_status_response')
     def handle_get_hub_status(self, req):
-        i = req.index
-        if i:
-            self.info('GetPortStatus (%d)' % i)
-        else:
-            self.info('GetHubStatus')
-        return b'\x00\x00\x00\x00'
+        port = self.get_port(req)
+        if port is None:
+            self.debug('GetHubStatus')
+            return b'\x00\x00\x00\x00'
+        self.debug('GetPortStatus (%d): %#06x %#06x' % (port.number, port.status, port.change))
+        return struct.pack('<HH', port.status, port.change)
 
     @mutable('hub_set_port_feature_response')
     def handle_set_port_feature(self, req):
-        return b'\x01'
+        port = self.get_port(req)
+        if port is None:
+            # hub features (C_HUB_LOCAL_POWER, C_HUB_OVER_CURRENT) have no state
+            return b''
+        self.debug('SetPortFeature (%d): %d' % (port.number, req.value))
+        if not port.set_feature(req.value):
+            self.phy.stall_ep0()
+            return None
+        if req.value == PortFeature.PORT_RESET and port.device is not None:
+            self.reset_port = port
+        return b''
+
+    def handle_clear_port_feature(self, req):
+        port = self.get_port(req)
+        if port is None:
+            return b''
+        self.debug('ClearPortFeature (%d): %d' % (port.number, req.value))
+        if not port.clear_feature(req.value):
+            self.phy.stall_ep0()
+            return None
+        return b''
 
     @mutable('hub_descriptor')
     def handle_get_descriptor(self, req):
+        return self.get_hub_descriptor()
+
+    def get_hub_descriptor(self):
+        # DeviceRemovable and PortPwrCtrlMask have a bit per port, bit 0 is reserved
+        num_bytes = (self.num_ports + 1 + 7) // 8
         d = struct.pack(
             '<BBHBB',
             DescriptorType.hub,
@@ -51,19 +200,30 @@ class USBHubClass(USBClass):
             self.pwr_on_2_pwr_good,
             self.hub_contr_current,
         )
-        num_bytes = self.num_ports // 7
-        if self.num_ports % 7 != 0:
-            num_bytes += 1
         d += b'\x00' * num_bytes
         d += b'\xff' * num_bytes
         d = struct.pack('B', len(d) + 1) + d
         return d
 
+    def get_status_change(self):
+        '''
+        :return: status change bitmap (11.12.4), None if nothing changed
+        '''
+        bitmap = 0
+        for port in self.ports:
+            if port.change:
+                bitmap |= 1 << port.number
+        if not bitmap:
+            return None
+        return bitmap.to_bytes((self.num_ports + 1 + 7) // 8, 'little')
+
 
 class USBHubInterface(USBInterface):
     name = 'HubInterface'
 
-    def __init__(self, app, phy, num=0):
+    def __init__(self, app, phy, num=0, usb_class=None):
+        if usb_class is None:
+            usb_class = USBHubClass(app, phy)
         # TODO: un-hardcode string index
         super(USBHubInterface, self).__init__(
             app=app,
@@ -91,40 +251,29 @@ class USBHubInterface(USBInterface):
             descriptors={
                 DescriptorType.hub: self.get_hub_descriptor
             },
-            usb_class=USBHubClass(app, phy)
+            usb_class=usb_class
         )
 
     @mutable('hub_descriptor')
-    def get_hub_descriptor(self, **kwargs):
-        bLength = 9
-        bDescriptorType = 0x29
-        bNbrPorts = 4
-        wHubCharacteristics = 0xe000
-        bPwrOn2PwrGood = 0x32
-        bHubContrCurrent = 0x64
-        DeviceRemovable = 0
-        PortPwrCtrlMask = 0xff
-
-        return struct.pack(
-            '<BBBHBBBB',
-            bLength,
-            bDescriptorType,
-            bNbrPorts,
-            wHubCharacteristics,
-            bPwrOn2PwrGood,
-            bHubContrCurrent,
-            DeviceRemovable,
-            PortPwrCtrlMask
-        )
+    def get_hub_descriptor(self, *args, **kwargs):
+        return self.usb_class.get_hub_descriptor()
 
     def handle_buffer_available(self):
-        return
+        change = self.usb_class.get_status_change()
+        if change is not None:
+            self.send_on_endpoint(2, change)
 
 
 class USBHubDevice(USBDevice):
     name = 'HubDevice'
 
-    def __init__(self, app, phy, vid=0x05e3, pid=0x0610, rev=0x7732, **kwargs):
+    def __init__(self, app, phy, vid=0x05e3, pid=0x0610, rev=0x7732, ports=4, children=None, **kwargs):
+        '''
+        :param ports: number of downstream ports (default: 4)
+        :param children: devices to attach to the ports, a comma separated list
+                         of device classes or a list of USBDevice instances (default: None)
+        '''
+        hub_class = USBHubClass(app, phy, ports)
         super(USBHubDevice, self).__init__(
             app=app,
             phy=phy,
@@ -145,13 +294,93 @@ class USBHubDevice(USBDevice):
                     index=1,
                     string='Emulated Hub',
                     interfaces=[
-                        USBHubInterface(app, phy)
+                        USBHubInterface(app, phy, usb_class=hub_class)
                     ],
                     attributes=USBConfiguration.ATTR_SELF_POWERED,
                 )
             ],
-            usb_class=USBHubClass(app, phy)
+            usb_class=hub_class
         )
+        self.hub_class = hub_class
+        # bus address: child device
+        self.children = {}
+        if isinstance(children, str):
+            children = [self.create_child(name.strip()) for name in children.split(',') if name.strip()]
+        for i, child in enumerate(children or []):
+            self.attach(i + 1, child)
+
+    @mutable('hub_descriptor')
+    def handle_get_hub_descriptor_request(self, num):
+        return self.hub_class.get_hub_descriptor()
+
+    def create_child(self, name):
+        '''
+        :param name: device class (see numap-list)
+        :return: USBDevice instance
+        '''
+        return load_device_module(name).usb_device(self.app, self.phy)
+
+    def attach(self, port_number, device):
+        '''
+        :param port_number: port number, starting at 1
+        :param device: USBDevice to connect to the port
+        '''
+        if not 1 <= port_number <= self.hub_class.num_ports:
+            raise Exception('Hub has no port %d' % port_number)
+        self.info('Attaching %s to hub port %d' % (device.name, port_number))
+        # the child is served by the service loop of the hub
+        self.runtime.adopt(device.runtime)
+        device.runtime = self.runtime
+        self.hub_class.ports[port_number - 1].attach(device)
+
+    def detach(self, port_number):
+        '''
+        :param port_number: port number, starting at 1
+        '''
+        port = self.hub_class.ports[port_number - 1]
+        if port.device is not None:
+            self.children = {a: d for a, d in self.children.items() if d is not port.device}
+        port.detach()
+
+    def route(self, address):
+        '''
+        :param address: bus address of a transaction
+        :return: device that owns the address, None if there is none
+        '''
+        if address == self.address:
+            return self
+        if address == 0:
+            port = self.hub_class.reset_port
+            if port is not None and port.device is not None and port.status & PortStatus.ENABLE:
+                return port.device
+            return None
+        return self.children.get(address)
+
+    def handle_request_for(self, address, req):
+        '''
+        Pass a setup request to the device with the given address
+
+        :param address: bus address of the request
+        :param req: USBDeviceRequest
+        '''
+        device = self.route(address)
+        if device is None:
+            return
+        if device is not self and req.get_type() == Request.type_standard and req.request == 5:
+            # SET_ADDRESS moves the child from the default address to its own
+            self.children[req.value] = device
+            self.hub_class.reset_port = None
+        device.handle_request(req)
+
+    def handle_data_available_for(self, address, ep_num, data):
+        device = self.route(address)
+        if device is not None:
+            device.handle_data_available(ep_num, data)
+
+    def handle_buffer_available_for(self, address, ep_num):
+        device = self.route(address)
+        if device is not None:
+            device.handle_buffer_available(ep_num)
 
 
 usb_device = USBHubDevice
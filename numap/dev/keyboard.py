@@ -11,6 +11,7 @@ from numap.core.usb_configuration import USBConfiguration
 from numap.core.usb_interface import USBInterface
 from numap.core.usb_endpoint import USBEndpoint
 from numap.fuzz.helpers import mutable
+from numap.utils.keystrokes import KeystrokeScheduler
 
 
 class Requests(object):
@@ -54,7 +55,12 @@ class USBKeyboardClass(USBClass):
 class USBKeyboardInterface(USBInterface):
     name = 'KeyboardInterface'
 
-    def __init__(self, app, phy):
+    def __init__(self, app, phy, text=None, script=None, layout='us'):
+        '''
+        :param text: text to type (default: None, 'ls' + enter unless a script is given)
+        :param script: keystroke script file (see numap/utils/keystrokes.py) (default: None)
+        :param layout: keyboard layout of the host (default: 'us')
+        '''
         super(USBKeyboardInterface, self).__init__(
             app=app,
             phy=phy,
@@ -73,8 +79,8 @@ class USBKeyboardInterface(USBInterface):
                     transfer_type=USBEndpoint.transfer_type_interrupt,
                     sync_type=USBEndpoint.sync_type_none,
                     usage_type=USBEndpoint.usage_type_data,
-                    max_packet_size=0x40,
-                    interval=0x40,
+                    max_packet_size=0x08,
+                    interval=0x0a,
                     handler=self.handle_buffer_available
                 )
             ],
@@ -85,22 +91,35 @@ class USBKeyboardInterface(USBInterface):
             usb_class=USBKeyboardClass(app, phy)
         )
 
-        empty_preamble = [0x00] * 10
-        text = [0x0f, 0x00, 0x16, 0x00, 0x28, 0x00]
-
-        self.keys = [chr(x) for x in empty_preamble + text]
-        self.call_count = 0
+        # the descriptors never change, build them once
+        self.report_descriptor = self.build_report_descriptor()
+        self.hid_descriptor = self.build_hid_descriptor()
+        self.keys = KeystrokeScheduler(layout)
+        if script:
+            self.keys.load_script(script)
+        if text or not script:
+            self.keys.type_text(text or 'ls\n')
+        # reports are sent once per polling interval (ms), so the host sees each key
+        self.report_interval = self.endpoints[0].interval / 1000.0
+        self.last_report = 0
         self.first_call = None
 
     @mutable('hid_descriptor')
     def get_hid_descriptor(self, *args, **kwargs):
-        report_descriptor = self.get_report_descriptor()
+        return self.hid_descriptor
+
+    @mutable('hid_report_descriptor')
+    def get_report_descriptor(self, *args, **kwargs):
+        self.first_call = None
+        return self.report_descriptor
+
+    def build_hid_descriptor(self):
         bDescriptorType = b'\x21'  # HID
         bcdHID = b'\x10\x01'
         bCountryCode = b'\x00'
         bNumDescriptors = b'\x01'
         bDescriptorType2 = b'\x22'  # REPORT
-        desclen = len(report_descriptor)
+        desclen = len(self.report_descriptor)
         wDescriptorLength = struct.pack('<H', desclen)
         hid_descriptor = (
             bDescriptorType +
@@ -114,9 +133,7 @@ class USBKeyboardInterface(USBInterface):
         hid_descriptor = bLength + hid_descriptor
         return hid_descriptor
 
-    @mutable('hid_report_descriptor')
-    def get_report_descriptor(self, *args, **kwargs):
-        self.first_call = None
+    def build_report_descriptor(self):
         usage_page_generic_desktop_controls = b'\x05\x01'
         # usage_page_generic_desktop_controls = b'\xb1\x01'
         usage_keyboard = b'\x09\x06'
@@ -137,8 +154,17 @@ class USBKeyboardInterface(USBInterface):
         logical_minimum2 = b'\x15\x00'
         logical_maximum2 = b'\x25\x65'
         report_size3 = b'\x75\x08'
-        report_count3 = b'\x95\x01'
+        report_count3 = b'\x95\x06'
         input_data_array_absolute_bitfield = b'\x81\x00'
+        usage_page_leds = b'\x05\x08'
+        usage_minimum3 = b'\x19\x01'
+        usage_maximum3 = b'\x29\x05'
+        report_count4 = b'\x95\x05'
+        report_size4 = b'\x75\x01'
+        output_data_variable_absolute_bitfield = b'\x91\x02'
+        report_count5 = b'\x95\x01'
+        report_size5 = b'\x75\x03'
+        output_constant_array_absolute_bitfield = b'\x91\x01'
         end_collection = b'\xc0'
 
         report_descriptor = (
@@ -163,6 +189,15 @@ class USBKeyboardInterface(USBInterface):
             report_size3 +
             report_count3 +
             input_data_array_absolute_bitfield +
+            usage_page_leds +
+            usage_minimum3 +
+            usage_maximum3 +
+            report_count4 +
+            report_size4 +
+            output_data_variable_absolute_bitfield +
+            report_count5 +
+            report_size5 +
+            output_constant_array_absolute_bitfield +
             end_collection
         )
         return report_descriptor
@@ -174,25 +209,33 @@ class USBKeyboardInterface(USBInterface):
         # ignores the actual ep (2 in this case), we'll just
         # wait for a little while... (see section 7.2.1 in HID spec)
         #
+        now = time.time()
         if self.first_call is None:
-            self.first_call = time.time()
-        if time.time() - self.first_call > 2:
+            self.first_call = now
+        if now - self.first_call > 2 and now - self.last_report >= self.report_interval:
             self.usb_function_supported('buffer available for keyboard report')
-            if self.keys:
-                letter = self.keys.pop(0)
-            else:
-                letter = b'\x00'
-            self.type_letter(letter)
+            report = self.keys.next_report(now)
+            if report is not None:
+                self.last_report = now
+                self.send_report(report)
+
+    def send_report(self, report):
+        '''
+        :param report: 8 byte boot keyboard report
+        '''
+        self.send_on_endpoint(2, report)
 
-    def type_letter(self, letter, modifiers=0):
-        data = struct.pack('<BBB', 0, 0, ord(letter))
-        self.send_on_endpoint(2, data)
+    def type_text(self, text):
+        '''
+        :param text: text to type after the queued keystrokes
+        '''
+        self.keys.type_text(text)
 
 
 class USBKeyboardDevice(USBDevice):
     name = 'KeyboardDevice'
 
-    def __init__(self, app, phy, vid=0x610b, pid=0x4653, rev=0x1234, **kwargs):
+    def __init__(self, app, phy, vid=0x610b, pid=0x4653, rev=0x1234, text=None, script=None, layout='us', **kwargs):
         super(USBKeyboardDevice, self).__init__(
             app=app,
             phy=phy,
@@ -213,7 +256,7 @@ class USBKeyboardDevice(USBDevice):
                     index=1,
                     string='Emulated Keyboard',
                     interfaces=[
-                        USBKeyboardInterface(app, phy)
+                        USBKeyboardInterface(app, phy, text, script, layout)
                     ]
                 )
             ],
@@ -13,10 +13,9 @@
 from mmap import mmap
 import os
 import struct
-from threading import Thread, Event
-import time
 
-from six.moves.queue import Queue
+from numap.core.endpoint_buffer import EndpointBuffer
+from numap.core.runtime import EndpointStream
 from numap.core.usb_device import USBDevice
 from numap.core.usb_configuration import USBConfiguration
 from numap.core.usb_interface import USBInterface
@@ -25,6 +24,9 @@ from numap.core.usb_class import USBClass
 from numap.core.usb_base import USBBaseActor
 from numap.fuzz.helpers import mutable
 
+# queued in the rx stream by handle_reset, the worker resets the state in order
+RESET = object()
+
 
 class ScsiCmds(object):
     TEST_UNIT_READY = 0x00
@@ -166,14 +168,33 @@ class ScsiDevice(USBBaseActor):
             ScsiCmds.READ_CAPACITY_16: self.handle_read_capacity_16,
         }
         self.is_write_in_progress = False
-        self.handle_reset()
-        self.stop_event = Event()
-        self.thread = Thread(target=self.handle_data_loop)
-        self.thread.daemon = True
-        self.thread.start()
+        # OUT packets from the host, processed by serve()
+        self.rx = EndpointStream('scsi rx', maxsize=256)
+        # responses, sent by the interface when the IN endpoint is ready
+        self.tx = EndpointBuffer('scsi tx', capacity=0x10000)
+        self.runtime = None
+        self.reset()
+
+    def start(self, runtime):
+        '''
+        :param runtime: DeviceRuntime of the device, runs the commands
+        '''
+        self.runtime = runtime
+        runtime.watch(self.rx)
+        runtime.spawn(self.serve)
+        runtime.at_stop(self.tx.close)
 
     def handle_reset(self):
+        '''
+        Called by the PHY. The command in progress is finished by the worker,
+        which resets the state after it (see reset).
+        '''
         self.debug('handling reset')
+        self.rx.clear()
+        self.tx.clear()
+        self.rx.put_nowait(RESET)
+
+    def reset(self):
         if self.is_write_in_progress and self.write_data:
             self.disk_image.put_sector_data(self.write_base_lba, self.write_data)
         self.is_write_in_progress = False
@@ -181,19 +202,31 @@ class ScsiDevice(USBBaseActor):
         self.write_base_lba = 0
         self.write_length = 0
         self.write_data = b''
-        self.tx = Queue()
-        self.rx = Queue()
+        self.tx.clear()
 
     def stop(self):
-        self.stop_event.set()
-
-    def handle_data_loop(self):
-        while not self.stop_event.isSet():
-            if not self.rx.empty():
-                data = self.rx.get()
-                self.handle_data(data)
+        self.rx.clear()
+        self.tx.close()
+
+    async def serve(self):
+        self.tx.closed = False
+        while True:
+            packets = [await self.rx.get()]
+            while len(self.rx):
+                packets.append(self.rx.get_nowait())
+            # the disk image is accessed in a worker thread, enumeration goes on meanwhile
+            await self.runtime.run_blocking(self.handle_packets, packets)
+
+    def respond(self, data):
+        # runs in a worker thread, waits while the host does not read
+        self.tx.put(data, block=True)
+
+    def handle_packets(self, packets):
+        for data in packets:
+            if data is RESET:
+                self.reset()
             else:
-                time.sleep(0.0001)
+                self.handle_data(data)
 
     def handle_data(self, data):
         if self.is_write_in_progress:
@@ -205,15 +238,15 @@ class ScsiDevice(USBBaseActor):
                 try:
                     resp = self.handlers[opcode](cbw)
                     if resp is not None:
-                        self.tx.put(resp)
-                    self.tx.put(scsi_status(cbw, ScsiCmdStatus.COMMAND_PASSED))
+                        self.respond(resp)
+                    self.respond(scsi_status(cbw, ScsiCmdStatus.COMMAND_PASSED))
                 except Exception as ex:
                     self.warning('exception while processing opcode %#x' % (opcode))
                     self.warning(ex)
-                    self.tx.put(scsi_status(cbw, ScsiCmdStatus.COMMAND_FAILED))
+                    self.respond(scsi_status(cbw, ScsiCmdStatus.COMMAND_FAILED))
             else:
                 self.error('No handler for opcode %#x, return CSW with ScsiCmdStatus.COMMAND_FAILED' % (opcode))
-                self.tx.put(scsi_status(cbw, ScsiCmdStatus.COMMAND_FAILED))
+                self.respond(scsi_status(cbw, ScsiCmdStatus.COMMAND_FAILED))
 
     def handle_write_data(self, data):
         self.write_data += data
@@ -224,7 +257,7 @@ class ScsiDevice(USBBaseActor):
             self.disk_image.put_sector_data(self.write_base_lba, self.write_data)
             self.is_write_in_progress = False
             self.write_data = b''
-            self.tx.put(scsi_status(self.write_cbw, ScsiCmdStatus.COMMAND_PASSED))
+            self.respond(scsi_status(self.write_cbw, ScsiCmdStatus.COMMAND_PASSED))
 
     @mutable('scsi_inquiry_response')
     def handle_inquiry(self, cbw):
@@ -320,7 +353,7 @@ class ScsiDevice(USBBaseActor):
         self.debug('SCSI Read (10), lba %#x + %#x block(s)' % (base_lba, num_blocks))
         for block_num in range(num_blocks):
             data = self.disk_image.get_sector_data(base_lba + block_num)
-            self.tx.put(data)
+            self.respond(data)
 
     @mutable('scsi_write_6_response')
     def handle_write_6(self, cbw):
@@ -496,13 +529,18 @@ class USBMassStorageInterface(USBInterface):
         self.scsi_device = scsi_device
 
     def handle_buffer_available(self):
-        if not self.scsi_device.tx.empty():
-            data = self.scsi_device.tx.get()
+        tx = self.scsi_device.tx
+        # 64 bytes at full speed, 512 at high speed, 1024 at SuperSpeed
+        max_packet_size = self.endpoints[1].get_max_packet_size()
+        if tx.max_packet_size != max_packet_size:
+            tx.set_max_packet_size(max_packet_size)
+        data = tx.get()
+        if data is not None:
             self.send_on_endpoint(3, data)
 
     def handle_data_available(self, data):
         self.debug('handling %d bytes of SCSI data' % (len(data)))
-        self.scsi_device.rx.put(data)
+        self.scsi_device.rx.put_nowait(data)
 
 
 class USBMassStorageDevice(USBDevice):
@@ -541,6 +579,7 @@ class USBMassStorageDevice(USBDevice):
                 )
             ],
         )
+        self.scsi_device.start(self.runtime)
 
     def disconnect(self):
         super(USBMassStorageDevice, self).disconnect()
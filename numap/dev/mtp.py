@@ -9,25 +9,24 @@ from numap.core.usb_endpoint import USBEndpoint
 from numap.core.usb_vendor import USBVendor
 from numap.core.usb_class import USBClass
 from numap.fuzz.helpers import mutable
-try:
-    from mtpdevice.mtp_device import MtpDevice, MtpDeviceInfo
-    from mtpdevice.mtp_object import MtpObject
-    from mtpdevice.mtp_storage import MtpStorage, MtpStorageInfo
-    from mtpdevice.mtp_api import MtpApi
-    from mtpdevice.mtp_property import MtpDeviceProperty, MtpDevicePropertyCode
-    from mtpdevice.mtp_data_types import MStr, UInt8
-    mtpdeviceloaded = True
-except:
-    print('Failed to load mtpdevice. please install pymtpdevice (https://github.com/BinyaminSharet/Mtp)')
-    mtpdeviceloaded = False
 
 
 class USBMtpInterface(USBInterface):
     name = 'MtpInterface'
 
     def __init__(self, app, phy):
-        if not mtpdeviceloaded:
-            raise Exception('You cannot use USBMtp until you install pymtpdevice')
+        # imported here, so listing the device classes does not need pymtpdevice
+        try:
+            from mtpdevice.mtp_device import MtpDevice, MtpDeviceInfo
+            from mtpdevice.mtp_object import MtpObject
+            from mtpdevice.mtp_storage import MtpStorage, MtpStorageInfo
+            from mtpdevice.mtp_api import MtpApi
+            from mtpdevice.mtp_property import MtpDeviceProperty, MtpDevicePropertyCode
+            from mtpdevice.mtp_data_types import MStr, UInt8
+        except ImportError:
+            raise Exception(
+                'You cannot use USBMtp until you install pymtpdevice (https://github.com/BinyaminSharet/Mtp)'
+            )
         # TODO: un-hardcode string index (last arg before 'verbose')
         super(USBMtpInterface, self).__init__(
             app=app,
@@ -4,7 +4,6 @@ Contains class definitions to implement a USB printer device.
 Still not working well, linux fails to set altsetting 0 on iface 0
 and then we get exception from Max342xPhy
 '''
-import time
 import struct
 import ast
 
@@ -14,6 +13,7 @@ from numap.core.usb_configuration import USBConfiguration
 from numap.core.usb_interface import USBInterface
 from numap.core.usb_endpoint import USBEndpoint
 from numap.fuzz.helpers import mutable
+from numap.utils.print_job import PrintJobSink
 
 DEFAULT_DEVICE_ID = '''{\
  'MFG': 'Hewlett-Packard',\
@@ -60,10 +60,6 @@ class USBPrinterInterface(USBInterface):
     name = 'PrinterInterface'
 
     def __init__(self, app, phy, int_num, usbclass, sub, proto):
-        self.filename = time.strftime('%Y%m%d%H%M%S', time.localtime())
-        self.filename += '.pcl'
-        self.writing = False
-
         endpoints0 = [
             USBEndpoint(
                 app=app,
@@ -135,22 +131,10 @@ class USBPrinterInterface(USBInterface):
             endpoints=endpoints,
             usb_class=USBPrinterClass(app, phy),
         )
+        self.sink = PrintJobSink(self)
 
-    @mutable('handle_data_available')
     def handle_data_available(self, data):
-        if not self.writing:
-            self.info('Writing PCL file: %s' % self.filename)
-
-        with open(self.filename, 'ab') as out_file:
-            self.writing = True
-            out_file.write(data)
-
-        text_buffer = ''.join(chr(c) for c in data)
-
-        if 'EOJ\n' in text_buffer:
-            self.info('File write complete')
-            out_file.close()
-            self.writing = False
+        self.sink.write(data)
 
 
 class USBPrinterDevice(USBDevice):
@@ -189,6 +173,16 @@ class USBPrinterDevice(USBDevice):
         )
         self.strings.append(DEFAULT_DEVICE_ID)  # the device_id is the last string in strings, the device class references the string list and always uses the last string
         self.configurations[0].interfaces[0].usb_class.set_strings(self.strings)
+        # complete the current print job when the device stops
+        self.runtime.at_stop(self.close_print_jobs)
+
+    def close_print_jobs(self):
+        for interface in self.configurations[0].interfaces:
+            interface.sink.close()
+
+    def disconnect(self):
+        super(USBPrinterDevice, self).disconnect()
+        self.close_print_jobs()
 
 
 usb_device = USBPrinterDevice
@@ -0,0 +1,158 @@
+'''
+Registry of the device classes that can be emulated (-C).
+
+Only metadata is kept here, the device modules are imported when a device
+is created, so listing the classes does not load any device code.
+
+Device packs can add classes with the ``numap.devices`` entry point group.
+An entry point points to a DeviceInfo, or a list of them, in a module that
+is cheap to import (i.e. not the device module itself)::
+
+    entry_points={
+        'numap.devices': ['my_devices = my_pack.numap_devices:DEVICES'],
+    }
+'''
+import importlib
+from collections import namedtuple
+
+DeviceInfo = namedtuple('DeviceInfo', ['name', 'module', 'description', 'strings', 'fuzz_templates'])
+DeviceInfo.__doc__ = '''
+:param name: name of the class, as given to -C
+:param module: module that has the usb_device class
+:param description: one line description
+:param strings: names of the strings of the device, in the order of their index (see numap-strings)
+:param fuzz_templates: module of the fuzzing templates of the class (None: only the generic ones)
+'''
+
+ENTRY_POINT_GROUP = 'numap.devices'
+
+STANDARD_STRINGS = ('Manufacturer String', 'Product String', 'Serial Number String', 'Configuration String')
+DEVICE_STRINGS = STANDARD_STRINGS[:3]
+
+BUILTIN_DEVICES = [
+    DeviceInfo('audio', 'numap.dev.audio', 'Headset', STANDARD_STRINGS, 'numap.fuzz.templates.audio'),
+    DeviceInfo(
+        'billboard', 'numap.dev.billboard', 'A billboard, requires USB-C',
+        STANDARD_STRINGS + ('Billboard Additional Info String', 'Alternate Mode String'), None
+    ),
+    DeviceInfo('bluetooth_cypress', 'numap.dev.bluetooth_cypress', 'A Bluetooth Cypress adapter.', DEVICE_STRINGS, None),
+    DeviceInfo(
+        'cdc_acm', 'numap.dev.cdc_acm', 'Abstract Control Model device (like serial modem)',
+        STANDARD_STRINGS, 'numap.fuzz.templates.cdc'
+    ),
+    DeviceInfo(
+        'cdc_ecm', 'numap.dev.cdc_ecm', 'Ethernet Control Model device (Ethernet over USB)',
+        STANDARD_STRINGS, 'numap.fuzz.templates.cdc'
+    ),
+    DeviceInfo(
+        'cdc_eem', 'numap.dev.cdc_eem', 'Ethernet Emulation Model device (Ethernet over USB)',
+        STANDARD_STRINGS, 'numap.fuzz.templates.cdc'
+    ),
+    DeviceInfo(
+        'cdc_dl', 'numap.dev.cdc_dl', 'Direct Line Control device (like modem)',
+        STANDARD_STRINGS, 'numap.fuzz.templates.cdc'
+    ),
+    DeviceInfo(
+        'cdc_ncm', 'numap.dev.cdc_ncm', 'Network Control Model device (Ethernet over USB)',
+        STANDARD_STRINGS, 'numap.fuzz.templates.cdc'
+    ),
+    DeviceInfo(
+        'composite', 'numap.dev.composite', 'Composite device (keyboard and mass storage by default, see --functions)',
+        STANDARD_STRINGS, None
+    ),
+    DeviceInfo('ftdi', 'numap.dev.ftdi', 'USB<->RS232 FTDI chip', STANDARD_STRINGS, None),
+    DeviceInfo(
+        'hid', 'numap.dev.hid', 'Generic HID device (mouse by default, see --report-descriptor)',
+        STANDARD_STRINGS, 'numap.fuzz.templates.hid'
+    ),
+    DeviceInfo('hub', 'numap.dev.hub', 'USB hub', STANDARD_STRINGS, 'numap.fuzz.templates.hub'),
+    DeviceInfo('keyboard', 'numap.dev.keyboard', 'Keyboard', STANDARD_STRINGS, 'numap.fuzz.templates.hid'),
+    DeviceInfo(
+        'mass_storage', 'numap.dev.mass_storage', 'Mass Storage device (e.g. thumb drive)',
+        STANDARD_STRINGS, 'numap.fuzz.templates.mass_storage'
+    ),
+    DeviceInfo('mtp', 'numap.dev.mtp', 'Android phone', STANDARD_STRINGS, None),
+    DeviceInfo(
+        'printer', 'numap.dev.printer', 'Printer',
+        STANDARD_STRINGS + (
+            'Device ID (insert as Python dictionary, will be automatically formatted, '
+            'bytes are passed as-is; unlimited length)',
+        ),
+        None
+    ),
+    DeviceInfo('rndis', 'numap.dev.rndis', 'RNDIS network interface', STANDARD_STRINGS, None),
+    DeviceInfo(
+        'smartcard', 'numap.dev.smartcard', 'USB<->smart card interface',
+        STANDARD_STRINGS, 'numap.fuzz.templates.smart_card'
+    ),
+    DeviceInfo('wifi_realtek', 'numap.dev.wifi_realtek', 'Realtek Wifi Adapter', DEVICE_STRINGS, None),
+    DeviceInfo('wifi_qualcomm', 'numap.dev.wifi_qualcomm', 'Qualcomm Atheros Wifi Adapter', DEVICE_STRINGS, None),
+]
+
+_devices = None
+
+
+def _entry_point_devices():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return []
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    found = []
+    for ep in eps:
+        loaded = ep.load()
+        found.extend([loaded] if isinstance(loaded, DeviceInfo) else loaded)
+    return found
+
+
+def get_devices():
+    '''
+    :return: dictionary of all device classes (name: DeviceInfo)
+    '''
+    global _devices
+    if _devices is None:
+        devices = {info.name: info for info in BUILTIN_DEVICES}
+        for info in _entry_point_devices():
+            devices[info.name] = info
+        _devices = devices
+    return _devices
+
+
+def get_device_info(name):
+    '''
+    :param name: name of the device class
+    :return: DeviceInfo
+    '''
+    devices = get_devices()
+    if name not in devices:
+        raise Exception('Unknown device class: %s' % name)
+    return devices[name]
+
+
+def load_device_module(name):
+    '''
+    :param name: name of the device class
+    :return: the module of the device class
+    '''
+    return importlib.import_module(get_device_info(name).module)
+
+
+def get_string_locations():
+    '''
+    :return: dictionary (device name: dictionary (string name: index in the strings of the device))
+    '''
+    return {
+        name: {string: i for i, string in enumerate(info.strings)}
+        for name, info in get_devices().items() if info.strings
+    }
+
+
+def get_fuzz_template_modules():
+    '''
+    :return: sorted list of the fuzzing template modules of all device classes
+    '''
+    return sorted(set(info.fuzz_templates for info in get_devices().values() if info.fuzz_templates))
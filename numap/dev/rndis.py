@@ -2,19 +2,74 @@
 Contains class definitions to implement an RNDIS device, i.e. an Ethernet adapter based on Microsoft's standard.
 
 Implemented as per https://learn.microsoft.com/en-us/windows-hardware/drivers/network/usb-802-3-device-sample
+The control messages are described in [MS-RNDIS].
 '''
-
+import struct
+from collections import deque
 from numap.core.usb_class import USBClass
 from numap.core.usb_device import USBDevice
 from numap.core.usb_configuration import USBConfiguration
 from numap.core.usb_interface import USBInterface
 from numap.core.usb_endpoint import USBEndpoint
 from numap.fuzz.helpers import mutable
+from numap.utils.ethernet import EthernetBridge, RndisFraming, get_sink
+
+RNDIS_STATUS_SUCCESS = 0x00000000
+RNDIS_STATUS_NOT_SUPPORTED = 0xc00000bb
+
+# locally administered address of the emulated adapter
+MAC_ADDRESS = b'\x02\x00\x4e\x75\x6d\x01'
+
+
+class RndisMessage:
+    HALT = 0x00000003
+    INITIALIZE = 0x00000002
+    QUERY = 0x00000004
+    SET = 0x00000005
+    RESET = 0x00000006
+    KEEPALIVE = 0x00000008
+    COMPLETION = 0x80000000
+
+
 class USBRndisClass(USBClass):
     name = 'RndisClass'
 
+    SEND_ENCAPSULATED_COMMAND = 0x00
+    GET_ENCAPSULATED_RESPONSE = 0x01
+
+    oids = {
+        0x00010102: struct.pack('<I', 0),  # OID_GEN_HARDWARE_STATUS
+        0x00010103: struct.pack('<I', 0),  # OID_GEN_MEDIA_SUPPORTED (802.3)
+        0x00010104: struct.pack('<I', 0),  # OID_GEN_MEDIA_IN_USE (802.3)
+        0x00010106: struct.pack('<I', 1500),  # OID_GEN_MAXIMUM_FRAME_SIZE
+        0x00010107: struct.pack('<I', 100000),  # OID_GEN_LINK_SPEED (units of 100 bps)
+        0x0001010c: struct.pack('<I', 0xffffff),  # OID_GEN_VENDOR_ID
+        0x0001010d: b'numap RNDIS\x00',  # OID_GEN_VENDOR_DESCRIPTION
+        0x0001010e: struct.pack('<I', 0),  # OID_GEN_CURRENT_PACKET_FILTER
+        0x00010111: struct.pack('<I', 1558),  # OID_GEN_MAXIMUM_TOTAL_SIZE
+        0x00010114: struct.pack('<I', 0),  # OID_GEN_MEDIA_CONNECT_STATUS (connected)
+        0x00010202: struct.pack('<I', 0),  # OID_GEN_PHYSICAL_MEDIUM
+        0x00020101: struct.pack('<I', 0),  # OID_GEN_XMIT_OK
+        0x00020102: struct.pack('<I', 0),  # OID_GEN_RCV_OK
+        0x00020103: struct.pack('<I', 0),  # OID_GEN_XMIT_ERROR
+        0x00020104: struct.pack('<I', 0),  # OID_GEN_RCV_ERROR
+        0x00020105: struct.pack('<I', 0),  # OID_GEN_RCV_NO_BUFFER
+        0x01010101: MAC_ADDRESS,  # OID_802_3_PERMANENT_ADDRESS
+        0x01010102: MAC_ADDRESS,  # OID_802_3_CURRENT_ADDRESS
+        0x01010104: struct.pack('<I', 1),  # OID_802_3_MAXIMUM_LIST_SIZE
+    }
+
+    def __init__(self, app, phy):
+        super().__init__(app, phy)
+        self.oids = dict(self.oids)
+        # encapsulated responses, each one is announced on the interrupt endpoint
+        self.responses = deque(maxlen=16)
+        self.notifications = 0
+
     def setup_local_handlers(self):
         self.local_handlers = {
+            self.SEND_ENCAPSULATED_COMMAND: self.handle_send_encapsulated_command,
+            self.GET_ENCAPSULATED_RESPONSE: self.handle_get_encapsulated_response,
             0x20: self.handle_unknown,
             0x21: self.handle_unknown,
             0x22: self.handle_unknown,
@@ -29,6 +84,48 @@ class USBRndisClass(USBClass):
         # self.info(req)
         return b''
 
+    def handle_send_encapsulated_command(self, req):
+        data = bytes(req.data)
+        if len(data) < 12:
+            return b''
+        msg_type, _, request_id = struct.unpack_from('<III', data)
+        self.debug('RNDIS control message %#x (request id %#x)' % (msg_type, request_id))
+        response = None
+        if msg_type == RndisMessage.INITIALIZE:
+            # DeviceFlags: connectionless, Medium: 802.3, one packet per transfer of up to 1580 bytes
+            response = struct.pack('<IIIIIIIIII', RNDIS_STATUS_SUCCESS, 1, 0, 1, 0, 1, 1580, 0, 0, 0)
+        elif msg_type == RndisMessage.QUERY:
+            oid, = struct.unpack_from('<I', data, 12)
+            value = self.oids.get(oid)
+            if oid == 0x00010101:  # OID_GEN_SUPPORTED_LIST
+                value = b''.join(struct.pack('<I', o) for o in sorted(self.oids))
+            if value is None:
+                response = struct.pack('<III', RNDIS_STATUS_NOT_SUPPORTED, 0, 0)
+            else:
+                response = struct.pack('<III', RNDIS_STATUS_SUCCESS, len(value), 16) + value
+        elif msg_type == RndisMessage.SET:
+            oid, length, offset = struct.unpack_from('<III', data, 12)
+            if oid in self.oids:
+                self.oids[oid] = data[8 + offset:8 + offset + length]
+                response = struct.pack('<I', RNDIS_STATUS_SUCCESS)
+            else:
+                response = struct.pack('<I', RNDIS_STATUS_NOT_SUPPORTED)
+        elif msg_type == RndisMessage.KEEPALIVE:
+            response = struct.pack('<I', RNDIS_STATUS_SUCCESS)
+        elif msg_type == RndisMessage.RESET:
+            # the reset completion has no request id, status and AddressingReset instead
+            self.responses.append(struct.pack('<IIII', msg_type | RndisMessage.COMPLETION, 16, RNDIS_STATUS_SUCCESS, 0))
+            self.notifications += 1
+        if response is not None:
+            self.responses.append(struct.pack('<III', msg_type | RndisMessage.COMPLETION, 12 + len(response), request_id) + response)
+            self.notifications += 1
+        return b''
+
+    def handle_get_encapsulated_response(self, req):
+        if self.responses:
+            return self.responses.popleft()
+        # no response available, a single zero byte
+        return b'\x00'
 
 
 class CCInterface(USBInterface):
@@ -39,14 +136,14 @@ class CCInterface(USBInterface):
             USBEndpoint(
                 app=app,
                 phy=phy,
-                number=1,
+                number=3,
                 direction=USBEndpoint.direction_in,
-                transfer_type=USBEndpoint.transfer_type_bulk,
+                transfer_type=USBEndpoint.transfer_type_interrupt,
                 sync_type=USBEndpoint.sync_type_none,
                 usage_type=USBEndpoint.usage_type_data,
                 max_packet_size=0x0008,
                 interval=0x01,
-                handler=self.handle_data_available
+                handler=self.handle_buffer_available
             )
         ]
 
@@ -63,15 +160,17 @@ class CCInterface(USBInterface):
             usb_class=USBRndisClass(app, phy)
         )
 
-    @mutable('handle_data_available')
-    def handle_data_available(self, data):
-        self.info(data)
+    def handle_buffer_available(self):
+        if self.usb_class.notifications:
+            self.usb_class.notifications -= 1
+            # RESPONSE_AVAILABLE notification
+            self.send_on_endpoint(3, struct.pack('<II', 1, 0))
 
 
 class DCInterface(USBInterface):
     name = 'DCInterface'
 
-    def __init__(self, app, phy):
+    def __init__(self, app, phy, tap=None):
         endpoints = [
             USBEndpoint(
                 app=app,
@@ -83,19 +182,19 @@ class DCInterface(USBInterface):
                 usage_type=USBEndpoint.usage_type_data,
                 max_packet_size=0x0040,
                 interval=0,
-                handler=self.handle_data_available
+                handler=self.handle_buffer_available
             ),
             USBEndpoint(
                 app=app,
                 phy=phy,
-                number=3,
+                number=1,
                 direction=USBEndpoint.direction_out,
                 transfer_type=USBEndpoint.transfer_type_bulk,
                 sync_type=USBEndpoint.sync_type_none,
                 usage_type=USBEndpoint.usage_type_data,
                 max_packet_size=0x0040,
                 interval=0,
-                handler=None
+                handler=self.handle_data_available
             )
 
         ]
@@ -112,16 +211,19 @@ class DCInterface(USBInterface):
             endpoints=endpoints,
             usb_class=USBRndisClass(app, phy)
         )
+        self.bridge = EthernetBridge(self, RndisFraming(), get_sink(tap), endpoints[0])
 
-    @mutable('handle_data_available')
     def handle_data_available(self, data):
-        self.info(data)
+        self.bridge.handle_data_available(data)
+
+    def handle_buffer_available(self):
+        self.bridge.handle_buffer_available()
 
 
 class USBRndisDevice(USBDevice):
     name = 'RndisDevice'
 
-    def __init__(self, app, phy):
+    def __init__(self, app, phy, vid=0x2001, pid=0x4a00, tap=None, **kwargs):
         super().__init__(
             app=app,
             phy=phy,
@@ -129,8 +231,8 @@ class USBRndisDevice(USBDevice):
             device_subclass=0,
             protocol_rel_num=0,
             max_packet_size_ep0=64,
-            vendor_id=0x2001,  # D-Link Corp.
-            product_id=0x4a00,  # DUB-1312 Gigabit Ethernet Adapter
+            vendor_id=vid,  # D-Link Corp.
+            product_id=pid,  # DUB-1312 Gigabit Ethernet Adapter
             device_rev=1,
             manufacturer_string='numap Inc.',
             product_string='numap RNDIS Network Interface',
@@ -143,11 +245,20 @@ class USBRndisDevice(USBDevice):
                     string='RNDIS',
                     interfaces=[
                         CCInterface(app, phy),
-                        DCInterface(app, phy)
+                        DCInterface(app, phy, tap)
                     ]
                 )
             ]
         )
+        # release the TAP interface when the device stops
+        self.runtime.at_stop(self.close_bridge)
+
+    def close_bridge(self):
+        self.configurations[0].interfaces[1].bridge.close()
+
+    def disconnect(self):
+        super().disconnect()
+        self.close_bridge()
 
 
 usb_device = USBRndisDevice
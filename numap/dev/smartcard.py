@@ -9,14 +9,15 @@
 # This device doesn't work properly yet!!!!!
 
 import struct
-from six.moves.queue import Queue
 from numap.core.usb import DescriptorType
+from numap.core.endpoint_buffer import EndpointBuffer
 from numap.core.usb_class import USBClass
 from numap.core.usb_device import USBDevice
 from numap.core.usb_configuration import USBConfiguration
 from numap.core.usb_interface import USBInterface
 from numap.core.usb_endpoint import USBEndpoint
 from numap.fuzz.helpers import mutable
+from numap.utils.virtual_card import get_card, CcidMessageBuffer, ApduStats, CCID_HEADER_SIZE
 
 
 class ClassRequests(object):
@@ -111,10 +112,27 @@ class RdrToPc(object):
     DataRateAndClock_Frequency = 0x84
 
 
+class ChainParameter(object):
+    '''
+    wLevelParameter of XfrBlock and bChainParameter of DataBlock (6.1.4, 6.2.1)
+    '''
+    COMPLETE = 0x00
+    BEGIN = 0x01
+    END = 0x02
+    CONTINUE = 0x03
+    EMPTY = 0x10
+
+
 class USBSmartcardInterface(USBInterface):
     name = 'SmartcardInterface'
 
-    def __init__(self, app, phy):
+    # dwMaxCCIDMessageLength
+    MAX_MESSAGE_LENGTH = 0x0000010f
+
+    def __init__(self, app, phy, card=None):
+        '''
+        :param card: virtual card, see numap/utils/virtual_card.py (default: None, scripted default card)
+        '''
         descriptors = {
             DescriptorType.hid: self.get_icc_descriptor
         }
@@ -197,8 +215,14 @@ class USBSmartcardInterface(USBInterface):
         self.proto = 0
         self.abProtocolDataStructure = b'\x11\x00\x00\x0a\x00'
         self.clock_status = 0x00
-        self.int_q = Queue()
+        # RDR_to_PC_NotifySlotChange messages for the interrupt endpoint
+        self.int_q = EndpointBuffer('smartcard interrupt', capacity=0x100, max_packet_size=8, max_transfer=8)
         self.int_q.put(b'\x50\x03')
+        self.card = get_card(card)
+        self.messages = CcidMessageBuffer(self.MAX_MESSAGE_LENGTH)
+        self.apdu = bytearray()
+        self.response = b''
+        self.apdu_stats = ApduStats()
 
         self.operations = {
             PcToRdrOpcode.IccPowerOn: self.handle_PcToRdr_IccPowerOn,
@@ -219,10 +243,9 @@ class USBSmartcardInterface(USBInterface):
 
     @mutable('smartcard_IccPowerOn_response')
     def handle_PcToRdr_IccPowerOn(self, slot, seq, data):
-        abData = b'\x3b\x6e\x00\x00\x80\x31\x80\x66\xb0\x84\x12\x01\x6e\x01\x83\x00\x90\x00'
-        # Entropia Universe Gold card
-        # Taken from http://ludovic.rousseau.free.fr/softwares/pcsc-tools/smartcard_list.txt
-        abData = b'\x3B\x6B\x00\x00\x00\x31\xC0\x64\xA9\xEC\x01\x00\x82\x90\x00'
+        abData = self.card.reset()
+        self.apdu = bytearray()
+        self.response = b''
         return R2P_DataBlock(
             slot=slot,
             seq=seq,
@@ -255,18 +278,41 @@ class USBSmartcardInterface(USBInterface):
             clock_status=self.clock_status
         )
 
-    @mutable('smartcard_XfrBlock_response')
+    @mutable('smartcard_XfrBlock_response', silent=True)
     def handle_PcToRdr_XfrBlock(self, slot, seq, data):
         '''
-        .. todo:: check the response again later,
+        Pass the APDU to the card, long APDUs and responses are chained (6.1.4)
         '''
-        abData = b'\x6a\x82'
+        level = struct.unpack('<H', data[8:10])[0]
+        if level in (ChainParameter.COMPLETE, ChainParameter.BEGIN):
+            self.apdu = bytearray(data[CCID_HEADER_SIZE:])
+        elif level in (ChainParameter.END, ChainParameter.CONTINUE):
+            self.apdu += data[CCID_HEADER_SIZE:]
+        if level in (ChainParameter.BEGIN, ChainParameter.CONTINUE):
+            # ask for the next part of the command
+            return R2P_DataBlock(slot=slot, seq=seq, status=0x00, error=0x80, chain_param=ChainParameter.EMPTY, data=b'')
+        if level != ChainParameter.EMPTY:
+            self.response = self.card.transmit(bytes(self.apdu))
+            self.apdu = bytearray()
+            self.apdu_stats.add()
+            report = self.apdu_stats.poll()
+            if report:
+                self.info(report)
+            first = True
+        else:
+            first = False
+        max_data = self.MAX_MESSAGE_LENGTH - CCID_HEADER_SIZE
+        abData, self.response = self.response[:max_data], self.response[max_data:]
+        if first:
+            chain_param = ChainParameter.BEGIN if self.response else ChainParameter.COMPLETE
+        else:
+            chain_param = ChainParameter.CONTINUE if self.response else ChainParameter.END
         return R2P_DataBlock(
             slot=slot,
             seq=seq,
             status=0x00,
             error=0x80,
-            chain_param=0x00,
+            chain_param=chain_param,
             data=abData
         )
 
@@ -413,8 +459,9 @@ class USBSmartcardInterface(USBInterface):
         dwMaxIFSD = 0x000000fe
         dwSynchProtocols = 0x00000000
         dwMechanical = 0x00000000
-        dwFeatures = 0x00010030
-        dwMaxCCIDMessageLength = 0x0000010f
+        # automatic ICC clock frequency and baud rate change, short and extended APDU level exchange
+        dwFeatures = 0x00040030
+        dwMaxCCIDMessageLength = self.MAX_MESSAGE_LENGTH
         bClassGetResponse = 0x00
         bClassEnvelope = 0x00
         wLcdLayout = 0x0000
@@ -451,6 +498,13 @@ class USBSmartcardInterface(USBInterface):
 
     def handle_data_available(self, data):
         self.usb_function_supported()
+        for message in self.messages.feed(data):
+            self.handle_message(message)
+
+    def handle_message(self, data):
+        '''
+        :param data: complete CCID message
+        '''
         opcode, length, slot, seq = struct.unpack('<BIBB', data[:7])
         if opcode in self.operations:
             handler = self.operations[opcode]
@@ -463,10 +517,13 @@ class USBSmartcardInterface(USBInterface):
             response = b''
         if response:
             self.send_on_endpoint(2, response)
+            if len(response) % self.endpoints[1].get_max_packet_size() == 0:
+                # the host reads up to a short packet
+                self.send_on_endpoint(2, b'')
 
     def handle_buffer_available(self):
-        if not self.int_q.empty():
-            buff = self.int_q.get()
+        buff = self.int_q.get()
+        if buff is not None:
             self.debug('Sending data to host: %s' % (buff.hex()))
             self.send_on_endpoint(3, buff)
         else:
@@ -476,7 +533,7 @@ class USBSmartcardInterface(USBInterface):
 class USBSmartcardDevice(USBDevice):
     name = 'SmartcardDevice'
 
-    def __init__(self, app, phy, vid=0x0bda, pid=0x0165, rev=0x2361, **kwargs):
+    def __init__(self, app, phy, vid=0x0bda, pid=0x0165, rev=0x2361, card=None, **kwargs):
         super(USBSmartcardDevice, self).__init__(
             app=app,
             phy=phy,
@@ -497,7 +554,7 @@ class USBSmartcardDevice(USBDevice):
                     index=1,
                     string='Emulated Smartcard',
                     interfaces=[
-                        USBSmartcardInterface(app, phy)
+                        USBSmartcardInterface(app, phy, card)
                     ]
                 )
             ],
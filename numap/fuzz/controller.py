@@ -13,9 +13,14 @@ class UmapController(ClientController):
     Signal the Umap to disconnect / reconnect using files.
     '''
 
-    def __init__(self, pre_disconnect_delay=0.0, post_disconnect_delay=0.0):
+    def __init__(self, pre_disconnect_delay=0.0, post_disconnect_delay=0.0, trigger_dir='/tmp/umap_kitty'):
+        '''
+        :param pre_disconnect_delay: seconds to wait in post_test before disconnecting (default: 0.0)
+        :param post_disconnect_delay: seconds to wait in post_test after disconnecting (default: 0.0)
+        :param trigger_dir: directory for the trigger files, shared with numapfuzz (default: /tmp/umap_kitty)
+        '''
         super(UmapController, self).__init__('UmapController')
-        self.trigger_dir = '/tmp/umap_kitty'
+        self.trigger_dir = trigger_dir
         self.connect_file = 'trigger_reconnect'
         self.disconnect_file = 'trigger_disconnect'
         self.heartbeat_file = 'heartbeat'
@@ -0,0 +1,115 @@
+'''
+Coverage feedback for the fuzzer.
+
+numapfuzz reports, for each test, how far the host got after the mutated
+response was sent (see NumapFuzzApp.get_progress).
+The tracker scores the stages by that progress, so the engine can fuzz
+the stages the host actually parses first, and skip the rest of a
+stage once its mutations stop reaching new states.
+'''
+import os
+import json
+
+
+class CoverageTracker(object):
+    '''
+    Per stage progress statistics, optionally persisted between runs.
+    '''
+
+    def __init__(self, filename=None, plateau=0):
+        '''
+        :param filename: json file to load/store the statistics (default: None)
+        :param plateau: number of consecutive tests without a new progress state
+                        after which a stage is considered exhausted, 0 to disable (default: 0)
+        '''
+        self.filename = filename
+        self.plateau = plateau
+        self.stages = {}
+        if filename and os.path.isfile(filename):
+            with open(filename, 'r') as f:
+                self.stages = json.load(f)
+
+    @classmethod
+    def score(cls, progress):
+        '''
+        :param progress: progress dictionary, as reported by numapfuzz
+        :return: score of the progress, higher is deeper into the enumeration
+        '''
+        return (
+            min(progress.get('requests', 0), 64) +
+            (16 if progress.get('configured', False) else 0) +
+            (32 if progress.get('function_supported', False) else 0)
+        )
+
+    @classmethod
+    def signature(cls, progress):
+        '''
+        :param progress: progress dictionary, as reported by numapfuzz
+        :return: coarse state the host reached (request count is bucketed by powers of two)
+        '''
+        return '%d:%d:%d' % (
+            progress.get('requests', 0).bit_length(),
+            progress.get('configured', False),
+            progress.get('function_supported', False),
+        )
+
+    def _get_stats(self, stage):
+        if stage not in self.stages:
+            self.stages[stage] = {
+                'tests': 0,
+                'total_score': 0,
+                'best_score': 0,
+                'since_new': 0,
+                'frontier': [],
+            }
+        return self.stages[stage]
+
+    def update(self, stage, progress):
+        '''
+        Add the result of a test
+
+        :param stage: the mutated stage
+        :param progress: progress dictionary, as reported by numapfuzz
+        :return: True if the test reached a state that was not reached before for this stage
+        '''
+        stats = self._get_stats(stage)
+        score = self.score(progress)
+        signature = self.signature(progress)
+        stats['tests'] += 1
+        stats['total_score'] += score
+        stats['best_score'] = max(stats['best_score'], score)
+        new_state = signature not in stats['frontier']
+        if new_state:
+            stats['frontier'].append(signature)
+            stats['since_new'] = 0
+        else:
+            stats['since_new'] += 1
+        self.save()
+        return new_state
+
+    def priority(self, stage):
+        '''
+        :param stage: stage name
+        :return: priority of the stage, stages that were never tested come first
+        '''
+        stats = self.stages.get(stage)
+        if not stats or not stats['tests']:
+            return float('inf')
+        mean = stats['total_score'] / float(stats['tests'])
+        frontier_rate = len(stats['frontier']) / float(stats['tests'])
+        return mean * (1 + frontier_rate)
+
+    def is_plateau(self, stage):
+        '''
+        :param stage: stage name
+        :return: whether the last tests of the stage did not reach any new state
+        '''
+        if not self.plateau:
+            return False
+        stats = self.stages.get(stage)
+        return stats is not None and stats['since_new'] >= self.plateau
+
+    def save(self):
+        if self.filename:
+            with open(self.filename, 'w') as f:
+                json.dump(self.stages, f, indent=4, sort_keys=True)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 '''
 Usage:
-    numapkitty -s <stage-file> [-d <pre,post>] [-c <count>] [-k <options>]
+    numapkitty -s <stage-file> [-d <pre,post>] [-c <count>] [-t <trigger-dir>] [-g <coverage-file>] [-p <count>] [-r <db-file> [-H <host-id>] [--report]] [-k <options>]
 
 Options:
     -c --count <count>                  stage count (e.g. how many times a stage might repeat
@@ -9,21 +9,34 @@ Options:
     -d --disconnect-delays=<pre,post>   number of seconds to wait in the post_test before and after
                                         disconnecting the device (might be necessary in order for
                                         failures to be matched with the correct test) [default: 0.0,0.0]
+    -g --coverage <coverage-file>       file to keep the host progress per stage in, stages are fuzzed
+                                        by the progress they made in previous runs (untested stages first)
+    -p --plateau <count>                skip the rest of a stage after <count> consecutive tests
+                                        without reaching a new host state (0 - never skip) [default: 0]
+    -r --results <db-file>              results database, tests that were already run against the host are skipped
+    -H --host-id <host-id>              id of the host in the results database
+                                        (default: derived from the stage file)
+    --report                            print the throughput and coverage from the results database and exit
     -k --kitty-options <options>        options for the kitty fuzzer, use -k -h to get a full list
     -s --stage-file <stage-file>        path to stage trace from umap emulation run
+    -t --trigger-dir <trigger-dir>      directory for the trigger files shared with numapfuzz
+                                        [default: /tmp/umap_kitty]
 '''
+import importlib
 import docopt
 from kitty.remote.rpc import RpcServer
-from kitty.fuzzers import ClientFuzzer
 from kitty.targets import ClientTarget
 from kitty.interfaces import WebInterface
 from kitty.model import GraphModel
 from kitty.model import Template, Meta, String, UInt32
 
-from numap.fuzz.templates import audio, cdc, enum, generic, hid, hub, mass_storage
-from numap.fuzz.templates import smart_card
+from numap.fuzz.templates import enum, generic
+from numap.dev.registry import get_fuzz_template_modules
 
 from numap.fuzz.controller import UmapController
+from numap.fuzz.coverage import CoverageTracker
+from numap.fuzz.fuzzer import NumapFuzzer
+from numap.fuzz.results import ResultsDB, get_host_id
 
 
 def enumerate_templates(module):
@@ -104,26 +117,36 @@ def add_stage(g, stage, template, count):
         g.connect(pseudos[-1], template)
 
 
-def get_model(options):
+def get_templates():
+    '''
+    :return: dictionary of all numap templates (stage:template)
+    '''
+    templates = {}
+    templates.update(enumerate_templates(enum))
+    templates.update(enumerate_templates(generic))
+    # the templates of the device classes, see numap.dev.registry
+    for module_name in get_fuzz_template_modules():
+        templates.update(enumerate_templates(importlib.import_module(module_name)))
+    return templates
+
+
+def get_model(options, coverage=None):
     '''
     Get the data model
 
     :param options: options
+    :param coverage: CoverageTracker, used to order the stages (default: None)
     :return: session model
     '''
     stage_file = options['--stage-file']
     stages = get_stages(stage_file)
-    templates = {}
-    templates.update(enumerate_templates(audio))
-    templates.update(enumerate_templates(cdc))
-    templates.update(enumerate_templates(enum))
-    templates.update(enumerate_templates(generic))
-    templates.update(enumerate_templates(hid))
-    templates.update(enumerate_templates(hub))
-    templates.update(enumerate_templates(mass_storage))
-    templates.update(enumerate_templates(smart_card))
+    templates = get_templates()
     g = GraphModel('usb model (%s)' % (stage_file))
-    for stage in stages:
+    stage_order = list(stages)
+    if coverage is not None:
+        # sort is stable, so stages with the same priority keep the stage file order
+        stage_order.sort(key=coverage.priority, reverse=True)
+    for stage in stage_order:
         if stage in templates:
             stage_template = templates[stage]
             stage_count = min(stages[stage], int(options['--count']))
@@ -144,7 +167,7 @@ def get_controller(options):
     except ValueError:
         msg = 'Please specify the --disconnect_delays as two comma-separated floats'
         raise Exception(msg)
-    return UmapController(pre_disconnect_delay, post_disconnect_delay)
+    return UmapController(pre_disconnect_delay, post_disconnect_delay, options['--trigger-dir'])
 
 
 def get_fuzzer(options=None):
@@ -158,24 +181,54 @@ def get_fuzzer(options=None):
         '--kitty-options': None,
         '--stage-file': None,
         '--count': '2',
-        '--disconnect-delays': '0.0,0.0'
+        '--disconnect-delays': '0.0,0.0',
+        '--trigger-dir': '/tmp/umap_kitty',
+        '--coverage': None,
+        '--plateau': '0',
+        '--results': None,
+        '--host-id': None,
     }
     local_options.update(options)
-    fuzzer = ClientFuzzer(name='numap', option_line=local_options['--kitty-options'])
+    coverage = None
+    if local_options['--coverage'] or int(local_options['--plateau']):
+        coverage = CoverageTracker(local_options['--coverage'], int(local_options['--plateau']))
+    results = None
+    host_id = None
+    if local_options['--results']:
+        results = ResultsDB(local_options['--results'])
+        host_id = local_options['--host-id'] or get_host_id(local_options['--stage-file'])
+    fuzzer = NumapFuzzer(
+        name='numap', option_line=local_options['--kitty-options'],
+        coverage=coverage, results=results, host_id=host_id
+    )
     fuzzer.set_interface(WebInterface())
 
     target = ClientTarget(name='USBTarget')
     target.set_controller(get_controller(local_options))
     target.set_mutation_server_timeout(10)
 
-    model = get_model(local_options)
+    model = get_model(local_options, coverage)
     fuzzer.set_model(model)
     fuzzer.set_target(target)
     return fuzzer
 
 
+def print_report(options):
+    '''
+    Print the throughput and coverage of the stages in the stage file
+    '''
+    results = ResultsDB(options['--results'])
+    host_id = options['--host-id'] or get_host_id(options['--stage-file'])
+    templates = get_templates()
+    stages = get_stages(options['--stage-file'])
+    print(results.report(host_id, {s: templates[s] for s in stages if s in templates}))
+
+
 def main():
     options = docopt.docopt(__doc__)
+    if options['--report']:
+        print_report(options)
+        return
     fuzzer = get_fuzzer(options)
     remote = RpcServer(host='localhost', port=26007, impl=fuzzer)
     remote.start()
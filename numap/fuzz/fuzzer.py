@@ -0,0 +1,110 @@
+'''
+Kitty fuzzer for the numap stack
+'''
+import time
+from kitty.fuzzers import ClientFuzzer
+from numap.fuzz.results import indices_to_ranges, get_path_id
+
+
+class NumapFuzzer(ClientFuzzer):
+    '''
+    ClientFuzzer that receives progress reports from numapfuzz
+    and uses them to skip stages whose mutations stopped making progress.
+    If a results database is set, tests that were already executed
+    against the host are skipped and new results are stored.
+    '''
+
+    def __init__(self, name='numap', logger=None, option_line=None, coverage=None, results=None, host_id=None):
+        '''
+        :param name: name of the object (default: 'numap')
+        :param logger: logger for the object (default: None)
+        :param option_line: cmd line options to the fuzzer (default: None)
+        :param coverage: CoverageTracker instance (default: None)
+        :param results: ResultsDB instance (default: None)
+        :param host_id: id of the host in the results database (default: None)
+        '''
+        super(NumapFuzzer, self).__init__(name, logger, option_line)
+        self.coverage = coverage
+        self.results = results
+        self.host_id = host_id
+        self._skip_current_stage = False
+        self._test_start_time = None
+
+    def start(self):
+        # an explicit test list (kitty's -t/-r options) takes precedence over the results database
+        explicit_list = self._test_list is not None and self.session_info.test_list_str not in (None, '', '0-')
+        if self.results is not None and not explicit_list:
+            test_list = self._get_untested_list()
+            if not test_list:
+                self.logger.info('All mutations were already tested on host %s' % self.host_id)
+                self._done_evt.set()
+                return
+            self.set_test_list(test_list)
+        return super(NumapFuzzer, self).start()
+
+    def _get_untested_list(self):
+        '''
+        :return: kitty test list string of the tests that were not executed on the host yet
+        '''
+        self.model._get_ready()
+        ranges = []
+        offset = 0
+        skipped = 0
+        for sequence in self.model._sequences:
+            template = sequence[-1].dst
+            count = template.num_mutations()
+            if count:
+                tested = self.results.tested(self.host_id, template.get_name(), template.hash(), get_path_id(sequence))
+                skipped += len(tested)
+                untested = [offset + i for i in range(count) if i not in tested]
+                ranges.extend(indices_to_ranges(untested))
+            offset += count
+        self.logger.info('Skipping %d mutations that were already tested on host %s' % (skipped, self.host_id))
+        return ','.join('%d' % first if first == last else '%d-%d' % (first, last) for first, last in ranges)
+
+    def _pre_test(self):
+        self._test_start_time = time.time()
+        super(NumapFuzzer, self)._pre_test()
+
+    def _post_test(self):
+        failure_detected = super(NumapFuzzer, self)._post_test()
+        if self.results is not None and not self._in_environment_test:
+            node = self._fuzz_path[-1].dst
+            self.results.add(
+                self.host_id, get_path_id(self._fuzz_path), node.get_name(), node.hash(), node._current_index,
+                'failed' if failure_detected else 'passed',
+                self._test_start_time, time.time()
+            )
+        return failure_detected
+
+    def report_progress(self, progress):
+        '''
+        Called (over rpc) by numapfuzz at the end of each test
+
+        :param progress: dictionary with the host progress after the mutated response
+        '''
+        if not progress.get('mutated', False) or self._report is None:
+            return
+        stage = self._fuzz_path[-1].dst.get_name()
+        self._report.add('progress', progress)
+        if self.coverage is not None:
+            if self.coverage.update(stage, progress):
+                self.logger.info('stage %s reached a new state: %s' % (stage, self.coverage.signature(progress)))
+            if self.coverage.is_plateau(stage):
+                self.logger.info('no progress on stage %s for %d tests, skipping the rest of it' % (stage, self.coverage.plateau))
+                self._skip_current_stage = True
+
+    def _next_mutation(self):
+        if self._skip_current_stage:
+            self._skip_current_stage = False
+            self._skip_rest_of_template()
+        return super(NumapFuzzer, self)._next_mutation()
+
+    def _skip_rest_of_template(self):
+        '''
+        Advance the test list beyond the last mutation of the current template
+        '''
+        node = self._fuzz_path[-1].dst
+        end = self.model.current_index() - node._current_index + node.num_mutations()
+        while self._test_list.current() is not None and self._test_list.current() < end:
+            self._test_list.skip(1)
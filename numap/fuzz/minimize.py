@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+'''
+Minimize a failing kitty test to the smallest mutation that still reproduces it
+
+Usage:
+    numapminimize (-f <session-file> -n <test-id> | -m <stage:payload>...) [-t <port:trigger-dir>...] [-w <timeout>] [-o <output>] [-v]
+
+Options:
+    -f --session <session-file>         kitty session file with the failure report
+    -n --test-id <test-id>              number of the failing test in the session
+    -m --mutation <stage:payload>       mutated stage and its payload (hex), instead of a kitty report
+    -t --target <port:trigger-dir>      rpc port and trigger directory of a numapfuzz instance,
+                                        use several targets to run tests in parallel [default: 26007:/tmp/umap_kitty]
+    -w --timeout <timeout>              seconds without host requests after which the host is considered
+                                        stuck [default: 5]
+    -o --output <output>                json file to store the minimal reproducer in, can be used
+                                        with numapreplay -m [default: minimized.json]
+    -v --verbose                        be more verbose in the log
+
+Each target is a numapfuzz instance connected to its own host, e.g.:
+
+    numapfuzz -P <PHY> -C <CLASS> -p 26007 -t /tmp/umap_kitty
+    numapfuzz -P <PHY2> -C <CLASS> -p 26008 -t /tmp/umap_kitty2
+    numapminimize -f kittylogs/session.sqlite -n 17 -t 26007:/tmp/umap_kitty -t 26008:/tmp/umap_kitty2
+'''
+import json
+import time
+import logging
+import binascii
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import docopt
+from kitty.remote.rpc import RpcServer
+from kitty.model import Container
+
+from numap.fuzz.controller import UmapController
+from numap.fuzz.fuzz_engine import get_templates
+
+
+def first_reproducing(candidates, reproduces, pool=None):
+    '''
+    :param candidates: list of candidates, in order of preference
+    :param reproduces: function (candidate) -> bool
+    :param pool: executor to test candidates in parallel (default: None)
+    :return: index of the first candidate that was found to reproduce, None if none does
+    '''
+    if pool is None:
+        for i, candidate in enumerate(candidates):
+            if reproduces(candidate):
+                return i
+        return None
+    futures = {pool.submit(reproduces, candidate): i for i, candidate in enumerate(candidates)}
+    try:
+        # in order of completion, the remaining candidates are not needed once one reproduces
+        for future in as_completed(futures):
+            if future.result():
+                return futures[future]
+    finally:
+        for future in futures:
+            future.cancel()
+    return None
+
+
+def ddmin(items, reproduces, pool=None):
+    '''
+    Delta debugging (Zeller's ddmin) - find a minimal sublist of items
+    for which the failure still reproduces.
+
+    :param items: list of items
+    :param reproduces: function (list of items) -> bool
+    :param pool: executor to test candidates in parallel (default: None)
+    :return: minimal sublist of items
+    '''
+    granularity = 2
+    while len(items) >= 2:
+        size = max(len(items) // granularity, 1)
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        complements = [
+            [item for j, chunk in enumerate(chunks) if j != i for item in chunk]
+            for i in range(len(chunks))
+        ]
+        candidates = chunks + complements
+        failing = first_reproducing(candidates, reproduces, pool)
+        if failing is not None and failing < len(chunks):
+            items = candidates[failing]
+            granularity = 2
+        elif failing is not None:
+            items = candidates[failing]
+            granularity = max(granularity - 1, 2)
+        elif granularity < len(items):
+            granularity = min(granularity * 2, len(items))
+        else:
+            break
+    return items
+
+
+def leaf_fields(field):
+    '''
+    :param field: kitty field
+    :return: list of the leaf fields of the field tree, in rendering order
+    '''
+    if isinstance(field, Container):
+        leaves = []
+        for f in field._fields:
+            leaves.extend(leaf_fields(f))
+        return leaves
+    return [field]
+
+
+def locate_mutation(template, payload):
+    '''
+    Find the mutated field of a template by mutating it until it renders to the payload
+
+    :param template: kitty template of the stage
+    :param payload: mutated payload
+    :return: (start, end, default) - byte range of the mutated field in the payload
+             and the default rendering of the field, or None if not found
+    '''
+    template.reset()
+    try:
+        while template.mutate():
+            if template.render().tobytes() != payload:
+                continue
+            offset = 0
+            for leaf in leaf_fields(template):
+                rendered = leaf._current_rendered
+                if not leaf.is_default() and leaf._fuzzable and offset % 8 == 0 and len(rendered) % 8 == 0:
+                    start = offset // 8
+                    return start, start + len(rendered) // 8, leaf._default_rendered.tobytes()
+                offset += len(rendered)
+            return None
+    finally:
+        template.reset()
+    return None
+
+
+class MinimizerSession(object):
+    '''
+    Rpc implementation for a single numapfuzz instance.
+    Serves the mutations of the current test and keeps track of the host requests.
+    '''
+
+    def __init__(self):
+        self.mutations = {}
+        self.requests = 0
+        self.mutated = False
+        self.last_request = 0
+
+    def start(self):
+        pass
+
+    def get_mutation(self, stage, data):
+        self.requests += 1
+        self.last_request = time.time()
+        payload = self.mutations.get(stage)
+        if payload is not None:
+            self.mutated = True
+        return payload
+
+    def report_progress(self, progress):
+        '''
+        numapfuzz reports the host progress after each test, the minimizer does not use it
+        '''
+        pass
+
+
+class MinimizerTarget(object):
+    '''
+    A numapfuzz instance (and the host it is connected to)
+    '''
+
+    def __init__(self, port, trigger_dir, timeout):
+        '''
+        :param port: rpc port the numapfuzz instance connects to
+        :param trigger_dir: trigger directory of the numapfuzz instance
+        :param timeout: seconds without host requests after which the host is considered stuck
+        '''
+        self.logger = logging.getLogger('numap')
+        self.session = MinimizerSession()
+        self.server = RpcServer(host='localhost', port=port, impl=self.session)
+        self.controller = UmapController(trigger_dir=trigger_dir)
+        self.controller.cleanup_triggers()
+        self.timeout = timeout
+        self.baseline = None
+        thread = threading.Thread(target=self.server.start)
+        thread.daemon = True
+        thread.start()
+
+    def run(self, mutations):
+        '''
+        Reconnect the device and serve the given mutations
+
+        :param mutations: dictionary of stage:payload
+        :return: (whether a mutation was served, number of host requests)
+        '''
+        session = self.session
+        session.mutations = mutations
+        session.requests = 0
+        session.mutated = False
+        session.last_request = time.time()
+        self.controller.trigger()
+        while time.time() - session.last_request < self.timeout:
+            time.sleep(0.1)
+        self.controller.trigger_disconnect()
+        return session.mutated, session.requests
+
+    def reproduces(self, mutations):
+        '''
+        The host is considered to fail if it stops sending requests
+        before reaching the number of requests of a session without mutations.
+
+        :param mutations: dictionary of stage:payload
+        :return: whether the failure was reproduced
+        '''
+        if self.baseline is None:
+            _, self.baseline = self.run({})
+            self.logger.info('Baseline (no mutations): %d host requests' % self.baseline)
+        mutated, requests = self.run(mutations)
+        return mutated and requests < self.baseline
+
+
+class Minimizer(object):
+
+    def __init__(self, targets, templates=None):
+        '''
+        :param targets: list of MinimizerTarget
+        :param templates: dictionary of stage:template (default: all numap templates)
+        '''
+        self.logger = logging.getLogger('numap')
+        self.templates = get_templates() if templates is None else templates
+        self.idle = list(targets)
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=len(targets)) if len(targets) > 1 else None
+        self.runs = 0
+
+    def reproduces(self, mutations):
+        with self.lock:
+            target = self.idle.pop()
+        try:
+            result = target.reproduces(mutations)
+        finally:
+            with self.lock:
+                self.idle.append(target)
+                self.runs += 1
+        self.logger.debug('run %d: %s -> %s' % (self.runs, sorted(mutations), 'FAIL' if result else 'pass'))
+        return result
+
+    def minimize_stages(self, mutations):
+        stages = sorted(mutations)
+        stages = ddmin(stages, lambda subset: self.reproduces({s: mutations[s] for s in subset}), self.pool)
+        return {s: mutations[s] for s in stages}
+
+    def minimize_payload(self, mutations, stage):
+        '''
+        Minimize the mutated field of a stage, first by removing bytes,
+        then by reverting the remaining bytes to the field's default value.
+        If the field cannot be located in the template, the whole payload is minimized.
+        '''
+        payload = mutations[stage]
+        location = None
+        if stage in self.templates:
+            location = locate_mutation(self.templates[stage], payload)
+        if location is None:
+            self.logger.info('Stage %s: mutated field not found, minimizing the whole payload' % stage)
+            start, end, default = 0, len(payload), b''
+        else:
+            start, end, default = location
+            self.logger.info('Stage %s: mutated field at bytes %d-%d' % (stage, start, end))
+        prefix, field, suffix = payload[:start], payload[start:end], payload[end:]
+
+        def build(indices, values):
+            return prefix + bytes(values[i] for i in sorted(indices)) + suffix
+
+        def with_field(data):
+            candidate = dict(mutations)
+            candidate[stage] = data
+            return candidate
+
+        # smaller: keep only the bytes that are needed
+        kept = ddmin(
+            list(range(len(field))),
+            lambda indices: self.reproduces(with_field(build(indices, field))),
+            self.pool
+        )
+        field = bytes(field[i] for i in kept)
+        # simpler: revert as many bytes as possible to their default value
+        if default:
+            reference = (default * (len(field) // len(default) + 1))[:len(field)]
+            mutated = [i for i in range(len(field)) if field[i] != reference[i]]
+
+            def revert(indices):
+                data = bytearray(reference)
+                for i in indices:
+                    data[i] = field[i]
+                return prefix + bytes(data) + suffix
+
+            mutated = ddmin(mutated, lambda indices: self.reproduces(with_field(revert(indices))), self.pool)
+            return revert(mutated)
+        return prefix + field + suffix
+
+    def minimize(self, mutations):
+        '''
+        :param mutations: dictionary of stage:payload of the failing test
+        :return: minimal dictionary of stage:payload that reproduces the failure, None if not reproducible
+        '''
+        if not self.reproduces(mutations):
+            self.logger.error('Failure does not reproduce with the original mutations')
+            return None
+        mutations = self.minimize_stages(mutations)
+        self.logger.info('Stages needed to reproduce: %s' % ', '.join(sorted(mutations)))
+        for stage in sorted(mutations):
+            mutations[stage] = self.minimize_payload(mutations, stage)
+        return mutations
+
+
+def get_report_mutations(session_file, test_id):
+    '''
+    :param session_file: kitty session file
+    :param test_id: id of the failing test
+    :return: dictionary of stage:payload from the kitty report of the test
+    '''
+    from kitty.data.data_manager import DataManager
+    dataman = DataManager(session_file)
+    dataman.start()
+    try:
+        report = dataman.get_report_by_id(test_id)
+    finally:
+        dataman.stop()
+    fuzzer_report = report.get('fuzzer')
+    mutations = {}
+    for stage, payload in zip(fuzzer_report.get('stages'), fuzzer_report.get('payloads')):
+        if payload is not None:
+            mutations[stage] = binascii.unhexlify(payload)
+    return mutations
+
+
+def main():
+    options = docopt.docopt(__doc__)
+    logger = logging.getLogger('numap')
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.DEBUG if options['--verbose'] else logging.INFO)
+    if options['--session']:
+        mutations = get_report_mutations(options['--session'], int(options['--test-id']))
+    else:
+        mutations = {}
+        for mutation in options['--mutation']:
+            stage, payload = mutation.rsplit(':', 1)
+            mutations[stage] = binascii.unhexlify(payload)
+    if not mutations:
+        raise Exception('No mutations to minimize')
+    timeout = float(options['--timeout'])
+    targets = []
+    for target in options['--target']:
+        port, trigger_dir = target.split(':', 1)
+        targets.append(MinimizerTarget(int(port), trigger_dir, timeout))
+    minimizer = Minimizer(targets)
+    start = time.time()
+    result = minimizer.minimize(mutations)
+    if result is None:
+        return
+    logger.info('Minimized in %d runs (%.1f seconds)' % (minimizer.runs, time.time() - start))
+    for stage, payload in sorted(result.items()):
+        logger.info('    %s: %s' % (stage, payload.hex()))
+    with open(options['--output'], 'w') as f:
+        json.dump({stage: payload.hex() for stage, payload in result.items()}, f, indent=4, sort_keys=True)
+    logger.info('Minimal reproducer stored in %s' % options['--output'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+'''
+Persistent store for fuzzing results.
+
+Each executed test is stored with the host it ran against, the path of
+stages that led to it, the stage and template hash, and the mutation index
+inside the template, so a later run against the same host can skip the
+mutations that were already tested.
+'''
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+def get_host_id(stage_file):
+    '''
+    The stage file is the enumeration flow of the host,
+    so its hash is used as the default host fingerprint.
+
+    :param stage_file: path to the stage file
+    :return: host id
+    '''
+    with open(stage_file, 'rb') as f:
+        return 'stages-%s' % hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+def get_path_id(path):
+    '''
+    A template ends a sequence for each path of stages that leads to it,
+    the same mutation is a different test in each of them.
+
+    :param path: list of the connections of a kitty sequence
+    :return: id of the path
+    '''
+    names = '/'.join(connection.dst.get_name() for connection in path)
+    return hashlib.sha1(names.encode('utf-8')).hexdigest()[:16]
+
+
+def indices_to_ranges(indices):
+    '''
+    :param indices: sorted list of ints
+    :return: list of (first, last) tuples of consecutive indices
+    '''
+    ranges = []
+    for idx in indices:
+        if ranges and ranges[-1][1] == idx - 1:
+            ranges[-1][1] = idx
+        else:
+            ranges.append([idx, idx])
+    return [tuple(r) for r in ranges]
+
+
+class ResultsDB(object):
+    '''
+    sqlite backed store of test results
+    '''
+
+    def __init__(self, filename):
+        '''
+        :param filename: path to the database file
+        '''
+        self.filename = filename
+        self.lock = threading.Lock()
+        # kitty calls us from both the rpc thread and the test thread
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                host TEXT,
+                stage TEXT,
+                template_hash TEXT,
+                mutation_index INTEGER,
+                status TEXT,
+                start_time REAL,
+                end_time REAL,
+                path TEXT
+            )
+        ''')
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(results)')]
+        if 'path' not in columns:
+            # results of older versions have no path, their tests are executed again
+            self.conn.execute("ALTER TABLE results ADD COLUMN path TEXT DEFAULT ''")
+        self.conn.execute('DROP INDEX IF EXISTS results_key')
+        self.conn.execute('''
+            CREATE INDEX IF NOT EXISTS results_path_key ON results (host, stage, template_hash, path, mutation_index)
+        ''')
+        self.conn.commit()
+
+    def add(self, host, path, stage, template_hash, mutation_index, status, start_time, end_time):
+        '''
+        Store the result of a single test
+
+        :param host: host id
+        :param path: id of the path of stages (see get_path_id)
+        :param stage: stage name
+        :param template_hash: hash of the stage template
+        :param mutation_index: index of the mutation inside the template
+        :param status: test status (e.g. passed/failed)
+        :param start_time: test start time
+        :param end_time: test end time
+        '''
+        with self.lock:
+            self.conn.execute(
+                '''
+                    INSERT INTO results (host, stage, template_hash, mutation_index, status, start_time, end_time, path)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''',
+                (host, stage, '%x' % template_hash, mutation_index, status, start_time, end_time, path)
+            )
+            self.conn.commit()
+
+    def tested(self, host, stage, template_hash, path=None):
+        '''
+        :param path: id of the path of stages (default: None, tested on any path)
+        :return: set of mutation indices of the template that were already tested on the host
+        '''
+        query = 'SELECT DISTINCT mutation_index FROM results WHERE host=? AND stage=? AND template_hash=?'
+        params = [host, stage, '%x' % template_hash]
+        if path is not None:
+            query += ' AND path=?'
+            params.append(path)
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return set(row[0] for row in rows)
+
+    def get_stats(self, host, since=None):
+        '''
+        :param host: host id
+        :param since: only count tests that ended after this time (default: None)
+        :return: dictionary of stage: (tests, distinct mutations, failures, first start, last end)
+        '''
+        query = '''
+            SELECT stage, COUNT(*), COUNT(DISTINCT template_hash || ':' || mutation_index),
+                   SUM(status != 'passed'), MIN(start_time), MAX(end_time)
+            FROM results WHERE host=?
+        '''
+        params = [host]
+        if since is not None:
+            query += ' AND end_time >= ?'
+            params.append(since)
+        query += ' GROUP BY stage'
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def report(self, host, templates):
+        '''
+        :param host: host id
+        :param templates: dictionary of stage: template of the current model
+        :return: printable report of the throughput and coverage
+        '''
+        lines = ['Results for host %s' % host]
+        stats = self.get_stats(host)
+        last_hour = self.get_stats(host, since=time.time() - 3600)
+        total_tests = sum(s[0] for s in stats.values())
+        if stats:
+            first = min(s[3] for s in stats.values())
+            last = max(s[4] for s in stats.values())
+            hours = max(last - first, 1) / 3600.0
+            lines.append('Tests: %d, %.1f tests/hour overall, %d in the last hour' % (
+                total_tests, total_tests / hours, sum(s[0] for s in last_hour.values())))
+        lines.append('%-40s %10s %10s %9s %9s' % ('Stage', 'Tested', 'Total', 'Coverage', 'Failures'))
+        for stage in sorted(set(templates) | set(stats)):
+            template = templates.get(stage)
+            total = template.num_mutations() if template is not None else 0
+            tested = len(self.tested(host, stage, template.hash())) if template is not None else 0
+            failures = stats[stage][2] if stage in stats else 0
+            coverage = '%.1f%%' % (100.0 * tested / total) if total else '-'
+            lines.append('%-40s %10d %10d %9s %9d' % (stage, tested, total, coverage, failures))
+        return '\n'.join(lines)
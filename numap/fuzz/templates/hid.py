@@ -170,16 +170,19 @@ hid_descriptor = Descriptor(
         DynamicInt('bCountryCode', UInt8(value=0x00)),
         DynamicInt('bNumDescriptors', UInt8(value=0x01)),
         DynamicInt('bDescriptorType2', UInt8(value=DescriptorType.hid)),
-        DynamicInt('wDescriptorLength', LE16(value=0x27)),
+        DynamicInt('wDescriptorLength', LE16(value=0x3d)),
     ])
 
 
-# this descriptor is based on umap
+# the report descriptor of the keyboard (numap.dev.keyboard), based on umap
 # https://github.com/nccgroup/umap
 # commit 3ad812135f8c34dcde0e055d1fefe30500196c0f
 hid_report_descriptor = Template(
     name='hid_report_descriptor',
     fields=GenerateHidReport(
-        binascii.a2b_hex('05010906A101050719E029E7150025017501950881029501750881011900296515002565750895018100C0')
+        binascii.a2b_hex(
+            '05010906A101050719E029E7150025017501950881029501750881011900296515002565750895068100'
+            '050819012905950575019102950175039101C0'
+        )
     )
 )
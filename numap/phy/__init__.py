@@ -0,0 +1,4 @@
+'''
+Physical layer helpers, sitting between the nümap devices and the
+actual USB backend.
+'''
@@ -0,0 +1,166 @@
+'''
+Capture tap between a PHY and the USB device.
+
+Every setup packet, endpoint transfer and response that passes through
+the PHY is recorded to a pcap file in the Linux usbmon format, so the
+session can be opened in wireshark or fed to other nümap tools.
+As with usbmon, each transfer is a submission (status -EINPROGRESS)
+followed by a callback with the same URB id: OUT data is in the submission,
+IN data in the callback.
+Mutations applied by the fuzzer are stored next to it, in <capture>.json
+'''
+import atexit
+import json
+import struct
+import logging
+import itertools
+from numap.utils.usbmon import UsbmonPcapWriter, EventType, XferType, STATUS_STALL, STATUS_IN_PROGRESS
+
+
+class _DeviceTap(object):
+    '''
+    Wraps the USB device that is handed to the PHY,
+    records the host side of the traffic and passes everything through.
+    '''
+
+    def __init__(self, capture, device):
+        object.__setattr__(self, '_capture', capture)
+        object.__setattr__(self, '_device', device)
+
+    def __getattr__(self, name):
+        return getattr(self._device, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._device, name, value)
+
+    def handle_request(self, req):
+        self._capture.record_setup(req)
+        return self._device.handle_request(req)
+
+    def handle_data_available(self, ep_num, data):
+        self._capture.record_out(ep_num, data)
+        return self._device.handle_data_available(ep_num, data)
+
+
+class CapturePhy(object):
+    '''
+    PHY proxy that records all traffic in usbmon pcap format.
+    Attributes that are not handled here are passed through to the real PHY.
+    '''
+
+    name = 'Capture'
+
+    def __init__(self, phy, filename, capacity=4096):
+        '''
+        :param phy: the PHY to wrap
+        :param filename: path of the pcap file to write
+        :param capacity: maximum number of records pending write (default: 4096)
+        '''
+        self.backend = phy
+        self.writer = UsbmonPcapWriter(filename, capacity=capacity)
+        self.logger = logging.getLogger('numap')
+        self.device = None
+        self._urb_ids = itertools.count(1)
+        # URB id, endpoint address and OUT data length of the current control request,
+        # URB id is None once its callback was recorded
+        self._setup_urb = None
+        self._setup_epnum = 0
+        self._setup_out_length = 0
+        self.mutations = {}
+        # a single capture may span several connect/disconnect cycles (e.g. numapscan)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def _devnum(self):
+        return getattr(self.device, 'address', 0) or 0
+
+    def _xfer_type(self, ep_num):
+        if ep_num == 0 or self.device is None:
+            return XferType.control
+        endpoint = self.device.endpoints.get(ep_num & 0x7f) if hasattr(self.device, 'endpoints') else None
+        if endpoint is None:
+            return XferType.bulk
+        return XferType.from_usb.get(endpoint.transfer_type, XferType.bulk)
+
+    def record_setup(self, req):
+        self._setup_urb = next(self._urb_ids)
+        setup = struct.pack('<BBHHH', req.request_type, req.request, req.value, req.index, req.length)
+        self._setup_epnum = 0x80 if req.request_type & 0x80 else 0x00
+        data = b'' if self._setup_epnum else bytes(req.data or b'')
+        self._setup_out_length = len(data)
+        self.writer.submit(
+            self._setup_urb, EventType.submission, XferType.control, self._setup_epnum, self._devnum(),
+            status=STATUS_IN_PROGRESS, setup=setup, data=data, length=req.length
+        )
+
+    def record_setup_callback(self, status=0, data=b''):
+        '''
+        :param status: URB status, 0 or STATUS_STALL (default: 0)
+        :param data: data stage of an IN request (default: b'')
+        '''
+        if self._setup_urb is None:
+            # the request was already answered
+            return
+        if self._setup_epnum:
+            self.writer.submit(self._setup_urb, EventType.callback, XferType.control, self._setup_epnum, self._devnum(), status=status, data=data)
+        else:
+            self.writer.submit(
+                self._setup_urb, EventType.callback, XferType.control, 0x00, self._devnum(),
+                status=status, length=self._setup_out_length
+            )
+        self._setup_urb = None
+
+    def record_out(self, ep_num, data):
+        urb_id = next(self._urb_ids)
+        xfer_type = self._xfer_type(ep_num)
+        devnum = self._devnum()
+        self.writer.submit(urb_id, EventType.submission, xfer_type, ep_num & 0x7f, devnum, status=STATUS_IN_PROGRESS, data=data)
+        self.writer.submit(urb_id, EventType.callback, xfer_type, ep_num & 0x7f, devnum, length=len(data))
+
+    def close(self):
+        '''
+        Flush pending records and close the capture file
+        '''
+        self.writer.stop()
+        if self.mutations:
+            with open(self.writer.filename + '.json', 'w') as f:
+                json.dump(self.mutations, f, indent=4, sort_keys=True)
+
+    def record_mutation(self, stage, payload):
+        '''
+        :param stage: stage name
+        :param payload: mutated response that was used for the stage
+        '''
+        self.mutations[stage] = bytes(payload).hex()
+
+    def connect(self, device, *args, **kwargs):
+        self.device = device
+        self.backend.connect(_DeviceTap(self, device), *args, **kwargs)
+
+    def disconnect(self):
+        self.backend.disconnect()
+        if self.writer.dropped:
+            self.logger.warning('Capture dropped %d records so far, consider a bigger capture buffer' % self.writer.dropped)
+
+    def send_on_endpoint(self, ep_num, data, *args, **kwargs):
+        if ep_num == 0:
+            self.record_setup_callback(data=data)
+        else:
+            # the host's IN URB is recorded when the device answers it
+            urb_id = next(self._urb_ids)
+            xfer_type = self._xfer_type(ep_num)
+            devnum = self._devnum()
+            self.writer.submit(urb_id, EventType.submission, xfer_type, ep_num | 0x80, devnum, status=STATUS_IN_PROGRESS, length=len(data))
+            self.writer.submit(urb_id, EventType.callback, xfer_type, ep_num | 0x80, devnum, data=data)
+        return self.backend.send_on_endpoint(ep_num, data, *args, **kwargs)
+
+    def stall_ep0(self, *args, **kwargs):
+        self.record_setup_callback(status=STATUS_STALL)
+        return self.backend.stall_ep0(*args, **kwargs)
+
+    def ack_status_stage(self, *args, **kwargs):
+        self.record_setup_callback()
+        return self.backend.ack_status_stage(*args, **kwargs)
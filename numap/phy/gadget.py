@@ -0,0 +1,645 @@
+'''
+Linux USB gadget physical layers, for boards with a device controller (UDC).
+
+GadgetFsPhy (-P gadgetfs[:MOUNTPOINT])
+    Uses the gadgetfs module (see gadget/README.rst). The kernel answers
+    the standard descriptor requests from the descriptors that are written
+    to ep0, everything else is passed to the device. The controller must
+    have endpoints with the numbers the device uses.
+
+FunctionFsPhy (-P functionfs[:NAME])
+    Creates a configfs gadget with a single FunctionFS function and binds
+    it to the first UDC. The kernel picks the controller endpoints, so it
+    also works with dummy_hcd for tests on a plain Linux box.
+
+ep0 is watched by the event loop of the device runtime (get_event_fds),
+service_irqs only handles the events that are ready. The data endpoint files of
+both file systems do not support poll, so each one is served by a thread:
+OUT endpoints are read into a preallocated buffer, IN data is written
+from memoryview slices without copying. The threads only hand the data
+over, the device code always runs in the event loop.
+
+The descriptors of each speed the kernel supports are generated from the
+device, the speed of the connection is kept in the phy (speed), so the
+device answers with the packet sizes of that speed.
+'''
+import os
+import errno
+import struct
+import select
+import threading
+import subprocess
+from collections import deque
+from numap.core.usb import DescriptorType, Request
+from numap.phy.iphy import PhyInterface
+
+# usb_ctrlrequest + event type
+EVENT_SIZE = 12
+SETUP_SIZE = 8
+
+# linux/usb/gadgetfs.h
+GADGETFS_NOP = 0
+GADGETFS_CONNECT = 1
+GADGETFS_DISCONNECT = 2
+GADGETFS_SETUP = 3
+GADGETFS_SUSPEND = 4
+
+# linux/usb/functionfs.h
+FUNCTIONFS_DESCRIPTORS_MAGIC_V2 = 3
+FUNCTIONFS_STRINGS_MAGIC = 2
+FUNCTIONFS_HAS_FS_DESC = 1
+FUNCTIONFS_HAS_HS_DESC = 2
+FUNCTIONFS_HAS_SS_DESC = 4
+FUNCTIONFS_ALL_CTRL_RECIP = 64
+FUNCTIONFS_BIND = 0
+FUNCTIONFS_UNBIND = 1
+FUNCTIONFS_ENABLE = 2
+FUNCTIONFS_DISABLE = 3
+FUNCTIONFS_SETUP = 4
+FUNCTIONFS_SUSPEND = 5
+FUNCTIONFS_RESUME = 6
+
+SET_CONFIGURATION = b'\x00\x09\x01\x00\x00\x00\x00\x00'
+
+# enum usb_device_speed of linux/usb/ch9.h, as reported by GADGETFS_CONNECT
+GADGETFS_SPEEDS = {2: 'fullspeed', 3: 'highspeed', 5: 'superspeed', 6: 'superspeed'}
+# /sys/class/udc/<udc>/current_speed
+UDC_SPEEDS = {
+    'full-speed': 'fullspeed', 'high-speed': 'highspeed',
+    'super-speed': 'superspeed', 'super-speed-plus': 'superspeed',
+}
+
+
+def split_descriptors(data):
+    '''
+    :param data: concatenated descriptors
+    :return: list of descriptors
+    '''
+    descriptors = []
+    offset = 0
+    while offset + 2 <= len(data):
+        length = data[offset]
+        if length < 2:
+            break
+        descriptors.append(bytes(data[offset:offset + length]))
+        offset += length
+    return descriptors
+
+
+def endpoint_descriptors(descriptors):
+    '''
+    :param descriptors: list of descriptors of a configuration
+    :return: list of the endpoint descriptors
+    '''
+    return [desc for desc in descriptors if desc[1] == DescriptorType.endpoint]
+
+
+class EndpointReader(threading.Thread):
+    '''
+    Reads an OUT endpoint file into a preallocated buffer
+    '''
+
+    def __init__(self, phy, ep_num, fd, buffer_size=0x4000):
+        super(EndpointReader, self).__init__(name='ep%d-out' % ep_num)
+        self.daemon = True
+        self.phy = phy
+        self.ep_num = ep_num
+        self.fd = fd
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.stopped = False
+
+    def run(self):
+        while not self.stopped:
+            try:
+                length = os.readv(self.fd, [self.buffer])
+            except OSError as e:
+                if e.errno in (errno.EINTR, errno.EAGAIN):
+                    continue
+                if not self.stopped and e.errno not in (errno.ESHUTDOWN, errno.EBADF, errno.ENODEV):
+                    self.phy.logger.error('Reading endpoint %d failed: %s' % (self.ep_num, e))
+                break
+            self.phy.post(self.ep_num, bytes(self.view[:length]))
+
+
+class EndpointWriter(threading.Thread):
+    '''
+    Writes the data of an IN endpoint, queued by send_on_endpoint
+    '''
+
+    def __init__(self, phy, ep_num, fd, max_pending=16, chunk_size=0x4000):
+        super(EndpointWriter, self).__init__(name='ep%d-in' % ep_num)
+        self.daemon = True
+        self.phy = phy
+        self.ep_num = ep_num
+        self.fd = fd
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.busy = False
+        self.stopped = False
+
+    @property
+    def idle(self):
+        return not self.busy and not self.pending
+
+    def send(self, data):
+        '''
+        :param data: data to send, waits while max_pending transfers are queued
+        '''
+        with self.condition:
+            while len(self.pending) >= self.max_pending and not self.stopped:
+                self.condition.wait(0.1)
+            self.pending.append(memoryview(data))
+            self.busy = True
+            self.condition.notify_all()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.busy = False
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                view = self.pending.popleft()
+                self.condition.notify_all()
+            offset = 0
+            try:
+                if not len(view):
+                    os.write(self.fd, b'')
+                while offset < len(view):
+                    offset += os.write(self.fd, view[offset:offset + self.chunk_size])
+            except OSError as e:
+                if not self.stopped and e.errno not in (errno.ESHUTDOWN, errno.EBADF, errno.ENODEV):
+                    self.phy.logger.error('Writing endpoint %d failed: %s' % (self.ep_num, e))
+                if e.errno in (errno.EBADF, errno.ENODEV):
+                    return
+            with self.condition:
+                if not self.pending:
+                    self.busy = False
+            # let the device fill the endpoint again
+            self.phy.post(self.ep_num, None)
+
+
+class GadgetPhy(PhyInterface):
+    '''
+    Event loop and endpoint I/O shared by the gadget file systems
+    '''
+
+    speeds = ('fullspeed', 'highspeed')
+
+    def __init__(self, app, name, poll_interval=0.001):
+        '''
+        :param app: application instance
+        :param name: name of the phy
+        :param poll_interval: seconds between calls to the handlers of idle IN endpoints (default: 0.001)
+        '''
+        super(GadgetPhy, self).__init__(app, name)
+        self.poll_interval = poll_interval
+        # speed of the connection, None until the host connected
+        self.speed = None
+        self.ep0 = None
+        self.readers = {}
+        self.writers = {}
+        self.events = deque()
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        os.set_blocking(self.wakeup_r, False)
+        os.set_blocking(self.wakeup_w, False)
+        self.poll = select.poll()
+        self.poll.register(self.wakeup_r, select.POLLIN)
+        # (direction, length, answered) of the control request that is handled
+        self.setup = None
+
+    def post(self, ep_num, data):
+        '''
+        Hand data from an endpoint thread to the event loop
+
+        :param ep_num: endpoint number
+        :param data: data read from an OUT endpoint, None when an IN endpoint became idle
+        '''
+        self.events.append((ep_num, data))
+        try:
+            os.write(self.wakeup_w, b'\x00')
+        except BlockingIOError:
+            pass
+
+    def open_ep0(self, path):
+        self.ep0 = os.open(path, os.O_RDWR)
+
+    def start_ep0_polling(self):
+        os.set_blocking(self.ep0, False)
+        self.poll.register(self.ep0, select.POLLIN)
+
+    def start_endpoint(self, ep_num, direction, fd):
+        if direction:
+            writer = EndpointWriter(self, ep_num, fd)
+            self.writers[ep_num] = writer
+            writer.start()
+        else:
+            reader = EndpointReader(self, ep_num, fd)
+            self.readers[ep_num] = reader
+            reader.start()
+
+    def stop_endpoints(self):
+        for writer in self.writers.values():
+            writer.stop()
+        for reader in self.readers.values():
+            reader.stopped = True
+        for thread in list(self.writers.values()) + list(self.readers.values()):
+            try:
+                os.close(thread.fd)
+            except OSError:
+                pass
+        self.writers = {}
+        self.readers = {}
+        self.events.clear()
+
+    def disconnect(self):
+        self.stop_endpoints()
+        if self.ep0 is not None:
+            try:
+                self.poll.unregister(self.ep0)
+            except KeyError:
+                pass
+            os.close(self.ep0)
+            self.ep0 = None
+        super(GadgetPhy, self).disconnect()
+
+    def send_on_endpoint(self, ep_num, data, blocking=True):
+        if ep_num == 0:
+            self.send_on_ep0(data)
+            return
+        writer = self.writers.get(ep_num)
+        if writer is None:
+            self.logger.debug('Dropping data for unconfigured endpoint %d' % ep_num)
+            return
+        writer.send(data)
+
+    def send_on_ep0(self, data):
+        if self.setup is None:
+            # e.g. the acknowledge of a request the kernel already answered
+            return
+        direction, length, answered = self.setup
+        if answered:
+            return
+        try:
+            if direction == Request.direction_device_to_host:
+                os.write(self.ep0, data[:length])
+            elif not len(data):
+                # status stage of an OUT request
+                os.read(self.ep0, 0)
+        except OSError as e:
+            self.logger.debug('ep0 response failed: %s' % e)
+        self.setup = (direction, length, True)
+
+    def stall_ep0(self):
+        if self.setup is None or self.setup[2]:
+            return
+        direction, length, _ = self.setup
+        # I/O in the wrong direction stalls the request
+        try:
+            if direction == Request.direction_device_to_host:
+                os.read(self.ep0, 0)
+            else:
+                os.write(self.ep0, b'')
+        except OSError:
+            pass
+        self.setup = (direction, length, True)
+
+    def ack_status_stage(self, blocking=False):
+        self.send_on_ep0(b'')
+
+    def read_ep0_data(self, length):
+        # the data stage may not have arrived when the setup event is read
+        os.set_blocking(self.ep0, True)
+        try:
+            return os.read(self.ep0, length)
+        finally:
+            os.set_blocking(self.ep0, False)
+
+    def handle_setup(self, setup):
+        '''
+        :param setup: 8 byte setup packet
+        '''
+        request_type, request, value, index, length = struct.unpack('<BBHHH', setup)
+        direction = request_type >> 7
+        data = b''
+        if direction == Request.direction_host_to_device and length:
+            data = self.read_ep0_data(length)
+        self.setup = (direction, length, False)
+        self.app.signal_setup_packet_received()
+        device = self.connected_device
+        device.handle_request(device.create_request(setup + data))
+        if not self.setup[2]:
+            if direction == Request.direction_device_to_host:
+                self.stall_ep0()
+            else:
+                self.send_on_ep0(b'')
+        self.setup = None
+
+    def handle_ep0_event(self, event):
+        raise NotImplementedError('should be implemented in subclass')
+
+    def get_event_fds(self):
+        # the endpoint threads write to the wakeup pipe
+        if self.ep0 is None:
+            return [self.wakeup_r]
+        return [self.wakeup_r, self.ep0]
+
+    def get_idle_timeout(self):
+        if self.ep0 is None or any(writer.idle for writer in self.writers.values()):
+            # the handlers of idle IN endpoints are called every poll_interval
+            return self.poll_interval
+        return 0.1
+
+    def service_irqs(self):
+        if self.ep0 is None:
+            return
+        for fd, _ in self.poll.poll(0):
+            if fd == self.wakeup_r:
+                try:
+                    while os.read(self.wakeup_r, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+            elif fd == self.ep0:
+                try:
+                    data = os.read(self.ep0, EVENT_SIZE * 8)
+                except BlockingIOError:
+                    continue
+                for offset in range(0, len(data) - EVENT_SIZE + 1, EVENT_SIZE):
+                    self.handle_ep0_event(data[offset:offset + EVENT_SIZE])
+        device = self.connected_device
+        while self.events:
+            ep_num, data = self.events.popleft()
+            if data is not None:
+                device.handle_data_available(ep_num, data)
+        for ep_num, writer in list(self.writers.items()):
+            if writer.idle:
+                device.handle_buffer_available(ep_num)
+
+
+class GadgetFsPhy(GadgetPhy):
+    '''
+    Phy for the gadgetfs file system
+    '''
+
+    def __init__(self, app, mountpoint='/dev/gadget'):
+        '''
+        :param app: application instance
+        :param mountpoint: mount point of gadgetfs (default: /dev/gadget)
+        '''
+        super(GadgetFsPhy, self).__init__(app, 'GadgetFS')
+        self.mountpoint = mountpoint
+        self.endpoint_descriptors = []
+
+    def find_ep0(self):
+        for name in sorted(os.listdir(self.mountpoint)):
+            if not name.startswith('ep'):
+                # ep0 is named after the controller, e.g. musb-hdrc or dummy_udc
+                return os.path.join(self.mountpoint, name)
+        raise Exception('No device controller found in %s, is gadgetfs mounted?' % self.mountpoint)
+
+    def find_endpoint_file(self, address, used):
+        prefix = 'ep%d%s' % (address & 0x0f, 'in' if address & 0x80 else 'out')
+        for name in sorted(os.listdir(self.mountpoint)):
+            if name not in used and (name == prefix or name.startswith(prefix + '-')):
+                return name
+        raise Exception('The device controller has no endpoint %s' % prefix)
+
+    def connect(self, device, max_packet_size_ep0=64):
+        super(GadgetFsPhy, self).connect(device, max_packet_size_ep0)
+        fs_config = bytes(device.get_configuration_descriptor(0, 'fullspeed'))
+        hs_config = bytes(device.get_configuration_descriptor(0, 'highspeed'))
+        self.endpoint_descriptors = list(zip(
+            endpoint_descriptors(split_descriptors(fs_config)), endpoint_descriptors(split_descriptors(hs_config))
+        ))
+        self.open_ep0(self.find_ep0())
+        os.write(self.ep0, struct.pack('<I', 0) + fs_config + hs_config + bytes(device.get_descriptor()))
+        self.start_ep0_polling()
+        self.logger.info('GadgetFS: device descriptors written to %s' % self.mountpoint)
+
+    def configure_endpoints(self):
+        self.stop_endpoints()
+        used = set()
+        for fs_desc, hs_desc in self.endpoint_descriptors:
+            address = fs_desc[2]
+            name = self.find_endpoint_file(address, used)
+            used.add(name)
+            fd = os.open(os.path.join(self.mountpoint, name), os.O_RDWR)
+            os.write(fd, struct.pack('<I', 1) + fs_desc[:7] + hs_desc[:7])
+            self.start_endpoint(address & 0x0f, address >> 7, fd)
+
+    def handle_ep0_event(self, event):
+        event_type = struct.unpack_from('<I', event, SETUP_SIZE)[0]
+        if event_type == GADGETFS_SETUP:
+            setup = event[:SETUP_SIZE]
+            self.handle_setup(setup)
+            if setup[0] & 0x60 == 0 and setup[1] == 9:
+                # SET_CONFIGURATION, the endpoints can be enabled now
+                self.configure_endpoints()
+        elif event_type == GADGETFS_CONNECT:
+            speed = struct.unpack_from('<I', event)[0]
+            self.speed = GADGETFS_SPEEDS.get(speed, 'fullspeed')
+            self.logger.info('GadgetFS: connected (speed %d, %s)' % (speed, self.speed))
+        elif event_type == GADGETFS_DISCONNECT:
+            self.logger.info('GadgetFS: disconnected')
+            self.speed = None
+            self.stop_endpoints()
+        elif event_type == GADGETFS_SUSPEND:
+            self.logger.debug('GadgetFS: suspended')
+
+
+class ConfigFsGadget(object):
+    '''
+    configfs gadget with one FunctionFS function
+    '''
+
+    def __init__(self, name, configfs='/sys/kernel/config/usb_gadget'):
+        self.name = name
+        self.path = os.path.join(configfs, name)
+        self.function = 'ffs.%s' % name
+        self.mountpoint = os.path.join('/dev', 'ffs-%s' % name)
+        self.udc = None
+
+    def _write(self, path, value):
+        with open(os.path.join(self.path, path), 'w') as f:
+            f.write(value)
+
+    def create(self, device_descriptor, strings):
+        '''
+        :param device_descriptor: device descriptor
+        :param strings: (manufacturer, product, serial number)
+        '''
+        (
+            _, _, bcd_usb, device_class, device_subclass, protocol, max_packet_size_ep0,
+            vendor_id, product_id, device_rev, _, _, _, _
+        ) = struct.unpack('<BBHBBBBHHHBBBB', device_descriptor)
+        if not os.path.isdir(os.path.dirname(self.path)):
+            raise Exception('configfs usb_gadget not found, load the libcomposite module')
+        os.makedirs(self.path, exist_ok=True)
+        for attribute, value in (
+            ('bcdUSB', bcd_usb), ('bDeviceClass', device_class), ('bDeviceSubClass', device_subclass),
+            ('bDeviceProtocol', protocol), ('bMaxPacketSize0', max_packet_size_ep0),
+            ('idVendor', vendor_id), ('idProduct', product_id), ('bcdDevice', device_rev),
+        ):
+            self._write(attribute, '%#x' % value)
+        os.makedirs(os.path.join(self.path, 'strings/0x409'), exist_ok=True)
+        for attribute, value in zip(('manufacturer', 'product', 'serialnumber'), strings):
+            self._write('strings/0x409/%s' % attribute, value)
+        os.makedirs(os.path.join(self.path, 'configs/c.1'), exist_ok=True)
+        os.makedirs(os.path.join(self.path, 'functions', self.function), exist_ok=True)
+        link = os.path.join(self.path, 'configs/c.1', self.function)
+        if not os.path.islink(link):
+            os.symlink(os.path.join(self.path, 'functions', self.function), link)
+        os.makedirs(self.mountpoint, exist_ok=True)
+        if not os.path.ismount(self.mountpoint):
+            subprocess.check_call(['mount', '-t', 'functionfs', self.name, self.mountpoint])
+
+    def bind(self, udc=None):
+        '''
+        :param udc: device controller (default: None, the first one)
+        '''
+        if udc is None:
+            controllers = sorted(os.listdir('/sys/class/udc'))
+            if not controllers:
+                raise Exception('No USB device controller found (for tests: modprobe dummy_hcd)')
+            udc = controllers[0]
+        self._write('UDC', udc)
+        self.udc = udc
+
+    def current_speed(self):
+        '''
+        :return: speed of the connection ('fullspeed', 'highspeed' or 'superspeed'), None if unknown
+        '''
+        if self.udc is None:
+            return None
+        try:
+            with open(os.path.join('/sys/class/udc', self.udc, 'current_speed')) as f:
+                return UDC_SPEEDS.get(f.read().strip())
+        except OSError:
+            return None
+
+    def destroy(self):
+        try:
+            self._write('UDC', '\n')
+        except OSError:
+            pass
+        if os.path.ismount(self.mountpoint):
+            subprocess.call(['umount', self.mountpoint])
+        for path in (
+            os.path.join('configs/c.1', self.function), 'strings/0x409',
+            os.path.join('functions', self.function), 'configs/c.1', '',
+        ):
+            path = os.path.join(self.path, path)
+            try:
+                if os.path.islink(path):
+                    os.unlink(path)
+                else:
+                    os.rmdir(path)
+            except OSError:
+                pass
+
+
+class FunctionFsPhy(GadgetPhy):
+    '''
+    Phy for a FunctionFS function in a configfs gadget
+    '''
+
+    speeds = ('fullspeed', 'highspeed', 'superspeed')
+
+    def __init__(self, app, name='numap'):
+        '''
+        :param app: application instance
+        :param name: name of the gadget and the FunctionFS instance (default: numap)
+        '''
+        super(FunctionFsPhy, self).__init__(app, 'FunctionFS')
+        self.gadget = ConfigFsGadget(name)
+        # endpoint address: file number
+        self.endpoint_files = {}
+
+    def get_strings(self, device):
+        def string(index):
+            if 0 < index <= len(device.strings):
+                s = device.strings[index - 1]
+                return s.decode('utf-8', 'replace') if isinstance(s, bytes) else s
+            return ''
+        return (
+            string(device.manufacturer_string_id),
+            string(device.product_string_id),
+            string(device.serial_number_string_id),
+        )
+
+    def get_function_descriptors(self, device, usb_type):
+        '''
+        :return: list of the descriptors of the function at the given speed,
+                 the gadget has the configuration descriptor
+        '''
+        return split_descriptors(device.get_configuration_descriptor(0, usb_type))[1:]
+
+    def build_descriptors(self, device):
+        fs, hs, ss = [self.get_function_descriptors(device, usb_type) for usb_type in self.speeds]
+        header = struct.Struct('<IIIIII')
+        data = b''.join(fs) + b''.join(hs) + b''.join(ss)
+        return header.pack(
+            FUNCTIONFS_DESCRIPTORS_MAGIC_V2, header.size + len(data),
+            FUNCTIONFS_HAS_FS_DESC | FUNCTIONFS_HAS_HS_DESC | FUNCTIONFS_HAS_SS_DESC | FUNCTIONFS_ALL_CTRL_RECIP,
+            len(fs), len(hs), len(ss)
+        ) + data
+
+    def build_strings(self, device):
+        strings = [s.decode('utf-8', 'replace') if isinstance(s, bytes) else s for s in device.strings]
+        data = struct.pack('<H', 0x0409) + b''.join(s.encode('utf-8') + b'\x00' for s in strings)
+        return struct.pack('<IIII', FUNCTIONFS_STRINGS_MAGIC, 16 + len(data), len(strings), 1) + data
+
+    def connect(self, device, max_packet_size_ep0=64):
+        super(FunctionFsPhy, self).connect(device, max_packet_size_ep0)
+        self.gadget.create(bytes(device.get_descriptor()), self.get_strings(device))
+        self.endpoint_files = {}
+        for desc in endpoint_descriptors(self.get_function_descriptors(device, 'fullspeed')):
+            # the files are numbered by the first use of each address (alternate settings share them)
+            if desc[2] not in self.endpoint_files:
+                self.endpoint_files[desc[2]] = len(self.endpoint_files) + 1
+        self.open_ep0(os.path.join(self.gadget.mountpoint, 'ep0'))
+        os.write(self.ep0, self.build_descriptors(device))
+        os.write(self.ep0, self.build_strings(device))
+        self.start_ep0_polling()
+        self.gadget.bind()
+        self.logger.info('FunctionFS: gadget %s bound' % self.gadget.name)
+
+    def disconnect(self):
+        super(FunctionFsPhy, self).disconnect()
+        self.gadget.destroy()
+
+    def enable(self):
+        self.stop_endpoints()
+        self.speed = self.gadget.current_speed()
+        # the kernel handled SET_CONFIGURATION, the device still has to configure itself
+        self.setup = (Request.direction_host_to_device, 0, True)
+        device = self.connected_device
+        device.handle_request(device.create_request(SET_CONFIGURATION))
+        self.setup = None
+        for address, file_num in self.endpoint_files.items():
+            fd = os.open(os.path.join(self.gadget.mountpoint, 'ep%d' % file_num), os.O_RDWR)
+            self.start_endpoint(address & 0x0f, address >> 7, fd)
+
+    def handle_ep0_event(self, event):
+        event_type = event[SETUP_SIZE]
+        if event_type == FUNCTIONFS_SETUP:
+            self.handle_setup(event[:SETUP_SIZE])
+        elif event_type == FUNCTIONFS_ENABLE:
+            self.enable()
+            self.logger.info('FunctionFS: enabled (%s)' % (self.speed or 'unknown speed'))
+        elif event_type in (FUNCTIONFS_DISABLE, FUNCTIONFS_UNBIND):
+            self.logger.info('FunctionFS: disabled')
+            self.stop_endpoints()
+            self.speed = None
+        elif event_type == FUNCTIONFS_BIND:
+            self.logger.debug('FunctionFS: bound')
@@ -0,0 +1,110 @@
+'''
+Interface for the physical layers that are implemented in nümap itself
+(i.e. not provided by facedancer).
+'''
+import select
+import logging
+
+
+class PhyInterface(object):
+    '''
+    Base class for nümap physical layers.
+    The API matches the subset of FacedancerUSBApp that is used by the
+    nümap devices, so a phy can be used wherever a FacedancerUSBApp is.
+    '''
+
+    def __init__(self, app, name):
+        '''
+        :type app: :class:`~numap.apps.base.NumapApp`
+        :param app: application instance
+        :param name: name of the phy
+        '''
+        self.app = app
+        self.name = name
+        self.logger = logging.getLogger('numap')
+        self.connected_device = None
+        self.verbose = 0
+        self.address = 0
+
+    def connect(self, device, max_packet_size_ep0=64):
+        '''
+        Connect a device to the phy
+
+        :param device: USB device
+        :param max_packet_size_ep0: max packet size on EP0 (default: 64)
+        '''
+        self.connected_device = device
+
+    def disconnect(self):
+        '''
+        Disconnect the device from the phy
+        '''
+        self.connected_device = None
+
+    def is_connected(self):
+        return self.connected_device is not None
+
+    def set_address(self, address, defer=False):
+        '''
+        :param address: address assigned by the host
+        :param defer: whether to set the address after the status stage (default: False)
+        '''
+        self.address = address
+
+    def send_on_endpoint(self, ep_num, data, blocking=True):
+        '''
+        Send data on a specific endpoint
+
+        :param ep_num: number of endpoint
+        :param data: data to send
+        :param blocking: wait for the data to be sent (default: True)
+        '''
+        raise NotImplementedError('should be implemented in subclass')
+
+    def stall_ep0(self):
+        '''
+        Stalls control endpoint (0)
+        '''
+        raise NotImplementedError('should be implemented in subclass')
+
+    def ack_status_stage(self, blocking=False):
+        '''
+        Acknowledge the status stage of a control transfer
+        '''
+        self.send_on_endpoint(0, b'')
+
+    def service_irqs(self):
+        '''
+        Handle pending events from the host.
+        Called repeatedly by the device scheduler, must not block.
+        '''
+        pass
+
+    def get_event_fds(self):
+        '''
+        :return: file descriptors that become readable when there are events to service
+        '''
+        return []
+
+    def get_idle_timeout(self):
+        '''
+        :return: seconds to wait for the event fds before the next call to service_irqs,
+                 the device runtime waits in its event loop, so the coroutines keep running
+        '''
+        return 0
+
+    def wait_events(self):
+        '''
+        Wait for events, for service loops that do not run in the device runtime
+        '''
+        timeout = self.get_idle_timeout()
+        if timeout:
+            select.select(self.get_event_fds(), [], [], timeout)
+
+    def run(self):
+        '''
+        Handle USB requests until the device is disconnected
+        '''
+        while self.is_connected() and not self.app.should_stop_phy():
+            self.service_irqs()
+            self.wait_events()
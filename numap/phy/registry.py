@@ -0,0 +1,75 @@
+'''
+Registry of the physical layers that can be selected with -P.
+
+The PHY string is ``<name>[:<argument>]``, e.g. ``fd:/dev/ttyUSB0`` or
+``gadgetfs:/dev/gadget``. Each backend is imported only when it is
+selected, so the optional dependencies of the other backends (facedancer,
+pyusb, ...) are not needed and not loaded.
+'''
+import os
+from collections import namedtuple
+
+PhyBackend = namedtuple('PhyBackend', ['name', 'factory', 'description'])
+
+PHY_BACKENDS = {}
+
+
+def register_phy(name, factory, description):
+    '''
+    :param name: name used in the PHY string
+    :param factory: called with (app, argument), imports the backend and returns the phy
+    :param description: one line description for the usage
+    '''
+    PHY_BACKENDS[name] = PhyBackend(name, factory, description)
+
+
+def parse_phy_string(phy_string):
+    '''
+    :param phy_string: ``<name>[:<argument>]``, None selects auto
+    :return: tuple (backend name, argument or None)
+    '''
+    name, _, argument = (phy_string or 'auto').partition(':')
+    return name, argument or None
+
+
+def load_phy(app, phy_string):
+    '''
+    :param app: application instance
+    :param phy_string: ``<name>[:<argument>]``
+    :return: the physical layer
+    '''
+    name, argument = parse_phy_string(phy_string)
+    if name not in PHY_BACKENDS:
+        raise Exception('Unknown physical layer %s, use one of: %s' % (name, ', '.join(sorted(PHY_BACKENDS))))
+    return PHY_BACKENDS[name].factory(app, argument)
+
+
+def facedancer_phy(app, argument):
+    if argument:
+        # facedancer selects the serial port of the GoodFET (MAXUSB) boards by environment
+        os.environ['BACKEND'] = 'goodfet'
+        os.environ['GOODFET'] = argument
+    from facedancer import FacedancerUSBApp
+    return FacedancerUSBApp()
+
+
+def gadgetfs_phy(app, argument):
+    from numap.phy.gadget import GadgetFsPhy
+    return GadgetFsPhy(app, argument or '/dev/gadget')
+
+
+def functionfs_phy(app, argument):
+    from numap.phy.gadget import FunctionFsPhy
+    return FunctionFsPhy(app, argument or 'numap')
+
+
+def virtual_phy(app, argument):
+    from numap.phy.virtual_phy import VirtualPhy
+    return VirtualPhy(app)
+
+
+register_phy('auto', facedancer_phy, 'automatically detect how we should connect')
+register_phy('fd', facedancer_phy, 'use facedancer connected to given serial port')
+register_phy('gadgetfs', gadgetfs_phy, 'use gadgetfs (requires mounting of gadgetfs beforehand)')
+register_phy('functionfs', functionfs_phy, 'use a FunctionFS gadget on the first UDC (requires libcomposite)')
+register_phy('virtual', virtual_phy, 'no hardware, the device only answers requests made in-process')
@@ -0,0 +1,142 @@
+'''
+Virtual physical layer, the host side is driven in-process.
+
+It is used to replay captured host sessions against a device
+without any hardware, as fast as the device can respond.
+'''
+from numap.phy.iphy import PhyInterface
+from numap.utils.usbmon import XferType, EventType, STATUS_STALL
+
+STALL = None
+
+
+class HostStep(object):
+    '''
+    A single action of the host, and the response that was captured for it
+    '''
+
+    setup = 'setup'
+    data_out = 'out'
+    data_in = 'in'
+
+    def __init__(self, kind, ep_num, data=b'', expected=None, address=None):
+        '''
+        :param kind: one of HostStep.setup, HostStep.data_out, HostStep.data_in
+        :param ep_num: endpoint number (without direction bit)
+        :param data: setup packet (+ data stage) or OUT data (default: b'')
+        :param expected: list of captured responses, STALL for a stall (default: None)
+        :param address: bus address of the device (default: None, the connected device)
+        '''
+        self.kind = kind
+        self.ep_num = ep_num
+        self.data = data
+        self.expected = [] if expected is None else expected
+        self.address = address
+
+    def __str__(self):
+        if self.address is None:
+            return '%s ep%d %s' % (self.kind, self.ep_num, bytes(self.data).hex())
+        return '%s %d:ep%d %s' % (self.kind, self.address, self.ep_num, bytes(self.data).hex())
+
+
+def steps_from_records(records):
+    '''
+    Convert usbmon records to a list of host steps.
+    Works with captures made by numap (--capture) and with captures
+    of a real host made with usbmon.
+
+    :param records: iterable of UsbmonRecord
+    :return: list of HostStep
+    '''
+    steps = []
+    pending = {}
+    for rec in records:
+        ep_num = rec.epnum & 0x7f
+        is_in = bool(rec.epnum & 0x80)
+        if rec.event_type == EventType.submission:
+            if rec.setup is not None:
+                step = HostStep(HostStep.setup, 0, rec.setup + rec.data, address=rec.devnum)
+            elif is_in:
+                step = HostStep(HostStep.data_in, ep_num, address=rec.devnum)
+            else:
+                steps.append(HostStep(HostStep.data_out, ep_num, rec.data, address=rec.devnum))
+                continue
+            steps.append(step)
+            pending[rec.urb_id] = step
+        elif rec.event_type == EventType.callback:
+            step = pending.get(rec.urb_id)
+            if rec.status == STATUS_STALL:
+                if step is not None:
+                    step.expected.append(STALL)
+            elif step is not None and (is_in or step.kind != HostStep.setup):
+                if rec.data or step.kind == HostStep.setup:
+                    step.expected.append(rec.data)
+            elif is_in and ep_num != 0 and rec.xfer_type != XferType.control:
+                # IN transfer without a submission (captures of older numap versions)
+                steps.append(HostStep(HostStep.data_in, ep_num, expected=[rec.data], address=rec.devnum))
+    return steps
+
+
+class VirtualPhy(PhyInterface):
+    '''
+    Phy that is driven by host steps instead of real hardware.
+    Everything the device sends is kept in ``responses``.
+
+    If the connected device routes transactions by bus address (a hub with
+    devices on its ports, see USBHubDevice.route), each step is passed to
+    the device with the address of the step.
+    '''
+
+    def __init__(self, app, idle_sleep=0.01):
+        '''
+        :type app: :class:`~numap.apps.base.NumapApp`
+        :param app: application instance
+        :param idle_sleep: seconds the runtime waits between the calls to service_irqs (default: 0.01)
+        '''
+        super(VirtualPhy, self).__init__(app, 'Virtual')
+        self.idle_sleep = idle_sleep
+        self.responses = []
+
+    def send_on_endpoint(self, ep_num, data, blocking=True):
+        self.responses.append((ep_num, bytes(data)))
+
+    def stall_ep0(self):
+        self.responses.append((0, STALL))
+
+    def ack_status_stage(self, blocking=False):
+        pass
+
+    def service_irqs(self):
+        # no events from a host, the steps are executed in-process (see execute)
+        pass
+
+    def get_idle_timeout(self):
+        # wait instead of spinning in the run loop
+        return self.idle_sleep
+
+    def execute(self, step):
+        '''
+        Perform a single host step against the connected device
+
+        :param step: HostStep to perform
+        :return: list of responses sent on the endpoint of the step
+        '''
+        device = self.connected_device
+        self.responses = []
+        routed = step.address is not None and hasattr(device, 'route')
+        if step.kind == HostStep.setup:
+            self.app.signal_setup_packet_received()
+            if routed:
+                device.handle_request_for(step.address, device.create_request(step.data))
+            else:
+                device.handle_request(device.create_request(step.data))
+        elif step.kind == HostStep.data_out:
+            if routed:
+                device.handle_data_available_for(step.address, step.ep_num, step.data)
+            else:
+                device.handle_data_available(step.ep_num, step.data)
+        elif routed:
+            device.handle_buffer_available_for(step.address, step.ep_num)
+        else:
+            device.handle_buffer_available(step.ep_num)
+        return [data for ep_num, data in self.responses if ep_num == step.ep_num]
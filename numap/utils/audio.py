@@ -0,0 +1,349 @@
+'''
+PCM sources and sinks for the isochronous audio endpoints.
+
+Samples are little endian signed PCM (8 bit samples are unsigned, like in
+WAV files). Format conversions are done on whole buffers with byte slices,
+numpy is used to mix channels down and to generate tones if it is
+installed (pip install numap[audio]), otherwise the first channel is used
+and the tone table is computed with the math module.
+'''
+import os
+import math
+import time
+import wave
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class AudioFormat(object):
+    '''
+    PCM format of a stream
+    '''
+
+    def __init__(self, channels, sample_width, rate):
+        '''
+        :param channels: number of channels
+        :param sample_width: bytes per sample
+        :param rate: samples per second
+        '''
+        self.channels = channels
+        self.sample_width = sample_width
+        self.rate = rate
+
+    @property
+    def frame_size(self):
+        return self.channels * self.sample_width
+
+    @classmethod
+    def from_format_type(cls, descriptor):
+        '''
+        :param descriptor: class specific AS format type I descriptor, without bLength and bDescriptorType
+                           (audio10.pdf, frmts10.pdf 2.2.5)
+        :return: AudioFormat with the first sample rate of the descriptor
+        '''
+        channels, subframe_size = descriptor[2], descriptor[3]
+        rate = int.from_bytes(descriptor[6:9], 'little') if len(descriptor) >= 9 else 0
+        return cls(channels, subframe_size, rate)
+
+    def __repr__(self):
+        return '%d Hz, %d bit, %d channel(s)' % (self.rate, self.sample_width * 8, self.channels)
+
+
+def _flip_sign(data):
+    # 8 bit WAV samples are unsigned
+    return bytes(data).translate(_SIGN_TABLE)
+
+
+_SIGN_TABLE = bytes((i ^ 0x80) for i in range(256))
+
+
+def convert(data, src, dst):
+    '''
+    Convert samples between sample widths and channel counts (the rate is not changed)
+
+    :param data: PCM data in src format
+    :param src: AudioFormat of data
+    :param dst: AudioFormat of the result
+    :return: PCM data in dst format
+    '''
+    src_width, dst_width = src.sample_width, dst.sample_width
+    if src.channels == dst.channels and src_width == dst_width:
+        return bytes(data)
+    if src_width == 1:
+        data = _flip_sign(data)
+    frames = len(data) // src.frame_size
+    data = data[:frames * src.frame_size]
+    if src.channels != dst.channels and dst.channels == 1 and numpy is not None and src_width in (2, 4):
+        # mix down
+        dtype = numpy.int16 if src_width == 2 else numpy.int32
+        samples = numpy.frombuffer(data, dtype=dtype).reshape(-1, src.channels)
+        data = samples.mean(axis=1).astype(dtype).tobytes()
+        src = AudioFormat(1, src_width, src.rate)
+    out = bytearray(frames * dst.channels * dst_width)
+    src_step = src.channels * src_width
+    dst_step = dst.channels * dst_width
+    # keep the most significant bytes, the least significant ones are zero when widening
+    common = min(src_width, dst_width)
+    for channel in range(dst.channels):
+        src_channel = min(channel, src.channels - 1)
+        for i in range(common):
+            src_byte = src_channel * src_width + src_width - common + i
+            dst_byte = channel * dst_width + dst_width - common + i
+            out[dst_byte::dst_step] = data[src_byte::src_step]
+    if dst_width == 1:
+        return _flip_sign(out)
+    return bytes(out)
+
+
+class SilenceSource(object):
+    '''
+    Source of zero samples
+    '''
+
+    def __init__(self, fmt):
+        self.format = fmt
+
+    def read(self, size):
+        '''
+        :param size: number of bytes
+        :return: up to size bytes of PCM data, b'' when the source is exhausted
+        '''
+        return bytes(size)
+
+
+class ToneSource(object):
+    '''
+    Sine tone generator
+    '''
+
+    def __init__(self, fmt, frequency=440, amplitude=0.5):
+        '''
+        :param fmt: AudioFormat of the samples
+        :param frequency: tone frequency in Hz (default: 440)
+        :param amplitude: amplitude, 0-1 (default: 0.5)
+        '''
+        self.format = fmt
+        # one second of samples holds a whole number of periods for integer frequencies
+        peak = amplitude * ((1 << (8 * fmt.sample_width - 1)) - 1)
+        mono = AudioFormat(1, 4, fmt.rate)
+        if numpy is not None:
+            t = numpy.arange(fmt.rate) * (2 * math.pi * frequency / fmt.rate)
+            table = (numpy.sin(t) * peak).astype('<i4') << (32 - 8 * fmt.sample_width)
+            table = table.tobytes()
+        else:
+            shift = 32 - 8 * fmt.sample_width
+            table = b''.join(
+                (int(math.sin(2 * math.pi * frequency * i / fmt.rate) * peak) << shift).to_bytes(4, 'little', signed=True)
+                for i in range(fmt.rate)
+            )
+        self.table = convert(table, mono, fmt)
+        self.position = 0
+
+    def read(self, size):
+        size -= size % self.format.frame_size
+        chunks = []
+        while size:
+            chunk = self.table[self.position:self.position + size]
+            self.position = (self.position + len(chunk)) % len(self.table)
+            size -= len(chunk)
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+
+class WaveSource(object):
+    '''
+    Samples of a WAV file, converted to the stream format
+    '''
+
+    def __init__(self, filename, fmt, loop=True, chunk_frames=4096):
+        '''
+        :param filename: WAV file
+        :param fmt: AudioFormat of the stream
+        :param loop: start over at the end of the file (default: True)
+        :param chunk_frames: frames read from the file at once (default: 4096)
+        '''
+        self.format = fmt
+        self.loop = loop
+        self.chunk_frames = chunk_frames
+        self.wave = wave.open(filename, 'rb')
+        self.file_format = AudioFormat(self.wave.getnchannels(), self.wave.getsampwidth(), self.wave.getframerate())
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def read(self, size):
+        size -= size % self.format.frame_size
+        while len(self.buffer) - self.offset < size:
+            frames = self.wave.readframes(self.chunk_frames)
+            if not frames:
+                if not self.loop:
+                    break
+                self.wave.rewind()
+                frames = self.wave.readframes(self.chunk_frames)
+                if not frames:
+                    break
+            # drop the consumed data once per file read, not once per packet
+            del self.buffer[:self.offset]
+            self.offset = 0
+            self.buffer += convert(frames, self.file_format, self.format)
+        data = bytes(self.buffer[self.offset:self.offset + size])
+        self.offset += len(data)
+        return data
+
+    def close(self):
+        self.wave.close()
+
+
+class WaveSink(object):
+    '''
+    Writes the received samples to a WAV file
+    '''
+
+    def __init__(self, filename, fmt):
+        '''
+        :param filename: WAV file
+        :param fmt: AudioFormat of the stream
+        '''
+        self.format = fmt
+        self.filename = filename
+        self.wave = self._open(filename, fmt.rate)
+        self.size = 0
+
+    def _open(self, filename, rate):
+        f = wave.open(filename, 'wb')
+        f.setnchannels(self.format.channels)
+        f.setsampwidth(self.format.sample_width)
+        f.setframerate(rate)
+        return f
+
+    def set_rate(self, rate):
+        '''
+        :param rate: sample rate of the following data,
+                     once data was written it goes to a new file: <name>-<rate>.wav
+        '''
+        if not self.size:
+            self.wave.setframerate(rate)
+            return
+        self.wave.close()
+        root, ext = os.path.splitext(self.filename)
+        self.wave = self._open('%s-%d%s' % (root, rate, ext or '.wav'), rate)
+        self.size = 0
+
+    def write(self, data):
+        self.wave.writeframesraw(data)
+        self.size += len(data)
+
+    def close(self):
+        # writes the final sizes to the header, can be called again
+        self.wave.close()
+
+
+class NullSink(object):
+
+    def set_rate(self, rate):
+        pass
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+class PacketSizer(object):
+    '''
+    Number of bytes per isochronous packet for a sample rate
+    '''
+
+    def __init__(self, fmt, max_packet_size, interval=1):
+        '''
+        :param fmt: AudioFormat of the stream
+        :param max_packet_size: wMaxPacketSize of the endpoint
+        :param interval: bInterval of the (full speed) endpoint, the period is 2^(bInterval-1) ms (default: 1)
+        '''
+        self.format = fmt
+        self.max_packet_size = max_packet_size
+        self.period = (1 << (max(interval, 1) - 1)) / 1000.0
+        self.remainder = 0.0
+        self.clipped = 0
+
+    @property
+    def max_rate(self):
+        '''
+        Highest sample rate the endpoint can carry
+        '''
+        return int(self.max_packet_size // self.format.frame_size / self.period)
+
+    def next_size(self):
+        '''
+        :return: size of the next packet in bytes, e.g. 9 packets of 44 frames and one of 45 for 44.1 kHz
+        '''
+        self.remainder += self.format.rate * self.period
+        frames = int(self.remainder)
+        self.remainder -= frames
+        size = frames * self.format.frame_size
+        if size > self.max_packet_size:
+            self.clipped += 1
+            size = self.max_packet_size - self.max_packet_size % self.format.frame_size
+        return size
+
+
+class StreamStats(object):
+    '''
+    Packet timing and underrun statistics of an isochronous stream
+    '''
+
+    def __init__(self, period, interval=5.0):
+        '''
+        :param period: expected time between packets in seconds
+        :param interval: seconds between reports (default: 5.0)
+        '''
+        self.period = period
+        self.interval = interval
+        self.reset(time.time())
+
+    def reset(self, now):
+        self.packets = 0
+        self.bytes = 0
+        self.underruns = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.last_packet = None
+        self.last_report = now
+
+    def add(self, size, underrun=False, now=None):
+        '''
+        :param size: packet size
+        :param underrun: True if the source had not enough data (default: False)
+        :param now: current time (default: None, time.time())
+        '''
+        if now is None:
+            now = time.time()
+        if self.last_packet is not None:
+            jitter = abs(now - self.last_packet - self.period)
+            self.jitter_sum += jitter
+            if jitter > self.jitter_max:
+                self.jitter_max = jitter
+        self.last_packet = now
+        self.packets += 1
+        self.bytes += size
+        if underrun:
+            self.underruns += 1
+
+    def poll(self, now=None):
+        '''
+        :return: report since the last report, None if the interval did not pass yet
+        '''
+        if now is None:
+            now = time.time()
+        elapsed = now - self.last_report
+        if elapsed < self.interval or not self.packets:
+            return None
+        report = '%.1f packets/s, %.1f kB/s, %d underruns, jitter avg %.3f ms max %.3f ms' % (
+            self.packets / elapsed, self.bytes / elapsed / 1000, self.underruns,
+            self.jitter_sum / max(self.packets - 1, 1) * 1000, self.jitter_max * 1000
+        )
+        self.reset(now)
+        return report
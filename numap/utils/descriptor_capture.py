@@ -0,0 +1,280 @@
+'''
+Extract device and configuration descriptors from captures of real devices.
+
+Supported inputs:
+
+lsusb -v text (.txt, .lsusb)
+    The descriptors are re-encoded from the decoded fields. Apart from the
+    HID descriptor, class specific descriptors that lsusb decodes can not be
+    restored and are dropped, the ones it dumps as hex (UNRECOGNIZED) are kept.
+
+raw descriptors (.bin, .raw)
+    The device descriptor followed by the configuration descriptors
+    (each with all its interface and endpoint descriptors).
+
+usbmon pcap (.pcap)
+    The GET_DESCRIPTOR responses of every device in the capture.
+'''
+import os
+import re
+import struct
+import hashlib
+from collections import namedtuple
+from numap.core.usb import DescriptorType
+from numap.utils.usbmon import read_pcap, EventType, XferType
+
+DescriptorSet = namedtuple('DescriptorSet', ['source', 'device', 'configurations', 'strings'])
+
+LSUSB_EXTENSIONS = ('.txt', '.lsusb')
+RAW_EXTENSIONS = ('.bin', '.raw')
+PCAP_EXTENSIONS = ('.pcap',)
+
+
+def descriptor_hash(descriptor_set):
+    '''
+    :param descriptor_set: DescriptorSet
+    :return: hex digest of the descriptors (the strings are not included)
+    '''
+    h = hashlib.sha1(descriptor_set.device)
+    for configuration in descriptor_set.configurations:
+        h.update(configuration)
+    return h.hexdigest()
+
+
+def from_blob(data, source=None):
+    '''
+    :param data: device descriptor followed by the configuration descriptors
+    :param source: name of the capture (default: None)
+    :return: DescriptorSet
+    '''
+    if len(data) < 18 or data[1] != DescriptorType.device:
+        raise Exception('%s: does not start with a device descriptor' % source)
+    device = bytes(data[:data[0]])
+    configurations = []
+    offset = device[0]
+    while offset + 4 <= len(data):
+        if data[offset + 1] != DescriptorType.configuration:
+            raise Exception('%s: expected a configuration descriptor at offset %d' % (source, offset))
+        total_length = struct.unpack_from('<H', data, offset + 2)[0]
+        configurations.append(bytes(data[offset:offset + total_length]))
+        offset += total_length
+    return DescriptorSet(source, device, configurations, {})
+
+
+# field sizes of the descriptors printed by lsusb -v, in descriptor order
+LSUSB_DESCRIPTORS = {
+    'Device Descriptor:': [
+        ('bLength', 1), ('bDescriptorType', 1), ('bcdUSB', 2), ('bDeviceClass', 1),
+        ('bDeviceSubClass', 1), ('bDeviceProtocol', 1), ('bMaxPacketSize0', 1), ('idVendor', 2),
+        ('idProduct', 2), ('bcdDevice', 2), ('iManufacturer', 1), ('iProduct', 1), ('iSerial', 1),
+        ('bNumConfigurations', 1),
+    ],
+    'Configuration Descriptor:': [
+        ('bLength', 1), ('bDescriptorType', 1), ('wTotalLength', 2), ('bNumInterfaces', 1),
+        ('bConfigurationValue', 1), ('iConfiguration', 1), ('bmAttributes', 1), ('MaxPower', 1),
+    ],
+    'Interface Descriptor:': [
+        ('bLength', 1), ('bDescriptorType', 1), ('bInterfaceNumber', 1), ('bAlternateSetting', 1),
+        ('bNumEndpoints', 1), ('bInterfaceClass', 1), ('bInterfaceSubClass', 1), ('bInterfaceProtocol', 1),
+        ('iInterface', 1),
+    ],
+    'Endpoint Descriptor:': [
+        ('bLength', 1), ('bDescriptorType', 1), ('bEndpointAddress', 1), ('bmAttributes', 1),
+        ('wMaxPacketSize', 2), ('bInterval', 1), ('bRefresh', 1), ('bSynchAddress', 1),
+    ],
+    'HID Device Descriptor:': [
+        ('bLength', 1), ('bDescriptorType', 1), ('bcdHID', 2), ('bCountryCode', 1), ('bNumDescriptors', 1),
+        ('bDescriptorType', 1), ('wDescriptorLength', 2),
+    ],
+}
+
+STRING_FIELDS = ('iManufacturer', 'iProduct', 'iSerial', 'iConfiguration', 'iInterface')
+
+_field_re = re.compile(r'^\s*(\w+)\s+(\S+)\s*(.*)$')
+
+
+def _parse_lsusb_value(name, value, bcd_usb):
+    if name.startswith('bcd'):
+        major, _, minor = value.partition('.')
+        return (int(major, 16) << 8) | int(minor or '0', 16)
+    if name == 'MaxPower':
+        # 2 mA units, 8 mA for SuperSpeed
+        return int(value.rstrip('mA')) // (8 if bcd_usb >= 0x0300 else 2)
+    return int(value, 0)
+
+
+def _encode_lsusb_descriptor(fields, values):
+    # values: name: list of values, some names appear twice (HID bDescriptorType)
+    values = {name: list(v) for name, v in values.items()}
+    data = b''
+    for name, size in fields:
+        if not values.get(name):
+            # audio endpoints have the bRefresh and bSynchAddress fields, others do not
+            break
+        data += values[name].pop(0).to_bytes(size, 'little')
+    return data[:data[0] if data else 0]
+
+
+def _build_configuration(descriptors):
+    # wTotalLength changes if lsusb decoded class specific descriptors
+    data = b''.join(descriptors)
+    return data[:2] + struct.pack('<H', len(data)) + data[4:]
+
+
+def from_lsusb(text, source=None):
+    '''
+    :param text: output of lsusb -v
+    :param source: name of the capture (default: None)
+    :return: list of DescriptorSet, one per device in the text
+    '''
+    result = []
+    device = None
+    configurations = []
+    current = []
+    strings = {}
+    kind = None
+    values = {}
+    bcd_usb = 0
+
+    def flush():
+        if kind is not None:
+            descriptor = _encode_lsusb_descriptor(LSUSB_DESCRIPTORS[kind], values)
+            if kind == 'Device Descriptor:':
+                return descriptor
+            current.append(descriptor)
+        return None
+
+    def finish_device():
+        if device is not None:
+            if current:
+                configurations.append(_build_configuration(current))
+            result.append(DescriptorSet(source, device, list(configurations), dict(strings)))
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped in LSUSB_DESCRIPTORS:
+            descriptor = flush()
+            if descriptor is not None:
+                device = descriptor
+            if stripped == 'Device Descriptor:':
+                finish_device()
+                device = None
+                configurations = []
+                current = []
+                strings = {}
+            elif stripped == 'Configuration Descriptor:' and current:
+                configurations.append(_build_configuration(current))
+                current = []
+            kind = stripped
+            values = {}
+            continue
+        if stripped.startswith('** UNRECOGNIZED:'):
+            descriptor = flush()
+            if descriptor is not None:
+                device = descriptor
+            kind = None
+            current.append(bytes.fromhex(stripped[len('** UNRECOGNIZED:'):].replace(' ', '')))
+            continue
+        if kind is None:
+            continue
+        if not line.startswith(' ') or stripped.endswith(':'):
+            # a descriptor lsusb decodes but can not be re-encoded, or the end of the device
+            descriptor = flush()
+            if descriptor is not None:
+                device = descriptor
+            kind = None
+            continue
+        match = _field_re.match(line)
+        if not match:
+            continue
+        name, value, rest = match.groups()
+        if name not in dict(LSUSB_DESCRIPTORS[kind]):
+            continue
+        try:
+            parsed = _parse_lsusb_value(name, value, bcd_usb)
+        except ValueError:
+            continue
+        values.setdefault(name, []).append(parsed)
+        if name == 'bcdUSB':
+            bcd_usb = parsed
+        if name in STRING_FIELDS and parsed and rest:
+            strings[parsed] = rest.strip()
+    descriptor = flush()
+    if descriptor is not None:
+        device = descriptor
+    finish_device()
+    return result
+
+
+def from_pcap(filename):
+    '''
+    :param filename: usbmon pcap file
+    :return: list of DescriptorSet, one per device (bus number, device number) in the capture
+    '''
+    requests = {}
+    devices = {}
+    for record in read_pcap(filename):
+        if record.xfer_type != XferType.control:
+            continue
+        if record.event_type == EventType.submission:
+            if record.setup is not None:
+                request_type, request, value, index, _ = struct.unpack('<BBHHH', record.setup)
+                if request_type == 0x80 and request == 6:
+                    requests[record.urb_id] = (value >> 8, value & 0xff)
+            continue
+        if record.event_type != EventType.callback or record.urb_id not in requests or record.status:
+            continue
+        desc_type, desc_index = requests.pop(record.urb_id)
+        key = (record.busnum, record.devnum)
+        device = devices.setdefault(key, {'device': b'', 'configurations': {}, 'strings': {}})
+        data = record.data
+        if desc_type == DescriptorType.device and len(data) >= len(device['device']):
+            device['device'] = bytes(data)
+        elif desc_type == DescriptorType.configuration and len(data) >= 4:
+            total_length = struct.unpack_from('<H', data, 2)[0]
+            if len(data) >= total_length:
+                device['configurations'][desc_index] = bytes(data[:total_length])
+        elif desc_type == DescriptorType.string and desc_index and len(data) > 2:
+            device['strings'][desc_index] = data[2:data[0]].decode('utf-16-le', 'replace')
+    result = []
+    for (busnum, devnum), device in sorted(devices.items()):
+        if len(device['device']) < 18 or not device['configurations']:
+            continue
+        result.append(DescriptorSet(
+            '%s:%d.%d' % (filename, busnum, devnum),
+            device['device'],
+            [device['configurations'][i] for i in sorted(device['configurations'])],
+            device['strings']
+        ))
+    return result
+
+
+def load_capture(filename):
+    '''
+    :param filename: capture file, the format is selected by the extension
+    :return: list of DescriptorSet
+    '''
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in PCAP_EXTENSIONS:
+        return from_pcap(filename)
+    if ext in RAW_EXTENSIONS:
+        with open(filename, 'rb') as f:
+            return [from_blob(f.read(), filename)]
+    if ext in LSUSB_EXTENSIONS:
+        with open(filename, 'r', errors='replace') as f:
+            return from_lsusb(f.read(), filename)
+    raise Exception('%s: unknown capture format' % filename)
+
+
+def find_captures(directory):
+    '''
+    :param directory: directory to search (recursively)
+    :return: sorted list of capture files
+    '''
+    extensions = LSUSB_EXTENSIONS + RAW_EXTENSIONS + PCAP_EXTENSIONS
+    found = []
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in extensions:
+                found.append(os.path.join(dirpath, filename))
+    return sorted(found)
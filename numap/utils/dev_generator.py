@@ -4,19 +4,35 @@ Generate a numap USB device python code from device and configuration descriptor
 
 Usage:
     numapmkdevice <DEVICE_DESCRIPTOR> <CONFIGURATION_DESCRIPTOR> ...
+    numapmkdevice --batch=DIR [--out=DIR] [--format=FORMAT] [--jobs=N]
 
 Arguments:
     DEVICE_DESCRIPTOR           device descriptor (hex)
     CONFIGURATION_DESCRIPTOR    one (or more) configuration descriptors
 
+Options:
+    --batch DIR                 generate a device for each capture in DIR: lsusb -v text (.txt, .lsusb),
+                                raw descriptors (.bin, .raw) or usbmon pcap (.pcap),
+                                devices with identical descriptors are generated once
+    --out DIR                   output directory of the batch mode [default: .]
+    --format FORMAT             output of the batch mode: py (python module)
+                                or json (device spec, loaded with -C FILE.json) [default: py]
+    --jobs N                    number of parallel processes, 0 for one per CPU [default: 0]
+
 Example(write in one line ...):
 
     numapmkdevice 120100020000004012831283000001020001 \\
     09022e00010100c0fa0904000004ff00000007058203000401070504020002000705860200020007058802000200
+
+    numapmkdevice --batch captures/ --out devices/ --format json
 '''
 from docopt import docopt
+import os
+import json
 import struct
+import multiprocessing
 from numap.core.usb import DescriptorType
+from numap.utils.descriptor_capture import find_captures, load_capture, descriptor_hash
 
 
 def get_device_descriptor(opts):
@@ -38,6 +54,11 @@ class DescriptorNode(object):
         self.node_type = node_type
         self.deps = []
         self.parent = None
+        # class descriptors without a parser, e.g. HID, kept as raw bytes
+        self.descriptors = {}
+        self.descriptors_name = None
+        # node type: name of the variable of the list of its children of that type
+        self.list_names = {}
 
     def get_by_type(self, req_type):
         # print 'get_by_type: %02x (%02x)' % (req_type, self.node_type)
@@ -59,10 +80,15 @@ class DescriptorNode(object):
     def get_pre(self):
         # print 'to_code(node_type: %02x)' % (self.node_type)
         pre_code = ''
+        if self.descriptors_name:
+            pre_code += '%s = {%s}\n' % (
+                self.descriptors_name,
+                ', '.join('%#x: %r' % (t, d) for t, d in sorted(self.descriptors.items()))
+            )
         available_list_types = set([n.node_type for n in self.deps if isinstance(n, ListNode)])
         known_list_types = set(t for t in self.list_names)
         if any(x not in known_list_types for x in available_list_types):
-            example = [x not in known_list_types for x in available_list_types][0]
+            example = [x for x in available_list_types if x not in known_list_types][0]
             raise Exception('An unknown list found, of type: %02x' % (example))
         for t in known_list_types:
             if t not in available_list_types:
@@ -86,6 +112,7 @@ class RootNode(DescriptorNode):
 
     def __init__(self):
         super(RootNode, self).__init__(0xff)
+        self.strings = {}
 
     def to_code(self):
         fres = ''
@@ -103,7 +130,7 @@ class USBMyDevice(USBDevice):
 
     def __init__(self, app, phy, vid=0x%04x, pid=0x%04x, **kwargs):''' % (dep.vendor_id, dep.product_id)
             res = ''
-            res += 'strings_dict = {}\n'
+            res += 'strings_dict = %r\n' % (self.strings)
             res += 'usb_class = None\n'
             res += 'usb_vendor = None\n'
             res += dep.get_pre()
@@ -155,10 +182,12 @@ class Parser(object):
     sync_types = ('USBEndpoint.sync_type_', ['none', 'async', 'adaptive', 'synchronous'])
     usage_types = ('USBEndpoint.usage_type_', ['data', 'feedback', 'implicit_feedback'])
 
-    def __init__(self, opts):
+    def __init__(self, opts, strings=None):
         self.opts = opts
         self.root_node = RootNode()
+        self.root_node.strings = dict(strings or {})
         self.curr_node = self.root_node
+        self.names = set()
         self.parsers = {
             DescriptorType.configuration: self.parse_configuration_desc,
             DescriptorType.interface: self.parse_interface_desc,
@@ -173,6 +202,19 @@ class Parser(object):
         else:
             return '%#x' % (value)
 
+    def unique_name(self, name):
+        '''
+        :return: a variable name that was not used yet in the generated code,
+                 e.g. for the endpoints of the alternate settings of an interface
+        '''
+        unique = name
+        i = 1
+        while unique in self.names:
+            unique = '%s_%d' % (name, i)
+            i += 1
+        self.names.add(unique)
+        return unique
+
     def push_node(self, node):
         self.curr_node.deps.append(node)
         node.parent = self.curr_node
@@ -197,9 +239,9 @@ class Parser(object):
 
     @parse_pfn(DescriptorType.cs_endpoint)
     def parse_cs_endpoint_desc(self, desc, node):
-        return build_init('CSEndpoint', [
+        return build_init('USBCSEndpoint', [
             ('name', "'CSEndpoint'"),
-            ('cs_config', "b'%s'" % (desc[2:].hex()))
+            ('cs_config', repr(bytes(desc[2:])))
         ])
 
     @parse_pfn(DescriptorType.endpoint)
@@ -212,8 +254,7 @@ class Parser(object):
         ) = struct.unpack('<BBBBHB', desc)
         direction = 'in' if address & 0x80 == 0x80 else 'out'
         number = address & 0x7f
-        handler_name = 'handle_ep%d_%s_available' % (number, direction)
-        cs_endpoints_name = "endpoint_%s_cs_endpoints" % (number)
+        cs_endpoints_name = self.unique_name('endpoint_%s_%s_cs_endpoints' % (number, direction))
         s = build_init('USBEndpoint', [
             ("number", number),
             ("direction", 'USBEndpoint.direction_' + direction),
@@ -222,7 +263,8 @@ class Parser(object):
             ("usage_type", self.endpoint_constant(self.usage_types, (attributes >> 4) & 0x03)),
             ("max_packet_size", max_packet_size),
             ("interval", interval),
-            ("handler", handler_name),
+            # the handlers have to be added by hand
+            ("handler", 'None'),
             ("cs_endpoints", cs_endpoints_name),
             ('usb_class', 'usb_class'),
             ('usb_vendor', 'usb_vendor'),
@@ -234,8 +276,8 @@ class Parser(object):
 
     @parse_pfn(DescriptorType.cs_interface)
     def parse_cs_interface_desc(self, desc, node):
-        return build_init('CSInterface', [
-            ("cs_config", "b'%s'" % (desc[2:].hex())),
+        return build_init('USBCSInterface', [
+            ("cs_config", repr(bytes(desc[2:]))),
             ("name", "'CSInterface'")
         ])
 
@@ -250,8 +292,11 @@ class Parser(object):
         ) = struct.unpack('<BBBBBBBBB', desc)
         if bDescriptorType != DescriptorType.interface:
             raise Exception('This is not an interface descriptor!')
-        endpoints_name = 'interface_%s_endpoints' % (number)
-        cs_interfaces_name = 'interface_%s_cs_interfaces' % (number)
+        prefix = 'interface_%s' % number if not alternate else 'interface_%s_alt_%s' % (number, alternate)
+        endpoints_name = self.unique_name('%s_endpoints' % prefix)
+        cs_interfaces_name = self.unique_name('%s_cs_interfaces' % prefix)
+        descriptors_name = self.unique_name('%s_descriptors' % prefix)
+        node.descriptors_name = descriptors_name
         s = build_init('USBInterface', [
             ('interface_number', number),
             ('interface_alternate', alternate),
@@ -260,9 +305,7 @@ class Parser(object):
             ('interface_protocol', protocol),
             ('interface_string_index', string_index),
             ('endpoints', endpoints_name),
-            # by default, no additional descriptors
-            # ('descriptors', 'interface_%s_descriptors' % (number)),
-            ('descriptors', 'None'),
+            ('descriptors', descriptors_name),
             ('cs_interfaces', cs_interfaces_name),
             ('usb_class', 'usb_class'),
             ('usb_vendor', 'usb_vendor'),
@@ -283,7 +326,7 @@ class Parser(object):
         ) = struct.unpack('<BBHBBBBB', desc)
         if bDescriptorType != DescriptorType.configuration:
             raise Exception('This is not a configuration descriptor! %02x' % (bDescriptorType))
-        interfaces_name = "config_%s_interfaces" % (index)
+        interfaces_name = self.unique_name('config_%s_interfaces' % (index))
         s = build_init('USBConfiguration', [
             ('index', index),
             ('string', "strings_dict.get(%s, 'Config-%s')" % (string_index, string_index)),
@@ -338,8 +381,18 @@ class Parser(object):
             if len(desc_buff) < 2:
                 raise Exception('Invalid configuration descriptor')
             desc_len, desc_type = struct.unpack('BB', desc_buff[:2])
-            if desc_len > len(desc_buff):
+            if desc_len < 2 or desc_len > len(desc_buff):
                 raise Exception('Invalid descriptor length: %02x %s' % (desc_len, desc_buff.hex()))
+            if desc_type == DescriptorType.interface_association:
+                # the interface classes have no representation for it
+                desc_buff = desc_buff[desc_len:]
+                continue
+            if desc_type not in self.parsers and self.curr_node.node_type in (
+                DescriptorType.interface, DescriptorType.endpoint
+            ):
+                self.curr_node.get_by_type(DescriptorType.interface).descriptors[desc_type] = desc_buff[:desc_len]
+                desc_buff = desc_buff[desc_len:]
+                continue
             if desc_type not in self.parsers:
                 raise Exception('Invalid descriptor type: %02x %s' % (desc_len, desc_buff.hex()))
             current_desc = desc_buff[:desc_len]
@@ -350,12 +403,101 @@ class Parser(object):
         for desc_buff in config_descs:
             self.parse_config_desc(desc_buff)
 
+    def to_code(self):
+        return self.root_node.to_code()
+
     def emit_output(self):
-        print self.root_node.to_code()
+        print(self.to_code())
+
+
+def generate_code(descriptor_set):
+    '''
+    :param descriptor_set: DescriptorSet
+    :return: python source of the device module
+    '''
+    parser = Parser({}, descriptor_set.strings)
+    parser.parse_device_desc(descriptor_set.device)
+    parser.parse_config_descs(descriptor_set.configurations)
+    return parser.to_code()
+
+
+def generate_spec(descriptor_set):
+    '''
+    :param descriptor_set: DescriptorSet
+    :return: json device spec (see numap.utils.device_spec)
+    '''
+    spec = {
+        'source': descriptor_set.source,
+        'device': descriptor_set.device.hex(),
+        'configurations': [c.hex() for c in descriptor_set.configurations],
+        'strings': {str(k): v for k, v in sorted(descriptor_set.strings.items())},
+    }
+    return json.dumps(spec, indent=4, sort_keys=True) + '\n'
+
+
+def _load_capture(filename):
+    try:
+        return filename, load_capture(filename), None
+    except Exception as e:
+        return filename, [], str(e)
+
+
+def run_batch(directory, out_dir, fmt='py', jobs=0):
+    '''
+    Generate a device for each distinct descriptor set in a directory of captures
+
+    :param directory: directory of captures (see numap.utils.descriptor_capture)
+    :param out_dir: output directory
+    :param fmt: 'py' for python modules, 'json' for device specs (default: 'py')
+    :param jobs: number of parallel processes, 0 for one per CPU (default: 0)
+    :return: (number of generated devices, number of duplicates, number of failed files)
+    '''
+    if fmt not in ('py', 'json'):
+        raise Exception('Unknown output format: %s' % fmt)
+    generate = generate_code if fmt == 'py' else generate_spec
+    captures = find_captures(directory)
+    os.makedirs(out_dir, exist_ok=True)
+    # hash: DescriptorSet, in the order of the captures so the same capture always wins a duplicate
+    unique = {}
+    generated = duplicates = failed = 0
+    with multiprocessing.Pool(jobs or None) as pool:
+        for filename, descriptor_sets, error in pool.imap(_load_capture, captures, chunksize=16):
+            if error:
+                print('%s: %s' % (filename, error))
+                failed += 1
+                continue
+            for descriptor_set in descriptor_sets:
+                digest = descriptor_hash(descriptor_set)
+                if digest in unique:
+                    # keep the strings that only the duplicate has
+                    for index, string in descriptor_set.strings.items():
+                        unique[digest].strings.setdefault(index, string)
+                    duplicates += 1
+                    continue
+                unique[digest] = descriptor_set._replace(strings=dict(descriptor_set.strings))
+    for digest, descriptor_set in unique.items():
+        vid, pid = struct.unpack_from('<HH', descriptor_set.device, 8)
+        out_name = os.path.join(out_dir, 'dev_%04x_%04x_%s.%s' % (vid, pid, digest[:8], fmt))
+        try:
+            output = generate(descriptor_set)
+        except Exception as e:
+            print('%s: %s' % (descriptor_set.source, e))
+            failed += 1
+            continue
+        with open(out_name, 'w') as f:
+            f.write(output)
+        generated += 1
+    return generated, duplicates, failed
 
 
 def main():
     opts = docopt(__doc__)
+    if opts['--batch']:
+        generated, duplicates, failed = run_batch(
+            opts['--batch'], opts['--out'], opts['--format'], int(opts['--jobs'])
+        )
+        print('Generated %d devices (%d duplicates, %d failed)' % (generated, duplicates, failed))
+        return
     device_desc = get_device_descriptor(opts)
     config_descs = get_configuration_descriptors(opts)
     parser = Parser(opts)
@@ -363,5 +505,6 @@ def main():
     parser.parse_config_descs(config_descs)
     parser.emit_output()
 
+
 if __name__ == '__main__':
     main()
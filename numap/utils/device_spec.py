@@ -0,0 +1,451 @@
+'''
+Devices defined by a declarative json spec instead of a python module.
+
+The spec holds the descriptors of the device (as captured, see
+numapmkdevice --batch) and optionally how it behaves::
+
+    {
+        "device": "12011001000000083c411321080100020001",
+        "configurations": ["09023b0002...", ...],
+        "strings": {"1": "Dell", "2": "Dell KB216 Wired Keyboard"},
+        "interface_descriptors": {"0": {"0x22": "05010906a101..."}},
+        "class_requests": {"0x01": "00", "0x0a": "", "0x03": null},
+        "vendor_requests": {"0x51": "0100"},
+        "endpoints": {
+            "0x81": {"behavior": "repeat", "data": "0000000000000000"},
+            "0x82": {"behavior": "sequence", "data": ["0100", "0000"], "loop": false},
+            "0x02": {"behavior": "echo", "to": "0x83"}
+        }
+    }
+
+interface_descriptors
+    descriptors the host requests from an interface (e.g. the HID report descriptor)
+class_requests, vendor_requests
+    response to a request (bRequest), truncated to wLength. null stalls the request,
+    requests that are not listed are stalled as well
+endpoints
+    IN: silent (default), repeat the data, send a sequence of packets
+    or echo what the host sent to an OUT endpoint.
+    OUT: discard (default), log or echo to an IN endpoint.
+
+Specs are validated and parsed once, the result is cached until the file
+changes, so a library of device personas can be loaded quickly.
+'''
+import os
+import json
+import struct
+from collections import deque, namedtuple
+from numap.core.usb import DescriptorType, interface_class_to_descriptor_type
+from numap.core.usb_class import USBClass
+from numap.core.usb_vendor import USBVendor
+from numap.core.usb_device import USBDevice
+from numap.core.usb_configuration import USBConfiguration
+from numap.core.usb_interface import USBInterface
+from numap.core.usb_endpoint import USBEndpoint
+from numap.core.usb_cs_interface import USBCSInterface
+from numap.core.usb_cs_endpoint import USBCSEndpoint
+
+SPEC_KEYS = (
+    'source', 'device', 'configurations', 'strings', 'interface_descriptors',
+    'class_requests', 'vendor_requests', 'endpoints'
+)
+IN_BEHAVIORS = ('silent', 'repeat', 'sequence', 'echo')
+OUT_BEHAVIORS = ('discard', 'log', 'echo')
+
+DeviceSpec = namedtuple('DeviceSpec', [
+    'source', 'device', 'configurations', 'strings', 'interface_descriptors',
+    'class_requests', 'vendor_requests', 'endpoints'
+])
+# descriptor: the interface descriptor, extra: class descriptors that follow it,
+# preceding: descriptors before it (interface associations)
+InterfaceSpec = namedtuple('InterfaceSpec', ['descriptor', 'extra', 'endpoints', 'preceding'])
+EndpointSpec = namedtuple('EndpointSpec', ['descriptor', 'extra'])
+ConfigurationSpec = namedtuple('ConfigurationSpec', ['descriptor', 'interfaces'])
+
+
+def _hex(value, what):
+    if not isinstance(value, str):
+        raise Exception('%s: expected a hex string' % what)
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        raise Exception('%s: invalid hex string' % what)
+
+
+def _number(value, what):
+    try:
+        return int(value, 0) if isinstance(value, str) else int(value)
+    except ValueError:
+        raise Exception('%s: invalid number %r' % (what, value))
+
+
+def parse_configuration(data, what='configuration'):
+    '''
+    :param data: configuration descriptor with all its interface and endpoint descriptors
+    :return: ConfigurationSpec
+    '''
+    if len(data) < 9 or data[0] != 9 or data[1] != DescriptorType.configuration:
+        raise Exception('%s: not a configuration descriptor' % what)
+    if struct.unpack_from('<H', data, 2)[0] != len(data):
+        raise Exception('%s: wTotalLength does not match the descriptor length' % what)
+    configuration = ConfigurationSpec(data[:9], [])
+    preceding = []
+    offset = 9
+    while offset < len(data):
+        length = data[offset]
+        if length < 2 or offset + length > len(data):
+            raise Exception('%s: invalid descriptor length at offset %d' % (what, offset))
+        desc_type = data[offset + 1]
+        desc = data[offset:offset + length]
+        offset += length
+        interfaces = configuration.interfaces
+        if desc_type == DescriptorType.interface:
+            if length != 9:
+                raise Exception('%s: interface descriptor length is not 9 bytes' % what)
+            interfaces.append(InterfaceSpec(desc, [], [], preceding))
+            preceding = []
+        elif desc_type == DescriptorType.endpoint:
+            if length < 7 or not interfaces:
+                raise Exception('%s: invalid endpoint descriptor at offset %d' % (what, offset - length))
+            interfaces[-1].endpoints.append(EndpointSpec(desc, []))
+        elif desc_type == DescriptorType.interface_association:
+            # sent before the first interface of the function
+            preceding.append(desc)
+        elif interfaces and interfaces[-1].endpoints and desc_type == DescriptorType.cs_endpoint:
+            interfaces[-1].endpoints[-1].extra.append(desc)
+        elif interfaces:
+            interfaces[-1].extra.append(desc)
+        else:
+            raise Exception('%s: descriptor %#x before the first interface' % (what, desc_type))
+    if preceding:
+        raise Exception('%s: interface association after the last interface' % what)
+    if len(set((i.descriptor[2], i.descriptor[3]) for i in configuration.interfaces)) != len(configuration.interfaces):
+        raise Exception('%s: duplicate interface' % what)
+    return configuration
+
+
+def parse_spec(spec, source=None):
+    '''
+    Validate a spec
+
+    :param spec: spec dictionary (see module doc)
+    :param source: name of the spec for the error messages (default: None)
+    :return: DeviceSpec
+    '''
+    what = source or 'spec'
+    if not isinstance(spec, dict):
+        raise Exception('%s: expected a json object' % what)
+    unknown = set(spec) - set(SPEC_KEYS)
+    if unknown:
+        raise Exception('%s: unknown keys: %s' % (what, ', '.join(sorted(unknown))))
+    device = _hex(spec.get('device'), '%s: device' % what)
+    if len(device) != 18 or device[0] != 18 or device[1] != DescriptorType.device:
+        raise Exception('%s: device: not a device descriptor' % what)
+    configurations = [
+        parse_configuration(_hex(c, '%s: configurations' % what), '%s: configuration %d' % (what, i))
+        for i, c in enumerate(spec.get('configurations', []))
+    ]
+    if not configurations:
+        raise Exception('%s: no configurations' % what)
+    endpoint_addresses = set(
+        e.descriptor[2] for c in configurations for i in c.interfaces for e in i.endpoints
+    )
+    strings = {
+        _number(k, '%s: strings' % what): str(v) for k, v in spec.get('strings', {}).items()
+    }
+    interface_descriptors = {}
+    for number, descriptors in spec.get('interface_descriptors', {}).items():
+        interface_descriptors[_number(number, '%s: interface_descriptors' % what)] = {
+            _number(t, '%s: interface_descriptors' % what): _hex(d, '%s: interface_descriptors' % what)
+            for t, d in descriptors.items()
+        }
+    requests = {}
+    for key in ('class_requests', 'vendor_requests'):
+        requests[key] = {
+            _number(k, '%s: %s' % (what, key)): None if v is None else _hex(v, '%s: %s' % (what, key))
+            for k, v in spec.get(key, {}).items()
+        }
+    endpoints = {}
+    for address, behavior in spec.get('endpoints', {}).items():
+        ep_what = '%s: endpoint %s' % (what, address)
+        address = _number(address, ep_what)
+        if address not in endpoint_addresses:
+            raise Exception('%s: not in the configurations' % ep_what)
+        name = behavior.get('behavior')
+        allowed = IN_BEHAVIORS if address & 0x80 else OUT_BEHAVIORS
+        if name not in allowed:
+            raise Exception('%s: behavior must be one of %s' % (ep_what, ', '.join(allowed)))
+        behavior = dict(behavior)
+        if name == 'repeat':
+            behavior['data'] = _hex(behavior.get('data', ''), ep_what)
+        elif name == 'sequence':
+            behavior['data'] = [_hex(d, ep_what) for d in behavior.get('data', [])]
+        elif name == 'echo' and not address & 0x80:
+            target = _number(behavior.get('to'), ep_what)
+            if not target & 0x80 or target not in endpoint_addresses:
+                raise Exception('%s: echo target must be an IN endpoint of the device' % ep_what)
+            behavior['to'] = target
+        endpoints[address] = behavior
+    return DeviceSpec(
+        source, device, configurations, strings, interface_descriptors,
+        requests['class_requests'], requests['vendor_requests'], endpoints
+    )
+
+
+# path: (mtime, size, DeviceSpec)
+_spec_cache = {}
+
+
+def load_spec(filename):
+    '''
+    :param filename: json spec file
+    :return: DeviceSpec, cached until the file changes
+    '''
+    path = os.path.abspath(filename)
+    st = os.stat(path)
+    cached = _spec_cache.get(path)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    with open(path, 'r') as f:
+        try:
+            spec = json.load(f)
+        except ValueError as e:
+            raise Exception('%s: %s' % (filename, e))
+    device_spec = parse_spec(spec, filename)
+    _spec_cache[path] = (st.st_mtime_ns, st.st_size, device_spec)
+    return device_spec
+
+
+class RawDescriptor(object):
+    '''
+    Class specific descriptor that is sent as it is
+    '''
+
+    def __init__(self, descriptor):
+        self.descriptor = descriptor
+
+    def get_descriptor(self, usb_type='fullspeed', valid=False):
+        return self.descriptor
+
+
+class SpecInterface(USBInterface):
+    '''
+    Interface that is sent after the descriptors that precede it in the spec
+    '''
+
+    def __init__(self, app, phy, preceding, **kwargs):
+        '''
+        :param preceding: list of raw descriptors (e.g. interface associations)
+        '''
+        self.preceding = preceding
+        super(SpecInterface, self).__init__(app=app, phy=phy, **kwargs)
+
+    def get_descriptor(self, usb_type='fullspeed', valid=False):
+        return b''.join(self.preceding) + super(SpecInterface, self).get_descriptor(usb_type, valid)
+
+
+class SpecClass(USBClass):
+    '''
+    Answers the class requests with the responses of the spec
+    '''
+    name = 'SpecClass'
+
+    def __init__(self, app, phy, responses):
+        self.responses = responses
+        super(SpecClass, self).__init__(app, phy)
+
+    def setup_local_handlers(self):
+        self.local_handlers = {request: self.handle_spec_request for request in self.responses}
+
+    def handle_spec_request(self, req):
+        response = self.responses[req.request]
+        if response is None:
+            self.phy.stall_ep0()
+            return None
+        return response[:req.length]
+
+    def default_handler(self, req):
+        if req.request in self.local_handlers:
+            return self._global_handler(req)
+        self.debug('Class request %#x is not in the spec, stalling' % req.request)
+        self.phy.stall_ep0()
+
+
+class SpecVendor(USBVendor):
+    '''
+    Answers the vendor requests with the responses of the spec
+    '''
+    name = 'SpecVendor'
+
+    def __init__(self, app, phy, responses):
+        self.responses = responses
+        super(SpecVendor, self).__init__(app, phy)
+
+    def default_handler(self, req):
+        response = self.responses.get(req.request)
+        if response is None:
+            self.debug('Vendor request %#x is not in the spec, stalling' % req.request)
+            self.phy.stall_ep0()
+            return
+        self.phy.send_on_endpoint(0, response[:req.length])
+        self.usb_function_supported('vendor specific setup request received')
+
+
+class EndpointBehavior(object):
+    '''
+    Data handler of an endpoint, as given in the spec
+    '''
+
+    def __init__(self, actor, number, behavior):
+        '''
+        :param actor: USB actor to send and log with
+        :param number: endpoint number
+        :param behavior: behavior dictionary of the spec
+        '''
+        self.actor = actor
+        self.number = number
+        self.behavior = behavior['behavior']
+        self.data = behavior.get('data')
+        self.loop = behavior.get('loop', True)
+        self.target = None
+        self.pending = deque()
+        self.index = 0
+
+    def handle_buffer_available(self):
+        if self.behavior == 'repeat':
+            self.actor.send_on_endpoint(self.number, self.data)
+        elif self.behavior == 'sequence' and self.data:
+            if self.index >= len(self.data):
+                if not self.loop:
+                    return
+                self.index = 0
+            self.actor.send_on_endpoint(self.number, self.data[self.index])
+            self.index += 1
+        elif self.behavior == 'echo' and self.pending:
+            self.actor.send_on_endpoint(self.number, self.pending.popleft())
+
+    def handle_data_available(self, data):
+        if self.behavior == 'log':
+            self.actor.info('Data on endpoint %d: %s' % (self.number, data.hex()))
+        elif self.behavior == 'echo' and self.target is not None:
+            self.target.pending.append(data)
+
+
+class SpecDevice(USBDevice):
+    '''
+    Device built from a DeviceSpec
+    '''
+    name = 'SpecDevice'
+
+    def __init__(self, app, phy, spec, vid=None, pid=None, **kwargs):
+        '''
+        :param spec: DeviceSpec (see load_spec)
+        :param vid: override the vendor id of the spec (default: None)
+        :param pid: override the product id of the spec (default: None)
+        '''
+        (
+            _, _, bcd_usb, device_class, device_subclass, protocol_rel_num,
+            max_packet_size_ep0, vendor_id, product_id, device_rev,
+            manufacturer_id, product_id_string, serial_id, _
+        ) = struct.unpack('<BBHBBBBHHHBBBB', spec.device)
+        self.spec = spec
+        self.usb_spec_class = SpecClass(app, phy, spec.class_requests)
+        self.usb_spec_vendor = SpecVendor(app, phy, spec.vendor_requests)
+        self.behaviors = {}
+        configurations = [self.build_configuration(app, phy, c) for c in spec.configurations]
+        for address, behavior in self.behaviors.items():
+            if behavior.behavior == 'echo' and not address & 0x80:
+                behavior.target = self.behaviors[spec.endpoints[address]['to']]
+        super(SpecDevice, self).__init__(
+            app=app,
+            phy=phy,
+            device_class=device_class,
+            device_subclass=device_subclass,
+            protocol_rel_num=protocol_rel_num,
+            max_packet_size_ep0=max_packet_size_ep0,
+            vendor_id=vid if vid is not None else vendor_id,
+            product_id=pid if pid is not None else product_id,
+            device_rev=device_rev,
+            manufacturer_string=spec.strings.get(manufacturer_id, ''),
+            product_string=spec.strings.get(product_id_string, ''),
+            serial_number_string=spec.strings.get(serial_id, ''),
+            configurations=configurations,
+            usb_class=self.usb_spec_class,
+            usb_vendor=self.usb_spec_vendor,
+        )
+        self.usb_spec_version = bcd_usb
+        # keep the string indices of the spec
+        count = max(list(spec.strings) + [manufacturer_id, product_id_string, serial_id, 0])
+        self.strings = [spec.strings.get(i, '') for i in range(1, count + 1)] or ['']
+        self.manufacturer_string_id = manufacturer_id
+        self.product_string_id = product_id_string
+        self.serial_number_string_id = serial_id
+
+    def build_configuration(self, app, phy, configuration):
+        (
+            _, _, _, _, index, string_index, attributes, max_power
+        ) = struct.unpack('<BBHBBBBB', configuration.descriptor)
+        return USBConfiguration(
+            app=app,
+            phy=phy,
+            index=index,
+            string=self.spec.strings.get(string_index),
+            interfaces=[self.build_interface(app, phy, i) for i in configuration.interfaces],
+            attributes=attributes,
+            max_power=max_power,
+        )
+
+    def build_interface(self, app, phy, interface):
+        (
+            _, _, number, alternate, _, iclass, subclass, protocol, string_index
+        ) = struct.unpack('<BBBBBBBBB', interface.descriptor)
+        descriptors = dict(self.spec.interface_descriptors.get(number, {}))
+        cs_interfaces = []
+        class_desc_type = interface_class_to_descriptor_type(iclass)
+        for desc in interface.extra:
+            if desc[1] == class_desc_type and class_desc_type not in descriptors:
+                descriptors[class_desc_type] = desc
+            elif desc[1] == DescriptorType.cs_interface:
+                cs_interfaces.append(USBCSInterface('CSInterface', app, phy, desc[2:]))
+            else:
+                cs_interfaces.append(RawDescriptor(desc))
+        return SpecInterface(
+            app=app,
+            phy=phy,
+            preceding=interface.preceding,
+            interface_number=number,
+            interface_alternate=alternate,
+            interface_class=iclass,
+            interface_subclass=subclass,
+            interface_protocol=protocol,
+            interface_string_index=string_index,
+            endpoints=[self.build_endpoint(app, phy, e) for e in interface.endpoints],
+            descriptors=descriptors,
+            cs_interfaces=cs_interfaces,
+            usb_class=self.usb_spec_class,
+            usb_vendor=self.usb_spec_vendor,
+        )
+
+    def build_endpoint(self, app, phy, endpoint):
+        address, attributes, max_packet_size, interval = struct.unpack_from('<BBHB', endpoint.descriptor, 2)
+        number = address & 0x0f
+        direction = address >> 7
+        default = {'behavior': 'silent' if direction else 'discard'}
+        behavior = self.behaviors.setdefault(
+            address, EndpointBehavior(self, number, self.spec.endpoints.get(address, default))
+        )
+        return USBEndpoint(
+            app=app,
+            phy=phy,
+            number=number,
+            direction=direction,
+            transfer_type=attributes & 0x03,
+            sync_type=(attributes >> 2) & 0x03,
+            usage_type=(attributes >> 4) & 0x03,
+            max_packet_size=max_packet_size,
+            interval=interval,
+            handler=behavior.handle_buffer_available if direction else behavior.handle_data_available,
+            cs_endpoints=[USBCSEndpoint('CSEndpoint', app, phy, desc[2:]) for desc in endpoint.extra],
+            usb_class=self.usb_spec_class,
+            usb_vendor=self.usb_spec_vendor,
+        )
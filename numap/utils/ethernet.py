@@ -0,0 +1,693 @@
+'''
+Ethernet data plane for the networking devices (CDC ECM/EEM/NCM and RNDIS).
+
+A framing object decodes the bulk OUT transfers of the host into Ethernet
+frames and encodes frames for the bulk IN endpoint. The EthernetBridge
+moves the frames between the device and a sink - a Linux TAP interface,
+or an in-process queue (for tests and throughput measurements).
+'''
+import os
+import time
+import zlib
+import struct
+from collections import deque
+
+# Ethernet frame without FCS, plus room for a VLAN tag
+MAX_FRAME_SIZE = 1518
+
+
+def ethernet_crc(frame):
+    '''
+    :param frame: ethernet frame
+    :return: the frame check sequence of the frame, as appended on the wire
+    '''
+    return struct.pack('<I', zlib.crc32(frame) & 0xffffffff)
+
+
+class Framing(object):
+    '''
+    Base class for the bulk framing of a networking device.
+
+    Transfers are reassembled in a preallocated buffer,
+    a transfer ends with a short packet (or when ``transfer_complete`` says so).
+    '''
+
+    name = 'raw'
+
+    def __init__(self, max_packet_size=0x40, max_transfer_size=0x4000):
+        '''
+        :param max_packet_size: max packet size of the bulk endpoints (default: 0x40)
+        :param max_transfer_size: largest transfer the host may send (default: 0x4000)
+        '''
+        self.max_packet_size = max_packet_size
+        self.buffer = bytearray(max_transfer_size)
+        self.length = 0
+        self.errors = 0
+
+    def feed(self, data):
+        '''
+        :param data: packet received on the bulk OUT endpoint
+        :return: list of the ethernet frames of the transfer, once it is complete
+        '''
+        end = self.length + len(data)
+        if end > len(self.buffer):
+            self.errors += 1
+            self.length = 0
+            return []
+        self.buffer[self.length:end] = data
+        self.length = end
+        with memoryview(self.buffer)[:end] as transfer:
+            if len(data) == self.max_packet_size and not self.transfer_complete(transfer):
+                return []
+            self.length = 0
+            if not end:
+                return []
+            try:
+                return self.decode(transfer)
+            except struct.error:
+                self.errors += 1
+                return []
+
+    def transfer_complete(self, transfer):
+        '''
+        :param transfer: data received so far (ends with a full packet)
+        :return: whether the transfer is complete without a short packet
+        '''
+        return False
+
+    def decode(self, transfer):
+        '''
+        :param transfer: complete bulk OUT transfer
+        :return: list of ethernet frames (bytes)
+        '''
+        return [bytes(transfer)]
+
+    def encode(self, frames):
+        '''
+        :param frames: list of ethernet frames
+        :return: list of bulk IN transfers
+        '''
+        return list(frames)
+
+    def needs_zlp(self, transfer):
+        '''
+        :param transfer: bulk IN transfer
+        :return: whether the transfer has to be terminated with a zero length packet
+        '''
+        return len(transfer) % self.max_packet_size == 0
+
+
+class EcmFraming(Framing):
+    '''
+    CDC ECM - each transfer is a single ethernet frame (ECM120, 3.3.1)
+    '''
+
+    name = 'ECM'
+
+    def decode(self, transfer):
+        if len(transfer) > MAX_FRAME_SIZE:
+            self.errors += 1
+            return []
+        return [bytes(transfer)]
+
+
+class EemFraming(Framing):
+    '''
+    CDC EEM - a transfer holds any number of EEM packets,
+    each one with a 2 byte header (CDC_EEM10, 5.1)
+    '''
+
+    name = 'EEM'
+
+    TYPE_COMMAND = 0x8000
+    CRC_CALCULATED = 0x4000
+    CRC_SENTINEL = b'\xde\xad\xbe\xef'
+
+    CMD_ECHO = 0
+    CMD_ECHO_RESPONSE = 1
+
+    def __init__(self, max_packet_size=0x40, max_transfer_size=0x4000):
+        super(EemFraming, self).__init__(max_packet_size, max_transfer_size)
+        # command packets (echo responses) waiting for the next IN transfer
+        self.commands = deque(maxlen=16)
+
+    def decode(self, transfer):
+        frames = []
+        offset = 0
+        while offset + 2 <= len(transfer):
+            header, = struct.unpack_from('<H', transfer, offset)
+            offset += 2
+            if header & self.TYPE_COMMAND:
+                opcode = (header >> 11) & 0x7
+                if opcode in (self.CMD_ECHO, self.CMD_ECHO_RESPONSE):
+                    length = header & 0x7ff
+                    if opcode == self.CMD_ECHO:
+                        response = self.TYPE_COMMAND | (self.CMD_ECHO_RESPONSE << 11) | length
+                        self.commands.append(struct.pack('<H', response) + transfer[offset:offset + length])
+                    offset += length
+                continue
+            length = header & 0x3fff
+            if not length:
+                # zero length EEM packet
+                continue
+            if length < 4 or offset + length > len(transfer):
+                self.errors += 1
+                break
+            frame = bytes(transfer[offset:offset + length - 4])
+            crc = transfer[offset + length - 4:offset + length]
+            if header & self.CRC_CALCULATED and crc != ethernet_crc(frame):
+                self.errors += 1
+            else:
+                frames.append(frame)
+            offset += length
+        return frames
+
+    def encode(self, frames):
+        parts = list(self.commands)
+        self.commands.clear()
+        for frame in frames:
+            parts.append(struct.pack('<H', len(frame) + 4))
+            parts.append(frame)
+            parts.append(self.CRC_SENTINEL)
+        return [b''.join(parts)] if parts else []
+
+
+class NtbParameters(object):
+    '''
+    NTB parameters of an NCM function (NCM10, 6.2.1),
+    and the values the host selected with the SET_NTB_* requests.
+    '''
+
+    # wLength, bmNtbFormatsSupported, dwNtbInMaxSize, wNdpInDivisor, wNdpInPayloadRemainder,
+    # wNdpInAlignment, wReserved, dwNtbOutMaxSize, wNdpOutDivisor, wNdpOutPayloadRemainder,
+    # wNdpOutAlignment, wNtbOutMaxDatagrams
+    STRUCT = struct.Struct('<HHIHHHHIHHHH')
+
+    FORMAT_NTB16 = 0x0000
+    FORMAT_NTB32 = 0x0001
+
+    # smallest dwNtbInMaxSize the host may select
+    MIN_NTB_IN_SIZE = 2048
+
+    def __init__(
+            self, ntb_in_max_size=0x4000, ndp_in_divisor=4, ndp_in_payload_remainder=0, ndp_in_alignment=4,
+            ntb_out_max_size=0x4000, ndp_out_divisor=4, ndp_out_payload_remainder=0, ndp_out_alignment=4,
+            ntb_out_max_datagrams=0, ntb32=True):
+        '''
+        :param ntb_in_max_size: largest NTB the device sends (default: 0x4000)
+        :param ndp_in_divisor: datagram alignment divisor of IN NTBs (default: 4)
+        :param ndp_in_payload_remainder: datagram offset remainder of IN NTBs (default: 0)
+        :param ndp_in_alignment: NDP alignment of IN NTBs (default: 4)
+        :param ntb_out_max_size: largest NTB the host may send (default: 0x4000)
+        :param ndp_out_divisor: datagram alignment divisor of OUT NTBs (default: 4)
+        :param ndp_out_payload_remainder: datagram offset remainder of OUT NTBs (default: 0)
+        :param ndp_out_alignment: NDP alignment of OUT NTBs (default: 4)
+        :param ntb_out_max_datagrams: max datagrams in an OUT NTB, 0 for no limit (default: 0)
+        :param ntb32: whether the NTB32 format is supported (default: True)
+        '''
+        self.ntb_in_max_size = ntb_in_max_size
+        self.ndp_in_divisor = ndp_in_divisor
+        self.ndp_in_payload_remainder = ndp_in_payload_remainder
+        self.ndp_in_alignment = ndp_in_alignment
+        self.ntb_out_max_size = ntb_out_max_size
+        self.ndp_out_divisor = ndp_out_divisor
+        self.ndp_out_payload_remainder = ndp_out_payload_remainder
+        self.ndp_out_alignment = ndp_out_alignment
+        self.ntb_out_max_datagrams = ntb_out_max_datagrams
+        self.ntb32_supported = ntb32
+        self.reset()
+
+    def reset(self):
+        '''
+        Restore the defaults that the host may change (NCM10, 6.2.4 - 6.2.13)
+        '''
+        self.ntb_format = self.FORMAT_NTB16
+        self.ntb_in_size = self.ntb_in_max_size
+        self.ntb_in_max_datagrams = 0
+        self.crc = False
+        self.max_datagram_size = 1514
+
+    def pack(self):
+        return self.STRUCT.pack(
+            self.STRUCT.size, 0x3 if self.ntb32_supported else 0x1,
+            self.ntb_in_max_size, self.ndp_in_divisor, self.ndp_in_payload_remainder, self.ndp_in_alignment, 0,
+            self.ntb_out_max_size, self.ndp_out_divisor, self.ndp_out_payload_remainder, self.ndp_out_alignment,
+            self.ntb_out_max_datagrams
+        )
+
+
+class NcmFraming(Framing):
+    '''
+    CDC NCM - each transfer is a single NTB (NCM10, 3.2 & 3.3),
+    with 16 or 32 bit offsets.
+
+    Frames for the host are aggregated into NTBs of up to the negotiated
+    NTB input size. A partially filled NTB is sent once its oldest frame
+    waited ``aggregation_timeout`` seconds.
+    '''
+
+    name = 'NCM'
+
+    NTH16 = struct.Struct('<4sHHHH')
+    NTH32 = struct.Struct('<4sHHII')
+    NDP16 = struct.Struct('<4sHH')
+    NDP32 = struct.Struct('<4sHHII')
+    DPE16 = struct.Struct('<HH')
+    DPE32 = struct.Struct('<II')
+
+    NTH16_SIGNATURE = b'NCMH'
+    NTH32_SIGNATURE = b'ncmh'
+    NDP16_SIGNATURES = (b'NCM0', b'NCM1')
+    NDP32_SIGNATURES = (b'ncm0', b'ncm1')
+
+    def __init__(self, max_packet_size=0x40, params=None, aggregation_timeout=0.001, max_pending=256):
+        '''
+        :param max_packet_size: max packet size of the bulk endpoints (default: 0x40)
+        :param params: NtbParameters instance (default: None, the default parameters)
+        :param aggregation_timeout: max seconds a frame waits for more frames (default: 0.001)
+        :param max_pending: max number of frames waiting for aggregation (default: 256)
+        '''
+        self.params = NtbParameters() if params is None else params
+        super(NcmFraming, self).__init__(max_packet_size, self.params.ntb_out_max_size)
+        self.aggregation_timeout = aggregation_timeout
+        self.sequence = 0
+        self.pending = deque()
+        # enqueue time of each pending frame
+        self.enqueued = deque()
+        # enqueue time of the oldest pending frame
+        self.pending_since = None
+        self.max_pending = max_pending
+        self.dropped = 0
+
+    def transfer_complete(self, transfer):
+        # an NTB of exactly dwNtbOutMaxSize bytes is not followed by a short packet
+        if len(transfer) >= self.NTH16.size and bytes(transfer[:4]) == self.NTH16_SIGNATURE:
+            return len(transfer) >= self.NTH16.unpack_from(transfer)[3]
+        if len(transfer) >= self.NTH32.size and bytes(transfer[:4]) == self.NTH32_SIGNATURE:
+            return len(transfer) >= self.NTH32.unpack_from(transfer)[3]
+        return False
+
+    def needs_zlp(self, transfer):
+        # the host reads at most the NTB input size, so a full NTB is not terminated
+        return len(transfer) != self.params.ntb_in_size and super(NcmFraming, self).needs_zlp(transfer)
+
+    def decode(self, transfer):
+        signature = bytes(transfer[:4])
+        if signature == self.NTH16_SIGNATURE:
+            _, _, _, block_length, ndp_index = self.NTH16.unpack_from(transfer)
+            ndp, dpe, signatures = self.NDP16, self.DPE16, self.NDP16_SIGNATURES
+        elif signature == self.NTH32_SIGNATURE:
+            _, _, _, block_length, ndp_index = self.NTH32.unpack_from(transfer)
+            ndp, dpe, signatures = self.NDP32, self.DPE32, self.NDP32_SIGNATURES
+        else:
+            self.errors += 1
+            return []
+        block_length = min(block_length, len(transfer))
+        frames = []
+        visited = set()
+        while ndp_index and ndp_index not in visited and ndp_index + ndp.size <= block_length:
+            visited.add(ndp_index)
+            fields = ndp.unpack_from(transfer, ndp_index)
+            ndp_signature, ndp_length = fields[0], fields[1]
+            next_index = fields[3] if ndp is self.NDP32 else fields[2]
+            if ndp_signature not in signatures:
+                self.errors += 1
+                break
+            with_crc = ndp_signature in (b'NCM1', b'ncm1')
+            end = min(ndp_index + ndp_length, block_length)
+            for entry in range(ndp_index + ndp.size, end - dpe.size + 1, dpe.size):
+                index, length = dpe.unpack_from(transfer, entry)
+                if not index or not length:
+                    break
+                if index + length > block_length or length < (4 if with_crc else 1):
+                    self.errors += 1
+                    continue
+                if with_crc:
+                    length -= 4
+                frames.append(bytes(transfer[index:index + length]))
+            ndp_index = next_index
+        return frames
+
+    def encode(self, frames):
+        now = time.time()
+        for frame in frames:
+            if len(self.pending) == self.max_pending:
+                self.dropped += 1
+                continue
+            # frames from the TAP sink are views of reused buffers
+            self.pending.append(bytes(frame))
+            self.enqueued.append(now)
+            if self.pending_since is None:
+                self.pending_since = now
+        transfers = []
+        while self.pending:
+            count, full = self._fit()
+            if not count:
+                # larger than a whole NTB
+                self._take(1)
+                self.errors += 1
+                continue
+            if not full and now - self.pending_since < self.aggregation_timeout:
+                break
+            transfers.append(self.build(self._take(count)))
+        return transfers
+
+    def _take(self, count):
+        '''
+        :return: the first count pending frames, removed from the pending frames
+        '''
+        frames = [self.pending.popleft() for _ in range(count)]
+        for _ in range(count):
+            self.enqueued.popleft()
+        self.pending_since = self.enqueued[0] if self.enqueued else None
+        return frames
+
+    def _layout(self):
+        '''
+        :return: (NTH, NDP, DPE) structs and NDP signature of the IN NTBs
+        '''
+        crc = 1 if self.params.crc else 0
+        if self.params.ntb_format == NtbParameters.FORMAT_NTB32:
+            return self.NTH32, self.NDP32, self.DPE32, self.NDP32_SIGNATURES[crc]
+        return self.NTH16, self.NDP16, self.DPE16, self.NDP16_SIGNATURES[crc]
+
+    def _datagram_offset(self, offset):
+        '''
+        :return: the first offset >= offset that satisfies the divisor and remainder
+        '''
+        divisor = max(self.params.ndp_in_divisor, 1)
+        remainder = self.params.ndp_in_payload_remainder % divisor
+        return offset + (remainder - offset) % divisor
+
+    def _ndp_offset(self, offset):
+        alignment = max(self.params.ndp_in_alignment, 4)
+        return offset + (-offset % alignment)
+
+    def _fit(self):
+        '''
+        :return: (number of pending frames that fit in the next NTB, whether the NTB is full)
+        '''
+        nth, ndp, dpe, _ = self._layout()
+        max_size = self.params.ntb_in_size
+        if nth is self.NTH16:
+            max_size = min(max_size, 0xffff)
+        max_datagrams = self.params.ntb_in_max_datagrams
+        crc_size = 4 if self.params.crc else 0
+        offset = nth.size
+        count = 0
+        for frame in self.pending:
+            end = self._datagram_offset(offset) + len(frame) + crc_size
+            ndp_size = max(ndp.size + dpe.size * (count + 2), ndp.size * 2)
+            if self._ndp_offset(end) + ndp_size > max_size:
+                return count, True
+            count += 1
+            offset = end
+            if count == max_datagrams:
+                return count, True
+        return count, False
+
+    def build(self, frames):
+        '''
+        :param frames: list of frames that fit in a single NTB (see _fit)
+        :return: the IN NTB with the frames
+        '''
+        nth, ndp, dpe, signature = self._layout()
+        offset = nth.size
+        parts = []
+        entries = []
+        for frame in frames:
+            start = self._datagram_offset(offset)
+            parts.append(b'\x00' * (start - offset))
+            parts.append(frame)
+            length = len(frame)
+            if self.params.crc:
+                parts.append(ethernet_crc(frame))
+                length += 4
+            entries.append(dpe.pack(start, length))
+            offset = start + length
+        entries.append(dpe.pack(0, 0))
+        ndp_index = self._ndp_offset(offset)
+        parts.append(b'\x00' * (ndp_index - offset))
+        ndp_length = max(ndp.size + dpe.size * len(entries), ndp.size * 2)
+        if ndp is self.NDP32:
+            parts.append(ndp.pack(signature, ndp_length, 0, 0, 0))
+        else:
+            parts.append(ndp.pack(signature, ndp_length, 0))
+        parts.extend(entries)
+        block_length = ndp_index + ndp_length
+        parts.append(b'\x00' * (block_length - ndp_index - ndp.size - dpe.size * len(entries)))
+        header = nth.pack(
+            self.NTH32_SIGNATURE if nth is self.NTH32 else self.NTH16_SIGNATURE,
+            nth.size, self.sequence, block_length, ndp_index
+        )
+        self.sequence = (self.sequence + 1) & 0xffff
+        return header + b''.join(parts)
+
+
+class RndisFraming(Framing):
+    '''
+    RNDIS - each transfer holds one or more REMOTE_NDIS_PACKET_MSG
+    '''
+
+    name = 'RNDIS'
+
+    PACKET_MSG = 0x00000001
+    # MessageType, MessageLength, DataOffset, DataLength, OOBDataOffset, OOBDataLength,
+    # NumOOBDataElements, PerPacketInfoOffset, PerPacketInfoLength, VcHandle, Reserved
+    PACKET_HEADER = struct.Struct('<IIIIIIIIIII')
+
+    def decode(self, transfer):
+        frames = []
+        offset = 0
+        while offset + 8 <= len(transfer):
+            msg_type, msg_length = struct.unpack_from('<II', transfer, offset)
+            if msg_type != self.PACKET_MSG or msg_length < self.PACKET_HEADER.size or offset + msg_length > len(transfer):
+                # a single padding byte may follow the last message
+                if len(transfer) - offset > 1:
+                    self.errors += 1
+                break
+            fields = self.PACKET_HEADER.unpack_from(transfer, offset)
+            # DataOffset is counted from the DataOffset field
+            start = offset + 8 + fields[2]
+            end = start + fields[3]
+            if end > offset + msg_length:
+                self.errors += 1
+            else:
+                frames.append(bytes(transfer[start:end]))
+            offset += msg_length
+        return frames
+
+    def encode(self, frames):
+        return [
+            self.PACKET_HEADER.pack(
+                self.PACKET_MSG, self.PACKET_HEADER.size + len(frame),
+                self.PACKET_HEADER.size - 8, len(frame), 0, 0, 0, 0, 0, 0, 0
+            ) + frame
+            for frame in frames
+        ]
+
+
+class PacketSink(object):
+    '''
+    In-process sink. Frames from the host are stored in ``received``,
+    frames queued with ``inject`` are sent to the host.
+    '''
+
+    def __init__(self, capacity=1024):
+        '''
+        :param capacity: maximum number of frames kept in each direction (default: 1024)
+        '''
+        self.received = deque(maxlen=capacity)
+        self.pending = deque(maxlen=capacity)
+
+    def inject(self, frame):
+        '''
+        :param frame: ethernet frame to send to the host
+        '''
+        self.pending.append(frame)
+
+    def write(self, frame):
+        self.received.append(frame)
+
+    def read(self, max_frames):
+        '''
+        :param max_frames: maximum number of frames to return
+        :return: list of frames for the host
+        '''
+        frames = []
+        while self.pending and len(frames) < max_frames:
+            frames.append(self.pending.popleft())
+        return frames
+
+    def close(self):
+        pass
+
+
+class TapSink(object):
+    '''
+    Bridge to a Linux TAP interface (requires CAP_NET_ADMIN).
+    The interface is opened non-blocking, so the phy service loop is never blocked.
+    '''
+
+    TUNSETIFF = 0x400454ca
+    IFF_TAP = 0x0002
+    IFF_NO_PI = 0x1000
+
+    def __init__(self, ifname, batch=32):
+        '''
+        :param ifname: name of the TAP interface, created if it does not exist
+        :param batch: maximum number of frames read at once (default: 32)
+        '''
+        import fcntl
+        self.ifname = ifname
+        self.fd = os.open('/dev/net/tun', os.O_RDWR | os.O_NONBLOCK)
+        fcntl.ioctl(self.fd, self.TUNSETIFF, struct.pack('16sH', ifname.encode(), self.IFF_TAP | self.IFF_NO_PI))
+        self.buffers = [bytearray(MAX_FRAME_SIZE) for _ in range(batch)]
+        self.dropped = 0
+
+    def write(self, frame):
+        if self.fd is None:
+            # closed with the device
+            self.dropped += 1
+            return
+        try:
+            os.write(self.fd, frame)
+        except (BlockingIOError, OSError):
+            self.dropped += 1
+
+    def read(self, max_frames):
+        '''
+        :param max_frames: maximum number of frames to return
+        :return: list of frames for the host,
+                 they are views of the read buffers and are only valid until the next read
+        '''
+        frames = []
+        if self.fd is None:
+            return frames
+        for buff in self.buffers[:max_frames]:
+            try:
+                length = os.readv(self.fd, [buff])
+            except (BlockingIOError, OSError):
+                break
+            frames.append(memoryview(buff)[:length])
+        return frames
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def get_sink(tap=None):
+    '''
+    :param tap: name of a TAP interface (default: None)
+    :return: TapSink if tap is given, PacketSink otherwise
+    '''
+    if tap:
+        return TapSink(tap)
+    return PacketSink()
+
+
+class NetStats(object):
+    '''
+    Packet and byte counters of the bridge, in both directions
+    '''
+
+    def __init__(self, interval=5.0):
+        '''
+        :param interval: seconds between reports (default: 5.0)
+        '''
+        self.interval = interval
+        self.counters = {'out': [0, 0], 'in': [0, 0]}
+        self.last = {'out': [0, 0], 'in': [0, 0]}
+        self.last_time = time.time()
+
+    def add(self, direction, frames, octets):
+        '''
+        :param direction: 'out' (host to device) or 'in' (device to host)
+        :param frames: number of frames
+        :param octets: number of bytes
+        '''
+        counter = self.counters[direction]
+        counter[0] += frames
+        counter[1] += octets
+
+    def poll(self):
+        '''
+        :return: report of the rates since the last report, None if the interval did not pass yet
+        '''
+        now = time.time()
+        elapsed = now - self.last_time
+        if elapsed < self.interval:
+            return None
+        parts = []
+        for direction in ('out', 'in'):
+            frames = self.counters[direction][0] - self.last[direction][0]
+            octets = self.counters[direction][1] - self.last[direction][1]
+            parts.append('%s: %.1f packets/s %.3f Mbit/s' % (direction, frames / elapsed, octets * 8 / elapsed / 1e6))
+            self.last[direction] = list(self.counters[direction])
+        self.last_time = now
+        return ', '.join(parts)
+
+
+class EthernetBridge(object):
+    '''
+    Moves frames between the bulk endpoints of a device and a sink
+    '''
+
+    def __init__(self, actor, framing, sink, ep_in, batch=16, stats_interval=5.0):
+        '''
+        :param actor: USB actor to send data and log with
+        :param framing: Framing instance of the device
+        :param sink: PacketSink or TapSink
+        :param ep_in: the bulk IN endpoint (USBEndpoint)
+        :param batch: maximum number of frames per IN interrupt (default: 16)
+        :param stats_interval: seconds between throughput reports (default: 5.0)
+        '''
+        self.actor = actor
+        self.framing = framing
+        self.sink = sink
+        self.ep_in = ep_in
+        # number as the device sends on it (a composite device remaps it in its phy)
+        self.ep_num = ep_in.number
+        self.batch = batch
+        self.stats = NetStats(stats_interval)
+
+    def update_max_packet_size(self):
+        '''
+        Follow the packet size of the connection speed,
+        64 bytes at full speed, 512 at high speed, 1024 at SuperSpeed
+        '''
+        max_packet_size = self.ep_in.get_max_packet_size()
+        if self.framing.max_packet_size != max_packet_size:
+            self.framing.max_packet_size = max_packet_size
+
+    def handle_data_available(self, data):
+        self.update_max_packet_size()
+        frames = self.framing.feed(data)
+        for frame in frames:
+            self.sink.write(frame)
+        if frames:
+            self.stats.add('out', len(frames), sum(len(f) for f in frames))
+        self._report()
+
+    def handle_buffer_available(self):
+        self.update_max_packet_size()
+        frames = self.sink.read(self.batch)
+        transfers = self.framing.encode(frames)
+        for transfer in transfers:
+            self.actor.send_on_endpoint(self.ep_num, transfer)
+            if self.framing.needs_zlp(transfer):
+                # terminate the transfer with a zero length packet
+                self.actor.send_on_endpoint(self.ep_num, b'')
+        if frames:
+            self.stats.add('in', len(frames), sum(len(f) for f in frames))
+        self._report()
+
+    def _report(self):
+        report = self.stats.poll()
+        if report is not None:
+            self.actor.info('%s bridge %s (%d framing errors)' % (self.framing.name, report, self.framing.errors))
+
+    def close(self):
+        self.sink.close()
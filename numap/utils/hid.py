@@ -0,0 +1,268 @@
+'''
+HID report descriptor parser (HID 1.11, 6.2.2).
+
+The descriptor is parsed once into a ReportLayout, which lists the
+input, output and feature reports and the bit position of every usage,
+so reports can be packed and unpacked without walking the descriptor again.
+
+Usages are (usage page << 16) | usage id, e.g. 0x00010030 for the X axis.
+Where unambiguous, the usage id alone can be used as well.
+'''
+import binascii
+
+# main item tags
+INPUT = 0x8
+OUTPUT = 0x9
+COLLECTION = 0xa
+FEATURE = 0xb
+END_COLLECTION = 0xc
+
+# global item tags
+USAGE_PAGE = 0x0
+LOGICAL_MINIMUM = 0x1
+LOGICAL_MAXIMUM = 0x2
+REPORT_SIZE = 0x7
+REPORT_ID = 0x8
+REPORT_COUNT = 0x9
+PUSH = 0xa
+POP = 0xb
+
+# local item tags
+USAGE = 0x0
+USAGE_MINIMUM = 0x1
+USAGE_MAXIMUM = 0x2
+
+# main item data bits
+CONSTANT = 0x01
+VARIABLE = 0x02
+
+REPORT_KINDS = {INPUT: 'input', OUTPUT: 'output', FEATURE: 'feature'}
+
+
+def load_report_descriptor(value):
+    '''
+    :param value: report descriptor as bytes, hex string or path of a binary file
+    :return: report descriptor (bytes)
+    '''
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    try:
+        return binascii.unhexlify(value.replace(' ', ''))
+    except (binascii.Error, ValueError):
+        with open(value, 'rb') as f:
+            return f.read()
+
+
+def iter_items(descriptor):
+    '''
+    :param descriptor: report descriptor
+    :return: generator of (type, tag, unsigned value, signed value)
+    '''
+    index = 0
+    length = len(descriptor)
+    while index < length:
+        prefix = descriptor[index]
+        if prefix == 0xfe:
+            # long item, no defined tags use it
+            if index + 1 >= length:
+                raise Exception('Truncated long item in report descriptor')
+            index += 3 + descriptor[index + 1]
+            continue
+        size = (0, 1, 2, 4)[prefix & 3]
+        if index + 1 + size > length:
+            raise Exception('Truncated item 0x%02x at offset %d in report descriptor' % (prefix, index))
+        data = descriptor[index + 1:index + 1 + size]
+        value = int.from_bytes(data, 'little')
+        signed = int.from_bytes(data, 'little', signed=True)
+        yield (prefix >> 2) & 3, prefix >> 4, value, signed
+        index += 1 + size
+
+
+class ReportFormat(object):
+    '''
+    Layout of a single report
+    '''
+
+    def __init__(self, kind, report_id):
+        '''
+        :param kind: 'input', 'output' or 'feature'
+        :param report_id: report id, 0 if the descriptor does not use report ids
+        '''
+        self.kind = kind
+        self.report_id = report_id
+        self.bits = 0
+        # usage: (bit offset, size, signed)
+        self.variables = {}
+        self.usages = []
+        # (bit offset, size, count, usage minimum, logical minimum)
+        self.arrays = []
+
+    @property
+    def length(self):
+        '''
+        Report length in bytes, including the report id
+        '''
+        return (self.bits + 7) // 8 + (1 if self.report_id else 0)
+
+    def add_field(self, flags, size, count, usages, usage_range, logical_minimum):
+        offset = self.bits
+        self.bits += size * count
+        if flags & CONSTANT:
+            return
+        if flags & VARIABLE:
+            if usage_range:
+                usages = usages + list(range(usage_range[0], usage_range[1] + 1))
+            if not usages:
+                return
+            for i in range(count):
+                # the last usage applies to the remaining fields
+                usage = usages[min(i, len(usages) - 1)]
+                self.variables.setdefault(usage, (offset + i * size, size, logical_minimum < 0))
+        else:
+            minimum = usage_range[0] if usage_range else (usages[0] if usages else 0)
+            self.arrays.append((offset, size, count, minimum, logical_minimum))
+
+    def finalize(self):
+        self.usages = list(self.variables)
+        # allow the short usage ids, unless two pages use the same id
+        short = {}
+        for usage, field in self.variables.items():
+            short.setdefault(usage & 0xffff, []).append(field)
+        for usage_id, fields in short.items():
+            if len(fields) == 1 and usage_id not in self.variables:
+                self.variables[usage_id] = fields[0]
+
+    def pack(self, values=None, pressed=()):
+        '''
+        :param values: dictionary of usage: value for the variable fields (default: None)
+        :param pressed: usages to report in the array fields (default: ())
+        :return: report data, starting with the report id if there is one
+        '''
+        report = 0
+        variables = self.variables
+        for usage, value in (values or {}).items():
+            offset, size, _ = variables[usage]
+            report |= (value & ((1 << size) - 1)) << offset
+        if pressed:
+            pressed = list(pressed)
+            for offset, size, count, minimum, logical_minimum in self.arrays:
+                for i, usage in enumerate(pressed[:count]):
+                    index = (usage & 0xffff) - (minimum & 0xffff) + logical_minimum
+                    report |= (index & ((1 << size) - 1)) << (offset + i * size)
+                pressed = pressed[count:]
+        data = report.to_bytes((self.bits + 7) // 8, 'little')
+        if self.report_id:
+            return bytes((self.report_id,)) + data
+        return data
+
+    def unpack(self, data):
+        '''
+        :param data: report data, starting with the report id if there is one
+        :return: (dictionary of usage: value, list of usages in the array fields)
+        '''
+        if self.report_id:
+            data = data[1:]
+        report = int.from_bytes(data, 'little')
+        values = {}
+        for usage in self.usages:
+            offset, size, signed = self.variables[usage]
+            value = (report >> offset) & ((1 << size) - 1)
+            if signed and value >> (size - 1):
+                value -= 1 << size
+            values[usage] = value
+        pressed = []
+        for offset, size, count, minimum, logical_minimum in self.arrays:
+            for i in range(count):
+                index = (report >> (offset + i * size)) & ((1 << size) - 1)
+                if index:
+                    pressed.append(minimum + index - logical_minimum)
+        return values, pressed
+
+
+class ReportLayout(object):
+    '''
+    All reports of a report descriptor
+    '''
+
+    def __init__(self, descriptor):
+        '''
+        :param descriptor: report descriptor
+        '''
+        self.descriptor = bytes(descriptor)
+        # (kind, report id): ReportFormat
+        self.reports = {}
+        self.parse()
+
+    def parse(self):
+        state = {USAGE_PAGE: 0, LOGICAL_MINIMUM: 0, REPORT_SIZE: 0, REPORT_ID: 0, REPORT_COUNT: 0}
+        stack = []
+        usages = []
+        usage_minimum = None
+        usage_range = None
+        depth = 0
+        for item_type, tag, value, signed in iter_items(self.descriptor):
+            if item_type == 0:
+                if tag in REPORT_KINDS:
+                    report = self.get_report(REPORT_KINDS[tag], state[REPORT_ID], create=True)
+                    report.add_field(
+                        value, state[REPORT_SIZE], state[REPORT_COUNT],
+                        usages, usage_range, state[LOGICAL_MINIMUM]
+                    )
+                elif tag == COLLECTION:
+                    depth += 1
+                elif tag == END_COLLECTION:
+                    depth -= 1
+                usages = []
+                usage_minimum = usage_range = None
+            elif item_type == 1:
+                if tag == PUSH:
+                    stack.append(dict(state))
+                elif tag == POP:
+                    if not stack:
+                        raise Exception('Pop without push in report descriptor')
+                    state = stack.pop()
+                elif tag == LOGICAL_MINIMUM:
+                    state[tag] = signed
+                else:
+                    state[tag] = value
+            elif item_type == 2:
+                page = state[USAGE_PAGE] << 16
+                if tag == USAGE:
+                    usages.append(value if value > 0xffff else page | value)
+                elif tag == USAGE_MINIMUM:
+                    usage_minimum = value if value > 0xffff else page | value
+                elif tag == USAGE_MAXIMUM and usage_minimum is not None:
+                    usage_range = (usage_minimum, value if value > 0xffff else page | value)
+        if depth:
+            raise Exception('Unbalanced collections in report descriptor')
+        for report in self.reports.values():
+            report.finalize()
+
+    def get_report(self, kind, report_id=0, create=False):
+        '''
+        :param kind: 'input', 'output' or 'feature'
+        :param report_id: report id (default: 0)
+        :return: ReportFormat, None if there is no such report
+        '''
+        key = (kind, report_id)
+        if create and key not in self.reports:
+            self.reports[key] = ReportFormat(kind, report_id)
+        return self.reports.get(key)
+
+    def get_reports(self, kind):
+        '''
+        :param kind: 'input', 'output' or 'feature'
+        :return: list of ReportFormat
+        '''
+        return [r for (k, _), r in sorted(self.reports.items()) if k == kind]
+
+    @property
+    def numbered(self):
+        '''
+        True if the reports start with a report id
+        '''
+        return any(report_id for _, report_id in self.reports)
+
+    @property
+    def max_input_length(self):
+        return max([r.length for r in self.get_reports('input')] or [0])
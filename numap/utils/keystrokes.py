@@ -0,0 +1,256 @@
+'''
+Keystroke scheduling for the emulated keyboard.
+
+Text and scripts are translated to 8 byte boot keyboard reports
+(modifiers, reserved, 6 key codes) for a keyboard layout.
+A key is only released explicitly when the next report presses it again,
+or before a delay, so text is typed with about one report per character.
+
+Scripts have one command per line:
+
+    REM comment
+    STRING text to type
+    STRINGLN text to type, followed by enter
+    DELAY 500
+    DEFAULTDELAY 100 (delay after each of the following commands)
+    GUI r
+    CTRL ALT DELETE
+    ENTER
+'''
+import time
+import struct
+from collections import deque
+
+# modifier bits (HID 1.11, 8.3)
+LEFT_CTRL = 0x01
+LEFT_SHIFT = 0x02
+LEFT_ALT = 0x04
+LEFT_GUI = 0x08
+RIGHT_ALT = 0x40
+
+KEY_ENTER = 0x28
+KEY_RELEASE = b'\x00' * 8
+
+MODIFIER_NAMES = {
+    'CTRL': LEFT_CTRL,
+    'CONTROL': LEFT_CTRL,
+    'SHIFT': LEFT_SHIFT,
+    'ALT': LEFT_ALT,
+    'ALTGR': RIGHT_ALT,
+    'GUI': LEFT_GUI,
+    'WINDOWS': LEFT_GUI,
+    'COMMAND': LEFT_GUI,
+}
+
+KEY_NAMES = {
+    'ENTER': KEY_ENTER,
+    'ESC': 0x29,
+    'ESCAPE': 0x29,
+    'BACKSPACE': 0x2a,
+    'TAB': 0x2b,
+    'SPACE': 0x2c,
+    'CAPSLOCK': 0x39,
+    'PRINTSCREEN': 0x46,
+    'SCROLLLOCK': 0x47,
+    'PAUSE': 0x48,
+    'BREAK': 0x48,
+    'INSERT': 0x49,
+    'HOME': 0x4a,
+    'PAGEUP': 0x4b,
+    'DELETE': 0x4c,
+    'END': 0x4d,
+    'PAGEDOWN': 0x4e,
+    'RIGHT': 0x4f,
+    'RIGHTARROW': 0x4f,
+    'LEFT': 0x50,
+    'LEFTARROW': 0x50,
+    'DOWN': 0x51,
+    'DOWNARROW': 0x51,
+    'UP': 0x52,
+    'UPARROW': 0x52,
+    'NUMLOCK': 0x53,
+    'MENU': 0x65,
+    'APP': 0x65,
+}
+KEY_NAMES.update({'F%d' % (i + 1): 0x3a + i for i in range(12)})
+
+
+def _us_layout():
+    layout = {}
+    for i in range(26):
+        layout[chr(ord('a') + i)] = (0, 0x04 + i)
+        layout[chr(ord('A') + i)] = (LEFT_SHIFT, 0x04 + i)
+    for i, (plain, shifted) in enumerate(zip('1234567890', '!@#$%^&*()')):
+        layout[plain] = (0, 0x1e + i)
+        layout[shifted] = (LEFT_SHIFT, 0x1e + i)
+    for code, plain, shifted in [
+            (0x2d, '-', '_'), (0x2e, '=', '+'), (0x2f, '[', '{'), (0x30, ']', '}'),
+            (0x31, '\\', '|'), (0x33, ';', ':'), (0x34, '\'', '"'), (0x35, '`', '~'),
+            (0x36, ',', '<'), (0x37, '.', '>'), (0x38, '/', '?')]:
+        layout[plain] = (0, code)
+        layout[shifted] = (LEFT_SHIFT, code)
+    layout.update({'\n': (0, KEY_ENTER), '\t': (0, 0x2b), ' ': (0, 0x2c), '\b': (0, 0x2a)})
+    return layout
+
+
+def _de_layout():
+    layout = _us_layout()
+    for c in '-_=+[{]}\\|;:\'"`~<>/?@#^&*()':
+        del layout[c]
+    layout.update({
+        'y': (0, 0x1d), 'Y': (LEFT_SHIFT, 0x1d), 'z': (0, 0x1c), 'Z': (LEFT_SHIFT, 0x1c),
+        '"': (LEFT_SHIFT, 0x1f), '§': (LEFT_SHIFT, 0x20), '&': (LEFT_SHIFT, 0x23),
+        '/': (LEFT_SHIFT, 0x24), '(': (LEFT_SHIFT, 0x25), ')': (LEFT_SHIFT, 0x26), '=': (LEFT_SHIFT, 0x27),
+        'ß': (0, 0x2d), '?': (LEFT_SHIFT, 0x2d), '´': (0, 0x2e), '`': (LEFT_SHIFT, 0x2e),
+        'ü': (0, 0x2f), 'Ü': (LEFT_SHIFT, 0x2f), '+': (0, 0x30), '*': (LEFT_SHIFT, 0x30),
+        '#': (0, 0x32), '\'': (LEFT_SHIFT, 0x32), 'ö': (0, 0x33), 'Ö': (LEFT_SHIFT, 0x33),
+        'ä': (0, 0x34), 'Ä': (LEFT_SHIFT, 0x34), '^': (0, 0x35), '°': (LEFT_SHIFT, 0x35),
+        ';': (LEFT_SHIFT, 0x36), ':': (LEFT_SHIFT, 0x37), '-': (0, 0x38), '_': (LEFT_SHIFT, 0x38),
+        '<': (0, 0x64), '>': (LEFT_SHIFT, 0x64), '|': (RIGHT_ALT, 0x64),
+        '@': (RIGHT_ALT, 0x14), '€': (RIGHT_ALT, 0x08), '{': (RIGHT_ALT, 0x24), '[': (RIGHT_ALT, 0x25),
+        ']': (RIGHT_ALT, 0x26), '}': (RIGHT_ALT, 0x27), '\\': (RIGHT_ALT, 0x2d), '~': (RIGHT_ALT, 0x30),
+    })
+    return layout
+
+
+LAYOUTS = {
+    'us': _us_layout(),
+    'de': _de_layout(),
+}
+
+
+def build_report(modifiers=0, keys=()):
+    '''
+    :param modifiers: modifier bits
+    :param keys: up to 6 key codes
+    :return: 8 byte boot keyboard report
+    '''
+    keys = (tuple(keys) + (0,) * 6)[:6]
+    return struct.pack('BB6B', modifiers, 0, *keys)
+
+
+class KeystrokeScheduler(object):
+    '''
+    Queue of keyboard reports and delays
+    '''
+
+    def __init__(self, layout='us'):
+        '''
+        :param layout: keyboard layout, one of LAYOUTS (default: 'us')
+        '''
+        if layout not in LAYOUTS:
+            raise Exception('Unknown keyboard layout %s, available layouts: %s' % (layout, ', '.join(sorted(LAYOUTS))))
+        self.layout = LAYOUTS[layout]
+        # each event is a report (bytes) or a delay in seconds (float)
+        self.events = deque()
+        self.resume_time = 0
+        self.pressed = None
+        # seconds to wait after each script command (DEFAULTDELAY)
+        self.default_delay = 0
+
+    def __len__(self):
+        return len(self.events)
+
+    def press(self, modifiers=0, keys=()):
+        '''
+        Queue a key press, releasing the previous keys first if needed
+
+        :param modifiers: modifier bits
+        :param keys: key codes to press
+        '''
+        report = build_report(modifiers, keys)
+        if self.pressed is not None and (self.pressed == report or set(keys) & set(self.pressed[2:]) - {0}):
+            # the host only sees a new key press after the key was released
+            self.events.append(KEY_RELEASE)
+        self.events.append(report)
+        self.pressed = report
+
+    def release(self):
+        if self.pressed is not None:
+            self.events.append(KEY_RELEASE)
+            self.pressed = None
+
+    def delay(self, seconds):
+        '''
+        :param seconds: time to wait before the next report
+        '''
+        self.release()
+        self.events.append(float(seconds))
+
+    def type_text(self, text):
+        '''
+        :param text: text to type, characters that are not in the layout are skipped
+        '''
+        for c in text:
+            key = self.layout.get(c)
+            if key is not None:
+                self.press(key[0], (key[1],))
+        self.release()
+
+    def run_script(self, lines):
+        '''
+        :param lines: script lines (see module doc)
+        '''
+        for line in lines:
+            line = line.rstrip('\r\n')
+            command, _, arg = line.strip().partition(' ')
+            command = command.upper()
+            if not command or command == 'REM':
+                continue
+            if command in ('STRING', 'STRINGLN'):
+                text = line.lstrip()[len(command) + 1:]
+                self.type_text(text + '\n' if command == 'STRINGLN' else text)
+            elif command in ('DEFAULTDELAY', 'DEFAULT_DELAY'):
+                self.default_delay = int(arg) / 1000.0
+                continue
+            elif command == 'DELAY':
+                self.delay(int(arg) / 1000.0)
+            else:
+                self.press_combo(line.split())
+            if self.default_delay:
+                self.delay(self.default_delay)
+
+    def press_combo(self, names):
+        '''
+        :param names: key names, e.g. ['CTRL', 'ALT', 'DELETE'] or ['GUI', 'r']
+        '''
+        modifiers = 0
+        keys = []
+        for name in names:
+            upper = name.upper()
+            if upper in MODIFIER_NAMES:
+                modifiers |= MODIFIER_NAMES[upper]
+            elif upper in KEY_NAMES:
+                keys.append(KEY_NAMES[upper])
+            elif name in self.layout:
+                key_mod, key = self.layout[name]
+                modifiers |= key_mod
+                keys.append(key)
+            else:
+                raise Exception('Unknown key in script: %s' % name)
+        self.press(modifiers, keys[:6])
+        self.release()
+
+    def load_script(self, filename):
+        '''
+        :param filename: script file (see module doc)
+        '''
+        with open(filename, 'r') as f:
+            self.run_script(f)
+
+    def next_report(self, now=None):
+        '''
+        :param now: current time (default: None, time.time())
+        :return: next report to send, None if there is none or a delay is in progress
+        '''
+        if now is None:
+            now = time.time()
+        if now < self.resume_time:
+            return None
+        while self.events:
+            event = self.events.popleft()
+            if isinstance(event, float):
+                self.resume_time = now + event
+                return None
+            return event
+        return None
@@ -0,0 +1,242 @@
+'''
+AT command engine for the emulated modems (CDC ACM and DL).
+
+The engine answers complete command lines (see numap.dev.cdc.LineBuffer)
+and queues the responses, which the device sends on its bulk IN endpoint.
+The responses can be extended with a json script:
+
+    {
+        "echo": true,
+        "responses": {"AT+CSQ": "+CSQ: 31,99"},
+        "rules": [["AT\\+CGDCONT=(\\d+),.*", "OK"]],
+        "unsolicited": [[10, "+CREG: 1"]]
+    }
+
+``responses`` are matched against the whole (upper case) command,
+``rules`` are regular expressions, their response may use group references (\\1).
+``unsolicited`` result codes are sent every <interval> seconds.
+'''
+import re
+import json
+import time
+from collections import deque
+
+FINAL_RESULT_CODES = (
+    'OK', 'ERROR', 'CONNECT', 'RING', 'NO CARRIER', 'NO DIALTONE', 'BUSY', 'NO ANSWER'
+)
+
+# numeric result codes (V.250, 5.7.1 and the common extensions)
+NUMERIC_RESULT_CODES = {
+    'OK': '0', 'CONNECT': '1', 'RING': '2', 'NO CARRIER': '3', 'ERROR': '4',
+    'NO DIALTONE': '6', 'BUSY': '7', 'NO ANSWER': '8',
+}
+
+DEFAULT_RESPONSES = {
+    'AT': '',
+    'ATZ': '',
+    'AT&F': '',
+    'ATI': 'numap modem',
+    'AT+GMI': 'numap',
+    'AT+GMM': 'numap modem',
+    'AT+GMR': '1.0',
+    'AT+GCAP': '+GCAP: +CGSM,+DS',
+    'AT+CGMI': 'numap',
+    'AT+CGMM': 'numap modem',
+    'AT+CGMR': '1.0',
+    'AT+CGSN': '490154203237518',
+    'AT+CIMI': '001010123456789',
+    'AT+CPIN?': '+CPIN: READY',
+    'AT+CSQ': '+CSQ: 20,99',
+    'AT+CFUN?': '+CFUN: 1',
+    'AT+CREG?': '+CREG: 0,1',
+    'AT+CGREG?': '+CGREG: 0,1',
+    'AT+CEREG?': '+CEREG: 0,1',
+    'AT+COPS?': '+COPS: 0,0,"numap",7',
+    'AT+CGATT?': '+CGATT: 1',
+    'AT+CMEE?': '+CMEE: 1',
+    'AT+CSCS?': '+CSCS: "IRA"',
+    'ATD': 'NO CARRIER',
+    'ATH': '',
+}
+
+DEFAULT_RULES = [
+    # settings are accepted and ignored
+    (r'AT[+&]\w+=.*', ''),
+    # test commands list no parameters
+    (r'AT\+\w+=\?', ''),
+    (r'ATS\d+=\d+', ''),
+    (r'ATS\d+\?', '000'),
+    (r'ATD.*', 'NO CARRIER'),
+    (r'AT[LMQVX&][0-9]?', ''),
+    (r'AT&[A-Z]\d*', ''),
+]
+
+# a command of a command line (V.250, 5.2.1): dial takes the rest of the line,
+# an extended command ends at ';' or at the end of the line (5.4.1)
+COMMAND = re.compile(
+    r'(?P<dial>D.*)'
+    r'|(?P<register>S *\d+ *(?:= *\d*|\?)?)'
+    r'|(?P<basic>&? *[A-Z] *\d*)'
+    r'|(?P<extended>[+^$%*#][A-Z0-9][^;"]*(?:"[^"]*"[^;"]*)*)'
+)
+SEPARATORS = re.compile(r'[ ;]*')
+
+
+def split_commands(line):
+    '''
+    :param line: command line (upper case), without the AT prefix
+    :return: list of the commands of the line with the AT prefix, None if the line is invalid
+    '''
+    commands = []
+    pos = SEPARATORS.match(line).end()
+    while pos < len(line):
+        match = COMMAND.match(line, pos)
+        if match is None:
+            return None
+        if match.lastgroup == 'extended':
+            commands.append('AT' + match.group().strip())
+        else:
+            commands.append('AT' + match.group().replace(' ', ''))
+        pos = SEPARATORS.match(line, match.end()).end()
+    return commands or ['AT']
+
+
+class ATResponder(object):
+    '''
+    Answers AT commands with a response table and regex rules
+    '''
+
+    def __init__(self, responses=None, rules=None, unsolicited=None, echo=True, max_pending=16384):
+        '''
+        :param responses: dictionary of command: response, added to the defaults (default: None)
+        :param rules: list of (regex, response), checked before the defaults (default: None)
+        :param unsolicited: list of (interval, result code) (default: None)
+        :param echo: initial echo state (ATE1/ATE0) (default: True)
+        :param max_pending: maximum number of queued bytes, older data is dropped (default: 16384)
+        '''
+        self.responses = dict(DEFAULT_RESPONSES)
+        self.responses.update({k.upper(): v for k, v in (responses or {}).items()})
+        self.rules = [(re.compile(r, re.IGNORECASE), v) for r, v in (rules or []) + DEFAULT_RULES]
+        now = time.time()
+        self.unsolicited = [[interval, code, now + interval] for interval, code in (unsolicited or [])]
+        self.echo = echo
+        self.verbose = True
+        self.pending = deque()
+        self.pending_size = 0
+        self.max_pending = max_pending
+        self.dropped = 0
+
+    @classmethod
+    def from_script(cls, filename):
+        '''
+        :param filename: json script (see module doc), or None for the defaults
+        :return: ATResponder instance
+        '''
+        if not filename:
+            return cls()
+        with open(filename, 'r') as f:
+            script = json.load(f)
+        return cls(
+            responses=script.get('responses'),
+            rules=[tuple(rule) for rule in script.get('rules', [])],
+            unsolicited=[tuple(urc) for urc in script.get('unsolicited', [])],
+            echo=script.get('echo', True),
+        )
+
+    def handle_line(self, line):
+        '''
+        :param line: command line received from the host (without the terminator)
+        '''
+        line = line.strip(b'\r\n\x00 ')
+        if not line:
+            return
+        if self.echo:
+            self.queue(line + b'\r')
+        command = line.decode('ascii', 'replace').upper()
+        if not command.startswith('AT'):
+            return
+        # basic and & commands may follow each other, e.g. AT&FE0V1,
+        # followed by extended commands separated with ';', e.g. ATE0+CMEE=1;+CREG?
+        commands = split_commands(command[2:])
+        if commands is None:
+            self.send_response([], 'ERROR')
+            return
+        info = []
+        result = 'OK'
+        for cmd in commands:
+            response = self.get_response(cmd)
+            if response in FINAL_RESULT_CODES:
+                result = response
+            elif response:
+                info.append(response)
+            if result != 'OK':
+                break
+        self.send_response(info, result)
+
+    def get_response(self, command):
+        '''
+        :param command: a single AT command (upper case)
+        :return: response text, result code only if it is one of FINAL_RESULT_CODES
+        '''
+        if command in ('ATE0', 'ATE1', 'ATE'):
+            self.echo = command == 'ATE1'
+            return ''
+        if command in ('ATV0', 'ATV1', 'ATV'):
+            self.verbose = command == 'ATV1'
+            return ''
+        if command in self.responses:
+            return self.responses[command]
+        for regex, response in self.rules:
+            match = regex.fullmatch(command)
+            if match:
+                return match.expand(response)
+        return 'ERROR'
+
+    def send_response(self, info, result):
+        '''
+        :param info: list of information responses
+        :param result: final result code
+        '''
+        if not self.verbose:
+            result = NUMERIC_RESULT_CODES.get(result, '4')
+            self.queue(''.join('%s\r\n' % i for i in info).encode() + result.encode() + b'\r')
+            return
+        self.queue((''.join('\r\n%s\r\n' % i for i in info) + '\r\n%s\r\n' % result).encode())
+
+    def send_unsolicited(self, code):
+        '''
+        :param code: unsolicited result code (e.g. RING)
+        '''
+        self.queue(('\r\n%s\r\n' % code).encode())
+
+    def queue(self, data):
+        self.pending.append(data)
+        self.pending_size += len(data)
+        while self.pending_size > self.max_pending:
+            self.pending_size -= len(self.pending.popleft())
+            self.dropped += 1
+
+    def read(self, max_size):
+        '''
+        Get the queued output, including the unsolicited result codes that are due
+
+        :param max_size: maximum number of bytes to return
+        :return: queued data, up to max_size bytes
+        '''
+        if self.unsolicited:
+            now = time.time()
+            for urc in self.unsolicited:
+                if now >= urc[2]:
+                    urc[2] = now + urc[0]
+                    self.send_unsolicited(urc[1])
+        chunks = []
+        size = 0
+        while self.pending and size < max_size:
+            chunk = self.pending.popleft()
+            if size + len(chunk) > max_size:
+                self.pending.appendleft(chunk[max_size - size:])
+                chunk = chunk[:max_size - size]
+            chunks.append(chunk)
+            size += len(chunk)
+        self.pending_size -= size
+        return b''.join(chunks)
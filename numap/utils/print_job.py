@@ -0,0 +1,108 @@
+'''
+Stream print jobs from the emulated printer to files.
+
+A PJL job ends with the universal exit language command (UEL) that follows
+``@PJL EOJ``. The markers are searched in the data as it arrives, including
+markers that are split between packets, and each job is written to its own
+buffered file: <prefix>-<job number>.pcl
+'''
+import time
+
+PJL_EOJ = b'@PJL EOJ'
+PJL_UEL = b'\x1b%-12345X'
+
+
+class PrintJobSink(object):
+    '''
+    Splits the printer data into job files
+    '''
+
+    # bytes that are kept to find markers split between packets
+    TAIL = max(len(PJL_EOJ), len(PJL_UEL)) - 1
+
+    def __init__(self, actor, prefix=None, buffer_size=0x10000, stats_interval=5.0):
+        '''
+        :param actor: USB actor to log with
+        :param prefix: prefix of the job files (default: None, the current time)
+        :param buffer_size: write buffer size of the job files (default: 0x10000)
+        :param stats_interval: seconds between throughput reports (default: 5.0)
+        '''
+        self.actor = actor
+        self.prefix = prefix or time.strftime('%Y%m%d%H%M%S', time.localtime())
+        self.buffer_size = buffer_size
+        self.stats_interval = stats_interval
+        self.jobs = 0
+        self.file = None
+        self.filename = None
+        self.job_size = 0
+        self.tail = b''
+        self.eoj = False
+        self.received = 0
+        self.last_received = 0
+        self.last_time = time.time()
+
+    def write(self, data):
+        '''
+        :param data: data received from the host
+        '''
+        self.received += len(data)
+        while data:
+            if self.file is None:
+                self.open_job()
+            end = self.find_job_end(data)
+            if end is None:
+                self.file.write(data)
+                self.job_size += len(data)
+                break
+            self.file.write(data[:end])
+            self.job_size += end
+            self.close_job()
+            data = data[end:]
+        self._report()
+
+    def find_job_end(self, data):
+        '''
+        :param data: data received from the host
+        :return: offset in data right after the end of the job, None if the job does not end in data
+        '''
+        base = len(self.tail)
+        window = self.tail + bytes(data)
+        start = 0
+        while True:
+            marker = PJL_UEL if self.eoj else PJL_EOJ
+            index = window.find(marker, start)
+            if index < 0:
+                self.tail = window[max(start, len(window) - self.TAIL):]
+                return None
+            start = index + len(marker)
+            if self.eoj:
+                self.eoj = False
+                self.tail = b''
+                return start - base
+            self.eoj = True
+
+    def open_job(self):
+        self.jobs += 1
+        self.filename = '%s-%d.pcl' % (self.prefix, self.jobs)
+        self.file = open(self.filename, 'wb', buffering=self.buffer_size)
+        self.job_size = 0
+        self.actor.info('Writing print job: %s' % self.filename)
+
+    def close_job(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        self.actor.info('Print job complete: %s (%d bytes)' % (self.filename, self.job_size))
+
+    def close(self):
+        self.close_job()
+
+    def _report(self):
+        now = time.time()
+        elapsed = now - self.last_time
+        if elapsed < self.stats_interval:
+            return
+        self.actor.info('Printer: %.1f kB/s' % ((self.received - self.last_received) / elapsed / 1000))
+        self.last_received = self.received
+        self.last_time = now
@@ -0,0 +1,82 @@
+'''
+Connect an emulated serial device to a local pseudo terminal.
+
+The device side uses the non-blocking master end, so the phy service loop
+is never blocked: data that the terminal does not accept is left to the
+caller, which holds the endpoint until the terminal is writable.
+Programs (screen, minicom, pppd, ...) use the slave end, which is
+optionally linked to a fixed path.
+'''
+import os
+import tty
+
+
+class PtyBridge(object):
+    '''
+    Non-blocking pseudo terminal
+    '''
+
+    def __init__(self, link=None):
+        '''
+        :param link: path of a symlink to the slave end (default: None)
+        '''
+        self.master, self.slave = os.openpty()
+        # raw mode, so binary data passes as is
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.name = os.ttyname(self.slave)
+        self.link = link
+        if link:
+            if os.path.islink(link):
+                os.unlink(link)
+            os.symlink(self.name, link)
+
+    def read(self, max_size):
+        '''
+        :param max_size: maximum number of bytes to read
+        :return: data written to the terminal, b'' if there is none
+        '''
+        if max_size <= 0:
+            return b''
+        try:
+            return os.read(self.master, max_size)
+        except (BlockingIOError, OSError):
+            # OSError (EIO) until the slave end is opened
+            return b''
+
+    def write(self, data):
+        '''
+        Write as much data as the terminal accepts
+
+        :param data: data to write
+        :return: number of bytes written, 0 while the terminal is full
+        '''
+        if not data:
+            return 0
+        try:
+            return os.write(self.master, data)
+        except BlockingIOError:
+            return 0
+
+    def set_speed(self, baudrate):
+        '''
+        Reflect the baud rate the host selected on the slave end (for stty and friends)
+
+        :param baudrate: baud rate
+        '''
+        import termios
+        # the FTDI divisors only approximate the standard rates
+        rates = [int(name[1:]) for name in dir(termios) if name[:1] == 'B' and name[1:].isdigit()]
+        nearest = min(rates, key=lambda rate: abs(rate - baudrate))
+        if abs(nearest - baudrate) > baudrate * 0.03:
+            return
+        speed = getattr(termios, 'B%d' % nearest)
+        attrs = termios.tcgetattr(self.slave)
+        attrs[4] = attrs[5] = speed
+        termios.tcsetattr(self.slave, termios.TCSANOW, attrs)
+
+    def close(self):
+        if self.link and os.path.islink(self.link):
+            os.unlink(self.link)
+        os.close(self.master)
+        os.close(self.slave)
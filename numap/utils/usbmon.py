@@ -0,0 +1,226 @@
+'''
+Linux usbmon pcap format (LINKTYPE_USB_LINUX_MMAPPED).
+
+Each captured packet is a 64 byte usbmon header followed by the payload.
+The header layout is taken from Documentation/usb/usbmon.txt in the
+Linux kernel tree (``struct usbmon_packet``).
+'''
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+
+PCAP_MAGIC = 0xa1b2c3d4
+PCAP_VERSION_MAJOR = 2
+PCAP_VERSION_MINOR = 4
+LINKTYPE_USB_LINUX = 189
+LINKTYPE_USB_LINUX_MMAPPED = 220
+
+pcap_header = struct.Struct('<IHHiIII')
+pcap_record_header = struct.Struct('<IIII')
+# id, type, xfer_type, epnum, devnum, busnum, flag_setup, flag_data,
+# ts_sec, ts_usec, status, length, len_cap, setup, interval, start_frame,
+# xfer_flags, ndesc
+usbmon_header = struct.Struct('<QcBBBHccqiiII8siiII')
+# LINKTYPE_USB_LINUX records only have the first 48 bytes of the header
+usbmon_short_header = struct.Struct('<QcBBBHccqiiII8s')
+
+UsbmonRecord = namedtuple('UsbmonRecord', [
+    'urb_id', 'event_type', 'xfer_type', 'epnum', 'devnum', 'busnum',
+    'ts', 'status', 'setup', 'data'
+])
+
+
+class EventType(object):
+    submission = b'S'
+    callback = b'C'
+    error = b'E'
+
+
+class XferType(object):
+    '''
+    usbmon transfer types, note that they differ from the USB spec values
+    '''
+    isochronous = 0
+    interrupt = 1
+    control = 2
+    bulk = 3
+
+    # maps USBEndpoint.transfer_type_* to usbmon transfer type
+    from_usb = {
+        0x00: control,
+        0x01: isochronous,
+        0x02: bulk,
+        0x03: interrupt,
+    }
+
+
+# status reported for a stalled endpoint (-EPIPE)
+STATUS_STALL = -32
+# status of the submission records (-EINPROGRESS)
+STATUS_IN_PROGRESS = -115
+
+
+def pack_record(urb_id, event_type, xfer_type, epnum, devnum, busnum, ts, status=0, setup=None, data=b'', length=None):
+    '''
+    Pack a single usbmon record (header + data)
+
+    :param urb_id: URB id, used to match submissions to callbacks
+    :param event_type: one of EventType.*
+    :param xfer_type: one of XferType.*
+    :param epnum: endpoint address (direction bit included)
+    :param devnum: device address
+    :param busnum: bus number
+    :param ts: timestamp (seconds since epoch, float)
+    :param status: URB status (default: 0)
+    :param setup: 8 byte setup packet, or None if not a setup record (default: None)
+    :param data: payload (default: b'')
+    :param length: length of the URB - the requested length of a submission,
+                   the actual length of a callback (default: None, the length of the payload)
+    :return: the usbmon header followed by the payload
+    '''
+    ts_sec = int(ts)
+    ts_usec = int((ts - ts_sec) * 1000000)
+    if setup is None:
+        flag_setup = b'-'
+        setup = b'\x00' * 8
+    else:
+        flag_setup = b'\x00'
+    flag_data = b'\x00' if data else (b'<' if epnum & 0x80 else b'>')
+    if length is None:
+        length = len(data)
+    header = usbmon_header.pack(
+        urb_id & 0xffffffffffffffff, event_type, xfer_type, epnum & 0xff,
+        devnum & 0xff, busnum & 0xffff, flag_setup, flag_data,
+        ts_sec, ts_usec, status, length, len(data), setup,
+        0, 0, 0, 0
+    )
+    return header + data
+
+
+class UsbmonPcapWriter(object):
+    '''
+    Write usbmon records to a pcap file from a background thread.
+
+    Records are queued in a bounded ring buffer, so a slow disk never blocks
+    the caller (usually the phy service loop). When the buffer is full the
+    oldest pending record is dropped and counted in ``dropped``.
+    '''
+
+    def __init__(self, filename, capacity=4096, snaplen=0xffff, busnum=1):
+        '''
+        :param filename: pcap file to write
+        :param capacity: maximum number of pending records (default: 4096)
+        :param snaplen: maximum payload bytes per record (default: 0xffff)
+        :param busnum: bus number reported in the records (default: 1)
+        '''
+        self.filename = filename
+        self.capacity = capacity
+        self.snaplen = snaplen
+        self.busnum = busnum
+        self.dropped = 0
+        self.written = 0
+        self._pending = deque(maxlen=capacity)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = None
+
+    def start(self):
+        self._fd = open(self.filename, 'wb')
+        self._fd.write(pcap_header.pack(
+            PCAP_MAGIC, PCAP_VERSION_MAJOR, PCAP_VERSION_MINOR,
+            0, 0, self.snaplen, LINKTYPE_USB_LINUX_MMAPPED
+        ))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._write_loop, name='usbmon-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        self._drain()
+        self._fd.close()
+        self._fd = None
+
+    def submit(self, urb_id, event_type, xfer_type, epnum, devnum, status=0, setup=None, data=b'', length=None):
+        '''
+        Queue a record. This is called from the service loop, so it only
+        timestamps the event and stores the raw fields, packing is done by
+        the writer thread.
+        '''
+        if len(self._pending) == self.capacity:
+            self.dropped += 1
+        self._pending.append((
+            urb_id, event_type, xfer_type, epnum, devnum,
+            time.time(), status, setup, bytes(data[:self.snaplen]), length
+        ))
+        self._wakeup.set()
+
+    def _drain(self):
+        pending = self._pending
+        write = self._fd.write
+        while pending:
+            urb_id, event_type, xfer_type, epnum, devnum, ts, status, setup, data, length = pending.popleft()
+            record = pack_record(urb_id, event_type, xfer_type, epnum, devnum, self.busnum, ts, status, setup, data, length)
+            ts_sec = int(ts)
+            write(pcap_record_header.pack(ts_sec, int((ts - ts_sec) * 1000000), len(record), len(record)))
+            write(record)
+            self.written += 1
+        self._fd.flush()
+
+    def _write_loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(0.5)
+            self._wakeup.clear()
+            self._drain()
+
+
+def read_pcap(filename):
+    '''
+    Read usbmon records from a pcap file
+
+    :param filename: pcap file (LINKTYPE_USB_LINUX or LINKTYPE_USB_LINUX_MMAPPED)
+    :return: generator of UsbmonRecord, setup is None for non-setup records
+    '''
+    with open(filename, 'rb') as fd:
+        raw = fd.read(pcap_header.size)
+        if len(raw) < pcap_header.size:
+            raise Exception('%s: not a pcap file' % filename)
+        magic = struct.unpack('<I', raw[:4])[0]
+        if magic == PCAP_MAGIC:
+            endian = '<'
+        elif magic == struct.unpack('>I', struct.pack('<I', PCAP_MAGIC))[0]:
+            endian = '>'
+        else:
+            raise Exception('%s: unsupported pcap magic %#x' % (filename, magic))
+        linktype = struct.unpack(endian + 'I', raw[20:24])[0]
+        if linktype == LINKTYPE_USB_LINUX_MMAPPED:
+            header = usbmon_header
+        elif linktype == LINKTYPE_USB_LINUX:
+            header = usbmon_short_header
+        else:
+            raise Exception('%s: unsupported link type %d' % (filename, linktype))
+        record_header = struct.Struct(endian + 'IIII')
+        while True:
+            raw = fd.read(record_header.size)
+            if len(raw) < record_header.size:
+                break
+            ts_sec, ts_usec, incl_len, _ = record_header.unpack(raw)
+            packet = fd.read(incl_len)
+            if len(packet) < header.size:
+                break
+            fields = header.unpack_from(packet)
+            (urb_id, event_type, xfer_type, epnum, devnum, busnum, flag_setup, _,
+             _, _, status, _, _, setup) = fields[:14]
+            yield UsbmonRecord(
+                urb_id, event_type, xfer_type, epnum, devnum, busnum,
+                ts_sec + ts_usec / 1000000.0, status,
+                setup if flag_setup == b'\x00' else None,
+                packet[header.size:]
+            )
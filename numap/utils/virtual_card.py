@@ -0,0 +1,244 @@
+'''
+Virtual smart cards for the emulated CCID reader.
+
+A card answers reset with its ATR and responds to command APDUs:
+
+ScriptedCard
+    APDU table from a json script, matched by prefix:
+
+        {
+            "atr": "3B6B00000031C064A9EC0100829000",
+            "apdus": [
+                ["00A4040007A0000000041010", "9000"],
+                ["00B2", "6A83"]
+            ],
+            "default": "6D00"
+        }
+
+ProcessCard
+    A local simulator process (exec:<command>): it prints the ATR as a hex
+    line on startup, then reads one hex APDU per line on stdin and prints
+    the hex response on stdout.
+
+Run this module to measure the APDUs/s of a card, including the CCID message
+framing of the reader:
+
+    python -m numap.utils.virtual_card [card] [count]
+'''
+import sys
+import json
+import time
+import shlex
+import struct
+import subprocess
+
+# Entropia Universe Gold card
+# Taken from http://ludovic.rousseau.free.fr/softwares/pcsc-tools/smartcard_list.txt
+DEFAULT_ATR = b'\x3B\x6B\x00\x00\x00\x31\xC0\x64\xA9\xEC\x01\x00\x82\x90\x00'
+
+SW_OK = b'\x90\x00'
+SW_FILE_NOT_FOUND = b'\x6a\x82'
+SW_INS_NOT_SUPPORTED = b'\x6d\x00'
+
+CCID_HEADER_SIZE = 10
+
+
+class ScriptedCard(object):
+    '''
+    Answers APDUs from a table of (prefix, response)
+    '''
+
+    def __init__(self, atr=DEFAULT_ATR, apdus=None, default=SW_FILE_NOT_FOUND):
+        '''
+        :param atr: answer to reset (default: DEFAULT_ATR)
+        :param apdus: list of (APDU prefix, response) (default: None)
+        :param default: response if no prefix matches (default: 6A82, file not found)
+        '''
+        self.atr = atr
+        self.apdus = list(apdus or [])
+        self.default = default
+        # exact matches are looked up directly
+        self.exact = {}
+        for prefix, response in reversed(self.apdus):
+            self.exact[prefix] = response
+
+    @classmethod
+    def from_script(cls, filename):
+        '''
+        :param filename: json script (see module doc)
+        :return: ScriptedCard instance
+        '''
+        with open(filename, 'r') as f:
+            script = json.load(f)
+        return cls(
+            atr=bytes.fromhex(script['atr']) if 'atr' in script else DEFAULT_ATR,
+            apdus=[(bytes.fromhex(prefix), bytes.fromhex(response)) for prefix, response in script.get('apdus', [])],
+            default=bytes.fromhex(script['default']) if 'default' in script else SW_FILE_NOT_FOUND,
+        )
+
+    def reset(self):
+        '''
+        :return: answer to reset
+        '''
+        return self.atr
+
+    def transmit(self, apdu):
+        '''
+        :param apdu: command APDU
+        :return: response APDU
+        '''
+        response = self.exact.get(apdu)
+        if response is not None:
+            return response
+        for prefix, response in self.apdus:
+            if apdu.startswith(prefix):
+                return response
+        return self.default
+
+    def close(self):
+        pass
+
+
+class ProcessCard(object):
+    '''
+    Forwards the APDUs to a simulator process (see module doc)
+    '''
+
+    def __init__(self, command):
+        '''
+        :param command: command line of the simulator
+        '''
+        self.process = subprocess.Popen(
+            shlex.split(command), stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0
+        )
+        self.atr = self._read_line()
+
+    def _read_line(self):
+        line = self.process.stdout.readline()
+        if not line:
+            raise Exception('Card simulator exited (%s)' % self.process.poll())
+        return bytes.fromhex(line.decode('ascii').strip())
+
+    def reset(self):
+        return self.atr
+
+    def transmit(self, apdu):
+        self.process.stdin.write(apdu.hex().encode('ascii') + b'\n')
+        return self._read_line()
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def get_card(spec=None):
+    '''
+    :param spec: None for the default card, exec:<command> for a simulator process or a json script
+    :return: virtual card
+    '''
+    if not spec:
+        return ScriptedCard()
+    if spec.startswith('exec:'):
+        return ProcessCard(spec[len('exec:'):])
+    return ScriptedCard.from_script(spec)
+
+
+class CcidMessageBuffer(object):
+    '''
+    Reassembles CCID messages that span multiple bulk packets
+    '''
+
+    def __init__(self, max_message_length):
+        '''
+        :param max_message_length: dwMaxCCIDMessageLength of the reader
+        '''
+        self.max_message_length = max_message_length
+        self.buffer = bytearray()
+        self.dropped = 0
+
+    def feed(self, data):
+        '''
+        :param data: bulk OUT packet
+        :return: list of complete CCID messages
+        '''
+        self.buffer += data
+        messages = []
+        offset = 0
+        while len(self.buffer) - offset >= CCID_HEADER_SIZE:
+            length = struct.unpack_from('<I', self.buffer, offset + 1)[0]
+            if length + CCID_HEADER_SIZE > self.max_message_length:
+                # out of sync or too long, start over with the next packet
+                self.dropped += 1
+                offset = len(self.buffer)
+                break
+            end = offset + CCID_HEADER_SIZE + length
+            if end > len(self.buffer):
+                break
+            messages.append(bytes(self.buffer[offset:end]))
+            offset = end
+        if offset:
+            del self.buffer[:offset]
+        return messages
+
+
+class ApduStats(object):
+    '''
+    APDU rate of the reader
+    '''
+
+    def __init__(self, interval=5.0):
+        '''
+        :param interval: seconds between reports (default: 5.0)
+        '''
+        self.interval = interval
+        self.apdus = 0
+        self.last_apdus = 0
+        self.last_time = time.time()
+
+    def add(self):
+        self.apdus += 1
+
+    def poll(self):
+        '''
+        :return: report since the last report, None if the interval did not pass yet
+        '''
+        now = time.time()
+        elapsed = now - self.last_time
+        if elapsed < self.interval or self.apdus == self.last_apdus:
+            return None
+        report = '%.1f APDUs/s' % ((self.apdus - self.last_apdus) / elapsed)
+        self.last_apdus = self.apdus
+        self.last_time = now
+        return report
+
+
+def benchmark(card, count=10000, apdu=b'\x00\xa4\x04\x00\x07\xa0\x00\x00\x00\x04\x10\x10\x00', packet_size=0x40):
+    '''
+    :param card: virtual card
+    :param count: number of APDUs (default: 10000)
+    :param apdu: APDU to send (default: SELECT of a payment application)
+    :param packet_size: bulk packet size (default: 0x40)
+    :return: APDUs per second
+    '''
+    message = struct.pack('<BIBBBH', 0x6f, len(apdu), 0, 0, 0, 0) + apdu
+    packets = [message[i:i + packet_size] for i in range(0, len(message), packet_size)]
+    messages = CcidMessageBuffer(0x10000)
+    start = time.time()
+    for _ in range(count):
+        for packet in packets:
+            for msg in messages.feed(packet):
+                card.transmit(msg[CCID_HEADER_SIZE:])
+    return count / (time.time() - start)
+
+
+def main():
+    card = get_card(sys.argv[1] if len(sys.argv) > 1 else None)
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    try:
+        print('%.1f APDUs/s' % benchmark(card, count))
+    finally:
+        card.close()
+
+
+if __name__ == '__main__':
+    main()
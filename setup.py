@@ -22,6 +22,9 @@ setup(
         'kittyfuzzer>=0.6.9',
         'facedancer'
     ],
+    extras_require={
+        'audio': ['numpy'],
+    },
     keywords='security,usb,fuzzing,kitty',
     entry_points={
         'console_scripts': [
@@ -30,10 +33,13 @@ setup(
             'numap-fuzz=numap.apps.fuzz:main',
             'numap-list=numap.apps.list_classes:main',
             'numap-kitty=numap.fuzz.fuzz_engine:main',
+            'numap-minimize=numap.fuzz.minimize:main',
             'numap-scan=numap.apps.scan:main',
             'numap-vsscan=numap.apps.vsscan:main',
             'numap-stages=numap.apps.makestages:main',
             'numap-strings=numap.apps.strings:main',
+            'numap-replay=numap.apps.replay:main',
+            'numap-mkdevice=numap.utils.dev_generator:main',
         ]
     },
     package_data={}
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+'''
+Measure the startup time of the console scripts in setup.py.
+
+Each entry point module is imported in a new interpreter, the median wall
+time of the runs is reported together with the optional backends that the
+import pulled in (they should only be loaded when a phy or device needs them).
+
+Usage:
+    bench_startup.py [--runs=N] [--script=NAME ...]
+
+Options:
+    --runs N            number of runs per script [default: 5]
+    --script NAME       only measure this console script (default: all)
+'''
+import os
+import re
+import sys
+import time
+import statistics
+import subprocess
+import docopt
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# imported only on demand, see numap.phy.registry
+OPTIONAL_MODULES = ('facedancer', 'usb', 'mtpdevice', 'kitty', 'numpy')
+
+PROBE = '''
+import sys
+import %s
+print(','.join(m for m in %r if m in sys.modules))
+'''
+
+
+def console_scripts():
+    '''
+    :return: list of (script name, module) from setup.py
+    '''
+    with open(os.path.join(ROOT, 'setup.py')) as f:
+        return re.findall(r"'([\w-]+)=([\w.]+):\w+'", f.read())
+
+
+def measure(module, runs):
+    '''
+    :return: tuple (list of run times in seconds, loaded optional modules or the error)
+    '''
+    times = []
+    loaded = ''
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-c', PROBE % (module, OPTIONAL_MODULES)],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+        )
+        times.append(time.perf_counter() - start)
+        if proc.returncode:
+            return times, 'error: %s' % proc.stderr.strip().splitlines()[-1]
+        loaded = proc.stdout.strip()
+    return times, loaded
+
+
+def main():
+    options = docopt.docopt(__doc__)
+    runs = int(options['--runs'])
+    selected = options['--script']
+    baseline, _ = measure('os', runs)
+    print('%-16s %10s  %s' % ('script', 'ms', 'optional modules loaded'))
+    print('%-16s %10.1f' % ('(python)', statistics.median(baseline) * 1000))
+    for name, module in console_scripts():
+        if selected and name not in selected:
+            continue
+        times, loaded = measure(module, runs)
+        print('%-16s %10.1f  %s' % (name, statistics.median(times) * 1000, loaded or '-'))
+
+
+if __name__ == '__main__':
+    main()
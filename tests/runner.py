@@ -2,6 +2,20 @@
 import os
 import unittest
 from test_devices import *
+from test_ethernet import *
+from test_results import *
+from test_dev_generator import *
+from test_device_spec import *
+from test_descriptors import *
+from test_line_buffer import *
+from test_virtual_card import *
+from test_endpoint_buffer import *
+from test_modem import *
+from test_runtime import *
+from test_capture import *
+from test_pty_bridge import *
+from test_keystrokes import *
+from test_hid import *
 
 
 if __name__ == '__main__':
@@ -0,0 +1,179 @@
+'''
+Tests for the usbmon pcap capture
+'''
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from numap.phy.capture import CapturePhy
+from numap.utils.usbmon import read_pcap, pcap_header, pcap_record_header, usbmon_header
+from numap.utils.usbmon import EventType, XferType, STATUS_STALL, STATUS_IN_PROGRESS
+
+
+class FakeRequest(object):
+
+    def __init__(self, request_type, request, value, index, length, data=b''):
+        self.request_type = request_type
+        self.request = request
+        self.value = value
+        self.index = index
+        self.length = length
+        self.data = data
+
+
+class FakeEndpoint(object):
+
+    def __init__(self, transfer_type):
+        self.transfer_type = transfer_type
+
+
+class FakeDevice(object):
+
+    address = 3
+
+    def __init__(self):
+        self.endpoints = {1: FakeEndpoint(0x02), 2: FakeEndpoint(0x02)}
+        self.requests = []
+        self.data = []
+
+    def handle_request(self, req):
+        self.requests.append(req)
+
+    def handle_data_available(self, ep_num, data):
+        self.data.append((ep_num, data))
+
+
+class FakePhy(object):
+
+    def __init__(self):
+        self.device = None
+        self.sent = []
+
+    def connect(self, device):
+        self.device = device
+
+    def disconnect(self):
+        self.device = None
+
+    def send_on_endpoint(self, ep_num, data, blocking=True):
+        self.sent.append((ep_num, data))
+
+    def stall_ep0(self):
+        pass
+
+    def ack_status_stage(self):
+        pass
+
+
+class CapturePhyTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'capture.pcap')
+        self.backend = FakePhy()
+        self.phy = CapturePhy(self.backend, self.filename)
+        self.device = FakeDevice()
+        self.phy.connect(self.device)
+
+    def tearDown(self):
+        self.phy.close()
+        shutil.rmtree(self.tmpdir)
+
+    def host_request(self, req):
+        self.backend.device.handle_request(req)
+
+    def host_out(self, ep_num, data):
+        self.backend.device.handle_data_available(ep_num, data)
+
+    def get_records(self):
+        self.phy.close()
+        return list(read_pcap(self.filename))
+
+    def get_raw_records(self):
+        '''
+        :return: list of (usbmon header fields, incl_len, payload)
+        '''
+        self.phy.close()
+        with open(self.filename, 'rb') as f:
+            raw = f.read()
+        offset = pcap_header.size
+        records = []
+        while offset < len(raw):
+            _, _, incl_len, orig_len = pcap_record_header.unpack_from(raw, offset)
+            offset += pcap_record_header.size
+            self.assertEqual(incl_len, orig_len)
+            self.assertGreaterEqual(incl_len, 64)
+            fields = usbmon_header.unpack_from(raw, offset)
+            records.append((fields, incl_len, raw[offset + 64:offset + incl_len]))
+            offset += incl_len
+        return records
+
+    def testHeaderSize(self):
+        self.assertEqual(usbmon_header.size, 64)
+
+    def testControlInTransfer(self):
+        descriptor = b'\x12\x01' + b'\x00' * 16
+        self.host_request(FakeRequest(0x80, 6, 0x0100, 0, 0x40))
+        self.phy.send_on_endpoint(0, descriptor)
+        records = self.get_raw_records()
+        self.assertEqual(len(records), 2)
+        (submission, s_len, s_data), (callback, c_len, c_data) = records
+        # id, type, xfer_type, epnum, devnum, busnum, flag_setup, flag_data, ts_sec, ts_usec, status, length, len_cap, setup
+        self.assertEqual(submission[0], callback[0])
+        self.assertEqual(submission[1:4], (EventType.submission, XferType.control, 0x80))
+        self.assertEqual(submission[4], 3)
+        self.assertEqual(submission[6], b'\x00')
+        self.assertEqual(submission[10:13], (STATUS_IN_PROGRESS, 0x40, 0))
+        self.assertEqual(submission[13], struct.pack('<BBHHH', 0x80, 6, 0x0100, 0, 0x40))
+        self.assertEqual((s_len, s_data), (64, b''))
+        self.assertEqual(callback[1:4], (EventType.callback, XferType.control, 0x80))
+        self.assertNotEqual(callback[6], b'\x00')
+        self.assertEqual(callback[10:13], (0, len(descriptor), len(descriptor)))
+        self.assertEqual((c_len, c_data), (64 + len(descriptor), descriptor))
+
+    def testControlOutTransfer(self):
+        self.host_request(FakeRequest(0x21, 0x20, 0, 0, 7, b'\x80\x25\x00\x00\x00\x00\x08'))
+        self.phy.ack_status_stage()
+        (submission, s_len, _), (callback, c_len, _) = self.get_raw_records()
+        self.assertEqual(submission[1:4], (EventType.submission, XferType.control, 0x00))
+        self.assertEqual(submission[10:13], (STATUS_IN_PROGRESS, 7, 7))
+        self.assertEqual(s_len, 64 + 7)
+        self.assertEqual(callback[1:4], (EventType.callback, XferType.control, 0x00))
+        self.assertEqual(callback[10:13], (0, 7, 0))
+        self.assertEqual(c_len, 64)
+
+    def testControlStall(self):
+        self.host_request(FakeRequest(0x80, 6, 0x0600, 0, 10))
+        self.phy.stall_ep0()
+        # a late status stage does not add a second callback
+        self.phy.ack_status_stage()
+        records = self.get_records()
+        self.assertEqual([r.event_type for r in records], [EventType.submission, EventType.callback])
+        self.assertEqual(records[1].status, STATUS_STALL)
+        self.assertEqual(records[1].epnum, 0x80)
+
+    def testBulkTransfers(self):
+        self.host_out(2, b'hello')
+        self.phy.send_on_endpoint(1, b'world!')
+        records = self.get_raw_records()
+        self.assertEqual(len(records), 4)
+        (out_s, out_s_len, out_s_data), (out_c, out_c_len, _) = records[:2]
+        self.assertEqual(out_s[0], out_c[0])
+        self.assertEqual(out_s[1:4], (EventType.submission, XferType.bulk, 0x02))
+        self.assertEqual(out_s[10:13], (STATUS_IN_PROGRESS, 5, 5))
+        self.assertEqual((out_s_len, out_s_data), (64 + 5, b'hello'))
+        self.assertEqual(out_c[1:4], (EventType.callback, XferType.bulk, 0x02))
+        self.assertEqual(out_c[10:13], (0, 5, 0))
+        self.assertEqual(out_c_len, 64)
+        (in_s, in_s_len, _), (in_c, in_c_len, in_c_data) = records[2:]
+        self.assertEqual(in_s[0], in_c[0])
+        self.assertNotEqual(in_s[0], out_s[0])
+        self.assertEqual(in_s[1:4], (EventType.submission, XferType.bulk, 0x81))
+        self.assertEqual(in_s[10:13], (STATUS_IN_PROGRESS, 6, 0))
+        self.assertEqual(in_s_len, 64)
+        self.assertEqual(in_c[1:4], (EventType.callback, XferType.bulk, 0x81))
+        self.assertEqual(in_c[10:13], (0, 6, 6))
+        self.assertEqual((in_c_len, in_c_data), (64 + 6, b'world!'))
+        self.assertEqual(self.device.data, [(2, b'hello')])
+        self.assertEqual(self.backend.sent, [(1, b'world!')])
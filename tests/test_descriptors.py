@@ -0,0 +1,127 @@
+'''
+Tests for the descriptors that are derived for each connection speed
+'''
+import struct
+import unittest
+from infra_event_handler import EventHandler
+from infra_app import TestApp
+from numap.core.usb import DescriptorType
+from numap.core.usb_endpoint import USBEndpoint
+from numap.phy.gadget import split_descriptors, endpoint_descriptors
+
+
+class DescriptorSetTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = TestApp(event_handler=EventHandler())
+        self.phy = self.app.load_phy('test')
+
+    def set_speed(self, speed, speeds):
+        self.phy.speed = speed
+        self.phy.speeds = speeds
+
+    def make_endpoint(self, transfer_type, interval, max_packet_size=0x40):
+        return USBEndpoint(
+            app=self.app,
+            phy=self.phy,
+            number=1,
+            direction=USBEndpoint.direction_in,
+            transfer_type=transfer_type,
+            sync_type=USBEndpoint.sync_type_none,
+            usage_type=USBEndpoint.usage_type_data,
+            max_packet_size=max_packet_size,
+            interval=interval,
+            handler=None
+        )
+
+    def get_interval(self, endpoint, usb_type):
+        return endpoint.get_descriptor(usb_type)[6]
+
+    def get_max_packet_size(self, endpoint, usb_type):
+        return struct.unpack_from('<H', endpoint.get_descriptor(usb_type), 4)[0]
+
+    def testBulkMaxPacketSize(self):
+        endpoint = self.make_endpoint(USBEndpoint.transfer_type_bulk, 0, 0x200)
+        self.assertEqual(self.get_max_packet_size(endpoint, 'fullspeed'), 0x40)
+        self.assertEqual(self.get_max_packet_size(endpoint, 'highspeed'), 0x200)
+        self.assertEqual(self.get_max_packet_size(endpoint, 'superspeed'), 0x400)
+
+    def testInterruptMaxPacketSize(self):
+        endpoint = self.make_endpoint(USBEndpoint.transfer_type_interrupt, 10, 0x8)
+        for usb_type in ('fullspeed', 'highspeed', 'superspeed'):
+            self.assertEqual(self.get_max_packet_size(endpoint, usb_type), 0x8)
+
+    def testCompanionDescriptor(self):
+        endpoint = self.make_endpoint(USBEndpoint.transfer_type_interrupt, 10, 0x8)
+        self.assertEqual(len(endpoint.get_descriptor('highspeed')), 7)
+        descriptor = endpoint.get_descriptor('superspeed')
+        self.assertEqual(len(descriptor), 7 + 6)
+        self.assertEqual(descriptor[8], DescriptorType.superspeed_endpoint_companion)
+        # wBytesPerInterval
+        self.assertEqual(struct.unpack_from('<H', descriptor, 11)[0], 0x8)
+
+    def testConfigurationAtEachSpeed(self):
+        self.set_speed('fullspeed', ('fullspeed', 'highspeed', 'superspeed'))
+        device = self.app.load_device('keyboard', self.phy)
+        for usb_type, companions in (('fullspeed', 0), ('highspeed', 0), ('superspeed', 1)):
+            configuration = device.get_configuration_descriptor(0, usb_type)
+            self.assertEqual(struct.unpack_from('<H', configuration, 2)[0], len(configuration))
+            descriptors = split_descriptors(configuration)
+            types = [d[1] for d in descriptors]
+            self.assertEqual(types.count(DescriptorType.superspeed_endpoint_companion), companions)
+            self.assertEqual(len(endpoint_descriptors(descriptors)), 1)
+
+    def testOtherSpeedConfiguration(self):
+        self.set_speed('highspeed', ('fullspeed', 'highspeed'))
+        device = self.app.load_device('keyboard', self.phy)
+        other = device.get_other_speed_configuration_descriptor(0)
+        self.assertEqual(other[1], DescriptorType.other_speed_configuration)
+        self.assertEqual(other[2:], device.get_configuration_descriptor(0, 'fullspeed')[2:])
+
+    def testNoOtherSpeedOnFullSpeedOnly(self):
+        device = self.app.load_device('keyboard', self.phy)
+        self.assertIsNone(device.get_other_speed_configuration_descriptor(0))
+
+    def testInterruptInterval(self):
+        endpoint = self.make_endpoint(USBEndpoint.transfer_type_interrupt, 10)
+        self.assertEqual(self.get_interval(endpoint, 'fullspeed'), 10)
+        # 2^(7-1) microframes = 8 ms
+        self.assertEqual(self.get_interval(endpoint, 'highspeed'), 7)
+        self.assertEqual(self.get_interval(endpoint, 'superspeed'), 7)
+
+    def testIsochronousInterval(self):
+        endpoint = self.make_endpoint(USBEndpoint.transfer_type_isochronous, 1)
+        self.assertEqual(self.get_interval(endpoint, 'fullspeed'), 1)
+        # 1 ms is 2^(4-1) microframes
+        self.assertEqual(self.get_interval(endpoint, 'highspeed'), 4)
+        self.assertEqual(self.get_interval(endpoint, 'superspeed'), 4)
+        endpoint = self.make_endpoint(USBEndpoint.transfer_type_isochronous, 16)
+        self.assertEqual(self.get_interval(endpoint, 'highspeed'), 16)
+
+    def testBulkInterval(self):
+        endpoint = self.make_endpoint(USBEndpoint.transfer_type_bulk, 0)
+        self.assertEqual(self.get_interval(endpoint, 'highspeed'), 0)
+
+    def get_bcd_usb(self):
+        device = self.app.load_device('keyboard', self.phy)
+        descriptor = device.get_descriptor()
+        qualifier = device.get_device_qualifier_descriptor(0)
+        return (
+            struct.unpack_from('<H', descriptor, 2)[0],
+            None if qualifier is None else struct.unpack_from('<H', qualifier, 2)[0]
+        )
+
+    def testBcdUsbFullSpeedOnly(self):
+        self.assertEqual(self.get_bcd_usb(), (0x0100, None))
+
+    def testBcdUsbHighSpeed(self):
+        self.set_speed('highspeed', ('fullspeed', 'highspeed'))
+        self.assertEqual(self.get_bcd_usb(), (0x0200, 0x0200))
+
+    def testBcdUsbSuperSpeed(self):
+        self.set_speed('superspeed', ('fullspeed', 'highspeed', 'superspeed'))
+        self.assertEqual(self.get_bcd_usb(), (0x0300, 0x0210))
+
+    def testBcdUsbSuperSpeedDeviceAtHighSpeed(self):
+        self.set_speed('highspeed', ('fullspeed', 'highspeed', 'superspeed'))
+        self.assertEqual(self.get_bcd_usb(), (0x0210, 0x0210))
@@ -0,0 +1,47 @@
+'''
+Tests for the device code generator (numapmkdevice)
+'''
+import types
+import unittest
+from infra_event_handler import EventHandler
+from infra_app import TestApp
+from numap.utils.dev_generator import generate_code
+from numap.utils.descriptor_capture import DescriptorSet
+
+# CDC ACM: class-specific interface descriptors
+CDC_ACM = (
+    '120100010200004048250110100001020301',
+    '09024300020100c032090400000102020100052400010105240101010424020105240600010705830340000909040100020a00'
+    '00000705010240000007058202400000'
+)
+# bluetooth: alternate settings with the same endpoint numbers
+BLUETOOTH = (
+    '12010001e0010140b40401f9010001020301',
+    '0902c800030100c0320904000003e00101000705810310000107058202400001070502024000010904010002e0010100070583'
+    '01000001070503010000010904010102e001010007058301090001070503010900010904010202e00101000705830111000107'
+    '0503011100010904010302e001010007058301190001070503011900010904010402e0010100070583012100010705030121'
+    '00010904010502e001010007058301310001070503013100010904020002ffffff000705840220000107050402200001'
+)
+
+
+class DevGeneratorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = TestApp(event_handler=EventHandler())
+        self.phy = self.app.load_phy('test')
+
+    def _testRoundTrip(self, device, configuration):
+        device = bytes.fromhex(device)
+        configuration = bytes.fromhex(configuration)
+        code = generate_code(DescriptorSet('test', device, [configuration], {}))
+        module = types.ModuleType('generated_device')
+        exec(compile(code, 'generated_device', 'exec'), module.__dict__)
+        generated = module.usb_device(self.app, self.phy)
+        self.assertEqual(generated.get_descriptor(), device)
+        self.assertEqual(generated.get_configuration_descriptor(0), configuration)
+
+    def testCsInterfaceRoundTrip(self):
+        self._testRoundTrip(*CDC_ACM)
+
+    def testAlternateSettingsRoundTrip(self):
+        self._testRoundTrip(*BLUETOOTH)
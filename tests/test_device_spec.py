@@ -0,0 +1,47 @@
+'''
+Tests for the devices that are defined by a json spec
+'''
+import struct
+import unittest
+from infra_event_handler import EventHandler
+from infra_app import TestApp
+from numap.utils.device_spec import parse_spec, SpecDevice
+
+DEVICE = '120100020200004048250110100001020301'
+# CDC ACM with an interface association before the communication interface
+ASSOCIATION = '080b000202020100'
+INTERFACES = (
+    '0904000001020201000524000101052401010104240201052406000107058303400009'
+    '09040100020a0000000705010240000007058202400000'
+)
+
+
+def make_configuration(body):
+    body = bytes.fromhex(body)
+    return (struct.pack('<BBHBBBBB', 9, 2, 9 + len(body), 2, 1, 0, 0xc0, 0x32) + body).hex()
+
+
+class DeviceSpecTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = TestApp(event_handler=EventHandler())
+        self.phy = self.app.load_phy('test')
+
+    def testInterfaceAssociationIsKept(self):
+        configuration = make_configuration(ASSOCIATION + INTERFACES)
+        spec = parse_spec({'device': DEVICE, 'configurations': [configuration]})
+        interfaces = spec.configurations[0].interfaces
+        self.assertEqual(interfaces[0].preceding, [bytes.fromhex(ASSOCIATION)])
+        self.assertEqual(interfaces[1].preceding, [])
+
+    def testInterfaceAssociationAfterLastInterface(self):
+        configuration = make_configuration(INTERFACES + ASSOCIATION)
+        with self.assertRaises(Exception):
+            parse_spec({'device': DEVICE, 'configurations': [configuration]})
+
+    def testConfigurationRoundTrip(self):
+        configuration = make_configuration(ASSOCIATION + INTERFACES)
+        spec = parse_spec({'device': DEVICE, 'configurations': [configuration]})
+        device = SpecDevice(self.app, self.phy, spec)
+        self.assertEqual(device.get_descriptor(), bytes.fromhex(DEVICE))
+        self.assertEqual(device.configurations[0].get_descriptor(), bytes.fromhex(configuration))
@@ -2,13 +2,22 @@
 Tests for emulated USB devices
 '''
 
+import os
 import unittest
 import struct
+import tempfile
+import time
+import wave
 from common import get_test_logger
 from infra_event_handler import EventHandler
 from infra_app import TestApp
 from infra_phy import SendDataEvent, StallEp0Event
+from numap.dev.audio import USBAudioDevice
 from numap.dev.cdc import USBCDCClass
+from numap.dev.composite import USBCompositeDevice
+from numap.dev.hub import HubPort, PortFeature, PortStatus, USBHubClass
+from numap.utils.ethernet import PacketSink
+from numap.utils.virtual_card import ScriptedCard
 
 DIR_OUT = 0x00
 DIR_IN = 0x80
@@ -164,6 +173,21 @@ class AudioDeviceTests(unittest.TestCase, BaseDeviceTests):
     def setUp(self):
         self._setUp()
 
+    def testPlaybackRateAndWaveFile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'playback.wav')
+            device = USBAudioDevice(self.app, self.phy, audio_sink=filename)
+            streaming = device.audio_streaming
+            # SET_CUR sampling frequency of the OUT endpoint: 48000 Hz
+            device.configurations[0].interfaces[1].usb_class._settings[(0x0100, 0x01)][0] = b'\x80\xbb\x00'
+            streaming.data_available(b'\x00' * 192)
+            self.assertEqual(streaming.rx_format.rate, 48000)
+            device.disconnect()
+            f = wave.open(filename, 'rb')
+            self.assertEqual(f.getframerate(), 48000)
+            self.assertEqual(f.getnframes(), 48)
+            f.close()
+
 
 class CdcAcmDeviceTests(unittest.TestCase, BaseDeviceTests):
 
@@ -188,6 +212,23 @@ class CdcAcmDeviceTests(unittest.TestCase, BaseDeviceTests):
         self._testClassRequestHandling(set_req, req_data=data)
         self._testClassRequestHandling(get_req, req_length=len(data), response_data=data)
 
+    def _testResponsePackets(self, response_length):
+        self.device.modem.echo = False
+        self.device.modem.queue(b'a' * response_length)
+        self.device.handle_ep2_buffer_available()
+        return [(ev.ep_num, len(ev.data)) for ev in self.events.events]
+
+    def testResponseZeroLengthPacket(self):
+        self.assertEqual(self._testResponsePackets(0x80), [(2, 0x80), (2, 0)])
+        self.events.reset()
+        self.assertEqual(self._testResponsePackets(0x50), [(2, 0x50)])
+
+    def testResponseZeroLengthPacketAtHighSpeed(self):
+        self.phy.speed = 'highspeed'
+        self.assertEqual(self._testResponsePackets(0x80), [(2, 0x80)])
+        self.events.reset()
+        self.assertEqual(self._testResponsePackets(0x200), [(2, 0x200), (2, 0)])
+
     def testClassSettersAndGetters(self):
         self._testClassSetterGetter(USBCDCClass.SEND_ENCAPSULATED_COMMAND, USBCDCClass.GET_ENCAPSULATED_RESPONSE, b'\x01\x02\x03'),
         self._testClassSetterGetter(USBCDCClass.SET_COMM_FEATURE, USBCDCClass.GET_COMM_FEATURE, b'\x01\x02\x03'),
@@ -207,6 +248,43 @@ class CdcAcmDeviceTests(unittest.TestCase, BaseDeviceTests):
         self._testClassSetterGetter(USBCDCClass.SET_CRC_MODE, USBCDCClass.GET_CRC_MODE, b'\x01\x02\x03'),
 
 
+class ClosingSink(PacketSink):
+
+    def __init__(self):
+        super(ClosingSink, self).__init__()
+        self.closed = 0
+
+    def close(self):
+        self.closed += 1
+
+
+class NetworkDeviceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = TestApp(event_handler=EventHandler())
+        self.phy = self.app.load_phy('test')
+
+    def get_bridge(self, device):
+        if hasattr(device, 'bridge'):
+            return device.bridge
+        return device.configurations[0].interfaces[1].bridge
+
+    def testSinkClosedOnDisconnect(self):
+        for name in ('cdc_ecm', 'cdc_eem', 'cdc_ncm', 'rndis'):
+            device = self.app.load_device(name, self.phy)
+            sink = self.get_bridge(device).sink = ClosingSink()
+            device.disconnect()
+            self.assertEqual(sink.closed, 1, name)
+
+    def testSinkClosedOnStop(self):
+        for name in ('cdc_ecm', 'cdc_eem', 'cdc_ncm', 'rndis'):
+            device = self.app.load_device(name, self.phy)
+            sink = self.get_bridge(device).sink = ClosingSink()
+            for callback in device.runtime.stop_callbacks:
+                callback()
+            self.assertEqual(sink.closed, 1, name)
+
+
 class FtdiDeviceTests(unittest.TestCase, BaseDeviceTests):
 
     __dev_name__ = 'ftdi'
@@ -214,6 +292,53 @@ class FtdiDeviceTests(unittest.TestCase, BaseDeviceTests):
     def setUp(self):
         self._setUp()
 
+    def testHighSpeedPackets(self):
+        self.phy.speed = 'highspeed'
+        interface = self.device.configurations[0].interfaces[0]
+        interface.queue(b'a' * 600)
+        interface.last_in = 0
+        interface.handle_ep3_buffer_available()
+        ev = self.events.events.pop()
+        self.assertEqual(ev.ep_num, 3)
+        # 510 bytes of data after the status bytes of each 512 byte packet
+        self.assertEqual(ev.data, b'\x31\x60' + b'a' * 510 + b'\x31\x60' + b'a' * 90)
+
+    def testStatusBytesInEveryPacket(self):
+        interface = self.device.configurations[0].interfaces[0]
+        interface.queue(b'a' * 62 + b'b' * 62 + b'c' * 6)
+        interface.last_in = 0
+        interface.handle_ep3_buffer_available()
+        ev = self.events.events.pop()
+        self.assertEqual(ev.data, b'\x31\x60' + b'a' * 62 + b'\x31\x60' + b'b' * 62 + b'\x31\x60' + b'c' * 6)
+
+    def testStatusOnlyPacket(self):
+        interface = self.device.configurations[0].interfaces[0]
+        interface.last_in = 0
+        interface.handle_ep3_buffer_available()
+        ev = self.events.events.pop()
+        self.assertEqual(ev.data, b'\x31\x60')
+
+    def testFullPacketsBeforeLatency(self):
+        interface = self.device.configurations[0].interfaces[0]
+        interface.queue(b'a' * 100)
+        interface.last_in = time.time() + 60
+        interface.handle_ep3_buffer_available()
+        ev = self.events.events.pop()
+        # only the full packet is sent, the rest waits for the latency timer
+        self.assertEqual(ev.data, b'\x31\x60' + b'a' * 62)
+        self.assertEqual(len(interface.txq), 38)
+        interface.handle_ep3_buffer_available()
+        self.assertEqual(len(self.events.events), 0)
+
+    def testMaxPacketsPerTransfer(self):
+        interface = self.device.configurations[0].interfaces[0]
+        interface.queue(b'a' * 62 * 10)
+        interface.last_in = 0
+        interface.handle_ep3_buffer_available()
+        ev = self.events.events.pop()
+        self.assertEqual(len(ev.data), 64 * interface.MAX_PACKETS)
+        self.assertEqual(len(interface.txq), 62 * 2)
+
 
 class HubDeviceTests(unittest.TestCase, BaseDeviceTests):
 
@@ -222,6 +347,106 @@ class HubDeviceTests(unittest.TestCase, BaseDeviceTests):
     def setUp(self):
         self._setUp()
 
+    def testStatusChangeBitmap(self):
+        hub_class = self.device.hub_class
+        self.assertIsNone(hub_class.get_status_change())
+        hub_class.ports[0].set_feature(PortFeature.PORT_POWER)
+        hub_class.ports[2].set_feature(PortFeature.PORT_POWER)
+        hub_class.ports[0].attach(object())
+        hub_class.ports[2].attach(object())
+        # bit 0 is the hub, bit n is port n
+        self.assertEqual(hub_class.get_status_change(), b'\x0a')
+        hub_class.ports[0].clear_feature(PortFeature.C_PORT_CONNECTION)
+        self.assertEqual(hub_class.get_status_change(), b'\x08')
+
+    def testStatusChangeBitmapSize(self):
+        hub_class = USBHubClass(self.app, self.phy, num_ports=8)
+        hub_class.ports[7].set_feature(PortFeature.PORT_POWER)
+        hub_class.ports[7].attach(object())
+        self.assertEqual(hub_class.get_status_change(), b'\x00\x01')
+
+    def testHubDescriptorPortBitmaps(self):
+        descriptor = USBHubClass(self.app, self.phy, num_ports=8).get_hub_descriptor()
+        self.assertEqual(descriptor[0], len(descriptor))
+        self.assertEqual(descriptor[2], 8)
+        # DeviceRemovable and PortPwrCtrlMask, 2 bytes each for 8 ports
+        self.assertEqual(descriptor[7:], b'\x00\x00\xff\xff')
+
+
+class HubPortTests(unittest.TestCase):
+
+    def setUp(self):
+        self.port = HubPort(1)
+
+    def testAttachUnpowered(self):
+        self.port.attach(object())
+        self.assertEqual((self.port.status, self.port.change), (0, 0))
+        # the connection is reported once the port is powered
+        self.assertTrue(self.port.set_feature(PortFeature.PORT_POWER))
+        self.assertEqual(self.port.status, PortStatus.POWER | PortStatus.CONNECTION)
+        self.assertEqual(self.port.change, PortStatus.CONNECTION)
+
+    def testAttachPowered(self):
+        self.port.set_feature(PortFeature.PORT_POWER)
+        self.assertEqual((self.port.status, self.port.change), (PortStatus.POWER, 0))
+        self.port.attach(object())
+        self.assertEqual(self.port.status, PortStatus.POWER | PortStatus.CONNECTION)
+        self.assertEqual(self.port.change, PortStatus.CONNECTION)
+
+    def testReset(self):
+        self.port.set_feature(PortFeature.PORT_POWER)
+        self.port.attach(object())
+        self.port.clear_feature(PortFeature.C_PORT_CONNECTION)
+        self.assertTrue(self.port.set_feature(PortFeature.PORT_RESET))
+        self.assertEqual(self.port.status, PortStatus.POWER | PortStatus.CONNECTION | PortStatus.ENABLE)
+        self.assertEqual(self.port.change, PortStatus.RESET)
+        # C_PORT_RESET clears bit 4 of wPortChange
+        self.assertTrue(self.port.clear_feature(PortFeature.C_PORT_RESET))
+        self.assertEqual(self.port.change, 0)
+
+    def testResetWithoutDevice(self):
+        self.port.set_feature(PortFeature.PORT_POWER)
+        self.assertTrue(self.port.set_feature(PortFeature.PORT_RESET))
+        self.assertEqual((self.port.status, self.port.change), (PortStatus.POWER, 0))
+
+    def testDetach(self):
+        self.port.set_feature(PortFeature.PORT_POWER)
+        self.port.attach(object())
+        self.port.set_feature(PortFeature.PORT_RESET)
+        self.port.clear_feature(PortFeature.C_PORT_CONNECTION)
+        self.port.clear_feature(PortFeature.C_PORT_RESET)
+        self.port.detach()
+        self.assertIsNone(self.port.device)
+        self.assertEqual(self.port.status, PortStatus.POWER)
+        self.assertEqual(self.port.change, PortStatus.CONNECTION)
+
+    def testSuspendResume(self):
+        self.port.set_feature(PortFeature.PORT_POWER)
+        self.port.attach(object())
+        self.port.clear_feature(PortFeature.C_PORT_CONNECTION)
+        self.port.set_feature(PortFeature.PORT_SUSPEND)
+        self.assertTrue(self.port.status & PortStatus.SUSPEND)
+        self.assertEqual(self.port.change, 0)
+        self.port.clear_feature(PortFeature.PORT_SUSPEND)
+        self.assertFalse(self.port.status & PortStatus.SUSPEND)
+        self.assertEqual(self.port.change, PortStatus.SUSPEND)
+        self.port.clear_feature(PortFeature.C_PORT_SUSPEND)
+        self.assertEqual(self.port.change, 0)
+
+    def testPowerOff(self):
+        self.port.set_feature(PortFeature.PORT_POWER)
+        self.port.attach(object())
+        self.port.set_feature(PortFeature.PORT_RESET)
+        self.assertTrue(self.port.clear_feature(PortFeature.PORT_POWER))
+        self.assertEqual(self.port.status, 0)
+
+    def testUnsupportedFeatures(self):
+        self.assertFalse(self.port.set_feature(PortFeature.PORT_CONNECTION))
+        self.assertFalse(self.port.set_feature(PortFeature.C_PORT_CONNECTION))
+        self.assertFalse(self.port.clear_feature(PortFeature.PORT_RESET))
+        self.assertTrue(self.port.set_feature(PortFeature.PORT_INDICATOR))
+        self.assertTrue(self.port.clear_feature(PortFeature.PORT_INDICATOR))
+
 
 class KeyboardDeviceTests(unittest.TestCase, BaseDeviceTests):
 
@@ -238,6 +463,17 @@ class PrinterDeviceTests(unittest.TestCase, BaseDeviceTests):
     def setUp(self):
         self._setUp()
 
+    def testPrintJobClosedOnDisconnect(self):
+        interface = self.device.configurations[0].interfaces[0]
+        with tempfile.TemporaryDirectory() as directory:
+            interface.sink.prefix = os.path.join(directory, 'job')
+            interface.handle_data_available(b'%!PS\n')
+            self.assertIsNotNone(interface.sink.file)
+            self.device.disconnect()
+            self.assertIsNone(interface.sink.file)
+            with open(os.path.join(directory, 'job-1.pcl'), 'rb') as f:
+                self.assertEqual(f.read(), b'%!PS\n')
+
 
 class SmartcardDeviceTests(unittest.TestCase, BaseDeviceTests):
 
@@ -246,6 +482,24 @@ class SmartcardDeviceTests(unittest.TestCase, BaseDeviceTests):
     def setUp(self):
         self._setUp()
 
+    def _testResponsePackets(self, response_length):
+        interface = self.device.configurations[0].interfaces[0]
+        # the CCID header is 10 bytes, with the 2 bytes of the status word
+        interface.card = ScriptedCard(default=bytes(response_length - 10 - 2) + b'\x90\x00')
+        apdu = b'\x00\xb0\x00\x00\x00'
+        interface.handle_data_available(struct.pack('<BIBBBH', 0x6f, len(apdu), 0, 1, 0, 0) + apdu)
+        return [(ev.ep_num, len(ev.data)) for ev in self.events.events]
+
+    def testZeroLengthPacketAtFullSpeed(self):
+        self.assertEqual(self._testResponsePackets(0x40), [(2, 0x40), (2, 0)])
+
+    def testZeroLengthPacketAtHighSpeed(self):
+        self.phy.speed = 'highspeed'
+        # the responses are shorter than a 512 byte packet
+        self.assertEqual(self._testResponsePackets(0x40), [(2, 0x40)])
+        self.events.reset()
+        self.assertEqual(self._testResponsePackets(0x80), [(2, 0x80)])
+
 
 class BillboardDeviceTests(unittest.TestCase, BaseDeviceTests):
 
@@ -260,3 +514,35 @@ class BillboardDeviceTests(unittest.TestCase, BaseDeviceTests):
             0, DESCRIPTOR_TYPE_BOS, 0, DESCRIPTOR_LENGTH_BOS
         )
         self._testGetDescriptorConsistent(bos_descriptor_request, DESCRIPTOR_LENGTH_BOS)
+
+
+def split_descriptors(data):
+    descriptors = []
+    while len(data) >= 2 and data[0] >= 2:
+        descriptors.append(data[:data[0]])
+        data = data[data[0]:]
+    return descriptors
+
+
+class CompositeDeviceTests(unittest.TestCase, BaseDeviceTests):
+
+    __dev_name__ = 'composite'
+
+    def setUp(self):
+        self.logger = get_test_logger()
+        self.events = EventHandler()
+        self.app = TestApp(event_handler=self.events)
+        self.logger.info('Starting test: %s' % self._testMethodName)
+        self.phy = self.app.load_phy('test')
+        # a CDC function that is not the first one
+        self.device = USBCompositeDevice(self.app, self.phy, functions='keyboard,cdc_acm')
+
+    def testCdcFunctionInterfaceNumbers(self):
+        descriptors = split_descriptors(self.device.get_configuration_descriptor(0))
+        interfaces = [d[2] for d in descriptors if d[1] == DESCRIPTOR_TYPE_INTERFACE]
+        self.assertEqual(interfaces, [0, 1, 2])
+        functional = dict((d[2], d[3:]) for d in descriptors if d[1] == 0x24)
+        # union: control interface, data interface
+        self.assertEqual(functional[0x06], b'\x01\x02')
+        # call management: bmCapabilities, data interface
+        self.assertEqual(functional[0x01][1:], b'\x02')
@@ -0,0 +1,78 @@
+'''
+Tests for the bounded buffers of the IN endpoints
+'''
+import time
+import threading
+import unittest
+from numap.core.endpoint_buffer import EndpointBuffer
+
+
+class EndpointBufferTests(unittest.TestCase):
+
+    def testMessagesCoalescedOnPacketBoundary(self):
+        buffer = EndpointBuffer('test', max_packet_size=0x40)
+        buffer.put(b'a' * 0x40)
+        buffer.put(b'b' * 0x10)
+        buffer.put(b'c' * 0x10)
+        # the short packet of the second message ends the transfer
+        self.assertEqual(buffer.get(), b'a' * 0x40 + b'b' * 0x10)
+        self.assertEqual(buffer.get(), b'c' * 0x10)
+        self.assertEqual(buffer.get(), None)
+
+    def testZeroLengthPacket(self):
+        buffer = EndpointBuffer('test', max_packet_size=0x40)
+        buffer.put(b'a' * 0x40)
+        buffer.put(b'')
+        buffer.put(b'b')
+        self.assertEqual(buffer.get(), b'a' * 0x40)
+        self.assertEqual(buffer.get(), b'')
+        self.assertEqual(buffer.get(), b'b')
+
+    def testMaxTransfer(self):
+        buffer = EndpointBuffer('test', max_packet_size=0x40, max_transfer=0x100)
+        buffer.put(b'a' * 0x180)
+        self.assertEqual(len(buffer.get()), 0x100)
+        self.assertEqual(len(buffer.get()), 0x80)
+
+    def testMessageDroppedWhenFull(self):
+        buffer = EndpointBuffer('test', capacity=0x100)
+        self.assertEqual(buffer.put(b'a' * 0xc0), 0xc0)
+        self.assertEqual(buffer.put(b'b' * 0x80), 0)
+        self.assertEqual(buffer.stats.dropped, 0x80)
+        # a message larger than the capacity is queued into an empty buffer
+        buffer.clear()
+        self.assertEqual(buffer.put(b'c' * 0x200), 0x200)
+
+    def testStream(self):
+        buffer = EndpointBuffer('test', capacity=0x100, stream=True)
+        self.assertEqual(buffer.put(b'a' * 0xc0), 0xc0)
+        self.assertEqual(buffer.put(b'b' * 0x80), 0x40)
+        self.assertEqual(buffer.get(0x50), b'a' * 0x50)
+        self.assertEqual(buffer.get(), b'a' * 0x70 + b'b' * 0x40)
+        self.assertEqual(len(buffer), 0)
+
+    def testBlockingPutWokenByGet(self):
+        buffer = EndpointBuffer('test', capacity=0x100)
+        buffer.put(b'a' * 0x100)
+        result = []
+        producer = threading.Thread(target=lambda: result.append(buffer.put(b'b' * 0x40, block=True)))
+        producer.start()
+        time.sleep(0.05)
+        self.assertEqual(result, [])
+        buffer.get()
+        producer.join(1)
+        self.assertEqual(result, [0x40])
+
+    def testBlockingPutReleasedByClose(self):
+        buffer = EndpointBuffer('test', capacity=0x100)
+        buffer.put(b'a' * 0x100)
+        producer = threading.Thread(target=buffer.put, args=(b'b' * 0x40, True))
+        producer.start()
+        buffer.close()
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+
+    def testBlockingPutTimeout(self):
+        buffer = EndpointBuffer('test', capacity=0x100)
+        buffer.put(b'a' * 0x100)
+        self.assertEqual(buffer.put(b'b' * 0x40, block=True, timeout=0.01), 0)
@@ -0,0 +1,243 @@
+'''
+Tests for the ethernet framing of the networking devices
+'''
+import time
+import struct
+import unittest
+from numap.utils.ethernet import EcmFraming, EemFraming, NcmFraming, NtbParameters, RndisFraming, ethernet_crc
+from numap.utils.ethernet import EthernetBridge, PacketSink
+
+
+def make_frame(i, size=60):
+    return struct.pack('<H', i) + b'\x5a' * (size - 2)
+
+
+def feed_packets(framing, transfer, max_packet_size=0x40):
+    '''
+    :return: frames of the transfer, fed in packets as the host sends it
+    '''
+    frames = []
+    for i in range(0, len(transfer), max_packet_size):
+        frames.extend(framing.feed(transfer[i:i + max_packet_size]))
+    if not len(transfer) % max_packet_size:
+        frames.extend(framing.feed(b''))
+    return frames
+
+
+class EcmFramingTests(unittest.TestCase):
+
+    def testFrameInPackets(self):
+        framing = EcmFraming()
+        frame = make_frame(1, 100)
+        self.assertEqual(framing.feed(frame[:0x40]), [])
+        self.assertEqual(framing.feed(frame[0x40:]), [frame])
+
+    def testFrameEndsWithZeroLengthPacket(self):
+        framing = EcmFraming()
+        frame = make_frame(1, 128)
+        self.assertEqual(feed_packets(framing, frame), [frame])
+        self.assertTrue(framing.needs_zlp(frame))
+        self.assertFalse(framing.needs_zlp(make_frame(1, 100)))
+
+    def testFrameInHighSpeedPackets(self):
+        framing = EcmFraming(0x200)
+        frame = make_frame(1, 1000)
+        # a full 512 byte packet does not end the transfer
+        self.assertEqual(framing.feed(frame[:0x200]), [])
+        self.assertEqual(framing.feed(frame[0x200:]), [frame])
+        frame = make_frame(2, 0x400)
+        self.assertEqual(feed_packets(framing, frame, 0x200), [frame])
+        self.assertTrue(framing.needs_zlp(frame))
+        self.assertFalse(framing.needs_zlp(make_frame(1, 0x40 * 3)))
+
+    def testFrameTooLong(self):
+        framing = EcmFraming()
+        self.assertEqual(feed_packets(framing, make_frame(1, 1600)), [])
+        self.assertEqual(framing.errors, 1)
+
+
+class EemFramingTests(unittest.TestCase):
+
+    def testRoundTripHighSpeed(self):
+        framing = EemFraming(0x200)
+        frames = [make_frame(i, 500 + i) for i in range(4)]
+        transfers = framing.encode(frames)
+        self.assertEqual(feed_packets(framing, transfers[0], 0x200), frames)
+
+    def testRoundTrip(self):
+        framing = EemFraming()
+        frames = [make_frame(1), make_frame(2, 200)]
+        transfers = framing.encode(frames)
+        self.assertEqual(len(transfers), 1)
+        self.assertEqual(feed_packets(framing, transfers[0]), frames)
+
+    def testCrc(self):
+        framing = EemFraming()
+        frame = make_frame(1)
+        header = struct.pack('<H', EemFraming.CRC_CALCULATED | (len(frame) + 4))
+        self.assertEqual(framing.decode(header + frame + ethernet_crc(frame)), [frame])
+        self.assertEqual(framing.decode(header + frame + b'\x00' * 4), [])
+        self.assertEqual(framing.errors, 1)
+
+    def testEcho(self):
+        framing = EemFraming()
+        echo = struct.pack('<H', EemFraming.TYPE_COMMAND | 3) + b'abc'
+        self.assertEqual(framing.decode(echo), [])
+        response = struct.pack('<H', EemFraming.TYPE_COMMAND | (EemFraming.CMD_ECHO_RESPONSE << 11) | 3) + b'abc'
+        self.assertEqual(framing.encode([]), [response])
+        self.assertEqual(framing.encode([]), [])
+
+
+class NcmFramingTests(unittest.TestCase):
+
+    def _testRoundTrip(self, params):
+        framing = NcmFraming(params=params, aggregation_timeout=0)
+        frames = [make_frame(i, 60 + i * 7) for i in range(10)]
+        transfers = framing.encode(frames)
+        self.assertEqual(len(transfers), 1)
+        self.assertEqual(feed_packets(framing, transfers[0]), frames)
+        self.assertEqual(framing.errors, 0)
+
+    def testRoundTripHighSpeed(self):
+        framing = NcmFraming(0x200, aggregation_timeout=0)
+        frames = [make_frame(i, 300 + i * 7) for i in range(10)]
+        transfers = framing.encode(frames)
+        self.assertEqual(len(transfers), 1)
+        self.assertEqual(feed_packets(framing, transfers[0], 0x200), frames)
+
+    def testRoundTripNtb16(self):
+        self._testRoundTrip(NtbParameters())
+
+    def testRoundTripNtb32(self):
+        params = NtbParameters()
+        params.ntb_format = NtbParameters.FORMAT_NTB32
+        self._testRoundTrip(params)
+
+    def testRoundTripCrc(self):
+        params = NtbParameters()
+        params.crc = True
+        self._testRoundTrip(params)
+
+    def testFramesSplitAtNtbSize(self):
+        params = NtbParameters()
+        params.ntb_in_size = NtbParameters.MIN_NTB_IN_SIZE
+        framing = NcmFraming(params=params, aggregation_timeout=0)
+        frames = [make_frame(i, 1000) for i in range(5)]
+        transfers = framing.encode(frames)
+        self.assertEqual(len(transfers), 3)
+        self.assertTrue(all(len(t) <= params.ntb_in_size for t in transfers))
+        self.assertEqual([f for t in transfers for f in framing.decode(t)], frames)
+
+    def testMaxDatagrams(self):
+        params = NtbParameters()
+        params.ntb_in_max_datagrams = 2
+        framing = NcmFraming(params=params, aggregation_timeout=0)
+        transfers = framing.encode([make_frame(i) for i in range(5)])
+        self.assertEqual([len(framing.decode(t)) for t in transfers], [2, 2, 1])
+
+    def testBadSignature(self):
+        framing = NcmFraming()
+        self.assertEqual(framing.decode(b'XXXX' + bytes(12)), [])
+        self.assertEqual(framing.errors, 1)
+
+    def testAggregationTimeoutWhilePolling(self):
+        framing = NcmFraming(aggregation_timeout=0.005)
+        self.assertEqual(framing.encode([make_frame(1)]), [])
+        transfers = []
+        deadline = time.time() + 1
+        while not transfers and time.time() < deadline:
+            time.sleep(0.0001)
+            transfers = framing.encode([])
+        self.assertEqual(len(transfers), 1)
+        self.assertEqual(framing.pending_since, None)
+        self.assertEqual(framing.decode(transfers[0]), [make_frame(1)])
+
+    def testTimerKeepsOldestPendingFrame(self):
+        framing = NcmFraming(aggregation_timeout=10)
+        framing.encode([make_frame(1)])
+        first = framing.pending_since
+        framing.encode([make_frame(2)])
+        framing.encode([])
+        self.assertEqual(framing.pending_since, first)
+
+
+class RndisFramingTests(unittest.TestCase):
+
+    def testRoundTrip(self):
+        framing = RndisFraming()
+        frames = [make_frame(1), make_frame(2, 300)]
+        transfer = b''.join(framing.encode(frames))
+        self.assertEqual(feed_packets(framing, transfer), frames)
+
+    def testRoundTripSuperSpeed(self):
+        framing = RndisFraming(0x400)
+        frames = [make_frame(1, 1500), make_frame(2, 1000)]
+        transfer = b''.join(framing.encode(frames))
+        self.assertEqual(feed_packets(framing, transfer, 0x400), frames)
+
+    def testPaddingByte(self):
+        framing = RndisFraming()
+        transfer = framing.encode([make_frame(1, 64 - RndisFraming.PACKET_HEADER.size)])[0]
+        self.assertEqual(framing.decode(transfer + b'\x00'), [make_frame(1, 64 - RndisFraming.PACKET_HEADER.size)])
+        self.assertEqual(framing.errors, 0)
+
+    def testTruncatedMessage(self):
+        framing = RndisFraming()
+        transfer = framing.encode([make_frame(1)])[0]
+        self.assertEqual(framing.decode(transfer[:-10]), [])
+        self.assertEqual(framing.errors, 1)
+
+
+class FakeEndpoint(object):
+
+    def __init__(self, number, max_packet_size):
+        self.number = number
+        self.max_packet_size = max_packet_size
+
+    def get_max_packet_size(self):
+        return self.max_packet_size
+
+
+class FakeActor(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def send_on_endpoint(self, ep_num, data):
+        self.sent.append((ep_num, bytes(data)))
+
+    def info(self, msg):
+        pass
+
+
+class EthernetBridgeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.actor = FakeActor()
+        self.sink = PacketSink()
+        self.endpoint = FakeEndpoint(2, 0x200)
+        self.bridge = EthernetBridge(self.actor, EcmFraming(), self.sink, self.endpoint)
+
+    def testPacketSizeOfTheConnection(self):
+        frame = make_frame(1, 0x200 + 0x40)
+        self.bridge.handle_data_available(frame[:0x200])
+        self.assertEqual(self.bridge.framing.max_packet_size, 0x200)
+        self.assertEqual(list(self.sink.received), [])
+        self.bridge.handle_data_available(frame[0x200:])
+        self.assertEqual(list(self.sink.received), [frame])
+
+    def testZeroLengthPacketAtHighSpeed(self):
+        self.sink.inject(make_frame(1, 0x40 * 3))
+        self.sink.inject(make_frame(2, 0x400))
+        self.bridge.handle_buffer_available()
+        self.assertEqual(
+            [(ep_num, len(data)) for ep_num, data in self.actor.sent],
+            [(2, 0x40 * 3), (2, 0x400), (2, 0)]
+        )
+
+    def testEndpointNumberAtCreation(self):
+        # composite devices renumber the endpoint, their phy maps the original number
+        self.endpoint.number = 5
+        self.sink.inject(make_frame(1))
+        self.bridge.handle_buffer_available()
+        self.assertEqual(self.actor.sent[0][0], 2)
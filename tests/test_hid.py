@@ -0,0 +1,148 @@
+'''
+Tests for the HID report descriptor parser
+'''
+import os
+import tempfile
+import binascii
+import unittest
+from numap.utils.hid import ReportLayout, iter_items, load_report_descriptor
+
+# boot keyboard (HID 1.11, appendix B.1)
+KEYBOARD_DESCRIPTOR = binascii.unhexlify(
+    '05010906a101'
+    '050719e029e7150025017501950881029501750881019505750105081901290591029501750391019506'
+    '7508150025650507190029658100'
+    'c0'
+)
+
+# 3 button mouse with relative X/Y in report 1
+MOUSE_DESCRIPTOR = binascii.unhexlify(
+    '05010902a1018501'
+    '0901a100'
+    '05091901290315002501950375018102950175058101'
+    '0501093009311581257f750895028106'
+    'c0c0'
+)
+
+KEY_A = 0x00070004
+LEFT_SHIFT = 0x000700e1
+LED_CAPS_LOCK = 0x00080002
+BUTTON_1 = 0x00090001
+BUTTON_3 = 0x00090003
+X = 0x00010030
+Y = 0x00010031
+
+
+class IterItemsTests(unittest.TestCase):
+
+    def testShortItems(self):
+        items = list(iter_items(b'\x05\x01\x16\x00\x80\x27\xff\xff\x00\x00\xc0'))
+        self.assertEqual(items, [
+            (1, 0x0, 0x01, 0x01),
+            (1, 0x1, 0x8000, -0x8000),
+            (1, 0x2, 0xffff, 0xffff),
+            (0, 0xc, 0, 0),
+        ])
+
+    def testLongItemSkipped(self):
+        items = list(iter_items(b'\xfe\x02\x10\xaa\xbb\xc0'))
+        self.assertEqual(items, [(0, 0xc, 0, 0)])
+
+    def testTruncatedItem(self):
+        with self.assertRaises(Exception):
+            list(iter_items(b'\x05\x01\x26\xff'))
+        with self.assertRaises(Exception):
+            list(iter_items(b'\xfe'))
+
+
+class ReportLayoutTests(unittest.TestCase):
+
+    def testKeyboardReports(self):
+        layout = ReportLayout(KEYBOARD_DESCRIPTOR)
+        self.assertFalse(layout.numbered)
+        report = layout.get_report('input')
+        self.assertEqual(report.length, 8)
+        self.assertEqual(layout.max_input_length, 8)
+        self.assertEqual(layout.get_report('output').length, 1)
+        self.assertIsNone(layout.get_report('feature'))
+        self.assertEqual(report.variables[LEFT_SHIFT], (1, 1, False))
+
+    def testKeyboardPack(self):
+        report = ReportLayout(KEYBOARD_DESCRIPTOR).get_report('input')
+        data = report.pack({LEFT_SHIFT: 1}, pressed=[KEY_A, 0x00070005])
+        self.assertEqual(data, b'\x02\x00\x04\x05\x00\x00\x00\x00')
+        values, pressed = report.unpack(data)
+        self.assertEqual(values[LEFT_SHIFT], 1)
+        self.assertEqual(values[0x000700e0], 0)
+        self.assertEqual(pressed, [KEY_A, 0x00070005])
+
+    def testShortUsageIds(self):
+        report = ReportLayout(KEYBOARD_DESCRIPTOR).get_report('input')
+        self.assertEqual(report.pack({0xe1: 1}), b'\x02' + b'\x00' * 7)
+        # only the full usages are reported
+        self.assertNotIn(0xe1, report.usages)
+
+    def testKeyboardLeds(self):
+        report = ReportLayout(KEYBOARD_DESCRIPTOR).get_report('output')
+        values, pressed = report.unpack(b'\x02')
+        self.assertEqual(values[LED_CAPS_LOCK], 1)
+        self.assertEqual(values[0x00080001], 0)
+        self.assertEqual(pressed, [])
+
+    def testMouseReportId(self):
+        layout = ReportLayout(MOUSE_DESCRIPTOR)
+        self.assertTrue(layout.numbered)
+        self.assertIsNone(layout.get_report('input', 0))
+        report = layout.get_report('input', 1)
+        # report id, 3 buttons and padding, X, Y
+        self.assertEqual(report.length, 4)
+        self.assertEqual(layout.max_input_length, 4)
+        self.assertEqual(report.usages, [BUTTON_1, 0x00090002, BUTTON_3, X, Y])
+
+    def testMouseSignedValues(self):
+        report = ReportLayout(MOUSE_DESCRIPTOR).get_report('input', 1)
+        data = report.pack({BUTTON_3: 1, X: -1, Y: 5})
+        self.assertEqual(data, b'\x01\x04\xff\x05')
+        values, _ = report.unpack(data)
+        self.assertEqual(values, {BUTTON_1: 0, 0x00090002: 0, BUTTON_3: 1, X: -1, Y: 5})
+
+    def testPushPop(self):
+        descriptor = binascii.unhexlify(
+            '05010906a101'
+            '75089501'
+            'a4'
+            '7510950209300931150026ff7f8102'
+            'b4'
+            '09328102'
+            'c0'
+        )
+        report = ReportLayout(descriptor).get_report('input')
+        # X and Y are 16 bit, Z uses the 8 bit size from before the push
+        self.assertEqual(report.variables[X], (0, 16, False))
+        self.assertEqual(report.variables[Y], (16, 16, False))
+        self.assertEqual(report.variables[0x00010032], (32, 8, False))
+        self.assertEqual(report.length, 5)
+
+    def testPopWithoutPush(self):
+        with self.assertRaises(Exception):
+            ReportLayout(b'\xb4')
+
+    def testUnbalancedCollections(self):
+        with self.assertRaises(Exception):
+            ReportLayout(b'\x05\x01\x09\x06\xa1\x01')
+
+
+class LoadReportDescriptorTests(unittest.TestCase):
+
+    def testBytes(self):
+        self.assertEqual(load_report_descriptor(bytearray(b'\x05\x01')), b'\x05\x01')
+
+    def testHexString(self):
+        self.assertEqual(load_report_descriptor('05 01 09 06'), b'\x05\x01\x09\x06')
+
+    def testFile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'report.bin')
+            with open(filename, 'wb') as f:
+                f.write(KEYBOARD_DESCRIPTOR)
+            self.assertEqual(load_report_descriptor(filename), KEYBOARD_DESCRIPTOR)
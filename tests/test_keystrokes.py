@@ -0,0 +1,114 @@
+'''
+Tests for the keystroke scheduling of the keyboard
+'''
+import os
+import tempfile
+import unittest
+from numap.utils.keystrokes import KeystrokeScheduler, build_report, KEY_RELEASE
+from numap.utils.keystrokes import LEFT_CTRL, LEFT_SHIFT, LEFT_ALT, LEFT_GUI, RIGHT_ALT, KEY_ENTER
+
+KEY_A = 0x04
+KEY_B = 0x05
+KEY_R = 0x15
+KEY_Y = 0x1c
+KEY_Z = 0x1d
+KEY_DELETE = 0x4c
+
+
+def key(code, modifiers=0):
+    return build_report(modifiers, (code,))
+
+
+class KeystrokeSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = KeystrokeScheduler()
+
+    def events(self):
+        return list(self.scheduler.events)
+
+    def testBuildReport(self):
+        self.assertEqual(build_report(), KEY_RELEASE)
+        self.assertEqual(build_report(LEFT_SHIFT, (KEY_A, KEY_B)), b'\x02\x00\x04\x05\x00\x00\x00\x00')
+        # the boot report has room for 6 keys only
+        self.assertEqual(build_report(0, range(1, 9)), b'\x00\x00\x01\x02\x03\x04\x05\x06')
+
+    def testUnknownLayout(self):
+        with self.assertRaises(Exception):
+            KeystrokeScheduler('xx')
+
+    def testTypeText(self):
+        self.scheduler.type_text('ab')
+        # different keys need no release in between
+        self.assertEqual(self.events(), [key(KEY_A), key(KEY_B), KEY_RELEASE])
+
+    def testRepeatedKey(self):
+        self.scheduler.type_text('aA')
+        # the same key with another modifier is a new press only after a release
+        self.assertEqual(self.events(), [key(KEY_A), KEY_RELEASE, key(KEY_A, LEFT_SHIFT), KEY_RELEASE])
+
+    def testUnknownCharacterSkipped(self):
+        self.scheduler.type_text('aäb')
+        self.assertEqual(self.events(), [key(KEY_A), key(KEY_B), KEY_RELEASE])
+
+    def testGermanLayout(self):
+        scheduler = KeystrokeScheduler('de')
+        scheduler.type_text('yz@ä')
+        self.assertEqual(list(scheduler.events), [
+            key(KEY_Z), key(KEY_Y), key(0x14, RIGHT_ALT), key(0x34), KEY_RELEASE
+        ])
+
+    def testUsLayout(self):
+        self.scheduler.type_text('yz@\n')
+        self.assertEqual(self.events(), [
+            key(KEY_Y), key(KEY_Z), key(0x1f, LEFT_SHIFT), key(KEY_ENTER), KEY_RELEASE
+        ])
+
+    def testScript(self):
+        self.scheduler.run_script([
+            'REM open a terminal\n',
+            '\n',
+            'GUI r\n',
+            'DELAY 500\n',
+            'STRING a b\n',
+            'STRINGLN b\r\n',
+            'CTRL ALT DELETE\n',
+        ])
+        self.assertEqual(self.events(), [
+            key(KEY_R, LEFT_GUI), KEY_RELEASE,
+            0.5,
+            key(KEY_A), key(0x2c), key(KEY_B), KEY_RELEASE,
+            key(KEY_B), key(KEY_ENTER), KEY_RELEASE,
+            key(KEY_DELETE, LEFT_CTRL | LEFT_ALT), KEY_RELEASE,
+        ])
+
+    def testScriptDefaultDelay(self):
+        self.scheduler.run_script(['DEFAULTDELAY 100', 'ENTER', 'STRING a'])
+        self.assertEqual(self.events(), [
+            key(KEY_ENTER), KEY_RELEASE, 0.1,
+            key(KEY_A), KEY_RELEASE, 0.1,
+        ])
+
+    def testScriptUnknownKey(self):
+        with self.assertRaises(Exception):
+            self.scheduler.run_script(['CTRL NOSUCHKEY'])
+
+    def testLoadScript(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'payload.txt')
+            with open(filename, 'w') as f:
+                f.write('REM test\nSTRING a\n')
+            self.scheduler.load_script(filename)
+        self.assertEqual(self.events(), [key(KEY_A), KEY_RELEASE])
+
+    def testNextReportDelay(self):
+        self.scheduler.run_script(['STRING a', 'DELAY 1000', 'STRING b'])
+        self.assertEqual(self.scheduler.next_report(now=10), key(KEY_A))
+        self.assertEqual(self.scheduler.next_report(now=10), KEY_RELEASE)
+        # the delay starts when it is reached
+        self.assertIsNone(self.scheduler.next_report(now=10))
+        self.assertIsNone(self.scheduler.next_report(now=10.5))
+        self.assertEqual(self.scheduler.next_report(now=11), key(KEY_B))
+        self.assertEqual(self.scheduler.next_report(now=11), KEY_RELEASE)
+        self.assertIsNone(self.scheduler.next_report(now=11))
+        self.assertEqual(len(self.scheduler), 0)
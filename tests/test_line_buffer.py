@@ -0,0 +1,43 @@
+'''
+Tests for the line buffer of the CDC serial devices
+'''
+import unittest
+from numap.dev.cdc import LineBuffer
+
+
+class LineBufferTests(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = []
+        self.buffer = LineBuffer(self.lines.append, max_length=16)
+
+    def testLinesInPackets(self):
+        self.buffer.feed(b'AT')
+        self.buffer.feed(b'Z\rATI\rAT')
+        self.assertEqual(self.lines, [b'ATZ', b'ATI'])
+        self.buffer.feed(b'D\r')
+        self.assertEqual(self.lines, [b'ATZ', b'ATI', b'ATD'])
+
+    def testSplitTerminator(self):
+        lines = []
+        buffer = LineBuffer(lines.append, terminator=b'\r\n')
+        buffer.feed(b'ATZ\r')
+        self.assertEqual(lines, [])
+        buffer.feed(b'\nATI\r\n')
+        self.assertEqual(lines, [b'ATZ', b'ATI'])
+
+    def testEmptyLine(self):
+        self.buffer.feed(b'\rATZ\r')
+        self.assertEqual(self.lines, [b'', b'ATZ'])
+
+    def testLongLineDropped(self):
+        self.buffer.feed(b'A' * 20)
+        self.buffer.feed(b'A' * 20 + b'\rATI\r')
+        self.assertEqual(self.lines, [b'ATI'])
+        self.assertEqual(self.buffer.overflows, 1)
+
+    def testClear(self):
+        self.buffer.feed(b'ATZ')
+        self.buffer.clear()
+        self.buffer.feed(b'ATI\r')
+        self.assertEqual(self.lines, [b'ATI'])
@@ -0,0 +1,107 @@
+'''
+Tests for the AT command engine of the emulated modems
+'''
+import time
+import unittest
+from numap.utils.modem import ATResponder, split_commands
+
+
+class SplitCommandsTests(unittest.TestCase):
+
+    def testBasicCommands(self):
+        self.assertEqual(split_commands('E0V1'), ['ATE0', 'ATV1'])
+        self.assertEqual(split_commands('&FE0'), ['AT&F', 'ATE0'])
+        self.assertEqual(split_commands('S0=0 E0'), ['ATS0=0', 'ATE0'])
+
+    def testExtendedCommands(self):
+        self.assertEqual(split_commands('+CSQ;+CREG?'), ['AT+CSQ', 'AT+CREG?'])
+        # ';' in a string does not end the command
+        self.assertEqual(split_commands('+CGDCONT=1,"IP","A;B";+CSQ'), ['AT+CGDCONT=1,"IP","A;B"', 'AT+CSQ'])
+
+    def testBasicAndExtendedCommands(self):
+        self.assertEqual(split_commands('E0+CMEE=1'), ['ATE0', 'AT+CMEE=1'])
+        self.assertEqual(split_commands('+CMEE=1;E1'), ['AT+CMEE=1', 'ATE1'])
+
+    def testDialTakesTheRestOfTheLine(self):
+        self.assertEqual(split_commands('E0D*99#'), ['ATE0', 'ATD*99#'])
+
+    def testEmptyAndInvalidLines(self):
+        self.assertEqual(split_commands(''), ['AT'])
+        self.assertIsNone(split_commands('!!'))
+
+
+class ATResponderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = ATResponder(echo=False)
+
+    def command(self, line):
+        self.modem.handle_line(line)
+        return self.modem.read(0x1000)
+
+    def testEcho(self):
+        modem = ATResponder()
+        modem.handle_line(b'AT')
+        self.assertEqual(modem.read(0x100), b'AT\r\r\nOK\r\n')
+        # the line that turns echo off is still echoed
+        modem.handle_line(b'ATE0')
+        self.assertEqual(modem.read(0x100), b'ATE0\r\r\nOK\r\n')
+        modem.handle_line(b'AT')
+        self.assertEqual(modem.read(0x100), b'\r\nOK\r\n')
+        modem.handle_line(b'ATE1')
+        modem.handle_line(b'AT')
+        self.assertEqual(modem.read(0x100), b'\r\nOK\r\nAT\r\r\nOK\r\n')
+
+    def testInformationResponse(self):
+        self.assertEqual(self.command(b'AT+CSQ'), b'\r\n+CSQ: 20,99\r\n\r\nOK\r\n')
+
+    def testNumericResultCodes(self):
+        self.assertEqual(self.command(b'ATV0'), b'0\r')
+        self.assertEqual(self.command(b'AT+CSQ'), b'+CSQ: 20,99\r\n0\r')
+        self.assertEqual(self.command(b'AT+NOPE'), b'4\r')
+        self.assertEqual(self.command(b'ATD123'), b'3\r')
+        self.assertEqual(self.command(b'ATV1'), b'\r\nOK\r\n')
+
+    def testChainedCommands(self):
+        self.assertEqual(
+            self.command(b'AT+CSQ;+CPIN?'),
+            b'\r\n+CSQ: 20,99\r\n\r\n+CPIN: READY\r\n\r\nOK\r\n'
+        )
+
+    def testErrorStopsTheLine(self):
+        self.assertEqual(self.command(b'AT+NOPE;+CSQ'), b'\r\nERROR\r\n')
+
+    def testBasicAndExtendedCommands(self):
+        self.assertEqual(self.command(b'ATE0+CMEE=1'), b'\r\nOK\r\n')
+        self.assertEqual(self.command(b'AT&FE0'), b'\r\nOK\r\n')
+        self.assertEqual(self.command(b'AT&FE0V1&C1&D2+CMEE=1;+CSQ'), b'\r\n+CSQ: 20,99\r\n\r\nOK\r\n')
+
+    def testRuleGroupSubstitution(self):
+        modem = ATResponder(echo=False, rules=[(r'AT\+CGACT\?(\d)', r'+CGACT: \1,1')])
+        modem.handle_line(b'at+cgact?3')
+        self.assertEqual(modem.read(0x100), b'\r\n+CGACT: 3,1\r\n\r\nOK\r\n')
+
+    def testUnsolicitedResultCodes(self):
+        modem = ATResponder(echo=False, unsolicited=[(0.05, 'RING')])
+        self.assertEqual(modem.read(0x100), b'')
+        time.sleep(0.06)
+        self.assertEqual(modem.read(0x100), b'\r\nRING\r\n')
+        # the next one is due one interval later
+        self.assertEqual(modem.read(0x100), b'')
+        time.sleep(0.06)
+        self.assertEqual(modem.read(0x100), b'\r\nRING\r\n')
+
+    def testReadInChunks(self):
+        self.modem.handle_line(b'AT+CSQ')
+        self.assertEqual(self.modem.read(4), b'\r\n+C')
+        self.assertEqual(self.modem.read(0x100), b'SQ: 20,99\r\n\r\nOK\r\n')
+        self.assertEqual(self.modem.pending_size, 0)
+
+    def testOldestDataDropped(self):
+        modem = ATResponder(echo=False, max_pending=32)
+        modem.handle_line(b'ATE0')
+        modem.handle_line(b'AT+CSQ')
+        self.assertEqual(modem.dropped, 0)
+        modem.handle_line(b'AT')
+        self.assertEqual(modem.dropped, 1)
+        self.assertEqual(modem.read(0x100), b'\r\n+CSQ: 20,99\r\n\r\nOK\r\n\r\nOK\r\n')
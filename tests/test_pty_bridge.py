@@ -0,0 +1,94 @@
+'''
+Tests for the pseudo terminal bridge of the serial devices
+'''
+import os
+import shutil
+import tempfile
+import termios
+import unittest
+from numap.utils.pty_bridge import PtyBridge
+
+
+class PtyBridgeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.link = os.path.join(self.tmpdir, 'ttyNUMAP')
+        self.bridge = PtyBridge(self.link)
+        # the program side of the terminal, as screen or minicom would open it
+        self.term = os.open(self.link, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+
+    def tearDown(self):
+        os.close(self.term)
+        if self.bridge is not None:
+            self.bridge.close()
+        shutil.rmtree(self.tmpdir)
+
+    def read_term(self):
+        try:
+            return os.read(self.term, 0x1000)
+        except BlockingIOError:
+            return b''
+
+    def testLink(self):
+        self.assertEqual(os.readlink(self.link), self.bridge.name)
+        self.assertEqual(os.ttyname(self.term), self.bridge.name)
+        self.bridge.close()
+        self.bridge = None
+        self.assertFalse(os.path.lexists(self.link))
+
+    def testReadEmpty(self):
+        self.assertEqual(self.bridge.read(0x40), b'')
+        self.assertEqual(self.bridge.read(0), b'')
+
+    def testRawData(self):
+        data = bytes(range(256))
+        os.write(self.term, data)
+        received = b''
+        for _ in range(100):
+            received += self.bridge.read(0x40)
+            if len(received) == len(data):
+                break
+        # raw mode: no line editing, no CR/LF translation
+        self.assertEqual(received, data)
+
+    def testReadMaxSize(self):
+        os.write(self.term, b'abcdef')
+        self.assertEqual(self.bridge.read(4), b'abcd')
+        self.assertEqual(self.bridge.read(4), b'ef')
+
+    def testWrite(self):
+        self.assertEqual(self.bridge.write(b''), 0)
+        self.assertEqual(self.bridge.write(b'AT\r\n\x00\xff'), 6)
+        self.assertEqual(self.read_term(), b'AT\r\n\x00\xff')
+
+    def testWriteFull(self):
+        written = 0
+        for _ in range(0x1000):
+            count = self.bridge.write(b'x' * 0x400)
+            if not count:
+                break
+            written += count
+        else:
+            self.fail('terminal never filled up')
+        # nothing is lost once the program reads the pending data
+        received = b''
+        while True:
+            data = self.read_term()
+            if not data:
+                break
+            received += data
+        self.assertEqual(len(received), written)
+        self.assertGreater(self.bridge.write(b'x'), 0)
+
+    def testSetSpeed(self):
+        self.bridge.set_speed(115200)
+        attrs = termios.tcgetattr(self.term)
+        self.assertEqual(attrs[4], termios.B115200)
+        self.assertEqual(attrs[5], termios.B115200)
+        # FTDI divisor approximation of 9600
+        self.bridge.set_speed(9598)
+        self.assertEqual(termios.tcgetattr(self.term)[4], termios.B9600)
+        # no standard rate close enough, the speed is kept
+        self.bridge.set_speed(700000)
+        self.assertEqual(termios.tcgetattr(self.term)[4], termios.B9600)
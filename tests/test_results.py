@@ -0,0 +1,36 @@
+'''
+Tests for the fuzzing results database
+'''
+import unittest
+from collections import namedtuple
+from numap.fuzz.results import ResultsDB, get_path_id
+
+Connection = namedtuple('Connection', ['src', 'dst'])
+
+
+class Node(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+
+def make_path(*names):
+    return [Connection(None, Node(name)) for name in names]
+
+
+class ResultsDBTests(unittest.TestCase):
+
+    def setUp(self):
+        self.db = ResultsDB(':memory:')
+
+    def testSameTemplateOnDifferentPaths(self):
+        direct = get_path_id(make_path('x'))
+        via_p1 = get_path_id(make_path('p1', 'x'))
+        self.assertNotEqual(direct, via_p1)
+        self.db.add('host', via_p1, 'x', 0x1234, 3, 'passed', 0, 1)
+        self.assertEqual(self.db.tested('host', 'x', 0x1234, via_p1), set([3]))
+        self.assertEqual(self.db.tested('host', 'x', 0x1234, direct), set())
+        self.assertEqual(self.db.tested('host', 'x', 0x1234), set([3]))
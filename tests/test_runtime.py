@@ -0,0 +1,100 @@
+'''
+Tests for the asyncio runtime of the devices
+'''
+import os
+import time
+import asyncio
+import unittest
+from numap.core.runtime import DeviceRuntime
+from numap.phy.iphy import PhyInterface
+
+
+class StopApp(object):
+
+    def __init__(self):
+        self.stop = False
+
+    def should_stop_phy(self):
+        return self.stop
+
+
+class PipePhy(PhyInterface):
+    '''
+    Phy with events on a pipe, waits up to idle_timeout for them
+    '''
+
+    def __init__(self, app, idle_timeout):
+        super(PipePhy, self).__init__(app, 'Pipe')
+        self.idle_timeout = idle_timeout
+        self.events_r, self.events_w = os.pipe()
+        os.set_blocking(self.events_r, False)
+        self.events = []
+
+    def service_irqs(self):
+        try:
+            self.events.append((os.read(self.events_r, 64), time.time()))
+        except BlockingIOError:
+            pass
+
+    def get_event_fds(self):
+        return [self.events_r]
+
+    def get_idle_timeout(self):
+        return self.idle_timeout
+
+
+class DeviceRuntimeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = StopApp()
+
+    def testCoroutinesRunWhilePhyIsIdle(self):
+        phy = PipePhy(self.app, 0.1)
+        runtime = DeviceRuntime(self.app, phy)
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(time.time())
+                await asyncio.sleep(0.005)
+                if len(ticks) == 10:
+                    self.app.stop = True
+                    os.write(phy.events_w, b'x')
+
+        runtime.spawn(ticker)
+        start = time.time()
+        runtime.run()
+        # the phy waits 100 ms for events, the coroutine is not held up by it
+        self.assertLess(ticks[9] - start, 0.09)
+
+    def testPhyEventWakesTheRuntime(self):
+        phy = PipePhy(self.app, 1)
+        runtime = DeviceRuntime(self.app, phy)
+        sent = []
+
+        async def sender():
+            await asyncio.sleep(0.01)
+            sent.append(time.time())
+            os.write(phy.events_w, b'x')
+            while not phy.events:
+                await asyncio.sleep(0.001)
+            self.app.stop = True
+            os.write(phy.events_w, b'y')
+
+        runtime.spawn(sender)
+        runtime.run()
+        self.assertEqual(phy.events[0][0], b'x')
+        self.assertLess(phy.events[0][1] - sent[0], 0.5)
+
+    def testStopWakesTheRuntime(self):
+        phy = PipePhy(self.app, 10)
+        runtime = DeviceRuntime(self.app, phy)
+
+        async def stopper():
+            await asyncio.sleep(0.01)
+            runtime.stop()
+
+        runtime.spawn(stopper)
+        start = time.time()
+        runtime.run()
+        self.assertLess(time.time() - start, 5)
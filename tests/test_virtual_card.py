@@ -0,0 +1,56 @@
+'''
+Tests for the virtual smart cards and the CCID message reassembly
+'''
+import struct
+import unittest
+from numap.utils.virtual_card import ScriptedCard, CcidMessageBuffer, CCID_HEADER_SIZE, DEFAULT_ATR, SW_FILE_NOT_FOUND
+
+
+def make_ccid_message(data, message_type=0x6f, seq=0):
+    return struct.pack('<BIBBBBB', message_type, len(data), 0, seq, 0, 0, 0) + data
+
+
+class ScriptedCardTests(unittest.TestCase):
+
+    def setUp(self):
+        self.card = ScriptedCard(apdus=[
+            (b'\x00\xa4\x04\x00', b'\x61\x10'),
+            (b'\x00\xa4', b'\x90\x00'),
+            (b'\x00\xb0\x00\x00\x10', b'\x01\x02\x90\x00'),
+        ])
+
+    def testReset(self):
+        self.assertEqual(self.card.reset(), DEFAULT_ATR)
+
+    def testExactMatch(self):
+        self.assertEqual(self.card.transmit(b'\x00\xb0\x00\x00\x10'), b'\x01\x02\x90\x00')
+
+    def testFirstPrefixMatches(self):
+        self.assertEqual(self.card.transmit(b'\x00\xa4\x04\x00\x02\x3f\x00'), b'\x61\x10')
+        self.assertEqual(self.card.transmit(b'\x00\xa4\x00\x00\x02\x3f\x00'), b'\x90\x00')
+
+    def testDefaultResponse(self):
+        self.assertEqual(self.card.transmit(b'\x00\xca\x00\x00'), SW_FILE_NOT_FOUND)
+
+
+class CcidMessageBufferTests(unittest.TestCase):
+
+    def testMessageInPackets(self):
+        buffer = CcidMessageBuffer(0x200)
+        message = make_ccid_message(bytes(range(100)))
+        self.assertEqual(buffer.feed(message[:0x40]), [])
+        self.assertEqual(buffer.feed(message[0x40:]), [message])
+
+    def testMessagesInOnePacket(self):
+        buffer = CcidMessageBuffer(0x200)
+        first = make_ccid_message(b'\x00\xa4', seq=1)
+        second = make_ccid_message(b'\x00\xb0', seq=2)
+        self.assertEqual(buffer.feed(first + second[:4]), [first])
+        self.assertEqual(buffer.feed(second[4:]), [second])
+
+    def testTooLongMessageDropped(self):
+        buffer = CcidMessageBuffer(0x40)
+        self.assertEqual(buffer.feed(make_ccid_message(bytes(0x40 - CCID_HEADER_SIZE + 1))[:0x40]), [])
+        self.assertEqual(buffer.dropped, 1)
+        message = make_ccid_message(b'\x00')
+        self.assertEqual(buffer.feed(message), [message])